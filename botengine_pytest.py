@@ -381,6 +381,28 @@ class BotEnginePyTest:
         logger.info(message)
         
 
+    #============================================================================
+    # HTTP Statistics
+    #============================================================================
+    def get_http_statistics(self):
+        """
+        Tests never talk to the server, so there are no HTTP requests to report
+        :return: HTTP statistics in the same format as BotEngine.get_http_statistics()
+        """
+        return {
+            'total': {
+                'calls': 0,
+                'retries': 0,
+                'errors': 0,
+                'httpErrors': 0,
+                'simulated': 0,
+                'bytesSent': 0,
+                'bytesReceived': 0,
+                'totalMs': 0
+            },
+            'endpoints': {}
+        }
+
     #============================================================================
     # Inputs
     #============================================================================
@@ -1323,18 +1345,22 @@ class BotEnginePyTest:
     #============================================================================
     def set_alarm(self, timestamp_ms, function, argument=None, reference=None):
         self.get_logger(f"{__name__}.{__class__.__name__}").info(">botengine.set_alarm(timestamp_ms={}, function={}, argument={}, reference={})".format(timestamp_ms, function, argument, reference))
+        self.timers.pop(reference, None)
         self.alarms[reference] = (timestamp_ms, argument, function)
 
     def start_timer_s(self, seconds, function, argument=None, reference=None):
         self.get_logger(f"{__name__}.{__class__.__name__}").info(">botengine.start_timer_s(s={}, function={}, argument={}, reference={})".format(seconds, function, argument, reference))
+        self.alarms.pop(reference, None)
         self.timers[reference] = (self.get_timestamp() + seconds * 1000, argument, function)
 
     def start_timer_ms(self, milliseconds, function, argument=None, reference=None):
         self.get_logger(f"{__name__}.{__class__.__name__}").info(">botengine.start_timer_ms(ms={}, function={}, argument={}, reference={})".format(milliseconds, function, argument, reference))
+        self.alarms.pop(reference, None)
         self.timers[reference] = (self.get_timestamp() + milliseconds, argument, function)
 
     def start_timer(self, seconds, function, argument=None, reference=None):
         self.get_logger(f"{__name__}.{__class__.__name__}").info(">botengine.start_timer(s={}, function={}, argument={}, reference={})".format(seconds, function, argument, reference))
+        self.alarms.pop(reference, None)
         self.timers[reference] = (self.get_timestamp() + seconds * 1000, argument, function)
 
     def cancel_timers(self, reference):
@@ -0,0 +1,730 @@
+'''
+Created on October 17, 2026
+
+Local mock of the cloud server, to run and benchmark the real BotEngine HTTP code paths offline.
+
+Implements the APIs a bot uses on every execution - start, binary variables, states, device measurements,
+asynchronous data requests, notifications, commands, execution requests - and the long-poll API that
+'botengine --run' listens to for new triggers. Variables, states and measurements are kept in memory,
+or in a storage directory that survives restarts.
+
+Faults can be injected to see how the bot behaves when the server is slow or failing:
+latency, HTTP 5xx errors, dropped connections, and lockouts of /analytic/start.
+
+Run it from the command line:
+
+    python botengine_server.py --port 8888 --storage .server
+
+Or in-process, from tests and benchmarks:
+
+    server = MockCloudServer().start()
+    botengine = BotEngine({'apiKey': 'key', 'apiHost': server.url})
+    ...
+    server.stop()
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default port to listen on
+DEFAULT_PORT = 8888
+
+# Trigger type for asynchronous data request responses
+TRIGGER_DATA_REQUEST = 2048
+
+# Result code returned by /analytic/start while the bot is locked out
+RESULT_CODE_LOCKED = 20
+
+# Longest time in seconds that a long-poll request waits for new triggers
+MAXIMUM_LISTEN_TIMEOUT_S = 60
+
+
+class Fault:
+    """
+    A fault injected into the requests that match it
+    """
+
+    def __init__(self, path=None, method=None, latency_s=0, status=None, disconnect=False, probability=1.0, count=None):
+        """
+        :param path: Regular expression matched against the request path, or None for every path
+        :param method: HTTP method to match, or None for every method
+        :param latency_s: Seconds to wait before responding
+        :param status: HTTP status to respond with instead of handling the request, for example 503
+        :param disconnect: True to close the connection without responding
+        :param probability: Probability from 0 to 1 that a matching request is affected
+        :param count: Number of requests to affect before this fault goes away, or None to never go away
+        """
+        self.path = re.compile(path) if path is not None else None
+        self.method = method
+        self.latency_s = latency_s
+        self.status = status
+        self.disconnect = disconnect
+        self.probability = probability
+        self.count = count
+
+    def matches(self, method, path):
+        """
+        :param method: HTTP method
+        :param path: Request path
+        :return: True if this fault applies to the request
+        """
+        if self.method is not None and self.method != method:
+            return False
+
+        if self.path is not None and self.path.search(path) is None:
+            return False
+
+        if self.count is not None and self.count <= 0:
+            return False
+
+        return self.probability >= 1.0 or random.random() < self.probability
+
+
+class MockCloudServer:
+    """
+    In-memory or on-disk implementation of the cloud APIs that BotEngine calls
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, storage_directory=None, bot_instance_id=1, api_key="mock-api-key"):
+        """
+        :param host: Host to listen on
+        :param port: Port to listen on, or 0 to pick a free port
+        :param storage_directory: Directory to keep variables, states and measurements in, or None to keep them in memory
+        :param bot_instance_id: Bot instance ID delivered with triggers from the long-poll API
+        :param api_key: API key delivered with triggers from the long-poll API
+        """
+        self.host = host
+        self.port = port
+        self.storage_directory = storage_directory
+        self.bot_instance_id = bot_instance_id
+        self.api_key = api_key
+
+        # Serializes access to everything below
+        self.lock = threading.RLock()
+
+        # Binary variables { (shared, name): bytes }
+        self.variables = {}
+
+        # Location states { location_id: { address: value } }
+        self.states = {}
+
+        # Time-series location states { location_id: { address: { timestamp_ms: value } } }
+        self.time_states = {}
+
+        # Device measurements { device_id: [ { 'name', 'value', 'time', 'index' } ] } ordered by time
+        self.measurements = {}
+
+        # Files created by data requests { file_id: bytes }
+        self.files = {}
+
+        # Bot inputs waiting to be delivered through the long-poll API
+        self.pending_inputs = []
+        self.inputs_available = threading.Condition(self.lock)
+
+        # Everything the bot sent that it only writes, for inspection by tests
+        self.notifications = []
+        self.commands = []
+        self.execution_requests = []
+        self.data_requests = []
+
+        # Injected faults
+        self.faults = []
+
+        # Timestamp in seconds when the /analytic/start lockout ends
+        self.locked_until = 0
+
+        # Requests handled { "METHOD /path": count }
+        self.request_counts = {}
+
+        self._httpd = None
+        self._thread = None
+
+        if storage_directory is not None:
+            self._load()
+
+    @property
+    def url(self):
+        """
+        :return: Base URL of this server, to use as the bot's API host
+        """
+        return "http://{}:{}".format(self.host, self.port)
+
+    # ===========================================================================
+    # Lifecycle
+    # ===========================================================================
+    def start(self):
+        """
+        Start serving in a background thread
+        :return: This server
+        """
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _MockCloudRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """
+        Serve in the current thread until interrupted
+        """
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _MockCloudRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self.port = self._httpd.server_address[1]
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        """
+        Stop serving
+        """
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    # ===========================================================================
+    # Fault injection
+    # ===========================================================================
+    def add_fault(self, path=None, method=None, latency_s=0, status=None, disconnect=False, probability=1.0, count=None):
+        """
+        Inject a fault into the requests that match it. See Fault for the parameters.
+        :return: The Fault, which can be passed to remove_fault()
+        """
+        fault = Fault(path=path, method=method, latency_s=latency_s, status=status, disconnect=disconnect, probability=probability, count=count)
+        with self.lock:
+            self.faults.append(fault)
+        return fault
+
+    def remove_fault(self, fault):
+        """
+        Remove an injected fault
+        :param fault: Fault returned by add_fault()
+        """
+        with self.lock:
+            if fault in self.faults:
+                self.faults.remove(fault)
+
+    def clear_faults(self):
+        """
+        Remove all injected faults and lockouts
+        """
+        with self.lock:
+            self.faults = []
+            self.locked_until = 0
+
+    def lockout(self, seconds):
+        """
+        Refuse to start bot executions for a while, as the server does while another execution of the same bot is running
+        :param seconds: Seconds to stay locked out
+        """
+        with self.lock:
+            self.locked_until = time.time() + seconds
+
+    # ===========================================================================
+    # Bot inputs
+    # ===========================================================================
+    def push_inputs(self, inputs):
+        """
+        Queue bot inputs for delivery through the long-poll API
+        :param inputs: List of bot input dictionaries, for example [{'trigger': 8, 'time': 1670000000000, ...}]
+        """
+        with self.lock:
+            self.pending_inputs.extend(inputs)
+            self.inputs_available.notify_all()
+
+    def add_measurements(self, device_id, measurements):
+        """
+        Add device measurements to the history
+        :param device_id: Device ID
+        :param measurements: List of { 'name', 'value', 'time', optional 'index' } dictionaries
+        """
+        with self.lock:
+            history = self.measurements.setdefault(device_id, [])
+            for m in measurements:
+                measure = {'name': m['name'], 'value': str(m['value']), 'time': int(m['time'])}
+                if m.get('index') is not None:
+                    measure['index'] = str(m['index'])
+                history.append(measure)
+            history.sort(key=lambda measure: measure['time'])
+            self._save()
+
+    # ===========================================================================
+    # Request handling
+    # ===========================================================================
+    def inject_faults(self, method, path):
+        """
+        Apply the faults that match this request
+        :return: (status, disconnect) of the fault to respond with, or (None, False) to handle the request normally
+        """
+        latency_s = 0
+        status = None
+        disconnect = False
+        with self.lock:
+            for fault in self.faults:
+                if fault.matches(method, path):
+                    if fault.count is not None:
+                        fault.count -= 1
+                    latency_s += fault.latency_s
+                    status = status or fault.status
+                    disconnect = disconnect or fault.disconnect
+
+        if latency_s > 0:
+            time.sleep(latency_s)
+
+        return status, disconnect
+
+    def handle(self, method, path, params, headers, body):
+        """
+        Handle a request
+        :param method: HTTP method
+        :param path: Request path, without query parameters
+        :param params: Dictionary of query parameters, each a list of values
+        :param headers: Request headers
+        :param body: Request body bytes
+        :return: (status, content type, response body bytes)
+        """
+        with self.lock:
+            key = method + " " + re.sub(r"/[^/]*\d[^/]*", "/{id}", path)
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+        for route_method, pattern, handler in _ROUTES:
+            if route_method != method:
+                continue
+
+            match = pattern.fullmatch(path)
+            if match is not None:
+                return handler(self, params, headers, body, *match.groups())
+
+        return _json_response({"resultCode": 1, "resultCodeMessage": "Not found: {} {}".format(method, path)}, status=404)
+
+    def _start(self, params, headers, body):
+        if time.time() < self.locked_until:
+            return _json_response({"resultCode": RESULT_CODE_LOCKED, "resultCodeMessage": "Another execution of this bot is in progress"})
+        return _json_response({"resultCode": 0})
+
+    def _post_variables(self, params, headers, body):
+        names = params.get('name', [])
+        lengths = [int(length) for length in params.get('length', [])]
+        if len(names) != len(lengths) or sum(lengths) != len(body):
+            return _json_response({"resultCode": 1, "resultCodeMessage": "Variable names and lengths do not match the body"})
+
+        if 'Content-MD5' in headers:
+            import hashlib
+            if hashlib.md5(body).digest().hex() != headers['Content-MD5']:
+                return _json_response({"resultCode": 1, "resultCodeMessage": "Content-MD5 does not match the body"})
+
+        with self.lock:
+            offset = 0
+            for name, length in zip(names, lengths):
+                self._put_variable(False, name, body[offset:offset + length])
+                offset += length
+
+        return _json_response({"resultCode": 0})
+
+    def _post_variable(self, params, headers, body, name):
+        with self.lock:
+            self._put_variable(_is_true(params.get('shared')), urllib.parse.unquote(name), body)
+        return _json_response({"resultCode": 0})
+
+    def _get_variable(self, params, headers, body, name):
+        with self.lock:
+            content = self.variables.get((_is_true(params.get('shared')), urllib.parse.unquote(name)))
+
+        if content is None:
+            # No variable content on the server
+            return 202, "application/octet-stream", b""
+
+        return 200, "application/octet-stream", content
+
+    def _delete_variable(self, params, headers, body, name):
+        with self.lock:
+            self._put_variable(_is_true(params.get('shared')), urllib.parse.unquote(name), None)
+        return _json_response({"resultCode": 0})
+
+    def _get_state(self, params, headers, body, location_id):
+        name = _first(params, 'name')
+        with self.lock:
+            states = self.states.get(location_id, {})
+            if name not in states:
+                return _json_response({"resultCode": 0})
+            return _json_response({"resultCode": 0, "value": states[name]})
+
+    def _put_state(self, params, headers, body, location_id):
+        name = _first(params, 'name')
+        value = json.loads(body or b"{}").get('value')
+        with self.lock:
+            states = self.states.setdefault(location_id, {})
+            if value is None:
+                states.pop(name, None)
+            elif not _is_true(params.get('overwrite'), default=True) and isinstance(value, dict) and isinstance(states.get(name), dict):
+                states[name].update(value)
+            else:
+                states[name] = value
+            self._save()
+        return _json_response({"resultCode": 0})
+
+    def _get_time_states(self, params, headers, body, location_id):
+        name = _first(params, 'name')
+        start_ms = int(_first(params, 'startDate', 0))
+        end_ms = _first(params, 'endDate')
+        with self.lock:
+            history = self.time_states.get(location_id, {}).get(name, {})
+            if end_ms is None:
+                # Only the state in effect at the start date
+                timestamps = [t for t in history if t <= start_ms]
+                timestamps = [max(timestamps)] if len(timestamps) > 0 else []
+            else:
+                timestamps = sorted(t for t in history if start_ms <= t <= int(end_ms))
+
+            states = [{"name": name, "stateDateMs": t, "value": history[t]} for t in timestamps]
+
+        return _json_response({"resultCode": 0, "states": states})
+
+    def _put_time_states(self, params, headers, body, location_id):
+        name = _first(params, 'name')
+        timestamp_ms = int(_first(params, 'date', int(time.time() * 1000)))
+        value = json.loads(body or b"{}").get('value')
+        with self.lock:
+            history = self.time_states.setdefault(location_id, {}).setdefault(name, {})
+            if value is None:
+                history.clear()
+            else:
+                history[timestamp_ms] = value
+            self._save()
+        return _json_response({"resultCode": 0})
+
+    def _get_measurements(self, params, headers, body, device_id):
+        param_names = params.get('paramName')
+        index = _first(params, 'index')
+        start_ms = _first(params, 'startDate')
+        end_ms = int(_first(params, 'endDate', int(time.time() * 1000)))
+        last_rows = _first(params, 'lastRows')
+
+        with self.lock:
+            measures = [m for m in self.measurements.get(device_id, [])
+                        if (param_names is None or m['name'] in param_names)
+                        and (index is None or m.get('index') == index)
+                        and m['time'] <= end_ms]
+
+        if start_ms is None:
+            # Only the latest measurement of each parameter
+            latest = {}
+            for m in measures:
+                latest[(m['name'], m.get('index'))] = m
+            measures = sorted(latest.values(), key=lambda m: m['time'])
+
+        else:
+            measures = [m for m in measures if m['time'] >= int(start_ms)]
+
+        if last_rows is not None:
+            measures = measures[-int(last_rows):]
+
+        return _json_response({"resultCode": 0, "measures": [dict(m, deviceId=device_id) for m in measures]})
+
+    def _post_measurements(self, params, headers, body, device_id):
+        j = json.loads(body or b"{}")
+        timestamp_ms = j.get('timestamp', int(time.time() * 1000))
+        self.add_measurements(device_id, [dict(p, time=timestamp_ms) for p in j.get('params', [])])
+        return _json_response({"resultCode": 0})
+
+    def _post_data_requests(self, params, headers, body):
+        """
+        Gather the requested measurements into LZ4-compressed CSV files, and deliver a data request trigger through the long-poll API
+        """
+        import lz4.block
+
+        requests = json.loads(body or b"{}").get('dataRequests', [])
+        data = []
+        with self.lock:
+            self.data_requests.extend(requests)
+            for request in requests:
+                device_id = request.get('deviceId')
+                param_names = request.get('paramNames')
+                lines = ["measureTime,paramName,index,group,value"]
+                for m in self.measurements.get(device_id, []):
+                    if request['startTime'] <= m['time'] <= request['endTime'] and (param_names is None or m['name'] in param_names):
+                        value = m['value']
+                        if ',' in value or '"' in value:
+                            value = '"' + value.replace('"', '""') + '"'
+                        lines.append("{},{},{},,{}".format(m['time'], m['name'], m.get('index', ''), value))
+
+                csv = ("\n".join(lines) + "\n").encode("utf-8")
+                file_id = uuid.uuid4().hex
+                self.files[file_id] = lz4.block.compress(csv, store_size=False)
+                data.append({
+                    "key": request.get('key'),
+                    "deviceId": device_id,
+                    "dataLength": len(csv),
+                    "url": "{}/files/{}".format(self.url, file_id)
+                })
+
+        if len(data) > 0:
+            self.push_inputs([{"trigger": TRIGGER_DATA_REQUEST, "time": int(time.time() * 1000), "data": data}])
+
+        return _json_response({"resultCode": 0})
+
+    def _get_file(self, params, headers, body, file_id):
+        with self.lock:
+            content = self.files.get(file_id)
+        if content is None:
+            return 404, "application/octet-stream", b""
+        return 200, "application/octet-stream", content
+
+    def _post_notifications(self, params, headers, body):
+        with self.lock:
+            self.notifications.append({"params": params, "body": json.loads(body or b"{}")})
+        return _json_response({"resultCode": 0})
+
+    def _put_commands(self, params, headers, body):
+        with self.lock:
+            self.commands.append(json.loads(body or b"{}"))
+        return _json_response({"resultCode": 0})
+
+    def _put_execute(self, params, headers, body):
+        with self.lock:
+            self.execution_requests.append({key: int(value[0]) for key, value in params.items()})
+        return _json_response({"resultCode": 0})
+
+    def _delete_execute(self, params, headers, body):
+        with self.lock:
+            self.execution_requests.append(None)
+        return _json_response({"resultCode": 0})
+
+    def _listen(self, params, headers, body):
+        """
+        Long-poll for bot inputs, waiting up to the requested timeout for some to arrive
+        """
+        timeout_s = min(float(_first(params, 'timeout', MAXIMUM_LISTEN_TIMEOUT_S)), MAXIMUM_LISTEN_TIMEOUT_S)
+        with self.inputs_available:
+            self.inputs_available.wait_for(lambda: len(self.pending_inputs) > 0, timeout=timeout_s)
+            inputs = self.pending_inputs
+            self.pending_inputs = []
+
+        if len(inputs) == 0:
+            return _json_response({})
+
+        return _json_response({
+            "apiKey": self.api_key,
+            "apiHost": self.url,
+            "id": self.bot_instance_id,
+            "inputs": inputs
+        })
+
+    # ===========================================================================
+    # Storage
+    # ===========================================================================
+    def _put_variable(self, shared, name, content):
+        """
+        Save or delete a binary variable. Call while holding the lock.
+        :param shared: True for a shared variable
+        :param name: Variable name
+        :param content: Variable bytes, or None to delete it
+        """
+        if content is None:
+            self.variables.pop((shared, name), None)
+        else:
+            self.variables[(shared, name)] = bytes(content)
+
+        if self.storage_directory is not None:
+            filename = self._variable_filename(shared, name)
+            if content is None:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            else:
+                with open(filename, "wb") as f:
+                    f.write(content)
+
+    def _variable_filename(self, shared, name):
+        """
+        :return: File that stores the given variable
+        """
+        directory = os.path.join(self.storage_directory, "shared" if shared else "variables")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, urllib.parse.quote(name, safe=""))
+
+    def _save(self):
+        """
+        Save the states and measurements to the storage directory. Call while holding the lock.
+        """
+        if self.storage_directory is None:
+            return
+
+        os.makedirs(self.storage_directory, exist_ok=True)
+        content = {
+            "states": self.states,
+            "time_states": {location_id: {name: [[t, v] for t, v in history.items()] for name, history in addresses.items()} for location_id, addresses in self.time_states.items()},
+            "measurements": self.measurements
+        }
+        filename = os.path.join(self.storage_directory, "server.json")
+        with open(filename + ".tmp", "w") as f:
+            json.dump(content, f)
+        os.replace(filename + ".tmp", filename)
+
+    def _load(self):
+        """
+        Load the variables, states and measurements from the storage directory
+        """
+        for shared, directory in [(False, "variables"), (True, "shared")]:
+            directory = os.path.join(self.storage_directory, directory)
+            if os.path.isdir(directory):
+                for filename in os.listdir(directory):
+                    with open(os.path.join(directory, filename), "rb") as f:
+                        self.variables[(shared, urllib.parse.unquote(filename))] = f.read()
+
+        filename = os.path.join(self.storage_directory, "server.json")
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                content = json.load(f)
+            self.states = content.get("states", {})
+            self.time_states = {location_id: {name: {int(t): v for t, v in history} for name, history in addresses.items()} for location_id, addresses in content.get("time_states", {}).items()}
+            self.measurements = content.get("measurements", {})
+
+
+class _MockCloudRequestHandler(BaseHTTPRequestHandler):
+    """
+    Translates HTTP requests into calls to the MockCloudServer
+    """
+
+    # Keep connections alive, like the cloud does, so the bot's session reuses them
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        mock = self.server.mock
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length) if length > 0 else b""
+
+        status, disconnect = mock.inject_faults(method, url.path)
+        if disconnect:
+            self.close_connection = True
+            self.connection.close()
+            return
+
+        if status is not None:
+            content_type, content = "text/plain", "Injected fault {}".format(status).encode("utf-8")
+
+        else:
+            try:
+                status, content_type, content = mock.handle(method, url.path, params, self.headers, body)
+
+            except Exception as e:
+                status, content_type, content = 500, "text/plain", str(e).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Quiet by default. Benchmarks shouldn't measure the console.
+        pass
+
+
+def _json_response(j, status=200):
+    """
+    :return: (status, content type, body) of a JSON response
+    """
+    return status, "application/json", json.dumps(j).encode("utf-8")
+
+
+def _first(params, name, default=None):
+    """
+    :return: The first value of a query parameter, or the default if it isn't there
+    """
+    values = params.get(name)
+    if not values:
+        return default
+    return values[0]
+
+
+def _is_true(values, default=False):
+    """
+    :param values: List of query parameter values, or None
+    :return: True if the query parameter is set to true
+    """
+    if not values:
+        return default
+    return values[0].lower() == "true"
+
+
+# (method, path pattern, handler) for each API
+_ROUTES = [
+    ("POST", re.compile(r"/analytic/start"), MockCloudServer._start),
+    ("POST", re.compile(r"/analytic/variables"), MockCloudServer._post_variables),
+    ("POST", re.compile(r"/analytic/variables/(.+)"), MockCloudServer._post_variable),
+    ("GET", re.compile(r"/analytic/variables/(.+)"), MockCloudServer._get_variable),
+    ("DELETE", re.compile(r"/analytic/variables/(.+)"), MockCloudServer._delete_variable),
+    ("GET", re.compile(r"/cloud/json/locations/([^/]+)/state"), MockCloudServer._get_state),
+    ("PUT", re.compile(r"/cloud/json/locations/([^/]+)/state"), MockCloudServer._put_state),
+    ("GET", re.compile(r"/cloud/json/locations/([^/]+)/timeStates"), MockCloudServer._get_time_states),
+    ("PUT", re.compile(r"/cloud/json/locations/([^/]+)/timeStates"), MockCloudServer._put_time_states),
+    ("GET", re.compile(r"/analytic/devices/([^/]+)/parameters"), MockCloudServer._get_measurements),
+    ("POST", re.compile(r"/analytic/devices/([^/]+)/parameters"), MockCloudServer._post_measurements),
+    ("POST", re.compile(r"/analytic/dataRequests"), MockCloudServer._post_data_requests),
+    ("GET", re.compile(r"/files/([^/]+)"), MockCloudServer._get_file),
+    ("POST", re.compile(r"/analytic/notifications"), MockCloudServer._post_notifications),
+    ("PUT", re.compile(r"/analytic/parameters"), MockCloudServer._put_commands),
+    ("PUT", re.compile(r"/analytic/execute"), MockCloudServer._put_execute),
+    ("DELETE", re.compile(r"/analytic/execute"), MockCloudServer._delete_execute),
+    ("GET", re.compile(r"/deviceio/analytic"), MockCloudServer._listen),
+]
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Local mock of the cloud server for offline bot executions")
+    parser.add_argument("--host", dest="host", default="127.0.0.1", help="Host to listen on, default is 127.0.0.1")
+    parser.add_argument("--port", dest="port", type=int, default=DEFAULT_PORT, help="Port to listen on, default is {}".format(DEFAULT_PORT))
+    parser.add_argument("--storage", dest="storage", help="Directory to keep variables, states and measurements in. Default is in memory.")
+    parser.add_argument("--latency_ms", dest="latency_ms", type=int, default=0, help="Add this much latency to every response")
+    parser.add_argument("--error_rate", dest="error_rate", type=float, default=0, help="Fraction of requests, from 0 to 1, to fail with an HTTP 503 error")
+    parser.add_argument("--lockout_s", dest="lockout_s", type=int, default=0, help="Refuse to start bot executions for this many seconds after the server starts")
+    args = parser.parse_args()
+
+    server = MockCloudServer(host=args.host, port=args.port, storage_directory=args.storage)
+    if args.latency_ms > 0:
+        server.add_fault(latency_s=args.latency_ms / 1000.0)
+    if args.error_rate > 0:
+        server.add_fault(status=503, probability=args.error_rate)
+    if args.lockout_s > 0:
+        server.lockout(args.lockout_s)
+
+    print("Mock cloud server listening on {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -11,6 +11,7 @@ import localization
 
 import json
 import utilities.utilities as utilities
+import utilities.datarequests as datarequests
 import importlib
 
 from startup import StartUpUtil
@@ -435,47 +436,26 @@ def trigger_event(botengine, controller, trigger_type, triggers):
             for device_id, csv_data in data.items():
                 device = controller.get_device(device_id)
                 if device is not None:
-                    events['all'][device] = csv_data
+                    events['all'][device] = datarequests.DataRequestContent(content=csv_data)
 
             for reference in events:
                 controller.data_request_ready(botengine, reference, events[reference])
 
         else:
-            imported = False
-
-            import time
             try:
                 import lz4.block
-                imported = True
             except ImportError:
                 botengine.get_logger(f"{__name__}").error(
                     "Attempted to import 'lz4' to uncompress the data request response, but lz4 is not available. Please add 'lz4' to 'pip_install_remotely' in your structure.json.")
-                pass
-
-            if imported:
-                for d in data:
-                    reference = None
-                    if 'key' in d:
-                        reference = d['key']
-
-                    if reference not in events:
-                        events[reference] = {}
-
-                    botengine.get_logger(f"{__name__}").info("Downloading {} ({} bytes)...".format(d['deviceId'], d['dataLength']))
-                    r = botengine.send_data_request(d['url'], timeout=60, stream=True)
-                    events[reference][d['deviceId']] = lz4.block.decompress(r.content, uncompressed_size=d['dataLength'])
+                return
 
+            # Files are downloaded concurrently and decompressed into a local cache, and microservices read the rows from there
+            for reference, value in datarequests.download(botengine, data).items():
                 data_events = {}
+                for device_id, content in value.items():
+                    data_events[controller.get_device(device_id)] = content
 
-                for reference, value in events.items():
-                    if reference not in data_events:
-                        data_events[reference] = {}
-
-                    for device_id, decompressed_content in value.items():
-                        data_events[reference][controller.get_device(device_id)] = decompressed_content
-
-                for reference in data_events:
-                    controller.data_request_ready(botengine, reference, data_events[reference])
+                controller.data_request_ready(botengine, reference, data_events)
 
 #===============================================================================
 # Location Intelligence Timers
@@ -509,8 +489,6 @@ def start_location_intelligence_timer(botengine, seconds, intelligence_id, argum
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger(f"{__name__}").info(">start_location_intelligence_timer({}, {})".format(seconds, reference))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.start_timer_s(int(seconds), _location_intelligence_fired, (intelligence_id, argument), reference)
 
 def start_location_intelligence_timer_ms(botengine, milliseconds, intelligence_id, argument, reference):
@@ -523,8 +501,6 @@ def start_location_intelligence_timer_ms(botengine, milliseconds, intelligence_i
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger(f"{__name__}").info(">start_location_intelligence_timer_ms({}, {})".format(milliseconds, reference))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.start_timer_ms(int(milliseconds), _location_intelligence_fired, (intelligence_id, argument), reference)
 
 def set_location_intelligence_alarm(botengine, timestamp_ms, intelligence_id, argument, reference):
@@ -537,8 +513,6 @@ def set_location_intelligence_alarm(botengine, timestamp_ms, intelligence_id, ar
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger(f"{__name__}").info(">set_location_intelligence_alarm({})".format(timestamp_ms))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.set_alarm(int(timestamp_ms), _location_intelligence_fired, (intelligence_id, argument), reference)
     
 def cancel_location_intelligence_timers(botengine, reference):
@@ -594,8 +568,6 @@ def start_device_intelligence_timer(botengine, seconds, intelligence_id, argumen
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger(f"{__name__}").info(">start_device_intelligence_timer({}, {})".format(seconds, reference))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.start_timer_s(int(seconds), _device_intelligence_fired, (intelligence_id, argument), reference)
 
 def start_device_intelligence_timer_ms(botengine, milliseconds, intelligence_id, argument, reference):
@@ -608,8 +580,6 @@ def start_device_intelligence_timer_ms(botengine, milliseconds, intelligence_id,
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger(f"{__name__}").info(">start_device_intelligence_timer_ms({}, {})".format(milliseconds, reference))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.start_timer_ms(int(milliseconds), _device_intelligence_fired, (intelligence_id, argument), reference)
 
 
@@ -623,8 +593,6 @@ def set_device_intelligence_alarm(botengine, timestamp_ms, intelligence_id, argu
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger(f"{__name__}").info(">set_device_intelligence_alarm({})".format(timestamp_ms))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.set_alarm(int(timestamp_ms), _device_intelligence_fired, (intelligence_id, argument), reference)
     
 def cancel_device_intelligence_timers(botengine, reference):
@@ -19,6 +19,9 @@ from devices.lock.lock import LockDevice
 
 import utilities.utilities as utilities
 
+# Device classes that contribute to occupancy confidence
+OCCUPANCY_DEVICE_CLASSES = (MotionDevice, VayyarDevice, EntryDevice, LockDevice)
+
 
 class OccupancyConfidenceStateMachine:
 
@@ -36,6 +39,18 @@ class OccupancyConfidenceStateMachine:
 
         self.home_reason = None
 
+        # Points each device contributed, kept between updates so only the devices that changed are evaluated again
+        # { 'device_id': ( revision, ( away_motion_points, away_entry_points, home_motion_points, home_entry_points ) ) }
+        self._device_points = {}
+
+    def __getstate__(self):
+        """
+        Device points are recomputed on demand, don't save them
+        """
+        state = self.__dict__.copy()
+        state.pop("_device_points", None)
+        return state
+
     def update_away_confidence_state(self, botengine, location_object):
         """
         Update the confidence state based on the devices we installed.
@@ -45,24 +60,9 @@ class OccupancyConfidenceStateMachine:
         confidence_motion_points = 0
         confidence_entry_points = 0
 
-        for device_id in location_object.devices:
-            device = location_object.devices[device_id]
-            if not device.is_connected:
-                continue
-
-            if isinstance(device, MotionDevice):
-                if device.is_goal_id(MotionDevice.GOAL_MOTION_PROTECT_HOME):
-                    confidence_motion_points += 1
-
-            elif isinstance(device, VayyarDevice):
-                confidence_motion_points += 1
-
-            elif isinstance(device, EntryDevice):
-                if device.is_goal_id(EntryDevice.GOAL_PERIMETER_NORMAL):
-                    confidence_entry_points += 1
-
-            elif isinstance(device, LockDevice):
-                confidence_entry_points += 1
+        for points in self._points(location_object):
+            confidence_motion_points += points[0]
+            confidence_entry_points += points[1]
 
         if confidence_motion_points == 0 and confidence_entry_points == 0:
             state = CONFIDENCE_OFFLINE
@@ -100,24 +100,9 @@ class OccupancyConfidenceStateMachine:
         confidence_motion_points = 0
         confidence_entry_points = 0
 
-        for device_id in location_object.devices:
-            device = location_object.devices[device_id]
-            if not device.is_connected:
-                continue
-
-            if isinstance(device, MotionDevice):
-                if not device.is_goal_id(MotionDevice.GOAL_MOTION_PROTECT_HOME):
-                    continue
-                confidence_motion_points += 1
-
-            elif isinstance(device, VayyarDevice):
-                confidence_motion_points += 1
-
-            elif isinstance(device, EntryDevice):
-                confidence_entry_points += 1
-
-            elif isinstance(device, LockDevice):
-                confidence_entry_points += 1
+        for points in self._points(location_object):
+            confidence_motion_points += points[2]
+            confidence_entry_points += points[3]
 
         if confidence_motion_points == 0 and confidence_entry_points == 0:
             state = CONFIDENCE_OFFLINE
@@ -155,3 +140,58 @@ class OccupancyConfidenceStateMachine:
     def is_away_confidence_good(self):
         return self.away_confidence_state > CONFIDENCE_LOW
 
+    def _points(self, location_object):
+        """
+        Points of each occupancy device in the location, only evaluating the devices that changed since the last update
+        :param location_object: Location object
+        :return: List of ( away_motion_points, away_entry_points, home_motion_points, home_entry_points ) for each device
+        """
+        device_points = getattr(self, "_device_points", None)
+        if device_points is None:
+            device_points = self._device_points = {}
+
+        devices = location_object.get_devices_by_class(OCCUPANCY_DEVICE_CLASSES)
+        if len(device_points) > len(devices):
+            # Forget deleted devices
+            device_ids = set(device.device_id for device in devices)
+            for device_id in [x for x in device_points if x not in device_ids]:
+                del device_points[device_id]
+
+        points = []
+        for device in devices:
+            revision = location_object.get_device_revision(device)
+            cached = device_points.get(device.device_id)
+            if cached is None or cached[0] != revision:
+                cached = device_points[device.device_id] = (revision, _occupancy_points(device))
+            points.append(cached[1])
+
+        return points
+
+
+def _occupancy_points(device):
+    """
+    Points a single device contributes to the away and home confidence
+    :param device: Device object
+    :return: ( away_motion_points, away_entry_points, home_motion_points, home_entry_points )
+    """
+    if not device.is_connected:
+        return (0, 0, 0, 0)
+
+    if isinstance(device, MotionDevice):
+        if device.is_goal_id(MotionDevice.GOAL_MOTION_PROTECT_HOME):
+            return (1, 0, 1, 0)
+        return (0, 0, 0, 0)
+
+    elif isinstance(device, VayyarDevice):
+        return (1, 0, 1, 0)
+
+    elif isinstance(device, EntryDevice):
+        if device.is_goal_id(EntryDevice.GOAL_PERIMETER_NORMAL):
+            return (0, 1, 0, 1)
+        return (0, 0, 0, 1)
+
+    elif isinstance(device, LockDevice):
+        return (0, 1, 0, 1)
+
+    return (0, 0, 0, 0)
+
@@ -17,6 +17,9 @@ from devices.vayyar.vayyar import VayyarDevice
 
 import utilities.utilities as utilities
 
+# Device classes that contribute to sleep confidence
+SLEEP_DEVICE_CLASSES = (MotionDevice, VayyarDevice)
+
 
 class SleepConfidenceStateMachine:
 
@@ -30,6 +33,18 @@ class SleepConfidenceStateMachine:
         # Reason for the confidence state
         self.reason = None
 
+        # What each device contributed, kept between updates so only the devices that changed are evaluated again
+        # { 'device_id': ( revision, ( last_measurement_timestamp_ms, in_bedroom ) or None ) }
+        self._device_contributions = {}
+
+    def __getstate__(self):
+        """
+        Device contributions are recomputed on demand, don't save them
+        """
+        state = self.__dict__.copy()
+        state.pop("_device_contributions", None)
+        return state
+
     def update_confidence_state(self, botengine, location_object):
         """
         Update the confidence state based on the devices we installed.
@@ -41,47 +56,21 @@ class SleepConfidenceStateMachine:
         confidence_in_bedroom_points = 0
         confidence_out_bedroom_points = 0
 
-        for device_id in location_object.devices:
-            device = location_object.devices[device_id]
-            if not device.is_connected:
+        for contribution in self._contributions(botengine, location_object):
+            if contribution is None:
                 continue
 
-            if isinstance(device, MotionDevice):
-                if not device.is_goal_id(MotionDevice.GOAL_MOTION_PROTECT_HOME):
-                    continue
-
-                confidence_normal_points += 1
-                
-                if MotionDevice.MEASUREMENT_NAME_STATUS in device.measurements:
-                    if botengine.get_timestamp() - device.measurements[MotionDevice.MEASUREMENT_NAME_STATUS][0][1] >= (utilities.ONE_HOUR_MS * 12):
-                        confidence_timeout_exceeded = True
-                    else:
-                        confidence_timeout_exceeded = False
-                else:
-                    confidence_timeout_exceeded = True
-                
-                if device.is_in_bedroom(botengine):
-                    confidence_in_bedroom_points += 1
-
-                else:
-                    confidence_out_bedroom_points += 1
+            last_measurement_timestamp_ms, in_bedroom = contribution
+            confidence_normal_points += 1
 
-            elif isinstance(device, VayyarDevice):
-                confidence_normal_points += 1
+            # The last device decides whether measurements are too old
+            confidence_timeout_exceeded = last_measurement_timestamp_ms is None or botengine.get_timestamp() - last_measurement_timestamp_ms >= (utilities.ONE_HOUR_MS * 12)
 
-                if VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET in device.measurements:
-                    if botengine.get_timestamp() - device.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET][0][1] >= (utilities.ONE_HOUR_MS * 12):
-                        confidence_timeout_exceeded = True
-                    else:
-                        confidence_timeout_exceeded = False
-                else:
-                    confidence_timeout_exceeded = True
-                    
-                if device.is_in_bedroom(botengine):
-                    confidence_in_bedroom_points += 1
+            if in_bedroom:
+                confidence_in_bedroom_points += 1
 
-                else:
-                    confidence_out_bedroom_points += 1
+            else:
+                confidence_out_bedroom_points += 1
 
         if confidence_normal_points == 0:
             state = CONFIDENCE_OFFLINE
@@ -120,3 +109,56 @@ class SleepConfidenceStateMachine:
 
     def current_confidence(self):
         return self.state, self.reason
+
+    def _contributions(self, botengine, location_object):
+        """
+        Contribution of each sleep device in the location, only evaluating the devices that changed since the last update
+        :param botengine: BotEngine environment
+        :param location_object: Location object
+        :return: List of ( last_measurement_timestamp_ms, in_bedroom ) for each device, or None for devices that don't contribute
+        """
+        device_contributions = getattr(self, "_device_contributions", None)
+        if device_contributions is None:
+            device_contributions = self._device_contributions = {}
+
+        devices = location_object.get_devices_by_class(SLEEP_DEVICE_CLASSES)
+        if len(device_contributions) > len(devices):
+            # Forget deleted devices
+            device_ids = set(device.device_id for device in devices)
+            for device_id in [x for x in device_contributions if x not in device_ids]:
+                del device_contributions[device_id]
+
+        contributions = []
+        for device in devices:
+            revision = location_object.get_device_revision(device)
+            cached = device_contributions.get(device.device_id)
+            if cached is None or cached[0] != revision:
+                cached = device_contributions[device.device_id] = (revision, _sleep_contribution(botengine, device))
+            contributions.append(cached[1])
+
+        return contributions
+
+
+def _sleep_contribution(botengine, device):
+    """
+    What a single device contributes to the sleep confidence
+    :param botengine: BotEngine environment
+    :param device: Device object
+    :return: ( last_measurement_timestamp_ms, in_bedroom ), or None if the device doesn't contribute
+    """
+    if not device.is_connected:
+        return None
+
+    if isinstance(device, MotionDevice):
+        if not device.is_goal_id(MotionDevice.GOAL_MOTION_PROTECT_HOME):
+            return None
+        parameter = MotionDevice.MEASUREMENT_NAME_STATUS
+
+    else:
+        parameter = VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET
+
+    last_measurement_timestamp_ms = None
+    if parameter in device.measurements:
+        last_measurement_timestamp_ms = device.measurements[parameter][0][1]
+
+    return last_measurement_timestamp_ms, device.is_in_bedroom(botengine)
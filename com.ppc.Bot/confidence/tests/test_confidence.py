@@ -864,3 +864,67 @@ class TestConfidence():
         model_under_test.update_confidence_state(botengine, location_object)
 
         assert model_under_test.current_confidence() == (CONFIDENCE_HIGH, "We have high confidence on the sleep service.")
+
+    def test_confidence_device_index(self):
+        """
+        A location with many devices only evaluates the devices that changed
+        :return:
+        """
+        import confidence.occupancy_confidence_machine as occupancy_confidence_machine
+
+        botengine = BotEnginePyTest({})
+
+        location_object = Location(botengine, 0)
+        location_object.initialize(botengine)
+
+        # 40 Motion (1 protecting the home) / 8 Entry (disconnected)
+        for i in range(40):
+            motion_device = MotionDevice(botengine, location_object, "M{}".format(i), 10038, "")
+            motion_device.is_connected = True
+            motion_device.goal_id = MotionDevice.GOAL_MOTION_PROTECT_HOME if i == 0 else None
+            location_object.add_device(botengine, motion_device)
+
+        for i in range(8):
+            entry_device = EntryDevice(botengine, location_object, "E{}".format(i), 10014, "")
+            entry_device.is_connected = False
+            location_object.add_device(botengine, entry_device)
+
+        assert len(location_object.get_devices_by_class(MotionDevice)) == 40
+        assert len(location_object.get_devices_by_class((MotionDevice, EntryDevice))) == 48
+        assert location_object.get_devices_by_class(VayyarDevice) == []
+
+        evaluated = []
+        occupancy_points = occupancy_confidence_machine._occupancy_points
+        occupancy_confidence_machine._occupancy_points = lambda device: evaluated.append(device.device_id) or occupancy_points(device)
+
+        try:
+            model_under_test = occupancy_confidence_machine.OccupancyConfidenceStateMachine()
+            model_under_test.update_away_confidence_state(botengine, location_object)
+            assert model_under_test.current_away_confidence()[0] == CONFIDENCE_LOW
+            assert len(evaluated) == 48
+
+            # Nothing changed
+            del evaluated[:]
+            model_under_test.update_away_confidence_state(botengine, location_object)
+            model_under_test.update_home_confidence_state(botengine, location_object)
+            assert evaluated == []
+
+            # One entry sensor connects
+            location_object.devices["E3"].is_connected = True
+            location_object.device_updated(location_object.devices["E3"])
+            model_under_test.update_away_confidence_state(botengine, location_object)
+            assert evaluated == ["E3"]
+            assert model_under_test.current_away_confidence()[0] == CONFIDENCE_MEDIUM
+
+            # A new vayyar is added, and the entry sensor is deleted
+            del evaluated[:]
+            vayyar_device = VayyarDevice(botengine, location_object, "V", 2000, "")
+            vayyar_device.is_connected = True
+            location_object.add_device(botengine, vayyar_device)
+            location_object.delete_device(botengine, "E3")
+            model_under_test.update_away_confidence_state(botengine, location_object)
+            assert evaluated == ["V"]
+            assert model_under_test.current_away_confidence()[0] == CONFIDENCE_MEDIUM
+
+        finally:
+            occupancy_confidence_machine._occupancy_points = occupancy_points
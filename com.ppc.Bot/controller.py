@@ -19,6 +19,12 @@ from devices.button.button_linkhigh import LinkHighButtonDevice
 from devices.gateway.gateway_peoplepower_xseries import PeoplePowerXSeriesDevice
 from devices.movement.touch import TouchDevice
 
+# Device type classes found in the devices directory, extracted once per process and reused by every execution in a warm container
+_available_device_type_classes = None
+
+# Device classes for each device type from the device_index.py file generated with the bot, False if the bot was generated without one
+_device_index = None
+
 class Controller:
     """
     This is the main class that will coordinate all our sensors and behavior
@@ -95,7 +101,7 @@ class Controller:
             if "intelligence" != intelligence_module.split(".")[0] or len(intelligence_module.split(".")) == 1:
                 continue
             
-            botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("intelligence_module: {} - {}".format(intelligence_module, intelligence_module_statistics))
+            botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("intelligence_module: %s - %s", intelligence_module, intelligence_module_statistics)
 
             intelligence_module_package_name = intelligence_module.split(".")[1]
             # Aggregate intelligence module statistics by package name
@@ -188,20 +194,19 @@ class Controller:
                         device_object = None
                         continue
                 
-                # Load any available device type class within this bundle
-                device_type_classes = self._extract_available_device_type_classes(botengine)
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("controller: Extracted available device type classes")
-
                 if device_object is None:
                     # Instantiate the device object based on the device type
-                    for device_type_class in device_type_classes:
-                        if device_type in device_type_class.DEVICE_TYPES:
-                            device_object = device_type_class(botengine, location_object, device_id, device_type, device_desc, precache_measurements)
-                            break
+                    device_type_class = self._get_device_type_class(botengine, device_type)
+                    if device_type_class is not None:
+                        device_object = device_type_class(botengine, location_object, device_id, device_type, device_desc, precache_measurements)
+
                     if device_object is None:
                         botengine.get_logger(f"{__name__}.{__class__.__name__}").warn("Unsupported device type: " + str(device_type) + " ('" + device_desc + "')")
                         continue
 
+                # What the device looked like before this access block, to tell the location's device index if it changed
+                previous_access = (device_object.is_connected, device_object.goal_id, device_object.description, device_object.can_read, device_object.can_control)
+
                 if 'connected' in item['device']:
                     device_object.is_connected = item['device']['connected']
                 else:
@@ -232,6 +237,9 @@ class Controller:
                 botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("controller: Synchronizing device")
                 self.sync_device(botengine, location_id, device_id, device_object)
 
+                if previous_access != (device_object.is_connected, device_object.goal_id, device_object.description, device_object.can_read, device_object.can_control):
+                    self.locations[location_id].device_updated(device_object)
+
                 if hasattr(device_object, "latitude") and hasattr(device_object, "longitude"):
                     if 'latitude' in item['device'] and 'longitude' in item['device']:
                         if float(item['device']['latitude']) != device_object.latitude or float(item['device']['longitude']) != device_object.longitude:
@@ -425,7 +433,7 @@ class Controller:
         A botengine.request_data() request is ready
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param device_csv_dict: { 'device_id': 'csv data string' }
+        :param device_csv_dict: { device_object: DataRequestContent }
         """
         for location_id in self.locations:
             self.locations[location_id].data_request_ready(botengine, reference, device_csv_dict)
@@ -489,14 +497,13 @@ class Controller:
         """
         botengine.get_logger(f"{__name__}.{__class__.__name__}").info("Device Intelligence Timer Fired: " + str(intelligence_id))
         for location_id in self.locations:
-            for device_id in self.locations[location_id].devices:
-                for intelligence_module_name in self.locations[location_id].devices[device_id].intelligence_modules:
-                    if intelligence_id == self.locations[location_id].devices[device_id].intelligence_modules[intelligence_module_name].intelligence_id:
-                        import time
-                        t = time.time()
-                        self.locations[location_id].devices[device_id].intelligence_modules[intelligence_module_name].timer_fired(botengine, argument)
-                        self.locations[location_id].devices[device_id].intelligence_modules[intelligence_module_name].track_statistics(botengine, (time.time() - t) * 1000)
-                        return
+            microservice_object = self.locations[location_id].get_microservice_by_id(intelligence_id)
+            if microservice_object is not None:
+                import time
+                t = time.time()
+                microservice_object.timer_fired(botengine, argument)
+                microservice_object.track_statistics(botengine, (time.time() - t) * 1000)
+                return
 
     def run_intelligence_schedules(self, botengine, schedule_id):
         """
@@ -589,17 +596,50 @@ class Controller:
         # Notify all locations
         self.new_version(botengine)
 
+    def _get_device_type_class(self, botengine, device_type):
+        """
+        Find the class that models a device type.
+        The device_index.py file generated with the bot tells us which module to import, so only the classes for the devices
+        in this location ever get imported. Without that file, we search the devices directory.
+        :param botengine: BotEngine environment
+        :param device_type: Device type
+        :return: Device class, or None if this bot doesn't support the device type
+        """
+        global _device_index
+        if _device_index is None:
+            try:
+                import device_index
+                _device_index = device_index.DEVICE_TYPES
+
+            except ImportError:
+                _device_index = False
+
+        if _device_index is False:
+            for device_type_class in self._extract_available_device_type_classes(botengine):
+                if device_type in device_type_class.DEVICE_TYPES:
+                    return device_type_class
+            return None
+
+        import importlib
+        for entry in _device_index.get(str(device_type), []):
+            try:
+                return getattr(importlib.import_module(entry['module']), entry['class'])
+
+            except Exception as e:
+                botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("controller: Cannot import device class {}.{}: {}".format(entry['module'], entry['class'], e))
+
+        return None
+
     def _extract_available_device_type_classes(self, botengine):
         """
         Extract all available device type classes from a module
         :return List of device type classes
         """
-        # 
-        
-        # Efficiently grab this information once for bot playback
-        if botengine.playback and hasattr(self, "available_device_type_classes"):
-            return self.available_device_type_classes
-        
+        # Efficiently grab this information once per process
+        global _available_device_type_classes
+        if _available_device_type_classes is not None:
+            return _available_device_type_classes
+
         available_device_type_classes = []
         # Walk through our devices directory
         import os
@@ -635,6 +675,5 @@ class Controller:
                             if hasattr(class_, "DEVICE_TYPES") and class_ not in available_device_type_classes:
                                 available_device_type_classes.append(class_)
 
-        if botengine.playback:
-            self.available_device_type_classes = available_device_type_classes
+        _available_device_type_classes = available_device_type_classes
         return available_device_type_classes
\ No newline at end of file
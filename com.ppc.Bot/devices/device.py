@@ -10,6 +10,7 @@ file 'LICENSE.txt', which is part of this source code package.
 import utilities.utilities as utilities
 import index
 import importlib
+from devices.measurements import MeasurementHistory
 
 # Maximum number of attempts for any one command
 MAX_ATTEMPTS = 20
@@ -92,7 +93,7 @@ class Device:
         self.description = device_description.strip()
         
         # Measurements for each parameter, newest measurements at index 0
-        # self.measurements["parameterName"] = [ ( newest_value, newest_timestamp ), ( value, timestamp ), ... ]
+        # self.measurements["parameterName"] = MeasurementHistory: [ ( newest_value, newest_timestamp ), ( value, timestamp ), ... ]
         self.measurements = {}
 
         # Last alert received { "alert_type": { "parameter_one" : "value_one", "timestamp_ms": timestamp_ms_set_locally } }
@@ -203,6 +204,11 @@ class Device:
         if not hasattr(self, "is_goal_changed"):
             self.is_goal_changed = False
 
+        # Measurements used to be saved as lists of tuples
+        for name in list(self.measurements.keys()):
+            if not isinstance(self.measurements[name], MeasurementHistory):
+                self.measurements[name] = MeasurementHistory(self.measurements[name])
+
         # Synchronize device microservices
         print("device.py - Synchronizing device microservices for device type: " + str(self.device_type))
         print("device.py - Device microservices: " + str(index.MICROSERVICES['DEVICE_MICROSERVICES']))
@@ -408,8 +414,8 @@ class Device:
                     botengine.get_logger(f"{__name__}.{__class__.__name__}").error("device.py: Measurement has no value: " + str(measure))
                     continue
 
-                value = utilities.normalize_measurement(measure['value'])
                 param_name = measure['name']
+                value = utilities.normalize_measurement(measure['value'], param_name)
                 time = measure['time']
 
                 # If there's an index number, we just augment the parameter name with the index number to make it a unique parameter name.  param_name.index
@@ -473,7 +479,7 @@ class Device:
                             botengine.get_logger(f"{__name__}.{__class__.__name__}").info("device.py: Updated parameter provided no updated value: {}".format(measure))
                             continue
                             
-                        value = utilities.normalize_measurement(measure['value'])
+                        value = utilities.normalize_measurement(measure['value'], param_name)
 
                         # If there's an index number, we just augment the parameter name with the index number to make it a unique parameter name.  param_name.index
                         if 'index' in measure:
@@ -484,6 +490,10 @@ class Device:
                         if is_param_get_new_value and not param_name in self.last_updated_params:
                             self.last_updated_params.append(param_name)
 
+        # Models computed from this device, like the confidence state machines, evaluate it again
+        if hasattr(self.location_object, "device_updated"):
+            self.location_object.device_updated(self)
+
         # List of devices (this one and its proxy) that were updated, to later synchronize with the location outside of this object
         updated_devices = []
         updated_metadata = []
@@ -548,30 +558,19 @@ class Device:
         :param timestamp: Timestamp in milliseconds
         :return:
         """
-        measurement_updated = False
-        if name not in self.measurements:
-            # Create the measurement
-            self.measurements[name] = []
+        history = self.measurements.get(name)
+        if not isinstance(history, MeasurementHistory):
+            # Create the measurement history, or convert a list of measurements that was set directly
+            history = MeasurementHistory(history)
+            self.measurements[name] = history
 
-            measurement_updated = True
+        measurement_updated = history.add(value, timestamp)
+        if measurement_updated:
             self.measurement_odometer += 1
-            self.measurements[name].insert(0, (value, timestamp))
-        else:
-            is_new_measurement = True
-            for i in range(len(self.measurements[name])):
-                if value == self.measurements[name][i][0] and timestamp == self.measurements[name][i][1]:
-                    is_new_measurement = False
-                    break
-
-            if is_new_measurement:
-                measurement_updated = True
-                self.measurement_odometer += 1
-                self.measurements[name].insert(0, (value, timestamp))
 
         # Auto garbage-collect
         if self.enforce_cache_size:
-            while (len(self.measurements[name]) > 1) and self.measurements[name][-1][1] <= botengine.get_timestamp() - TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS:
-                del(self.measurements[name][-1])
+            history.expire(botengine.get_timestamp() - TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS)
 
         return measurement_updated
 
@@ -596,16 +595,24 @@ class Device:
         self.communications_odometer = 0
         self.measurement_odometer = 0
 
-    def get_measurement_history(self, botengine, param_name):
+    def get_measurement_history(self, botengine, param_name, oldest_timestamp_ms=None, newest_timestamp_ms=None):
         """
         Get the measurement history for this parameter, newest measurements first
         [ ( value, timestamp), (value, timestamp) ]
         :param botengine: BotEngine environment
         :param param_name: Parameter name
+        :param oldest_timestamp_ms: Optional oldest timestamp in milliseconds to include
+        :param newest_timestamp_ms: Optional newest timestamp in milliseconds to include
         :return: List of measurements history tuples, or None if the measurement doesn't exist
         """
         if param_name in self.measurements:
-            return self.measurements[param_name]
+            if oldest_timestamp_ms is None and newest_timestamp_ms is None:
+                return self.measurements[param_name]
+
+            history = self.measurements[param_name]
+            if not isinstance(history, MeasurementHistory):
+                history = MeasurementHistory(history)
+            return history.between(oldest_timestamp_ms, newest_timestamp_ms)
         return None
 
     #===========================================================================
@@ -788,7 +795,7 @@ class Device:
         :param ordered:
         :return:
         """
-        botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("{}: request_data() - Requesting data from {} to {} for parameters {}".format(self.description, oldest_timestamp_ms, newest_timestamp_ms, param_name_list))
+        botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("%s: request_data() - Requesting data from %s to %s for parameters %s", self.description, oldest_timestamp_ms, newest_timestamp_ms, param_name_list)
         if oldest_timestamp_ms is None:
             oldest_timestamp_ms = botengine.get_timestamp() - utilities.ONE_MONTH_MS * 6
         
@@ -866,8 +873,8 @@ class Device:
                 if 'value' not in measure:
                     continue
 
-                value = utilities.normalize_measurement(measure['value'])
                 param_name = measure['name']
+                value = utilities.normalize_measurement(measure['value'], param_name)
                 time = int(measure['time'])
 
                 # If there's an index number, we just augment the parameter name with the index number to make it a unique parameter name.  param_name.index
@@ -979,7 +986,7 @@ def _attempt_reliable_delivery(botengine, args):
     
     logger = botengine.get_logger(f"{__name__}")
     
-    logger.debug("RELIABILITY: Queue looks like " + str(queue))
+    logger.debug("RELIABILITY: Queue looks like %s", queue)
 
     import copy
     for device_id in copy.copy(queue):
@@ -998,7 +1005,7 @@ def _attempt_reliable_delivery(botengine, args):
                     # No longer have access to the device
                     params_to_remove.append(param_name)
 
-                logger.debug("RELIABILITY: measurements since " + str(timestamp) + ": " + str(measures))
+                logger.debug("RELIABILITY: measurements since %s: %s", timestamp, measures)
 
                 if measures is not None:
                     if 'measures' in measures:
@@ -1033,7 +1040,7 @@ def _attempt_reliable_delivery(botengine, args):
         else:
             del(queue[device_id])
                 
-    logger.debug("RELIABILITY: Cleaned queue looks like " + str(queue))
+    logger.debug("RELIABILITY: Cleaned queue looks like %s", queue)
         
     botengine.save_variable(RELIABILITY_VARIABLE_NAME, queue)
     
@@ -8,8 +8,12 @@ file 'LICENSE.txt', which is part of this source code package.
 '''
 
 from devices.device import Device
+from devices.health.vitals import VitalAggregator
 import utilities.utilities as utilities
 
+import datetime
+import pytz
+
 class HealthDevice(Device):
     """
     Health Device
@@ -87,7 +91,28 @@ class HealthDevice(Device):
     SLEEP_ANALYSIS_INDEX_ASLEEP_DEEP  = 4 # The user is in deep sleep.
     SLEEP_ANALYSIS_INDEX_ASLEEP_REM   = 5 # The user is in REM sleep.
 
+    # Vital signs we aggregate, with their plausible range and the resolution of their percentiles: (minimum, maximum, resolution)
+    # Measurements outside the plausible range are counted as outliers and left out of the statistics.
+    VITAL_RANGES = {
+        MEASUREMENT_NAME_HEART_RATE: (20, 250, 1),
+        MEASUREMENT_NAME_BREATHING_RATE: (2, 60, 0.5),
+        MEASUREMENT_NAME_SPO2: (50, 100, 0.5),
+        MEASUREMENT_NAME_BLOOD_PRESSURE_SYSTOLIC: (50, 260, 1),
+        MEASUREMENT_NAME_BLOOD_PRESSURE_DIASTOLIC: (30, 160, 1),
+        MEASUREMENT_NAME_HR_VARIABILITY: (0, 300, 1),
+        MEASUREMENT_NAME_PERFUSION_INDEX: (0, 20, 0.1),
+        MEASUREMENT_NAME_PLETH_VARIABILITY_INDEX: (0, 100, 1),
+        MEASUREMENT_NAME_HEMATOCRIT: (10, 70, 0.5),
+        MEASUREMENT_NAME_HEMOGLOBIN: (3, 25, 0.1),
+    }
+
     def __init__(self, botengine, location_object, device_id, device_type, device_description, precache_measurements=True):
+        # Rolling windows and daily summaries of each vital sign: { parameter name: VitalAggregator }
+        self.vitals = {}
+
+        # Tuple (start_ms, end_ms, day) of the last local day we looked up for a vital sign measurement
+        self.vitals_day = None
+
         Device.__init__(self, botengine, location_object, device_id, device_type, device_description, precache_measurements=precache_measurements)
 
         # Distance moved in meters
@@ -118,7 +143,13 @@ class HealthDevice(Device):
         :param botengine: BotEngine environment
         """
         Device.new_version(self, botengine)
-        return
+
+        # Added October 17, 2026
+        if not hasattr(self, 'vitals'):
+            self.vitals = {}
+
+        if not hasattr(self, 'vitals_day'):
+            self.vitals_day = None
         
     def get_device_type_name(self):
         """
@@ -151,6 +182,108 @@ class HealthDevice(Device):
         """
         return "heartbeat"
 
+    def add_measurement(self, botengine, name, value, timestamp):
+        """
+        Overriding the method from the parent to add a measurement,
+        in order to aggregate vital signs as they arrive.
+        :param botengine: BotEngine environment
+        :param name: Parameter name
+        :param value: Parameter value
+        :param timestamp: Timestamp in milliseconds
+        :return: True if this is a new measurement
+        """
+        measurement_updated = Device.add_measurement(self, botengine, name, value, timestamp)
+
+        if measurement_updated and name in self.VITAL_RANGES:
+            if name in self.vitals:
+                self.vitals[name].add(value, timestamp, self._local_day(botengine, timestamp))
+
+            else:
+                # Learns this measurement along with the ones we already have
+                self.get_vital(botengine, name)
+
+        return measurement_updated
+
+    #===========================================================================
+    # Vital signs
+    #===========================================================================
+    def get_vital(self, botengine, name):
+        """
+        Get the rolling window and daily summaries of a vital sign.
+        The first time we ask for a vital sign, it learns the measurements we already have.
+        :param botengine: BotEngine environment
+        :param name: Parameter name of the vital sign, like HealthDevice.MEASUREMENT_NAME_HEART_RATE
+        :return: VitalAggregator, or None if this parameter isn't a vital sign we aggregate
+        """
+        if name not in self.VITAL_RANGES:
+            return None
+
+        vital = self.vitals.get(name)
+        if vital is None:
+            vital = VitalAggregator(*self.VITAL_RANGES[name])
+            self.vitals[name] = vital
+
+            if name in self.measurements:
+                for value, timestamp_ms in reversed(list(self.measurements[name])):
+                    vital.add(value, timestamp_ms, self._local_day(botengine, timestamp_ms))
+
+        return vital
+
+    def get_vital_window_summary(self, botengine, name):
+        """
+        Summarize a vital sign over its rolling window, up to now
+        :param botengine: BotEngine environment
+        :param name: Parameter name of the vital sign, like HealthDevice.MEASUREMENT_NAME_HEART_RATE
+        :return: Dictionary with the count, min, max, mean, p10, p50 and p90 values, or None if there are no measurements in the window
+        """
+        vital = self.get_vital(botengine, name)
+        if vital is None:
+            return None
+
+        return vital.window_summary(botengine.get_timestamp())
+
+    def get_daily_vitals_summary(self, botengine, day=None):
+        """
+        Summarize each vital sign for a local day, ready for the daily report
+        :param botengine: BotEngine environment
+        :param day: Local day like 20261017, default is today
+        :return: Dictionary of { parameter name: summary dictionary } for each vital sign with a summary for that day
+        """
+        if day is None:
+            day = self._local_day(botengine, botengine.get_timestamp())
+
+        summaries = {}
+        for name in self.VITAL_RANGES:
+            if name in self.vitals or name in self.measurements:
+                summary = self.get_vital(botengine, name).daily_summary(day)
+                if summary is not None:
+                    summaries[name] = summary
+
+        return summaries
+
+    def _local_day(self, botengine, timestamp_ms):
+        """
+        Local day of a timestamp. The boundaries of the last day we looked up are kept so most measurements don't convert timezones.
+        :param botengine: BotEngine environment
+        :param timestamp_ms: Timestamp in milliseconds
+        :return: Local day like 20261017
+        """
+        if self.vitals_day is not None and self.vitals_day[0] <= timestamp_ms < self.vitals_day[1]:
+            return self.vitals_day[2]
+
+        timezone = pytz.utc
+        if self.location_object is not None:
+            timezone = pytz.timezone(self.location_object.get_local_timezone_string(botengine))
+
+        # Localize midnight on both ends, days are 23 or 25 hours long when daylight saving time changes
+        date = datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, timezone).date()
+        start_ms = int(timezone.localize(datetime.datetime.combine(date, datetime.time())).timestamp() * 1000)
+        end_ms = int(timezone.localize(datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time())).timestamp() * 1000)
+
+        day = date.year * 10000 + date.month * 100 + date.day
+        self.vitals_day = (start_ms, end_ms, day)
+        return day
+
     def did_update_bed_status(self, botengine):
         """
         Determine if we updated the bed status in this execution
@@ -0,0 +1,365 @@
+'''
+Created on October 17, 2026
+
+Rolling windows and daily summaries of vital signs
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+from collections import deque
+
+import math
+
+import utilities.utilities as utilities
+
+# Percentiles included in each summary
+SUMMARY_PERCENTILES = (10, 50, 90)
+
+# Default duration of the rolling window
+DEFAULT_WINDOW_MS = utilities.ONE_HOUR_MS
+
+# Default number of daily summaries to keep before today
+DEFAULT_TOTAL_DAYS = 7
+
+# Default number of days before today that still count late measurements. Older days are reduced to their summary.
+DEFAULT_LATE_DAYS = 1
+
+
+class VitalHistogram(object):
+    """
+    Sparse histogram of a vital sign across its plausible range, used to answer percentiles.
+
+    Values are counted into bins as wide as the vital's resolution, so adding and removing a value is constant time,
+    and a percentile walks a bounded number of bins no matter how many values were counted. Only the bins that
+    counted something are kept, so the histogram is as small as the spread of the values.
+    """
+
+    def __init__(self, minimum, maximum, resolution):
+        """
+        :param minimum: Lowest plausible value
+        :param maximum: Highest plausible value
+        :param resolution: Width of each bin
+        """
+        self.minimum = minimum
+        self.resolution = resolution
+        self.total_bins = int(round((maximum - minimum) / resolution)) + 1
+
+        # { bin index: count }, without the bins that are empty
+        self.bins = {}
+        self.total = 0
+
+    def _bin(self, value):
+        """
+        :param value: Value
+        :return: Index of the bin for this value
+        """
+        # Values on a bin edge like 0.3 / 0.1 = 2.9999999999999996 belong to the bin above
+        return min(max(int(math.floor((value - self.minimum) / self.resolution + 1e-9)), 0), self.total_bins - 1)
+
+    def add(self, value):
+        """
+        Count a value
+        :param value: Value
+        """
+        index = self._bin(value)
+        self.bins[index] = self.bins.get(index, 0) + 1
+        self.total += 1
+
+    def remove(self, value):
+        """
+        Stop counting a value we counted before
+        :param value: Value
+        """
+        index = self._bin(value)
+        if self.bins[index] > 1:
+            self.bins[index] -= 1
+        else:
+            del self.bins[index]
+        self.total -= 1
+
+    def percentile(self, percent):
+        """
+        :param percent: Percentile from 0 to 100
+        :return: Lower edge of the bin containing this percentile, None if we haven't counted anything
+        """
+        if self.total == 0:
+            return None
+
+        rank = max(1, int(math.ceil(self.total * percent / 100.0)))
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen >= rank:
+                return round(self.minimum + index * self.resolution, 3)
+
+        return None
+
+
+class VitalDay(object):
+    """
+    Statistics of a vital sign for one local day
+    """
+
+    def __init__(self, day, minimum, maximum, resolution):
+        """
+        :param day: Local day like 20261017
+        :param minimum: Lowest plausible value
+        :param maximum: Highest plausible value
+        :param resolution: Resolution of the percentiles
+        """
+        self.day = day
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.outliers = 0
+        self.histogram = VitalHistogram(minimum, maximum, resolution)
+
+    def add(self, value):
+        """
+        Add a value
+        :param value: Value inside the plausible range
+        """
+        self.count += 1
+        self.total += value
+        self.histogram.add(value)
+
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def summary(self):
+        """
+        :return: Summary dictionary of this day
+        """
+        summary = _summary(self.count, self.total, self.minimum, self.maximum, self.histogram) or {"count": 0}
+        summary["day"] = self.day
+        summary["outliers"] = self.outliers
+        return summary
+
+
+class VitalAggregator(object):
+    """
+    Rolling window and daily summaries of one vital sign, updated one measurement at a time.
+
+    Measurements outside the plausible range of the vital sign are counted as outliers and left out of the statistics.
+    The rolling window keeps its sum, a histogram and monotonic queues for its minimum and maximum, so adding a measurement
+    is amortized constant time. Each local day keeps its own statistics, and we keep the summaries of the last few days.
+
+    Late measurements, like a batch a wearable backfills when it syncs, still count toward the day they belong to
+    as long as that day is within the last few late days, and toward the rolling window if they fall inside it.
+    Days before that are reduced to their summary, so we don't save their statistics with the device on every execution.
+    """
+
+    def __init__(self, minimum, maximum, resolution, window_ms=DEFAULT_WINDOW_MS, total_days=DEFAULT_TOTAL_DAYS, late_days=DEFAULT_LATE_DAYS):
+        """
+        :param minimum: Lowest plausible value
+        :param maximum: Highest plausible value
+        :param resolution: Resolution of the percentiles
+        :param window_ms: Duration of the rolling window in milliseconds
+        :param total_days: Number of daily summaries to keep before today
+        :param late_days: Number of days before today that still count late measurements
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.resolution = resolution
+        self.window_ms = window_ms
+        self.total_days = total_days
+        self.late_days = late_days
+
+        # Measurements (timestamp_ms, value) in the rolling window, oldest first
+        self.window = deque()
+
+        # Sum of the values in the rolling window
+        self.window_total = 0.0
+
+        # Histogram of the values in the rolling window
+        self.window_histogram = VitalHistogram(minimum, maximum, resolution)
+
+        # Monotonic queues of measurements (timestamp_ms, value) that can still become the rolling window's minimum and maximum
+        self.window_minimums = deque()
+        self.window_maximums = deque()
+
+        # Timestamp of the newest measurement we added
+        self.newest_timestamp_ms = None
+
+        # Statistics of the current local day
+        self.today = None
+
+        # Statistics of previous local days that still count late measurements: { day: VitalDay }
+        self.days = {}
+
+        # Summaries of the previous local days before that: { day: summary dictionary }
+        self.summaries = {}
+
+    def add(self, value, timestamp_ms, day):
+        """
+        Add a measurement
+        :param value: Measured value
+        :param timestamp_ms: Timestamp of the measurement in milliseconds
+        :param day: Local day of the measurement like 20261017
+        :return: True if the measurement was added to the statistics, False if it's an outlier or from a day that no longer counts late measurements
+        """
+        if self.today is None or day > self.today.day:
+            self._start_day(day)
+
+        statistics = self.today if day == self.today.day else self.days.get(day)
+        if statistics is None:
+            return False
+
+        try:
+            value = float(value)
+
+        except (TypeError, ValueError):
+            value = None
+
+        if value is None or not self.minimum <= value <= self.maximum:
+            statistics.outliers += 1
+            return False
+
+        statistics.add(value)
+
+        if self.newest_timestamp_ms is None or timestamp_ms >= self.newest_timestamp_ms:
+            self.newest_timestamp_ms = timestamp_ms
+            self.window.append((timestamp_ms, value))
+            self.window_total += value
+            self.window_histogram.add(value)
+            self._push_extremes(timestamp_ms, value)
+            self.expire(timestamp_ms - self.window_ms)
+
+        elif timestamp_ms > self.newest_timestamp_ms - self.window_ms:
+            self._insert_late(timestamp_ms, value)
+
+        return True
+
+    def expire(self, oldest_timestamp_ms):
+        """
+        Remove measurements at or before the given timestamp from the rolling window
+        :param oldest_timestamp_ms: Measurements at or before this timestamp are removed
+        """
+        while self.window and self.window[0][0] <= oldest_timestamp_ms:
+            timestamp_ms, value = self.window.popleft()
+            self.window_total -= value
+            self.window_histogram.remove(value)
+
+        while self.window_minimums and self.window_minimums[0][0] <= oldest_timestamp_ms:
+            self.window_minimums.popleft()
+
+        while self.window_maximums and self.window_maximums[0][0] <= oldest_timestamp_ms:
+            self.window_maximums.popleft()
+
+        if not self.window:
+            # Don't let rounding errors accumulate
+            self.window_total = 0.0
+
+    def percentile(self, percent):
+        """
+        :param percent: Percentile from 0 to 100
+        :return: Percentile of the rolling window, None if the window is empty
+        """
+        return self.window_histogram.percentile(percent)
+
+    def window_summary(self, timestamp_ms=None):
+        """
+        :param timestamp_ms: Current timestamp in milliseconds, to leave out measurements that fell out of the window since the newest one
+        :return: Summary dictionary of the rolling window, None if the window is empty
+        """
+        if timestamp_ms is not None:
+            self.expire(timestamp_ms - self.window_ms)
+
+        if not self.window:
+            return None
+
+        return _summary(len(self.window), self.window_total, self.window_minimums[0][1], self.window_maximums[0][1], self.window_histogram)
+
+    def daily_summary(self, day):
+        """
+        :param day: Local day like 20261017
+        :return: Summary dictionary of the day, None if we don't have a summary for this day
+        """
+        if self.today is not None and self.today.day == day:
+            return self.today.summary()
+
+        if day in self.days:
+            return self.days[day].summary()
+
+        return self.summaries.get(day)
+
+    def _start_day(self, day):
+        """
+        Keep the current day and start a new one
+        :param day: New local day like 20261017
+        """
+        if self.today is not None:
+            self.days[self.today.day] = self.today
+            while len(self.days) > self.late_days:
+                oldest = self.days.pop(min(self.days))
+                self.summaries[oldest.day] = oldest.summary()
+
+            while len(self.days) + len(self.summaries) > self.total_days:
+                if self.summaries:
+                    del self.summaries[min(self.summaries)]
+                else:
+                    del self.days[min(self.days)]
+
+        self.today = VitalDay(day, self.minimum, self.maximum, self.resolution)
+
+    def _push_extremes(self, timestamp_ms, value):
+        """
+        Push the newest measurement of the rolling window onto the monotonic queues of its minimum and maximum
+        :param timestamp_ms: Timestamp in milliseconds
+        :param value: Value
+        """
+        while self.window_minimums and self.window_minimums[-1][1] >= value:
+            self.window_minimums.pop()
+        self.window_minimums.append((timestamp_ms, value))
+
+        while self.window_maximums and self.window_maximums[-1][1] <= value:
+            self.window_maximums.pop()
+        self.window_maximums.append((timestamp_ms, value))
+
+    def _insert_late(self, timestamp_ms, value):
+        """
+        Insert a late measurement into the rolling window in timestamp order and rebuild the monotonic queues.
+        This walks the window, but late measurements are rare compared to the ones that arrive in order.
+        :param timestamp_ms: Timestamp in milliseconds, inside the rolling window
+        :param value: Value
+        """
+        index = len(self.window)
+        while index > 0 and self.window[index - 1][0] > timestamp_ms:
+            index -= 1
+
+        self.window.insert(index, (timestamp_ms, value))
+        self.window_total += value
+        self.window_histogram.add(value)
+
+        self.window_minimums.clear()
+        self.window_maximums.clear()
+        for measurement_timestamp_ms, measurement_value in self.window:
+            self._push_extremes(measurement_timestamp_ms, measurement_value)
+
+
+def _summary(count, total, minimum, maximum, histogram):
+    """
+    :return: Summary dictionary with the count, minimum, maximum, mean and percentiles, None if there are no values
+    """
+    if count == 0:
+        return None
+
+    summary = {
+        "count": count,
+        "min": minimum,
+        "max": maximum,
+        "mean": total / count
+    }
+
+    for percent in SUMMARY_PERCENTILES:
+        # Percentiles are bin edges, so keep them inside the values we actually saw
+        summary["p{}".format(percent)] = min(max(histogram.percentile(percent), minimum), maximum)
+
+    return summary
@@ -0,0 +1,193 @@
+'''
+Created on October 17, 2026
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Compact the ring buffer once this many expired measurements have accumulated at its start
+COMPACT_THRESHOLD = 32
+
+
+class MeasurementHistory:
+    """
+    Measurement history for a single device parameter.
+
+    Reads like the list of ( value, timestamp ) tuples a device has always kept, newest measurement at index 0:
+
+        device_object.measurements["parameterName"][0][0]     # Newest value
+        device_object.measurements["parameterName"][0][1]     # Newest timestamp
+        for value, timestamp_ms in device_object.measurements["parameterName"]: ...
+
+    Underneath, values and timestamps are stored in separate columns, oldest first, ordered by timestamp.
+    Adding a new measurement appends to the end, expiring old measurements advances the start of the buffer,
+    and time range queries use a binary search on the timestamps. When saved, the timestamps are delta-encoded
+    into a compact array.
+    """
+
+    def __init__(self, measurements=None):
+        """
+        :param measurements: Optional list of ( value, timestamp ) measurements, newest first
+        """
+        # Values, oldest first
+        self._values = []
+
+        # Timestamps in milliseconds, oldest first
+        self._timestamps = []
+
+        # Index of the oldest measurement we still hold. Everything before it has expired.
+        self._start = 0
+
+        for value, timestamp_ms in reversed(measurements or []):
+            self.add(value, timestamp_ms)
+
+    def add(self, value, timestamp_ms):
+        """
+        Add a measurement
+        :param value: Value
+        :param timestamp_ms: Timestamp in milliseconds
+        :return: True if this is a new measurement, False if we already had this value at this timestamp
+        """
+        timestamps = self._timestamps
+        if len(timestamps) == self._start or timestamp_ms > timestamps[-1]:
+            # Newest measurement
+            timestamps.append(timestamp_ms)
+            self._values.append(value)
+            return True
+
+        low = bisect_left(timestamps, timestamp_ms, self._start)
+        high = bisect_right(timestamps, timestamp_ms, low)
+        for i in range(low, high):
+            if self._values[i] == value:
+                return False
+
+        # Measurements at the same timestamp stay in the order they were added
+        timestamps.insert(high, timestamp_ms)
+        self._values.insert(high, value)
+        return True
+
+    def expire(self, oldest_timestamp_ms):
+        """
+        Remove measurements at or before the given timestamp, always keeping the newest measurement
+        :param oldest_timestamp_ms: Measurements at or before this timestamp are removed
+        """
+        start = min(bisect_right(self._timestamps, oldest_timestamp_ms, self._start), len(self._timestamps) - 1)
+        if start <= self._start:
+            return
+
+        self._start = start
+        if self._start >= COMPACT_THRESHOLD and self._start * 2 >= len(self._timestamps):
+            del self._timestamps[:self._start]
+            del self._values[:self._start]
+            self._start = 0
+
+    def between(self, oldest_timestamp_ms=None, newest_timestamp_ms=None):
+        """
+        Measurements within a time range
+        :param oldest_timestamp_ms: Oldest timestamp to include, or None for no limit
+        :param newest_timestamp_ms: Newest timestamp to include, or None for no limit
+        :return: List of ( value, timestamp ) tuples, newest first
+        """
+        low = self._start
+        if oldest_timestamp_ms is not None:
+            low = bisect_left(self._timestamps, oldest_timestamp_ms, self._start)
+
+        high = len(self._timestamps)
+        if newest_timestamp_ms is not None:
+            high = bisect_right(self._timestamps, newest_timestamp_ms, low)
+
+        return [(self._values[i], self._timestamps[i]) for i in range(high - 1, low - 1, -1)]
+
+    def newest(self):
+        """
+        :return: The newest ( value, timestamp ) tuple, or None if there are no measurements
+        """
+        if len(self._timestamps) == self._start:
+            return None
+        return self._values[-1], self._timestamps[-1]
+
+    def newest_timestamp_ms(self):
+        """
+        :return: Timestamp of the newest measurement, or None if there are no measurements
+        """
+        if len(self._timestamps) == self._start:
+            return None
+        return self._timestamps[-1]
+
+    def values(self):
+        """
+        :return: List of values, newest first
+        """
+        return self._values[:self._start - 1 if self._start > 0 else None:-1]
+
+    def timestamps(self):
+        """
+        :return: List of timestamps, newest first
+        """
+        return self._timestamps[:self._start - 1 if self._start > 0 else None:-1]
+
+    def __len__(self):
+        return len(self._timestamps) - self._start
+
+    def __getitem__(self, index):
+        length = len(self._timestamps) - self._start
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(length))]
+
+        if index < 0:
+            index += length
+
+        if index < 0 or index >= length:
+            raise IndexError("MeasurementHistory index out of range")
+
+        i = len(self._timestamps) - 1 - index
+        return self._values[i], self._timestamps[i]
+
+    def __iter__(self):
+        for i in range(len(self._timestamps) - 1, self._start - 1, -1):
+            yield self._values[i], self._timestamps[i]
+
+    def __eq__(self, other):
+        if isinstance(other, MeasurementHistory):
+            return self.values() == other.values() and self.timestamps() == other.timestamps()
+        if isinstance(other, list):
+            return list(self) == [tuple(m) for m in other]
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __getstate__(self):
+        """
+        Save the timestamps as a delta-encoded array of unsigned integers
+        """
+        timestamps = self._timestamps[self._start:]
+        values = self._values[self._start:]
+
+        if len(timestamps) > 0 and all(isinstance(t, int) and not isinstance(t, bool) for t in timestamps):
+            deltas = [timestamps[i] - timestamps[i - 1] for i in range(1, len(timestamps))]
+            if len(deltas) == 0 or max(deltas) < 2 ** 32:
+                typecode = "I" if array("I").itemsize == 4 else "L"
+            else:
+                typecode = "Q"
+            return (timestamps[0], typecode, array(typecode, deltas).tobytes(), values)
+
+        return (None, None, timestamps, values)
+
+    def __setstate__(self, state):
+        first_timestamp_ms, typecode, timestamps, values = state
+        if typecode is not None:
+            deltas = array(typecode)
+            deltas.frombytes(timestamps)
+            timestamps = [first_timestamp_ms]
+            for delta in deltas:
+                timestamps.append(timestamps[-1] + delta)
+
+        self._timestamps = list(timestamps)
+        self._values = list(values)
+        self._start = 0
@@ -1,6 +1,8 @@
 
 from botengine_pytest import BotEnginePyTest
 from devices.device import Device
+from devices.measurements import MeasurementHistory
+import devices.device as device
 
 from locations.location import Location
 import utilities.utilities as utilities
@@ -76,3 +78,55 @@ class TestDevice():
             assert mut.intelligence_modules[i].parent == mut
 
 
+
+    def test_device_measurement_history(self):
+        botengine = BotEnginePyTest({})
+        # Clear out any previous tests
+        botengine.reset()
+
+        # Initialize the location
+        location_object = Location(botengine, 0)
+
+        mut = Device(botengine, location_object, "A", 0, "Test")
+        now_ms = botengine.get_timestamp()
+
+        assert mut.add_measurement(botengine, "degC", 20.0, now_ms - 3000)
+        assert mut.add_measurement(botengine, "degC", 21.0, now_ms - 2000)
+        assert mut.add_measurement(botengine, "degC", 22.0, now_ms - 1000)
+        assert not mut.add_measurement(botengine, "degC", 21.0, now_ms - 2000)
+        assert mut.measurement_odometer == 3
+
+        # Reads like a list of tuples, newest first
+        assert mut.measurements["degC"][0][0] == 22.0
+        assert mut.measurements["degC"][-1] == (20.0, now_ms - 3000)
+        assert len(mut.measurements["degC"]) == 3
+        assert [value for value, timestamp_ms in mut.measurements["degC"]] == [22.0, 21.0, 20.0]
+        assert mut.measurements["degC"][:2] == [(22.0, now_ms - 1000), (21.0, now_ms - 2000)]
+
+        # Late measurements are kept in time order
+        assert mut.add_measurement(botengine, "degC", 20.5, now_ms - 2500)
+        assert mut.measurements["degC"][0][0] == 22.0
+        assert mut.get_measurement_history(botengine, "degC", oldest_timestamp_ms=now_ms - 2500, newest_timestamp_ms=now_ms - 2000) == [(21.0, now_ms - 2000), (20.5, now_ms - 2500)]
+        assert mut.last_measurement_timestamp_ms(botengine) == now_ms - 1000
+
+        # Old measurements expire, but the newest one is always kept
+        mut.add_measurement(botengine, "rssi", -60, now_ms - device.TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS - 2000)
+        mut.add_measurement(botengine, "rssi", -61, now_ms - device.TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS - 1000)
+        assert mut.measurements["rssi"] == [(-61, now_ms - device.TOTAL_DURATION_TO_CACHE_MEASUREMENTS_MS - 1000)]
+        mut.add_measurement(botengine, "rssi", -62, now_ms)
+        assert mut.measurements["rssi"] == [(-62, now_ms)]
+
+        # Lists of measurements set directly, or saved by previous versions, are converted
+        mut.measurements["doorStatus"] = [[True, now_ms - 1000], [False, now_ms - 2000]]
+        assert mut.add_measurement(botengine, "doorStatus", False, now_ms)
+        assert mut.measurements["doorStatus"] == [(False, now_ms), (True, now_ms - 1000), (False, now_ms - 2000)]
+
+        # Histories pickle compactly and come back the same
+        import pickle
+        history = MeasurementHistory()
+        for i in range(1000):
+            history.add(i % 2 == 0, now_ms + i * 1000)
+        restored = pickle.loads(pickle.dumps(history))
+        assert restored == history
+        assert restored[0] == (False, now_ms + 999000)
+        assert len(pickle.dumps(history)) < len(pickle.dumps(list(history))) / 2
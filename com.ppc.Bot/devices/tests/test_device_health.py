@@ -7,6 +7,8 @@ from devices.health.health_google import GoogleHealthDevice
 from locations.location import Location
 import utilities.utilities as utilities
 
+import pickle
+
 
 class TestHealthDevice():
 
@@ -72,3 +74,85 @@ class TestHealthDevice():
         for i in mut.intelligence_modules:
             assert mut.intelligence_modules[i].intelligence_id != None
             assert mut.intelligence_modules[i].parent == mut
+
+    def test_device_health_vitals(self):
+        botengine = BotEnginePyTest({})
+        botengine.reset()
+        now = botengine.get_timestamp()
+
+        location_object = Location(botengine, 0)
+        mut = HealthDevice(botengine, location_object, "123", AppleHealthDevice.DEVICE_TYPES[0], "Device", precache_measurements=False)
+        today = mut._local_day(botengine, now)
+
+        # A burst of heart rate measurements, with one implausible value
+        for i, value in enumerate([60, 62, 64, 300, 70, 80]):
+            mut.add_measurement(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE, value, now - (10 - i) * utilities.ONE_MINUTE_MS)
+
+        summary = mut.get_vital_window_summary(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE)
+        assert summary["count"] == 5
+        assert summary["min"] == 60
+        assert summary["max"] == 80
+        assert summary["mean"] == 67.2
+        assert summary["p50"] == 64
+        assert summary["p90"] == 80
+
+        daily = mut.get_daily_vitals_summary(botengine)
+        assert list(daily.keys()) == [HealthDevice.MEASUREMENT_NAME_HEART_RATE]
+        assert daily[HealthDevice.MEASUREMENT_NAME_HEART_RATE]["day"] == today
+        assert daily[HealthDevice.MEASUREMENT_NAME_HEART_RATE]["outliers"] == 1
+
+        # The rolling window slides forward, the minimum and maximum follow it
+        mut.add_measurement(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE, 75, now + utilities.ONE_HOUR_MS - 7 * utilities.ONE_MINUTE_MS)
+        vital = mut.get_vital(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE)
+        assert vital.window_summary()["min"] == 70
+        assert vital.window_summary()["count"] == 3
+
+        # Late measurements count toward their day and the rolling window, but not toward days we no longer keep
+        mut.add_measurement(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE, 65, now + utilities.ONE_HOUR_MS - 8 * utilities.ONE_MINUTE_MS)
+        assert vital.window_summary()["count"] == 4
+        assert vital.window_summary()["min"] == 65
+        assert mut.get_daily_vitals_summary(botengine)[HealthDevice.MEASUREMENT_NAME_HEART_RATE]["count"] == 7
+        assert not vital.add(50, now - 30 * utilities.ONE_DAY_MS, mut._local_day(botengine, now - 30 * utilities.ONE_DAY_MS))
+
+        # Each day is summarized when the next day starts, and the window is empty again after an hour without measurements
+        tomorrow_ms = now + utilities.ONE_DAY_MS
+        mut.add_measurement(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE, 90, tomorrow_ms)
+        assert mut.get_daily_vitals_summary(botengine, today)[HealthDevice.MEASUREMENT_NAME_HEART_RATE]["count"] == 7
+        assert mut.get_daily_vitals_summary(botengine, mut._local_day(botengine, tomorrow_ms))[HealthDevice.MEASUREMENT_NAME_HEART_RATE]["count"] == 1
+
+        # A backfilled measurement from the previous day still counts toward it
+        mut.add_measurement(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE, 68, now - 30 * utilities.ONE_MINUTE_MS)
+        assert mut.get_daily_vitals_summary(botengine, today)[HealthDevice.MEASUREMENT_NAME_HEART_RATE]["count"] == 8
+        assert vital.window_summary(tomorrow_ms + utilities.ONE_HOUR_MS) is None
+
+        # Days past the late days are reduced to their summary, which no longer counts late measurements
+        mut.add_measurement(botengine, HealthDevice.MEASUREMENT_NAME_HEART_RATE, 91, tomorrow_ms + utilities.ONE_DAY_MS)
+        assert today in vital.summaries
+        assert not vital.add(69, now - 20 * utilities.ONE_MINUTE_MS, today)
+        assert mut.get_daily_vitals_summary(botengine, today)[HealthDevice.MEASUREMENT_NAME_HEART_RATE]["count"] == 8
+
+        # Histograms only keep the bins they counted something in
+        assert len(vital.window_histogram.bins) <= 2
+        assert len(pickle.dumps(vital)) < 2000
+
+        # Vital signs we start aggregating later learn the measurements we already have
+        mut.measurements[HealthDevice.MEASUREMENT_NAME_SPO2] = [(97, now), (98, now - 1000)]
+        assert mut.get_vital(botengine, HealthDevice.MEASUREMENT_NAME_SPO2).daily_summary(today)["mean"] == 97.5
+        assert mut.get_vital(botengine, HealthDevice.MEASUREMENT_NAME_STEPS) is None
+
+    def test_device_health_vitals_resolution(self):
+        botengine = BotEnginePyTest({})
+        botengine.reset()
+        now = botengine.get_timestamp()
+
+        location_object = Location(botengine, 0)
+        mut = HealthDevice(botengine, location_object, "123", AppleHealthDevice.DEVICE_TYPES[0], "Device", precache_measurements=False)
+
+        # Values on the edges of 0.1-wide bins land in their own bin
+        for i, value in enumerate([0.3, 0.6, 0.7]):
+            mut.add_measurement(botengine, HealthDevice.MEASUREMENT_NAME_PERFUSION_INDEX, value, now - (10 - i) * utilities.ONE_MINUTE_MS)
+
+        summary = mut.get_vital_window_summary(botengine, HealthDevice.MEASUREMENT_NAME_PERFUSION_INDEX)
+        assert summary["p10"] == 0.3
+        assert summary["p50"] == 0.6
+        assert summary["p90"] == 0.7
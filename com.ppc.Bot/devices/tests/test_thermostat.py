@@ -0,0 +1,96 @@
+from botengine_pytest import BotEnginePyTest
+from devices.thermostat.thermostat import ThermostatDevice, ONE_DEGREE_F_TO_C
+from devices.thermostat.thermostat_ecobee import ThermostatEcobeeDevice
+from devices.thermostat.learning import SetpointLearning, MODE_HOME, MODE_SLEEP, MODE_AWAY, KIND_HEAT, KIND_COOL
+
+from locations.location import Location
+
+import pickle
+
+
+class TestThermostat():
+
+    def _thermostat(self, botengine):
+        location_object = Location(botengine, 0)
+        mut = ThermostatEcobeeDevice(botengine, location_object, "thermostat", 4240, "Thermostat", precache_measurements=False)
+        mut.is_connected = True
+        return mut
+
+    def test_thermostat_setpoint_learning(self):
+        learning = SetpointLearning()
+        assert learning.get(MODE_HOME, KIND_HEAT) == 20.0
+        assert learning.get(MODE_HOME, KIND_HEAT, 7) == 20.0
+        assert learning.observations(MODE_HOME, KIND_HEAT, 7) == 0
+
+        # The first observation replaces the preference, later ones are averaged in
+        assert learning.learn(MODE_HOME, KIND_HEAT, 21.0, 7) == 21.0
+        assert learning.learn(MODE_HOME, KIND_HEAT, 22.0, 7) == 21.5
+        assert learning.get(MODE_HOME, KIND_HEAT) == 21.5
+        assert learning.get(MODE_HOME, KIND_COOL, 7) == 23.9
+
+        # Hours we haven't learned fall back to the all-day preference
+        learning.learn(MODE_HOME, KIND_HEAT, 18.0, 23)
+        assert learning.get(MODE_HOME, KIND_HEAT, 23) == 18.0
+        assert learning.get(MODE_HOME, KIND_HEAT, 7) == 21.5
+        assert learning.get(MODE_HOME, KIND_HEAT, 12) == learning.get(MODE_HOME, KIND_HEAT)
+
+        # The model stays the same size no matter how long it learns
+        size = len(pickle.dumps(learning))
+        for i in range(1000):
+            learning.learn(MODE_SLEEP, KIND_COOL, 2.0, i % 24)
+        assert learning.observations(MODE_SLEEP, KIND_COOL) == 255
+        assert abs(learning.get(MODE_SLEEP, KIND_COOL, 5) - 2.0) < 0.001
+        assert len(pickle.dumps(learning)) == size
+
+        restored = pickle.loads(pickle.dumps(learning))
+        assert restored.get(MODE_HOME, KIND_HEAT, 23) == 18.0
+        assert restored.observations(MODE_SLEEP, KIND_COOL, 5) == learning.observations(MODE_SLEEP, KIND_COOL, 5)
+
+    def test_thermostat_learn_preferences(self):
+        botengine = BotEnginePyTest({})
+        botengine.reset()
+        now = botengine.get_timestamp()
+
+        mut = self._thermostat(botengine)
+        hour = mut.location_object.get_local_datetime(botengine).hour
+        mut.add_measurement(botengine, ThermostatDevice.MEASUREMENT_NAME_SYSTEM_MODE, ThermostatDevice.SYSTEM_MODE__HEAT, now)
+        mut.add_measurement(botengine, ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C, 25.0, now)
+        mut.add_measurement(botengine, ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C, 21.0, now)
+        mut.last_updated_params = [ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C]
+
+        mut.record_preferred_home_setpoint(botengine)
+        assert mut.learning.get(MODE_HOME, KIND_HEAT, hour) == 21.0
+        assert mut.preferred_heating_setpoint_home_c == 21.0
+
+        # Sleep offsets are learned relative to the HOME setpoint, and never drop below 1 degree F
+        mut.add_measurement(botengine, ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C, 18.0, now + 1000)
+        mut.record_preferred_sleep_offset(botengine)
+        assert mut.learning.get(MODE_SLEEP, KIND_HEAT, hour) == 3.0
+
+        mut.add_measurement(botengine, ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C, 22.0, now + 2000)
+        mut.record_preferred_away_offset(botengine)
+        assert mut.learning.get(MODE_AWAY, KIND_HEAT, hour) == ONE_DEGREE_F_TO_C
+
+        # Energy efficiency applies the offsets learned for this hour
+        mut.set_energy_efficiency_sleep(botengine)
+        assert mut.ee_stack_heat["sleep"] == 3.0
+        assert mut.last_heating_setpoint_command[0] == 18.0
+
+    def test_thermostat_preferences_new_version(self):
+        botengine = BotEnginePyTest({})
+        botengine.reset()
+
+        # Thermostats saved before the setpoint learning model kept their preferences as attributes
+        mut = self._thermostat(botengine)
+        del mut.learning
+        mut.__dict__["preferred_cooling_setpoint_home_c"] = 22.0
+        mut.__dict__["preferred_heating_offset_away_c"] = 3.0
+
+        mut.new_version(botengine)
+        assert "preferred_cooling_setpoint_home_c" not in mut.__dict__
+        assert mut.preferred_cooling_setpoint_home_c == 22.0
+        assert mut.preferred_heating_offset_away_c == 3.0
+        assert mut.preferred_heating_setpoint_home_c == 20.0
+
+        restored = pickle.loads(pickle.dumps(mut))
+        assert restored.learning.get(MODE_AWAY, KIND_HEAT, 3) == 3.0
@@ -0,0 +1,122 @@
+from botengine_pytest import BotEnginePyTest
+from devices.vayyar.vayyar import VayyarDevice
+from devices.vayyar.occupancy import OccupancyModel, OccupancyTargets
+
+from locations.location import Location
+
+import pickle
+
+
+class TestVayyar():
+
+    def _vayyar(self, botengine):
+        location_object = Location(botengine, 0)
+        mut = VayyarDevice(botengine, location_object, "vayyar", 2000, "Vayyar", precache_measurements=False)
+        mut.is_connected = True
+        return mut
+
+    def test_vayyar_decode_targets(self):
+        targets = OccupancyTargets("0:19,73,127;1:-40,210,30", 1000)
+        assert len(targets) == 2
+        assert targets.to_dict() == {"0": {"x": 19, "y": 73, "z": 127}, "1": {"x": -40, "y": 210, "z": 30}}
+        assert len(OccupancyTargets("", 1000)) == 0
+
+        # Room boundaries are in meters, targets in centimeters
+        assert targets.inside(-0.3, 0.3, 0.3, 4.0) == ["0"]
+        assert targets.inside(-0.3, 0.3, 0.3, 4.0, 0, 1.0) == []
+        assert targets.inside(-2.5, 2.5, 0.3, 4.0, 0, 2.0) == ["0", "1"]
+        assert targets.inside_subregions([{"xMin": -1.0, "xMax": 0.0, "yMin": 1.0, "yMax": 3.0}, {"xMin": 0.0, "xMax": 1.0, "yMin": 0.3, "yMax": 1.0}]) == {0: ["1"], 1: ["0"]}
+
+    def test_vayyar_occupancy_targets(self):
+        botengine = BotEnginePyTest({})
+        botengine.reset()
+        now = botengine.get_timestamp()
+
+        mut = self._vayyar(botengine)
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, "0:19,73,127", now - 2000)
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, "0:20,80,120;1:-40,210,30", now - 1000)
+
+        assert mut.get_occupancy_targets(botengine) == {now - 1000: {"0": {"x": 20, "y": 80, "z": 120}, "1": {"x": -40, "y": 210, "z": 30}}}
+        assert list(mut.get_occupancy_targets(botengine, now - 5000, now).keys()) == [now - 1000, now - 2000]
+        assert mut.get_newest_targets(botengine) == {"0": {"x": 20, "y": 80, "z": 120}, "1": {"x": -40, "y": 210, "z": 30}}
+
+        # Every reader gets the same decoded measurement
+        decoded = mut.get_decoded_targets(botengine, limit=1)[0]
+        assert mut.get_decoded_targets(botengine, limit=1)[0] is decoded
+        assert len(mut.occupancy) == 2
+
+        # Readers can't change the decoded measurement
+        mut.get_newest_targets(botengine)["0"]["x"] = 0
+        assert mut.get_newest_targets(botengine)["0"]["x"] == 20
+
+        assert mut.get_targets_in_room(botengine) == ["0", "1"]
+
+        mut.add_measurement(botengine, "vyrc.trackerSubRegions", '[{"xMin":-1.0,"xMax":0.0,"yMin":1.0,"yMax":3.0}]', now - 1000)
+        assert mut.get_targets_in_subregions(botengine) == {0: ["1"]}
+
+        # The decoded measurements are not saved with the device
+        restored = pickle.loads(pickle.dumps(mut))
+        assert isinstance(restored.occupancy, OccupancyModel)
+        assert len(restored.occupancy) == 0
+        assert restored.get_newest_targets(botengine) == mut.get_newest_targets(botengine)
+
+    def test_vayyar_occupancy_map(self):
+        botengine = BotEnginePyTest({})
+        botengine.reset()
+        now = botengine.get_timestamp()
+
+        mut = self._vayyar(botengine)
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP, 0, now - 2000)
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP, "0110", now - 1000)
+        mut.last_updated_params = [VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP]
+
+        assert mut.get_subregions_entered(botengine) == [1, 2]
+        assert mut.get_subregions_occupied(botengine) == [1, 2]
+        assert mut.get_subregions_exited(botengine) == []
+
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP, 1000, now)
+        assert mut.get_subregions_entered(botengine) == [0]
+        assert mut.get_subregions_exited(botengine) == [1, 2]
+
+        # Decoded maps expire with the measurement history
+        assert len(mut.occupancy) == 3
+        mut.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP].expire(now - 1500)
+        mut.get_subregions_occupied(botengine)
+        assert len(mut.occupancy) == 2
+
+    def test_vayyar_trajectory(self):
+        botengine = BotEnginePyTest({})
+        botengine.reset()
+        now = botengine.get_timestamp()
+
+        mut = self._vayyar(botengine)
+        mut.add_measurement(botengine, "vyrc.trackerSubRegions", '[{"xMin":-1.0,"xMax":0.0,"yMin":1.0,"yMax":3.0},{"xMin":0.0,"xMax":1.0,"yMin":0.3,"yMax":1.0}]', now - 60000)
+
+        # Target 0 walks 1 meter in 10 seconds into subregion 0 and stays there
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, "0:50,50,100", now - 40000)
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, "0:-50,50,100", now - 30000)
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, "0:-50,150,100", now - 20000)
+
+        trajectory = mut.get_trajectory(botengine)
+        assert len(trajectory) == 3
+        assert mut.get_subregion_dwell_times_ms(botengine) == {0: 20000, 1: 10000}
+        assert mut.get_time_since_target_in_subregions_ms(botengine) == {0: 0, 1: 30000}
+        assert mut.get_target_speeds(botengine) == {"0": 0.1}
+
+        # Sliding windows only count the part of the window they cover
+        assert trajectory.dwell_time_ms(now - 35000, now - 25000, -1.0, 0.0, 1.0, 3.0) == 0
+        assert trajectory.dwell_time_ms(now - 45000, now - 35000, 0.0, 1.0, 0.3, 1.0) == 5000
+
+        # Only new measurements are appended, and the trajectory is rebuilt when a measurement arrives out of order
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, "0:-50,150,100;1:50,50,100", now - 10000)
+        assert mut.get_trajectory(botengine) is trajectory
+        assert len(trajectory) == 4
+        assert mut.get_subregion_dwell_times_ms(botengine) == {0: 20000, 1: 20000}
+
+        mut.add_measurement(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, "0:-50,150,100", now - 25000)
+        assert len(mut.get_trajectory(botengine)) == 5
+        assert mut.get_subregion_dwell_times_ms(botengine) == {0: 25000, 1: 20000}
+
+        # The trajectory expires with the measurement history
+        mut.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET].expire(now - 30000)
+        assert len(mut.get_trajectory(botengine)) == 3
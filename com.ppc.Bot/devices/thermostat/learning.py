@@ -0,0 +1,161 @@
+'''
+Created on October 17, 2026
+
+Setpoint learning model for thermostats
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+from array import array
+
+# Modes we learn preferences for
+MODE_HOME = 0
+MODE_SLEEP = 1
+MODE_AWAY = 2
+TOTAL_MODES = 3
+
+# Kinds of setpoints we learn in each mode
+KIND_HEAT = 0
+KIND_COOL = 1
+TOTAL_KINDS = 2
+
+# Each mode and kind has an all-day preference, followed by one preference for each hour of the day
+HOURS_PER_DAY = 24
+SLOTS_PER_PREFERENCE = HOURS_PER_DAY + 1
+
+# After this many observations, older observations fade away as new ones arrive
+LEARNING_WINDOW = 4
+
+# Observation counts are saved as unsigned bytes
+MAXIMUM_COUNT = 255
+
+# Version of the saved state
+STATE_VERSION = 1
+
+# Preferences before we learn anything. HOME is an absolute setpoint, SLEEP and AWAY are offsets from the HOME setpoint.
+DEFAULT_PREFERENCES_C = {
+    (MODE_HOME, KIND_HEAT): 20.0,   # 68F
+    (MODE_HOME, KIND_COOL): 23.9,   # 75F
+    (MODE_SLEEP, KIND_HEAT): 1.6,   # 3F
+    (MODE_SLEEP, KIND_COOL): 1.6,   # 3F
+    (MODE_AWAY, KIND_HEAT): 2.4,    # 5F
+    (MODE_AWAY, KIND_COOL): 2.4     # 5F
+}
+
+
+def _slot(mode, kind, hour=None):
+    """
+    :param mode: MODE_HOME, MODE_SLEEP or MODE_AWAY
+    :param kind: KIND_HEAT or KIND_COOL
+    :param hour: Local hour of the day, or None for the all-day preference
+    :return: Index of the preference in the model's columns
+    """
+    slot = (mode * TOTAL_KINDS + kind) * SLOTS_PER_PREFERENCE
+    if hour is not None:
+        slot += 1 + (hour % HOURS_PER_DAY)
+    return slot
+
+
+class SetpointLearning(object):
+    """
+    Compact model of the setpoints a user prefers in each mode, by time of day.
+
+    HOME preferences are absolute setpoints in Celsius. SLEEP and AWAY preferences are offsets in Celsius
+    from the HOME setpoint in the direction that saves energy, always positive.
+
+    Each mode and kind keeps an all-day preference and one preference for each local hour of the day,
+    in fixed-size columns, so the model is the same size no matter how long the thermostat has been learning.
+    Hours we haven't observed yet fall back to the all-day preference.
+    """
+
+    __slots__ = ("values", "counts")
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        # Preferred setpoint or offset in Celsius for each slot
+        self.values = array('d', [0.0]) * (TOTAL_MODES * TOTAL_KINDS * SLOTS_PER_PREFERENCE)
+
+        # Number of observations learned into each slot, up to MAXIMUM_COUNT
+        self.counts = array('B', [0]) * len(self.values)
+
+        for (mode, kind), value_c in DEFAULT_PREFERENCES_C.items():
+            self.values[_slot(mode, kind)] = value_c
+
+    def __getstate__(self):
+        """
+        Save the columns as raw bytes
+        """
+        return STATE_VERSION, self.values.tobytes(), self.counts.tobytes()
+
+    def __setstate__(self, state):
+        """
+        Restore the columns
+        """
+        version, values, counts = state
+        self.values = array('d')
+        self.values.frombytes(values)
+        self.counts = array('B')
+        self.counts.frombytes(counts)
+
+    def get(self, mode, kind, hour=None):
+        """
+        Get a preference
+        :param mode: MODE_HOME, MODE_SLEEP or MODE_AWAY
+        :param kind: KIND_HEAT or KIND_COOL
+        :param hour: Local hour of the day, or None for the all-day preference
+        :return: Preferred setpoint (HOME) or offset (SLEEP, AWAY) in Celsius
+        """
+        if hour is not None:
+            slot = _slot(mode, kind, hour)
+            if self.counts[slot]:
+                return self.values[slot]
+
+        return self.values[_slot(mode, kind)]
+
+    def set(self, mode, kind, value_c):
+        """
+        Overwrite the all-day preference. Hours we already learned keep their own preference.
+        :param mode: MODE_HOME, MODE_SLEEP or MODE_AWAY
+        :param kind: KIND_HEAT or KIND_COOL
+        :param value_c: Preferred setpoint (HOME) or offset (SLEEP, AWAY) in Celsius
+        """
+        self.values[_slot(mode, kind)] = value_c
+
+    def learn(self, mode, kind, value_c, hour=None):
+        """
+        Learn one observation into the all-day preference and the preference for this hour.
+
+        The first observation of a slot replaces it. After that, each slot keeps a running average of
+        its last LEARNING_WINDOW or so observations.
+
+        :param mode: MODE_HOME, MODE_SLEEP or MODE_AWAY
+        :param kind: KIND_HEAT or KIND_COOL
+        :param value_c: Observed setpoint (HOME) or offset (SLEEP, AWAY) in Celsius
+        :param hour: Local hour of the day of the observation, or None to only learn the all-day preference
+        :return: The new preference for this hour
+        """
+        slots = [_slot(mode, kind)]
+        if hour is not None:
+            slots.append(_slot(mode, kind, hour))
+
+        for slot in slots:
+            count = self.counts[slot]
+            self.values[slot] += (value_c - self.values[slot]) / min(count + 1, LEARNING_WINDOW)
+            if count < MAXIMUM_COUNT:
+                self.counts[slot] = count + 1
+
+        return self.get(mode, kind, hour)
+
+    def observations(self, mode, kind, hour=None):
+        """
+        :param mode: MODE_HOME, MODE_SLEEP or MODE_AWAY
+        :param kind: KIND_HEAT or KIND_COOL
+        :param hour: Local hour of the day, or None for the all-day preference
+        :return: Number of observations learned into this preference, up to MAXIMUM_COUNT
+        """
+        return self.counts[_slot(mode, kind, hour)]
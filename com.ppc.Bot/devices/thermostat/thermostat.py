@@ -11,6 +11,8 @@ file 'LICENSE.txt', which is part of this source code package.
 from devices.device import Device
 from devices.device import send_command_reliably
 from devices.device import cancel_reliable_command
+from devices.thermostat.learning import SetpointLearning
+from devices.thermostat.learning import MODE_HOME, MODE_SLEEP, MODE_AWAY, KIND_HEAT, KIND_COOL
 
 import utilities.utilities as utilities
 import signals.analytics as analytics
@@ -48,6 +50,35 @@ MAXIMUM_COOLING_SETPOINT_C = 28.9
 # Minimum heating setpoint = 60 degrees F
 MINIMUM_HEATING_SETPOINT_C = 15.6
 
+# Attribute names of the all-day preferences that used to be saved on the thermostat, and where they live in the setpoint learning model now
+PREFERENCE_ATTRIBUTES = {
+    "preferred_heating_setpoint_home_c": (MODE_HOME, KIND_HEAT),
+    "preferred_cooling_setpoint_home_c": (MODE_HOME, KIND_COOL),
+    "preferred_heating_offset_away_c": (MODE_AWAY, KIND_HEAT),
+    "preferred_cooling_offset_away_c": (MODE_AWAY, KIND_COOL),
+    "preferred_heating_offset_sleep_c": (MODE_SLEEP, KIND_HEAT),
+    "preferred_cooling_offset_sleep_c": (MODE_SLEEP, KIND_COOL)
+}
+
+
+def _preference(name, doc):
+    """
+    Property reading and writing an all-day preference in the thermostat's setpoint learning model
+    :param name: Attribute name from PREFERENCE_ATTRIBUTES
+    :param doc: Description of the preference
+    :return: property
+    """
+    mode, kind = PREFERENCE_ATTRIBUTES[name]
+
+    def getter(self):
+        return self.learning.get(mode, kind)
+
+    def setter(self, value_c):
+        self.learning.set(mode, kind, value_c)
+
+    return property(getter, setter, doc=doc)
+
+
 class ThermostatDevice(Device):
     '''
     Abstract Thermostat class, providing a predictable interface for all Thermostat definition
@@ -87,6 +118,14 @@ class ThermostatDevice(Device):
     FAN_MODE__AUTO = 5
     FAN_MODE__SMART = 6
 
+    # All-day preferences, kept by the setpoint learning model
+    preferred_heating_setpoint_home_c = _preference("preferred_heating_setpoint_home_c", "Preferred heating setpoint for this thermostat while you're home")
+    preferred_cooling_setpoint_home_c = _preference("preferred_cooling_setpoint_home_c", "Preferred cooling setpoint for this thermostat while you're home")
+    preferred_heating_offset_away_c = _preference("preferred_heating_offset_away_c", "Preferred heating offset when we're in away mode")
+    preferred_cooling_offset_away_c = _preference("preferred_cooling_offset_away_c", "Preferred cooling offset when we're in away mode")
+    preferred_heating_offset_sleep_c = _preference("preferred_heating_offset_sleep_c", "Preferred heating offset when we're in sleep mode")
+    preferred_cooling_offset_sleep_c = _preference("preferred_cooling_offset_sleep_c", "Preferred cooling offset when we're in sleep mode")
+
     def __init__(self, botengine, location_object, device_id, device_type, device_description, precache_measurements=True):
 
         # Saved system mode
@@ -127,11 +166,8 @@ class ThermostatDevice(Device):
         # Timestamp at which the user last adjusted their thermostat
         self.user_adjusted_timestamp = None
 
-        # Preferred heating setpoint for this thermostat while you're home
-        self.preferred_heating_setpoint_home_c = 20.0  # 68F
-
-        # Preferred cooling setpoint for this thermostat while you're home
-        self.preferred_cooling_setpoint_home_c = 23.9  # 75F
+        # Preferred setpoints while home and offsets while sleeping or away, by local hour of the day
+        self.learning = SetpointLearning()
 
         # Absolute maximum heating offset (when you're on vacation or something)
         self.absolute_max_heating_offset_c = 8.3  # 15F
@@ -139,18 +175,6 @@ class ThermostatDevice(Device):
         # Absolute maximum cooling offset (when you're on vacation or something)
         self.absolute_max_cooling_offset_c = 8.3  # 15F
 
-        # Preferred cooling offset when we're in away mode
-        self.preferred_heating_offset_away_c = 2.4  # 5F
-
-        # Preferred heating offset when we're in away mode
-        self.preferred_cooling_offset_away_c = 2.4 # 5F
-
-        # Preferred cooling offset when we're in away mode
-        self.preferred_heating_offset_sleep_c = 1.6 # 3F
-
-        # Preferred heating offset when we're in away mode
-        self.preferred_cooling_offset_sleep_c = 1.6  # 3F
-
         # Start timestamp of DR events for tracking
         self.dr_timestamp_ms = None
 
@@ -162,6 +186,19 @@ class ThermostatDevice(Device):
 
         Device.__init__(self, botengine, location_object, device_id, device_type, device_description, precache_measurements=precache_measurements)
 
+    def new_version(self, botengine):
+        """
+        New version
+        :param botengine: BotEngine environment
+        """
+        Device.new_version(self, botengine)
+
+        # Added October 17, 2026
+        if not hasattr(self, 'learning'):
+            self.learning = SetpointLearning()
+            for name in PREFERENCE_ATTRIBUTES:
+                if name in self.__dict__:
+                    setattr(self, name, self.__dict__.pop(name))
 
     def initialize(self, botengine):
         '''
@@ -549,30 +586,31 @@ class ThermostatDevice(Device):
         """
         botengine.get_logger().info("{} {}: Updating your preferred home set point".format(self.description, self.device_id))
         system_mode = self.get_system_mode(botengine)
+        hour = self._local_hour(botengine)
         if system_mode is not None:
             if ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C in self.last_updated_params:
-                self.preferred_cooling_setpoint_home_c = self.measurements[ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C][0][0]
+                learned_c = self.learning.learn(MODE_HOME, KIND_COOL, self.measurements[ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C][0][0], hour)
                 # NOTE: Learned HOME thermostat cooling set point.
                 self.location_object.narrate(botengine,
                                              title=_("'{}': Learned HOME cooling set point.").format(self.description),
-                                             description=_("Your '{}' learned you want the cooling set point set to {} when you are home.").format(self.description, self._celsius_to_narrative(self.preferred_cooling_setpoint_home_c)),
+                                             description=_("Your '{}' learned you want the cooling set point set to {} when you are home.").format(self.description, self._celsius_to_narrative(learned_c)),
                                              priority=botengine.NARRATIVE_PRIORITY_DEBUG,
                                              icon='thermostat',
                                              extra_json_dict={"device_id": self.device_id},
                                              event_type="thermostat.thermostat_cooling_setpoint_learned")
-                analytics.track(botengine, self.location_object, 'thermostat_cooling_setpoint_learned', properties={"device_id": self.device_id, "description": self.description, "thermostat_mode": "COOL", "mode": "HOME", "setpoint_c": self.preferred_cooling_setpoint_home_c})
+                analytics.track(botengine, self.location_object, 'thermostat_cooling_setpoint_learned', properties={"device_id": self.device_id, "description": self.description, "thermostat_mode": "COOL", "mode": "HOME", "setpoint_c": learned_c})
 
             if ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C in self.last_updated_params:
-                self.preferred_heating_setpoint_home_c = self.measurements[ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C][0][0]
+                learned_c = self.learning.learn(MODE_HOME, KIND_HEAT, self.measurements[ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C][0][0], hour)
                 # NOTE: Learned HOME thermostat heating set point.
                 self.location_object.narrate(botengine,
                                              title=_("'{}': Learned HOME heating set point.").format(self.description),
-                                             description=_("Your '{}' learned you want the heating set point set to {} when you are home.").format(self.description, self._celsius_to_narrative(self.preferred_heating_setpoint_home_c)),
+                                             description=_("Your '{}' learned you want the heating set point set to {} when you are home.").format(self.description, self._celsius_to_narrative(learned_c)),
                                              priority=botengine.NARRATIVE_PRIORITY_DEBUG,
                                              icon='thermostat',
                                              extra_json_dict={"device_id": self.device_id},
                                              event_type="thermostat.thermostat_heating_setpoint_learned")
-                analytics.track(botengine, self.location_object, 'thermostat_heating_setpoint_learned', properties={"device_id": self.device_id, "description": self.description, "thermostat_mode": "HEAT", "mode": "HOME", "setpoint_c": self.preferred_heating_setpoint_home_c})
+                analytics.track(botengine, self.location_object, 'thermostat_heating_setpoint_learned', properties={"device_id": self.device_id, "description": self.description, "thermostat_mode": "HEAT", "mode": "HOME", "setpoint_c": learned_c})
 
         # This number will represent the total amount of time across ALL devices.
         # For example, if you have 1 thermostat and a DR event for 10000s, then the total is 10000s.
@@ -592,23 +630,17 @@ class ThermostatDevice(Device):
         """
         botengine.get_logger().info("{} {}: Updating your preferred sleep offset".format(self.description, self.device_id))
         system_mode = self.get_system_mode(botengine)
+        hour = self._local_hour(botengine)
 
         if system_mode is not None:
             if ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C in self.last_updated_params:
-                current_absolute_setpoint_c = self.measurements[ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C][0][0]
-                current_absolute_cooling_c = self.preferred_cooling_setpoint_home_c + self.preferred_cooling_offset_sleep_c
+                previous_c, learned_c = self._learn_offset(botengine, MODE_SLEEP, KIND_COOL, hour)
 
-                if current_absolute_setpoint_c > current_absolute_cooling_c:
-                    # More energy efficient.
-                    self.preferred_cooling_offset_sleep_c += ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Sleep mode cooling offset is now more efficient (offset={}C)".format(self.preferred_cooling_offset_sleep_c))
+                if learned_c > previous_c:
+                    botengine.get_logger().info("Sleep mode cooling offset is now more efficient (offset={}C)".format(learned_c))
 
-                elif current_absolute_setpoint_c < current_absolute_cooling_c:
-                    # Less energy efficient. Adjust it slightly, but don't hit 0 adjustment
-                    self.preferred_cooling_offset_sleep_c -= ONE_DEGREE_F_TO_C
-                    if self.preferred_cooling_offset_sleep_c < ONE_DEGREE_F_TO_C:
-                        self.preferred_cooling_offset_sleep_c = ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Sleep mode cooling offset is now less efficient (offset={}C)".format(self.preferred_cooling_offset_sleep_c))
+                elif learned_c < previous_c:
+                    botengine.get_logger().info("Sleep mode cooling offset is now less efficient (offset={}C)".format(learned_c))
 
                 # NOTE: Thermostat cooling setpoint learned night time preferences.
                 self.location_object.narrate(botengine,
@@ -634,20 +666,13 @@ class ThermostatDevice(Device):
                 #     "preferred_heating_setpoint_home_c": self.preferred_heating_setpoint_home_c})
 
             if ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C in self.last_updated_params:
-                current_absolute_setpoint_c = self.measurements[ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C][0][0]
-                current_absolute_heating_c = self.preferred_heating_setpoint_home_c - self.preferred_heating_offset_sleep_c
+                previous_c, learned_c = self._learn_offset(botengine, MODE_SLEEP, KIND_HEAT, hour)
 
-                if current_absolute_setpoint_c < current_absolute_heating_c:
-                    # More energy efficient. Set it directly.
-                    self.preferred_heating_offset_sleep_c += ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Sleep mode heating offset is now more efficient (offset={}C)".format(self.preferred_heating_offset_sleep_c))
+                if learned_c > previous_c:
+                    botengine.get_logger().info("Sleep mode heating offset is now more efficient (offset={}C)".format(learned_c))
 
-                elif current_absolute_setpoint_c > current_absolute_heating_c:
-                    # Less energy efficient. Adjust it slightly, but don't hit 0 adjustment
-                    self.preferred_heating_offset_sleep_c -= ONE_DEGREE_F_TO_C
-                    if self.preferred_heating_offset_sleep_c < ONE_DEGREE_F_TO_C:
-                        self.preferred_heating_offset_sleep_c = ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Sleep mode heating offset is now less efficient (offset={}C)".format(self.preferred_heating_offset_sleep_c))
+                elif learned_c < previous_c:
+                    botengine.get_logger().info("Sleep mode heating offset is now less efficient (offset={}C)".format(learned_c))
 
                 # NOTE: Thermostat heating setpoint learned night time preferences.
                 self.location_object.narrate(botengine,
@@ -690,27 +715,21 @@ class ThermostatDevice(Device):
         """
         botengine.get_logger().info("{} {}: Updating your preferred away offset".format(self.description, self.device_id))
         system_mode = self.get_system_mode(botengine)
+        hour = self._local_hour(botengine)
         if system_mode is not None:
             if ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C in self.last_updated_params:
-                current_absolute_setpoint_c = self.measurements[ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C][0][0]
-                current_absolute_cooling_c = self.preferred_cooling_setpoint_home_c + self.preferred_cooling_offset_away_c
+                previous_c, learned_c = self._learn_offset(botengine, MODE_AWAY, KIND_COOL, hour)
 
-                if current_absolute_setpoint_c > current_absolute_cooling_c:
-                    # More energy efficient.
-                    self.preferred_cooling_offset_away_c += ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Away mode cooling offset is now more efficient (offset={}C)".format(self.preferred_cooling_offset_away_c))
+                if learned_c > previous_c:
+                    botengine.get_logger().info("Away mode cooling offset is now more efficient (offset={}C)".format(learned_c))
 
-                elif current_absolute_setpoint_c < current_absolute_cooling_c:
-                    # Less energy efficient. Adjust it slightly, but don't hit 0 adjustment
-                    self.preferred_cooling_offset_away_c -= ONE_DEGREE_F_TO_C
-                    if self.preferred_cooling_offset_away_c < ONE_DEGREE_F_TO_C:
-                        self.preferred_cooling_offset_away_c = ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Away mode cooling offset is now less efficient (offset={}C)".format(self.preferred_cooling_offset_away_c))
+                elif learned_c < previous_c:
+                    botengine.get_logger().info("Away mode cooling offset is now less efficient (offset={}C)".format(learned_c))
 
                 # NOTE: Thermostat cooling setpoint learned away preferences.
                 self.location_object.narrate(botengine,
                                              title=_("'{}': Learned away preferences.").format(self.description),
-                                             description=_("Your '{}' learned the away cooling setpoint should be {} from HOME mode.").format(self.description, self._celsius_to_narrative(self.preferred_cooling_offset_away_c)),
+                                             description=_("Your '{}' learned the away cooling setpoint should be {} from HOME mode.").format(self.description, self._celsius_to_narrative(learned_c)),
                                              priority=botengine.NARRATIVE_PRIORITY_DEBUG,
                                              icon='thermostat',
                                              extra_json_dict={
@@ -737,25 +756,18 @@ class ThermostatDevice(Device):
                 #     "preferred_heating_setpoint_home_c": self.preferred_heating_setpoint_home_c})
 
             if ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C in self.last_updated_params:
-                current_absolute_setpoint_c = self.measurements[ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C][0][0]
-                current_absolute_heating_c = self.preferred_heating_setpoint_home_c - self.preferred_heating_offset_away_c
+                previous_c, learned_c = self._learn_offset(botengine, MODE_AWAY, KIND_HEAT, hour)
 
-                if current_absolute_setpoint_c < current_absolute_heating_c:
-                    # More energy efficient. Set it directly.
-                    self.preferred_heating_offset_away_c += ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Away mode heating offset is now more efficient (offset={}C)".format(self.preferred_heating_offset_away_c))
+                if learned_c > previous_c:
+                    botengine.get_logger().info("Away mode heating offset is now more efficient (offset={}C)".format(learned_c))
 
-                elif current_absolute_setpoint_c > current_absolute_heating_c:
-                    # Less energy efficient. Adjust it slightly, but don't hit 0 adjustment
-                    self.preferred_heating_offset_away_c -= ONE_DEGREE_F_TO_C
-                    if self.preferred_heating_offset_away_c < ONE_DEGREE_F_TO_C:
-                        self.preferred_heating_offset_away_c = ONE_DEGREE_F_TO_C
-                    botengine.get_logger().info("Away mode heating offset is now less efficient (offset={}C)".format(self.preferred_heating_offset_away_c))
+                elif learned_c < previous_c:
+                    botengine.get_logger().info("Away mode heating offset is now less efficient (offset={}C)".format(learned_c))
 
                 # NOTE: Thermostat heating setpoint learned away preferences.
                 self.location_object.narrate(botengine,
                                              title=_("'{}': Learned night time preferences.").format(self.description),
-                                             description=_("Your '{}' learned the away heating setpoint should be {} from HOME mode.").format(self.description, self._celsius_to_narrative(self.preferred_heating_offset_away_c)),
+                                             description=_("Your '{}' learned the away heating setpoint should be {} from HOME mode.").format(self.description, self._celsius_to_narrative(learned_c)),
                                              priority=botengine.NARRATIVE_PRIORITY_DEBUG,
                                              icon='thermostat',
                                              extra_json_dict={
@@ -952,8 +964,11 @@ class ThermostatDevice(Device):
 
         if system_mode is not None and self.is_connected:
             if abs(heat_ee_offset + heat_dr_offset + cool_ee_offset + cool_dr_offset) != self.last_offset_c:
-                cooling_setpoint_celsius = float(self.preferred_cooling_setpoint_home_c + cool_ee_offset + cool_dr_offset)
-                heating_setpoint_celsius = float(self.preferred_heating_setpoint_home_c - heat_ee_offset - heat_dr_offset)
+                hour = self._local_hour(botengine)
+                preferred_cooling_setpoint_c = self.learning.get(MODE_HOME, KIND_COOL, hour)
+                preferred_heating_setpoint_c = self.learning.get(MODE_HOME, KIND_HEAT, hour)
+                cooling_setpoint_celsius = float(preferred_cooling_setpoint_c + cool_ee_offset + cool_dr_offset)
+                heating_setpoint_celsius = float(preferred_heating_setpoint_c - heat_ee_offset - heat_dr_offset)
 
                 if cooling_setpoint_celsius > MAXIMUM_COOLING_SETPOINT_C:
                     cooling_setpoint_celsius = MAXIMUM_COOLING_SETPOINT_C
@@ -964,9 +979,9 @@ class ThermostatDevice(Device):
                 self.set_cooling_setpoint(botengine, cooling_setpoint_celsius)
                 self.set_heating_setpoint(botengine, heating_setpoint_celsius)
 
-                policies["preferred_cooling_setpoint_home_c"] = self.preferred_cooling_setpoint_home_c
+                policies["preferred_cooling_setpoint_home_c"] = preferred_cooling_setpoint_c
                 policies["cooling_temperature_c"] = cooling_setpoint_celsius
-                policies["preferred_heating_setpoint_home_c"] = self.preferred_heating_setpoint_home_c
+                policies["preferred_heating_setpoint_home_c"] = preferred_heating_setpoint_c
                 policies["heating_temperature_c"] = heating_setpoint_celsius
 
                 # NOTE: Thermostat update the policy.
@@ -1057,25 +1072,32 @@ class ThermostatDevice(Device):
 
         system_mode = self.get_system_mode(botengine)
         self.location_object.increment_location_property(botengine, "{}_total_ee_incremental_policies_applied".format(self.device_id))
+        hour = self._local_hour(botengine)
 
         # Correct the maximum offset
         if "sleep" in identifier:
-            self.ee_stack_heat[identifier] += (self.preferred_heating_offset_sleep_c / 3)
-            if self.ee_stack_heat[identifier] > self.preferred_heating_offset_sleep_c:
-                self.ee_stack_heat[identifier] = self.preferred_heating_offset_sleep_c
+            heating_offset_c = self.learning.get(MODE_SLEEP, KIND_HEAT, hour)
+            cooling_offset_c = self.learning.get(MODE_SLEEP, KIND_COOL, hour)
+
+            self.ee_stack_heat[identifier] += (heating_offset_c / 3)
+            if self.ee_stack_heat[identifier] > heating_offset_c:
+                self.ee_stack_heat[identifier] = heating_offset_c
 
-            self.ee_stack_cool[identifier] += (self.preferred_cooling_offset_sleep_c / 3)
-            if self.ee_stack_cool[identifier] > self.preferred_cooling_offset_sleep_c:
-                self.ee_stack_cool[identifier] = self.preferred_cooling_offset_sleep_c
+            self.ee_stack_cool[identifier] += (cooling_offset_c / 3)
+            if self.ee_stack_cool[identifier] > cooling_offset_c:
+                self.ee_stack_cool[identifier] = cooling_offset_c
 
         elif "away" in identifier:
-            self.ee_stack_heat[identifier] += (self.preferred_heating_offset_away_c / 3)
-            if self.ee_stack_heat[identifier] > self.preferred_heating_offset_away_c:
-                self.ee_stack_heat[identifier] = self.preferred_heating_offset_away_c
+            heating_offset_c = self.learning.get(MODE_AWAY, KIND_HEAT, hour)
+            cooling_offset_c = self.learning.get(MODE_AWAY, KIND_COOL, hour)
 
-            self.ee_stack_cool[identifier] += (self.preferred_cooling_offset_away_c / 3)
-            if self.ee_stack_cool[identifier] > self.preferred_cooling_offset_away_c:
-                self.ee_stack_cool[identifier] = self.preferred_cooling_offset_away_c
+            self.ee_stack_heat[identifier] += (heating_offset_c / 3)
+            if self.ee_stack_heat[identifier] > heating_offset_c:
+                self.ee_stack_heat[identifier] = heating_offset_c
+
+            self.ee_stack_cool[identifier] += (cooling_offset_c / 3)
+            if self.ee_stack_cool[identifier] > cooling_offset_c:
+                self.ee_stack_cool[identifier] = cooling_offset_c
 
         else:
             self.ee_stack_cool[identifier] += (max_offset_c / 3)
@@ -1099,8 +1121,9 @@ class ThermostatDevice(Device):
         self.set_energy_efficiency(botengine, False, "sleep", change_temperature=False)
         self.location_object.increment_location_property(botengine, "{}_total_ee_away_policies_applied".format(self.device_id))
 
-        self.ee_stack_heat["away"] = self.preferred_heating_offset_away_c
-        self.ee_stack_cool["away"] = self.preferred_cooling_offset_away_c
+        hour = self._local_hour(botengine)
+        self.ee_stack_heat["away"] = self.learning.get(MODE_AWAY, KIND_HEAT, hour)
+        self.ee_stack_cool["away"] = self.learning.get(MODE_AWAY, KIND_COOL, hour)
 
         return self.apply_offsets(botengine)
 
@@ -1116,8 +1139,9 @@ class ThermostatDevice(Device):
 
         self.location_object.increment_location_property(botengine, "{}_total_ee_sleep_policies_applied".format(self.device_id))
 
-        self.ee_stack_heat["sleep"] = self.preferred_heating_offset_sleep_c
-        self.ee_stack_cool["sleep"] = self.preferred_cooling_offset_sleep_c
+        hour = self._local_hour(botengine)
+        self.ee_stack_heat["sleep"] = self.learning.get(MODE_SLEEP, KIND_HEAT, hour)
+        self.ee_stack_cool["sleep"] = self.learning.get(MODE_SLEEP, KIND_COOL, hour)
 
         return self.apply_offsets(botengine)
 
@@ -1183,5 +1207,37 @@ class ThermostatDevice(Device):
         return abs(a - b) > tolerance
 
 
+    def _local_hour(self, botengine):
+        """
+        :param botengine: BotEngine environment
+        :return: Local hour of the day to learn and apply preferences for, None if this thermostat doesn't have a location
+        """
+        if self.location_object is None:
+            return None
+
+        return self.location_object.get_local_datetime(botengine).hour
+
+    def _learn_offset(self, botengine, mode, kind, hour):
+        """
+        Learn the offset of the current setpoint from the HOME setpoint at this hour, in the direction that saves energy.
+        Offsets stay between 1 degree F and the absolute maximum offset.
+        :param botengine: BotEngine environment
+        :param mode: MODE_SLEEP or MODE_AWAY
+        :param kind: KIND_HEAT or KIND_COOL
+        :param hour: Local hour of the day
+        :return: Tuple (previous offset, learned offset) in Celsius for this hour
+        """
+        if kind == KIND_COOL:
+            offset_c = self.measurements[ThermostatDevice.MEASUREMENT_NAME_COOLING_SETPOINT_C][0][0] - self.learning.get(MODE_HOME, KIND_COOL, hour)
+            maximum_offset_c = self.absolute_max_cooling_offset_c
+
+        else:
+            offset_c = self.learning.get(MODE_HOME, KIND_HEAT, hour) - self.measurements[ThermostatDevice.MEASUREMENT_NAME_HEATING_SETPOINT_C][0][0]
+            maximum_offset_c = self.absolute_max_heating_offset_c
+
+        offset_c = min(max(offset_c, ONE_DEGREE_F_TO_C), maximum_offset_c)
+        previous_c = self.learning.get(mode, kind, hour)
+        return previous_c, self.learning.learn(mode, kind, offset_c, hour)
+
     def _celsius_to_narrative(self, temperature_c):
         return "{}°F / {}°C".format(str("%.1f" % float(utilities.celsius_to_fahrenheit(temperature_c))), str("%.1f" % float(temperature_c)))
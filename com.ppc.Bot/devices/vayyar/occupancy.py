@@ -0,0 +1,389 @@
+'''
+Created on October 17, 2026
+
+Occupancy targets and occupancy maps from a Vayyar Home device, decoded once and shared by every reader,
+and the trajectory of the targets over time.
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+import math
+
+# Targets are reported in centimeters, while room boundaries and subregions are defined in meters
+CENTIMETERS_PER_METER = 100
+
+# Number of subregions an empty occupancy map stands for
+DEFAULT_SUBREGIONS = 4
+
+
+class OccupancyTargets:
+    """
+    Occupancy targets from a single 'occupancyTarget' measurement, like "0:19,73,127;1:-40,210,30".
+
+    The targets are decoded into columns: target IDs, and typed arrays of the x, y and z coordinates in centimeters.
+    Containment queries compare a whole column against a boundary at a time.
+    """
+
+    __slots__ = ('timestamp_ms', 'ids', 'x', 'y', 'z')
+
+    def __init__(self, value, timestamp_ms):
+        """
+        :param value: Raw 'occupancyTarget' value
+        :param timestamp_ms: Timestamp of the measurement in milliseconds
+        """
+        self.timestamp_ms = timestamp_ms
+        self.ids = []
+        self.x = array('l')
+        self.y = array('l')
+        self.z = array('l')
+
+        for target in str(value).split(";"):
+            if ":" not in target:
+                continue
+
+            identifier, coordinates = target.split(":", 1)
+            x, y, z = coordinates.split(",")
+            self.ids.append(identifier)
+            self.x.append(int(x))
+            self.y.append(int(y))
+            self.z.append(int(z))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_dict(self):
+        """
+        :return: New dictionary of targets, { 'target_id': { 'x': x, 'y': y, 'z': z } }
+        """
+        return {identifier: {"x": x, "y": y, "z": z} for identifier, x, y, z in zip(self.ids, self.x, self.y, self.z)}
+
+    def inside(self, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters=None, z_max_meters=None):
+        """
+        Find the targets inside a box, like the room boundaries or a subregion.
+        Boundaries are inclusive, and a boundary of None doesn't limit that axis.
+        :param x_min_meters: Left boundary in meters
+        :param x_max_meters: Right boundary in meters
+        :param y_min_meters: Nearest boundary in meters
+        :param y_max_meters: Farthest boundary in meters
+        :param z_min_meters: Lowest boundary in meters
+        :param z_max_meters: Highest boundary in meters
+        :return: List of target IDs inside the box
+        """
+        inside = _inside(self.x, self.y, self.z, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters, z_max_meters)
+        return [identifier for identifier, i in zip(self.ids, inside) if i]
+
+    def inside_subregions(self, subregions):
+        """
+        Find the targets inside each subregion
+        :param subregions: List of subregions as reported by the device, like [{"xMin":-1.0,"xMax":1.0,"yMin":0.3,"yMax":1.0, ...}]
+        :return: { subregion_index: [ target IDs ] } for every subregion
+        """
+        return {index: self.inside(s.get('xMin'), s.get('xMax'), s.get('yMin'), s.get('yMax'), s.get('zMin'), s.get('zMax')) for index, s in enumerate(subregions)}
+
+
+def _inside(x, y, z, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters, z_max_meters):
+    """
+    Compare columns of coordinates in centimeters against a box in meters, one boundary at a time.
+    Boundaries are inclusive, and a boundary of None doesn't limit that axis.
+    :return: List with True for each row inside the box
+    """
+    inside = [True] * len(x)
+    for column, minimum, maximum in ((x, x_min_meters, x_max_meters), (y, y_min_meters, y_max_meters), (z, z_min_meters, z_max_meters)):
+        if minimum is not None:
+            minimum *= CENTIMETERS_PER_METER
+            inside = [i and v >= minimum for i, v in zip(inside, column)]
+
+        if maximum is not None:
+            maximum *= CENTIMETERS_PER_METER
+            inside = [i and v <= maximum for i, v in zip(inside, column)]
+
+    return inside
+
+
+def decode_occupancy_map(value):
+    """
+    Convert an 'occupancyMap' value like "1010" to ( 1, 0, 1, 0 )
+    :param value: Raw 'occupancyMap' value, a string like "0" or "0100", or the integer it may have been converted to
+    :return: Tuple with 1 for each occupied subregion and 0 for each empty one
+    """
+    if int(value) == 0:
+        return (0,) * DEFAULT_SUBREGIONS
+    return tuple(int(i) for i in str(value))
+
+
+class TargetTrajectory:
+    """
+    Trajectory of the occupancy targets of one device over time.
+
+    Each 'occupancyTarget' measurement is a frame. Frames are kept in timestamp order, and the targets of every frame
+    are appended to shared columns of target IDs and x / y / z coordinates in centimeters, with the offset of each
+    frame's first target. Queries over a sliding window find their frames with a binary search on the timestamps and
+    evaluate a boundary against whole columns, instead of decoding and looping over the measurements one at a time.
+
+    A device measures the targets again when they move, so a frame describes the room until the next frame.
+    """
+
+    def __init__(self):
+        # Timestamp of each frame, oldest first
+        self.timestamps = array('q')
+
+        # Offset of each frame's first target in the target columns, plus the end of the last frame
+        self.offsets = array('l', [0])
+
+        # Target columns
+        self.ids = []
+        self.x = array('l')
+        self.y = array('l')
+        self.z = array('l')
+
+        # Index of the oldest frame we still hold. Everything before it has expired.
+        self._start = 0
+
+    def __len__(self):
+        return len(self.timestamps) - self._start
+
+    def newest_timestamp_ms(self):
+        """
+        :return: Timestamp of the newest frame, or None if there are no frames
+        """
+        if len(self) == 0:
+            return None
+        return self.timestamps[-1]
+
+    def add(self, targets):
+        """
+        Add a frame, which must not be older than the newest frame
+        :param targets: OccupancyTargets of the frame
+        """
+        self.timestamps.append(targets.timestamp_ms)
+        self.ids.extend(targets.ids)
+        self.x.extend(targets.x)
+        self.y.extend(targets.y)
+        self.z.extend(targets.z)
+        self.offsets.append(len(self.ids))
+
+    def expire(self, oldest_timestamp_ms):
+        """
+        Remove frames older than the given timestamp
+        :param oldest_timestamp_ms: Oldest timestamp to keep
+        """
+        start = bisect_left(self.timestamps, oldest_timestamp_ms, self._start)
+        if start <= self._start:
+            return
+
+        self._start = start
+        if self._start * 2 >= len(self.timestamps):
+            # Compact the columns once half of them have expired
+            first = self.offsets[self._start]
+            del self.timestamps[:self._start]
+            del self.ids[:first]
+            del self.x[:first]
+            del self.y[:first]
+            del self.z[:first]
+            self.offsets = array('l', [offset - first for offset in self.offsets[self._start:]])
+            self._start = 0
+
+    def dwell_time_ms(self, oldest_timestamp_ms, newest_timestamp_ms, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters=None, z_max_meters=None):
+        """
+        Time spent with at least one target inside a box, like a subregion, within a window of time
+        :param oldest_timestamp_ms: Start of the window
+        :param newest_timestamp_ms: End of the window
+        :param x_min_meters: Left boundary in meters
+        :param x_max_meters: Right boundary in meters
+        :param y_min_meters: Nearest boundary in meters
+        :param y_max_meters: Farthest boundary in meters
+        :param z_min_meters: Lowest boundary in meters
+        :param z_max_meters: Highest boundary in meters
+        :return: Milliseconds within the window with a target inside the box
+        """
+        # The frame in effect at the start of the window counts from the start of the window
+        low = max(self._start, bisect_right(self.timestamps, oldest_timestamp_ms, self._start) - 1)
+        high = bisect_right(self.timestamps, newest_timestamp_ms, low)
+        if low >= high:
+            return 0
+
+        occupied = self._occupied_frames(low, high, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters, z_max_meters)
+        starts = [max(t, oldest_timestamp_ms) for t in self.timestamps[low:high]]
+        ends = starts[1:] + [newest_timestamp_ms]
+        return sum(end - start for start, end, o in zip(starts, ends, occupied) if o)
+
+    def time_since_target_ms(self, timestamp_ms, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters=None, z_max_meters=None):
+        """
+        Time since a target was last inside a box, like a subregion
+        :param timestamp_ms: Current timestamp in milliseconds
+        :param x_min_meters: Left boundary in meters
+        :param x_max_meters: Right boundary in meters
+        :param y_min_meters: Nearest boundary in meters
+        :param y_max_meters: Farthest boundary in meters
+        :param z_min_meters: Lowest boundary in meters
+        :param z_max_meters: Highest boundary in meters
+        :return: Milliseconds since the box was last occupied, 0 if it's occupied now, or None if it wasn't occupied within our trajectory
+        """
+        high = bisect_right(self.timestamps, timestamp_ms, self._start)
+        occupied = self._occupied_frames(self._start, high, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters, z_max_meters)
+        for i in range(len(occupied) - 1, -1, -1):
+            if occupied[i]:
+                if i == len(occupied) - 1:
+                    return 0
+
+                # The target left the box when the next frame arrived
+                return max(0, timestamp_ms - self.timestamps[self._start + i + 1])
+
+        return None
+
+    def speeds(self, oldest_timestamp_ms, newest_timestamp_ms):
+        """
+        Average speed of each target within a window of time, from the distance it covered between frames
+        :param oldest_timestamp_ms: Start of the window
+        :param newest_timestamp_ms: End of the window
+        :return: { 'target_id': meters per second } for each target seen in at least two frames within the window
+        """
+        low = bisect_left(self.timestamps, oldest_timestamp_ms, self._start)
+        high = bisect_right(self.timestamps, newest_timestamp_ms, low)
+        first = self.offsets[low]
+        last = self.offsets[high]
+
+        # Timestamp of each target row
+        times = array('q')
+        for i in range(low, high):
+            times.extend([self.timestamps[i]] * (self.offsets[i + 1] - self.offsets[i]))
+
+        # { 'target_id': [ centimeters, milliseconds, previous row ] }
+        totals = {}
+        for row, identifier in enumerate(self.ids[first:last], first):
+            total = totals.get(identifier)
+            if total is None:
+                totals[identifier] = [0.0, 0, row]
+                continue
+
+            previous = total[2]
+            total[0] += math.sqrt((self.x[row] - self.x[previous]) ** 2 + (self.y[row] - self.y[previous]) ** 2 + (self.z[row] - self.z[previous]) ** 2)
+            total[1] += times[row - first] - times[previous - first]
+            total[2] = row
+
+        return {identifier: (total[0] / CENTIMETERS_PER_METER) / (total[1] / 1000.0) for identifier, total in totals.items() if total[1] > 0}
+
+    def _occupied_frames(self, low, high, x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters, z_max_meters):
+        """
+        :return: List with True for each frame from low to high that has a target inside the box
+        """
+        first = self.offsets[low]
+        last = self.offsets[high]
+        inside = _inside(self.x[first:last], self.y[first:last], self.z[first:last], x_min_meters, x_max_meters, y_min_meters, y_max_meters, z_min_meters, z_max_meters)
+
+        occupied = [False] * (high - low)
+        for row in [i for i, v in enumerate(inside) if v]:
+            occupied[bisect_right(self.offsets, row + first, low) - 1 - low] = True
+        return occupied
+
+
+class OccupancyModel:
+    """
+    Decoded occupancy targets and occupancy maps of one device, by measurement.
+
+    Each measurement is decoded the first time any microservice reads it, and every reader after that gets the
+    decoded copy. Decoded measurements are forgotten once they expire out of the device's measurement history.
+    The model is a cache: it's saved empty with the device and fills up again as measurements are read.
+    """
+
+    def __init__(self):
+        # { timestamp_ms : ( value, OccupancyTargets ) }
+        self._targets = {}
+
+        # { timestamp_ms : ( value, ( 0, 1, ... ) ) }
+        self._maps = {}
+
+        # Trajectory of the targets
+        self._trajectory = TargetTrajectory()
+
+    def __len__(self):
+        return len(self._targets) + len(self._maps)
+
+    def __reduce__(self):
+        return (OccupancyModel, ())
+
+    def targets(self, value, timestamp_ms):
+        """
+        :param value: Raw 'occupancyTarget' value
+        :param timestamp_ms: Timestamp of the measurement in milliseconds
+        :return: OccupancyTargets for this measurement
+        """
+        return self._decode(self._targets, value, timestamp_ms, lambda: OccupancyTargets(value, timestamp_ms))
+
+    def occupancy_map(self, value, timestamp_ms):
+        """
+        :param value: Raw 'occupancyMap' value
+        :param timestamp_ms: Timestamp of the measurement in milliseconds
+        :return: Tuple with 1 for each occupied subregion and 0 for each empty one
+        """
+        return self._decode(self._maps, value, timestamp_ms, lambda: decode_occupancy_map(value))
+
+    def trajectory(self, history):
+        """
+        Bring the trajectory up to date with the 'occupancyTarget' measurement history and return it.
+        New measurements are appended as frames. The trajectory is built again from the whole history if it doesn't
+        match, like after the model was restored empty or a measurement arrived out of order.
+        :param history: MeasurementHistory of the 'occupancyTarget' parameter
+        :return: TargetTrajectory
+        """
+        trajectory = self._trajectory
+        if len(history) == 0:
+            self._trajectory = TargetTrajectory()
+            return self._trajectory
+
+        newest_timestamp_ms = trajectory.newest_timestamp_ms()
+        if newest_timestamp_ms is not None:
+            # Measurements at the newest timestamp may be new too, so only whole timestamps get appended
+            trajectory.expire(history[-1][1])
+            for value, timestamp_ms in reversed(history.between(newest_timestamp_ms + 1, None)):
+                trajectory.add(self._peek_targets(value, timestamp_ms))
+
+        if len(trajectory) != len(history):
+            trajectory = TargetTrajectory()
+            for value, timestamp_ms in reversed(history):
+                trajectory.add(self._peek_targets(value, timestamp_ms))
+            self._trajectory = trajectory
+
+        return trajectory
+
+    def expire(self, oldest_timestamp_ms):
+        """
+        Forget decoded measurements older than the given timestamp
+        :param oldest_timestamp_ms: Oldest timestamp to keep
+        """
+        for cache in (self._targets, self._maps):
+            for timestamp_ms in [t for t in cache if t < oldest_timestamp_ms]:
+                del cache[timestamp_ms]
+
+    def _peek_targets(self, value, timestamp_ms):
+        """
+        Targets of a measurement, from the cache if a reader already decoded it, without adding it to the cache
+        :param value: Raw 'occupancyTarget' value
+        :param timestamp_ms: Timestamp of the measurement in milliseconds
+        :return: OccupancyTargets
+        """
+        cached = self._targets.get(timestamp_ms)
+        if cached is not None and cached[0] == value:
+            return cached[1]
+        return OccupancyTargets(value, timestamp_ms)
+
+    def _decode(self, cache, value, timestamp_ms, decode):
+        """
+        :param cache: Cache of decoded measurements for this parameter
+        :param value: Raw value
+        :param timestamp_ms: Timestamp of the measurement in milliseconds
+        :param decode: Function to decode the value
+        :return: Decoded value
+        """
+        cached = cache.get(timestamp_ms)
+        if cached is not None and cached[0] == value:
+            return cached[1]
+
+        decoded = decode()
+        cache[timestamp_ms] = (value, decoded)
+        return decoded
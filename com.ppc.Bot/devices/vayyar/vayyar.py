@@ -8,6 +8,8 @@ file 'LICENSE.txt', which is part of this source code package.
 '''
 
 from devices.device import Device
+from devices.measurements import MeasurementHistory
+from devices.vayyar.occupancy import OccupancyModel, OccupancyTargets
 import signals.vayyar as vayyar
 import utilities.utilities as utilities
 
@@ -133,6 +135,9 @@ class VayyarDevice(Device):
         # Default Behavior
         self.goal_id = VayyarDevice.BEHAVIOR_TYPE_OTHER
 
+        # Occupancy targets and maps decoded from our measurements, shared by every microservice that reads them
+        self.occupancy = OccupancyModel()
+
     def new_version(self, botengine):
         """
         New version
@@ -176,6 +181,10 @@ class VayyarDevice(Device):
         if not hasattr(self, 'knowledge_occupied_subregions'):
             self.knowledge_occupied_subregions = []
 
+        # Added October 17, 2026
+        if not hasattr(self, 'occupancy'):
+            self.occupancy = OccupancyModel()
+
 
     def get_device_type_name(self):
         """
@@ -422,7 +431,7 @@ class VayyarDevice(Device):
 
         if self.is_connected:
             if VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET in self.measurements:
-                botengine.get_logger().debug("get_occupancy_targets: pure targets={}".format(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET]))
+                botengine.get_logger().debug("get_occupancy_targets: pure targets=%s", self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET])
                 extract_multiple = newest_timestamp_ms is not None and oldest_timestamp_ms is not None
 
                 if newest_timestamp_ms is None:
@@ -431,19 +440,106 @@ class VayyarDevice(Device):
                 if oldest_timestamp_ms is None:
                     oldest_timestamp_ms = newest_timestamp_ms - (utilities.ONE_MINUTE_MS * 30)
 
-                for t in self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET]:
-                    if t[1] < oldest_timestamp_ms:
-                        break
+                for target in self.get_decoded_targets(botengine, oldest_timestamp_ms, newest_timestamp_ms, limit=None if extract_multiple else 1):
+                    targets[target.timestamp_ms] = target.to_dict()
+        botengine.get_logger().info("get_occupancy_targets: targets=%s", targets)
+        return targets
 
-                    if t[1] > newest_timestamp_ms:
-                        continue
+    def get_decoded_targets(self, botengine, oldest_timestamp_ms=None, newest_timestamp_ms=None, limit=None):
+        """
+        Get the occupancy targets within a range of time from the locally available 1-hour cache, decoded into columns of
+        target IDs and x / y / z coordinates in centimeters. Each measurement is only decoded once, no matter how many
+        microservices read it.
 
-                    targets[t[1]] = self._extract_targets(t[0])
+        Unlike get_occupancy_targets(), this does not check whether the device is connected.
 
-                    if not extract_multiple:
-                        break
-        botengine.get_logger().info("get_occupancy_targets: targets={}".format(targets))
-        return targets
+        :param botengine: BotEngine environment
+        :param oldest_timestamp_ms: Oldest timestamp in milliseconds to include, or None for no limit
+        :param newest_timestamp_ms: Newest timestamp in milliseconds to include, or None for no limit
+        :param limit: Maximum number of measurements to decode, newest first, or None for no limit
+        :return: List of OccupancyTargets, newest first
+        """
+        history = self.get_measurement_history(botengine, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, oldest_timestamp_ms, newest_timestamp_ms)
+        if history is None:
+            return []
+
+        self._expire_occupancy()
+        return [self.occupancy.targets(value, timestamp_ms) for value, timestamp_ms in history[:limit]]
+
+    def get_targets_in_room(self, botengine):
+        """
+        Get the newest targets that are inside the room boundaries
+        :param botengine: BotEngine environment
+        :return: List of target IDs inside the room boundaries
+        """
+        targets = self.get_decoded_targets(botengine, botengine.get_timestamp() - (utilities.ONE_MINUTE_MS * 30), botengine.get_timestamp(), limit=1)
+        if len(targets) == 0 or not self.is_connected:
+            return []
+
+        room = self.get_room_boundaries(botengine)
+        return targets[0].inside(room['x_min_meters'], room['x_max_meters'], room['y_min_meters'], room['y_max_meters'], room['z_min_meters'], room['z_max_meters'])
+
+    def get_targets_in_subregions(self, botengine):
+        """
+        Get the newest targets inside each subregion reported by the device.
+        This does not provide context.
+        :param botengine: BotEngine environment
+        :return: { subregion_index: [ target IDs ] } for every subregion, or {} if there are no subregions or targets
+        """
+        targets = self.get_decoded_targets(botengine, botengine.get_timestamp() - (utilities.ONE_MINUTE_MS * 30), botengine.get_timestamp(), limit=1)
+        if len(targets) == 0 or not self.is_connected:
+            return {}
+
+        subregions = self.get_raw_subregions(botengine)
+        if subregions is None:
+            return {}
+
+        return targets[0].inside_subregions(subregions)
+
+    def get_trajectory(self, botengine):
+        """
+        Get the trajectory of the occupancy targets over the locally available 1-hour cache of measurements.
+        The trajectory is shared by every microservice and only decodes the measurements that are new since it was last read.
+        :param botengine: BotEngine environment
+        :return: TargetTrajectory
+        """
+        history = self.measurements.get(VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET)
+        if not isinstance(history, MeasurementHistory):
+            history = MeasurementHistory(history)
+        return self.occupancy.trajectory(history)
+
+    def get_subregion_dwell_times_ms(self, botengine, window_ms=utilities.ONE_HOUR_MS):
+        """
+        Get how long a target spent inside each subregion reported by the device over a sliding window of time
+        :param botengine: BotEngine environment
+        :param window_ms: Length of the window in milliseconds, ending now
+        :return: { subregion_index: milliseconds } for every subregion, or {} if there are no subregions
+        """
+        subregions = self.get_raw_subregions(botengine) or []
+        trajectory = self.get_trajectory(botengine)
+        now_ms = botengine.get_timestamp()
+        return {index: trajectory.dwell_time_ms(now_ms - window_ms, now_ms, s.get('xMin'), s.get('xMax'), s.get('yMin'), s.get('yMax'), s.get('zMin'), s.get('zMax')) for index, s in enumerate(subregions)}
+
+    def get_time_since_target_in_subregions_ms(self, botengine):
+        """
+        Get how long ago a target was last inside each subregion reported by the device
+        :param botengine: BotEngine environment
+        :return: { subregion_index: milliseconds } for every subregion, 0 if it's occupied now, or None if it wasn't occupied within the last hour
+        """
+        subregions = self.get_raw_subregions(botengine) or []
+        trajectory = self.get_trajectory(botengine)
+        now_ms = botengine.get_timestamp()
+        return {index: trajectory.time_since_target_ms(now_ms, s.get('xMin'), s.get('xMax'), s.get('yMin'), s.get('yMax'), s.get('zMin'), s.get('zMax')) for index, s in enumerate(subregions)}
+
+    def get_target_speeds(self, botengine, window_ms=utilities.ONE_MINUTE_MS * 5):
+        """
+        Get the average speed of each target over a sliding window of time
+        :param botengine: BotEngine environment
+        :param window_ms: Length of the window in milliseconds, ending now
+        :return: { 'target_id': meters per second } for each target measured at least twice within the window
+        """
+        now_ms = botengine.get_timestamp()
+        return self.get_trajectory(botengine).speeds(now_ms - window_ms, now_ms)
 
     def get_newest_targets(self, botengine):
         """
@@ -1275,11 +1371,11 @@ class VayyarDevice(Device):
         if VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP in self.last_updated_params:
             if VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP in self.measurements:
                 if len(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP]) > 1:
-                    m_new = self._to_subregion_indices(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][0][0])
-                    m_old = self._to_subregion_indices(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][1][0])
-                    botengine.get_logger().info("vayyar.py: \n\tm_new = {}\nm_old = {}".format(m_new, m_old))
+                    m_new = self._to_subregion_indices(*self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][0])
+                    m_old = self._to_subregion_indices(*self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][1])
+                    botengine.get_logger().info("vayyar.py: \n\tm_new = %s\nm_old = %s", m_new, m_old)
                     for i in range(0, len(m_new)):
-                        if m_new[i] and not m_old[i]:
+                        if m_new[i] and not (i < len(m_old) and m_old[i]):
                             entered.append(i)
 
         return entered
@@ -1294,7 +1390,7 @@ class VayyarDevice(Device):
         occupied = []
         if VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP in self.measurements:
             if len(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP]) > 1:
-                m_new = self._to_subregion_indices(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][0][0])
+                m_new = self._to_subregion_indices(*self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][0])
                 for i in range(0, len(m_new)):
                     if m_new[i]:
                         occupied.append(i)
@@ -1311,47 +1407,45 @@ class VayyarDevice(Device):
         if VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP in self.last_updated_params:
             if VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP in self.measurements:
                 if len(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP]) > 1:
-                    m_new = self._to_subregion_indices(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][0][0])
-                    m_old = self._to_subregion_indices(self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][1][0])
-                    for i in range(0, len(m_new)):
-                        if not m_new[i] and m_old[i]:
+                    m_new = self._to_subregion_indices(*self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][0])
+                    m_old = self._to_subregion_indices(*self.measurements[VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP][1])
+                    for i in range(0, len(m_old)):
+                        if m_old[i] and not (i < len(m_new) and m_new[i]):
                             exited.append(i)
 
         return exited
 
-    def _to_subregion_indices(self, subregion_str):
+    def _to_subregion_indices(self, subregion_str, timestamp_ms):
         """
-        Convert "1010" to [1, 0, 1, 0]
+        Convert "1010" to (1, 0, 1, 0), decoding each occupancy map measurement only once
 
         :param subregion_str: Subregion string like "0" or "0100"
-        :return: Subregion list [0, 0, 0, 0] or [0, 1, 0, 0]
+        :param timestamp_ms: Timestamp of the measurement in milliseconds
+        :return: Subregion tuple (0, 0, 0, 0) or (0, 1, 0, 0)
         """
-        if int(subregion_str) == 0:
-            return [0, 0, 0, 0]
+        self._expire_occupancy()
+        return self.occupancy.occupancy_map(subregion_str, timestamp_ms)
 
-        indices = []
-        for i in str(subregion_str):
-            indices.append(int(i))
-        return indices
+    def _expire_occupancy(self):
+        """
+        Forget decoded occupancy measurements that are no longer in our measurement history
+        """
+        total = 0
+        oldest_timestamp_ms = None
+        for param_name in [VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_TARGET, VayyarDevice.MEASUREMENT_NAME_OCCUPANCY_MAP]:
+            history = self.measurements.get(param_name)
+            if history:
+                total += len(history)
+                if oldest_timestamp_ms is None or history[-1][1] < oldest_timestamp_ms:
+                    oldest_timestamp_ms = history[-1][1]
 
+        if oldest_timestamp_ms is not None and len(self.occupancy) > total:
+            self.occupancy.expire(oldest_timestamp_ms)
 
     def _extract_targets(self, target):
         """
         Private method to extract the occupancy targets from a single occupancy presence measurement
-        :param botengine:
-        :param target:
-        :return:
+        :param target: Raw 'occupancyTarget' value
+        :return: { 'target_id': { 'x': x, 'y': y, 'z': z } }
         """
-        targets = {}
-        for t in target.split(";"):
-            identifier = t.split(":")[0]
-            x = t.split(":")[1].split(",")[0]
-            y = t.split(":")[1].split(",")[1]
-            z = t.split(":")[1].split(",")[2]
-            targets[identifier] = {
-                "x": int(x),
-                "y": int(y),
-                "z": int(z)
-            }
-
-        return targets
+        return OccupancyTargets(target, None).to_dict()
@@ -165,7 +165,7 @@ class Filter:
 
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param csv_dict: { device_object: 'csv data string' }
+        :param csv_dict: { device_object: DataRequestContent }
         """
         return
 
@@ -298,10 +298,10 @@ class Filter:
                 if index is not None:
                     if 'index' in m:
                         if utilities.normalize_measurement(m['index']) == index:
-                            m['value'] = utilities.normalize_measurement(m['value'])
+                            m['value'] = utilities.normalize_measurement(m['value'], name)
                             return m
                 else:
-                    m['value'] = utilities.normalize_measurement(m['value'])
+                    m['value'] = utilities.normalize_measurement(m['value'], name)
                     return m
 
         return None
@@ -14,6 +14,20 @@ class Intelligence:
     """
     Base Intelligence Module Class / Interface
     """
+
+    # Subscriptions.
+    # Declare which events this microservice listens to, so the location only delivers the events it cares about.
+    # Leave a subscription as None to receive everything.
+
+    # Device types that trigger device_measurements_updated(), for example [10014, 10072]
+    SUBSCRIBED_DEVICE_TYPES = None
+
+    # Measurement parameter names that trigger device_measurements_updated(), for example ["doorStatus"]
+    SUBSCRIBED_PARAMETERS = None
+
+    # Data stream addresses that trigger datastream_updated(), for example ["update_occupancy"]
+    SUBSCRIBED_DATASTREAMS = None
+
     def __init__(self, botengine, parent):
         """
         Instantiate this object
@@ -235,13 +249,17 @@ class Intelligence:
         reference is passed back out at the completion of the request, allowing the developer to ensure the
         data request that is now available was truly destined for their microservice.
 
+        Each device's CSV data is a utilities.datarequests.DataRequestContent instead of the bytes it used to be.
+        Iterate over its rows() to read the data one row at a time instead of loading it all into memory, or call
+        bytes(content) where the complete bytes are needed.
+
         Your bots will need to include the following configuration for data requests to operate:
         * runtime.json should include trigger 2048
         * structure.json should include inside 'pip_install_remotely' a reference to the "lz4" Python package
 
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param csv_dict: { device_object: 'csv data string' }
+        :param csv_dict: { device_object: DataRequestContent }
         """
         return
 
@@ -345,10 +363,60 @@ class Intelligence:
         # They're all the same thing underneath, and this is a convenience method help to avoid confusion and questions.
         botengine.cancel_timers(self.intelligence_id + str(reference))
 
+    #===============================================================================
+    # Subscriptions
+    #===============================================================================
+    @classmethod
+    def implements(cls, method_name):
+        """
+        :param method_name: Name of an event method on this interface, for example 'schedule_fired'
+        :return: True if this microservice overrides the event method, False if the event would do nothing here
+        """
+        return getattr(cls, method_name, None) is not getattr(Intelligence, method_name)
+
+    @classmethod
+    def subscribes_to_device_type(cls, device_type):
+        """
+        :param device_type: Device type
+        :return: True if measurements from this device type should be delivered to this microservice
+        """
+        if not cls.implements("device_measurements_updated"):
+            return False
+        return cls.SUBSCRIBED_DEVICE_TYPES is None or device_type in cls.SUBSCRIBED_DEVICE_TYPES
+
+    @classmethod
+    def subscribes_to_parameters(cls, updated_params):
+        """
+        :param updated_params: List of measurement parameter names that were just updated
+        :return: True if any of these parameters should be delivered to this microservice
+        """
+        if cls.SUBSCRIBED_PARAMETERS is None:
+            return True
+
+        for param_name in updated_params:
+            if param_name in cls.SUBSCRIBED_PARAMETERS:
+                return True
+        return False
+
+    @classmethod
+    def subscribes_to_datastream(cls, address):
+        """
+        :param address: Data stream address
+        :return: True if data stream messages to this address should be delivered to this microservice
+        """
+        if cls.SUBSCRIBED_DATASTREAMS is not None:
+            return address in cls.SUBSCRIBED_DATASTREAMS
+
+        if cls.implements("datastream_updated"):
+            return True
+
+        # The default datastream_updated() only calls a method named after the address
+        return hasattr(cls, address)
+
     # ===============================================================================
     # Private methods
     # ===============================================================================
-    
+
     def _init_statistics(self):
         self.statistics = {
             "calls": 0,
@@ -9,6 +9,7 @@ file 'LICENSE.txt', which is part of this source code package.
 
 import pytz
 import datetime
+import time
 import utilities.utilities as utilities
 from utilities.narrative import *
 import index
@@ -17,6 +18,19 @@ import properties
 
 from users.user import User
 
+
+def _subscribes(receiver, subscription_method, *args):
+    """
+    Ask a microservice whether it subscribes to an event.
+    Objects that don't declare subscriptions receive everything.
+    :param receiver: Microservice object
+    :param subscription_method: Subscription classmethod name, for example 'subscribes_to_datastream'
+    :return: True if the event should be delivered
+    """
+    subscribes = getattr(receiver, subscription_method, None)
+    return subscribes is None or subscribes(*args)
+
+
 class Location:
     """
     Provide tools and information to manage the Location.
@@ -158,6 +172,9 @@ class Location:
                     import time
                     time.sleep(2)
 
+        # Device microservices may have been added or removed
+        self._reset_dispatch_index()
+
         # Tell all filters we're running a new version
         for filter_object in self.filters.values():
             try:
@@ -259,7 +276,13 @@ class Location:
         Perform any bounds checking, for example with multiple gateways at one location.
         :param device_object: Device object to track
         """
+        replaced = device_object.device_id in self.devices
         self.devices[device_object.device_id] = device_object
+        self._reset_dispatch_index()
+        if replaced:
+            self._reset_device_index()
+        else:
+            self._index_device(device_object)
 
         if hasattr(device_object, "intelligence_modules"):
             for intelligence_id in device_object.intelligence_modules:
@@ -310,6 +333,8 @@ class Location:
                 botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py.delete_device() device_object.destory(): {}".format(e))
 
             del self.devices[device_id]
+            self._reset_dispatch_index()
+            self._unindex_device(device_object)
 
             for microservice_object in self.intelligence_modules.values():
                 try:
@@ -403,25 +428,17 @@ class Location:
 
     def device_measurements_updated(self, botengine, device_object):
         """
-        Evaluate a device that was recently updated
+        Evaluate a device that was recently updated.
+        Only location microservices subscribed to this device type and its updated parameters receive the update.
         :param botengine: BotEngine environment
         :param device_object: Device object that was updated
         """
-        for microservice_object in self.intelligence_modules.values():
-            try:
-                import time
-                t = time.time()
-                microservice_object.device_measurements_updated(botengine, device_object)
-                microservice_object.track_statistics(botengine, (time.time() - t) * 1000)
-            except Exception as e:
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering device_measurements_updated to location microservice (continuing execution): " + str(e))
-                import traceback
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                if botengine.playback:
-                    # Give us a chance to see the error as we playback data in fast-forward mode
-                    import time
-                    time.sleep(2)
-    
+        for microservice_object in self._measurement_receivers(device_object.device_type):
+            if not _subscribes(microservice_object, "subscribes_to_parameters", device_object.last_updated_params):
+                continue
+
+            self._deliver(botengine, microservice_object, "device_measurements_updated", "location microservice", device_object)
+
     def device_metadata_updated(self, botengine, device_object):
         """
         Evaluate a device that is new or whose goal/scenario was recently updated
@@ -505,60 +522,26 @@ class Location:
     
     def datastream_updated(self, botengine, address, content):
         """
-        Data Stream Updated
+        Data Stream Updated.
+        Only microservices subscribed to this data stream address receive the message. Filters receive every message.
         :param botengine: BotEngine environment
         :param address: Data Stream address
         :param content: Data Stream content
         """
+        location_microservices, device_microservices = self._datastream_receivers(address)
+
         # Top priority - Location microservices
-        botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("location.py - Delivering datastream message '{}' to microservices: {}".format(address, address))
-        for microservice_object in self.intelligence_modules.values():
-            if not hasattr(microservice_object, "datastream_updated"):
-                continue
-            botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("location.py - Delivering datastream message '{}' to location microservice: {}".format(address, microservice_object))
-            try:
-                import time
-                t = time.time()
-                microservice_object.datastream_updated(botengine, address, content.copy() if isinstance(content, dict) else content)
-                microservice_object.track_statistics(botengine, (time.time() - t) * 1000)
-            except Exception as e:
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering datastream message '{}' to location microservice (continuing execution): {}".format(address, str(e)))
-                import traceback
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                if botengine.playback:
-                    # Give us a chance to see the error as we playback data in fast-forward mode
-                    import time
-                    time.sleep(2)
+        botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("location.py - Delivering datastream message '{}' to {} location microservices and {} device microservices".format(address, len(location_microservices), len(device_microservices)))
+        for microservice_object in location_microservices:
+            self._deliver(botengine, microservice_object, "datastream_updated", "location microservice", address, content.copy() if isinstance(content, dict) else content)
 
         # Second priority - Device microservices
-        for device_object in self.devices.values():
-            botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("location.py - Delivering datastream message '{}' to device: {}".format(address, device_object))
-            if hasattr(device_object, "intelligence_modules"):
-                for intelligence_id in device_object.intelligence_modules:
-                    botengine.get_logger(f"{__name__}.{__class__.__name__}").debug("location.py - Delivering datastream message '{}' to device microservice: {}".format(address, intelligence_id))
-                    try:
-                        device_object.intelligence_modules[intelligence_id].datastream_updated(botengine, address, content.copy() if isinstance(content, dict) else content)
-                    except Exception as e:
-                        botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering datastream message '{}' to device microservice (continuing execution): {}".format(address, str(e)))
-                        import traceback
-                        botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                        if botengine.playback:
-                            # Give us a chance to see the error as we playback data in fast-forward mode
-                            import time
-                            time.sleep(2)
+        for microservice_object in device_microservices:
+            self._deliver(botengine, microservice_object, "datastream_updated", "device microservice", address, content.copy() if isinstance(content, dict) else content, track_statistics=False)
 
         # Lowest priority - filters
         for filter_object in self.filters.values():
-            try:
-                filter_object.datastream_updated(botengine, address, content.copy() if isinstance(content, dict) else content)
-            except Exception as e:
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering datastream message to data filter (continuing execution): " + str(e))
-                import traceback
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                if botengine.playback:
-                    # Give us a chance to see the error as we playback data in fast-forward mode
-                    import time
-                    time.sleep(2)
+            self._deliver(botengine, filter_object, "datastream_updated", "data filter", address, content.copy() if isinstance(content, dict) else content, track_statistics=False)
 
     def schedule_fired(self, botengine, schedule_id):
         """
@@ -571,48 +554,18 @@ class Location:
 
         # Filters
         for filter_object in self.filters.values():
-            try:
-                filter_object.schedule_fired(botengine, schedule_id)
-            except Exception as e:
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering schedule_fired to filter (continuing execution): " + str(e))
-                import traceback
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                if botengine.playback:
-                    # Give us a chance to see the error as we playback data in fast-forward mode
-                    import time
-                    time.sleep(2)
+            self._deliver(botengine, filter_object, "schedule_fired", "filter", schedule_id, track_statistics=False)
+
+        location_microservices, device_microservices = self._schedule_receivers()
 
         # Location intelligence modules
-        for microservice_object in self.intelligence_modules.values():
-            try:
-                import time
-                t = time.time()
-                microservice_object.schedule_fired(botengine, schedule_id)
-                microservice_object.track_statistics(botengine, (time.time() - t) * 1000)
-            except Exception as e:
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering schedule_fired to location microservice (continuing execution): " + str(e))
-                import traceback
-                botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                if botengine.playback:
-                    # Give us a chance to see the error as we playback data in fast-forward mode
-                    import time
-                    time.sleep(2)
+        for microservice_object in location_microservices:
+            self._deliver(botengine, microservice_object, "schedule_fired", "location microservice", schedule_id)
 
         # Device intelligence modules
-        for device_object in self.devices.values():
-            if hasattr(device_object, "intelligence_modules"):
-                for intelligence_id in device_object.intelligence_modules:
-                    try:
-                        device_object.intelligence_modules[intelligence_id].schedule_fired(botengine, schedule_id)
-                    except Exception as e:
-                        botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering schedule_fired to device microservice (continuing execution): " + str(e))
-                        import traceback
-                        botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                        if botengine.playback:
-                            # Give us a chance to see the error as we playback data in fast-forward mode
-                            import time
-                            time.sleep(2)
-        
+        for microservice_object in device_microservices:
+            self._deliver(botengine, microservice_object, "schedule_fired", "device microservice", schedule_id, track_statistics=False)
+
     def timer_fired(self, botengine, microservice_id, argument):
         """
         Timer fired
@@ -620,38 +573,18 @@ class Location:
         :param microservice_id: Microservice to trigger
         :param argument: Optional argument
         """
-        # Search for and trigger location intelligence instances
-        for microservice_object in self.intelligence_modules.values():
-            if microservice_id == microservice_object.intelligence_id:
-                try:
-                    import time
-                    t = time.time()
-                    microservice_object.timer_fired(botengine, argument)
-                    microservice_object.track_statistics(botengine, (time.time() - t) * 1000)
-                except Exception as e:
-                    botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error triggering timer_fired in location microservice (continuing execution): " + str(e))
-                    import traceback
-                    botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                    if botengine.playback:
-                        # Give us a chance to see the error as we playback data in fast-forward mode
-                        import time
-                        time.sleep(2)
-                return
+        dispatch_index = self._dispatch_index()
 
-        # Search for and trigger filters
-        for filter_object in self.filters.values():
-            if microservice_id == filter_object.filter_id:
-                try:
-                    filter_object.timer_fired(botengine, argument)
-                except Exception as e:
-                    botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error triggering timer_fired in filter microservice (continuing execution): " + str(e))
-                    import traceback
-                    botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
-                    if botengine.playback:
-                        # Give us a chance to see the error as we playback data in fast-forward mode
-                        import time
-                        time.sleep(2)
-                return
+        # Location intelligence instances
+        microservice_object = dispatch_index["location_microservices"].get(microservice_id)
+        if microservice_object is not None:
+            self._deliver(botengine, microservice_object, "timer_fired", "location microservice", argument)
+            return
+
+        # Filters
+        filter_object = dispatch_index["filters"].get(microservice_id)
+        if filter_object is not None:
+            self._deliver(botengine, filter_object, "timer_fired", "filter microservice", argument, track_statistics=False)
 
     def file_uploaded(self, botengine, device_object, file_id, filesize_bytes, content_type, file_extension):
         """
@@ -755,7 +688,7 @@ class Location:
         A botengine.request_data() asynchronous request for CSV data is ready.
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param device_csv_dict: { 'device_id': 'csv data string' }
+        :param device_csv_dict: { device_object: DataRequestContent }
         """
         # Filters to correct data before passing to other microservices
         # Edit the device_csv_dict in place inside the filter
@@ -862,16 +795,237 @@ class Location:
         :param microservice_id: Microservice ID
         :return: Microservice object, or None if it doesn't exist.
         """
-        for microservice_object in self.intelligence_modules.values():
-            if microservice_object.intelligence_id == microservice_id:
-                return microservice_object
+        dispatch_index = self._dispatch_index()
+        microservice_object = dispatch_index["location_microservices"].get(microservice_id)
+        if microservice_object is None:
+            microservice_object = dispatch_index["device_microservices"].get(microservice_id)
+        return microservice_object
 
-        for device_object in self.devices.values():
-            for microservice in device_object.intelligence_modules:
-                if device_object.intelligence_modules[microservice].intelligence_id == microservice_id:
-                    return device_object.intelligence_modules[microservice]
+    # ===========================================================================
+    # Event dispatch
+    # ===========================================================================
+    def _dispatch_index(self):
+        """
+        Index of who receives which events, so each event only reaches the microservices that care about it.
+        The index is built lazily, reset whenever microservices, filters or devices change, and never saved with the location.
+        :return: Dispatch index dictionary
+        """
+        if getattr(self, "_dispatch", None) is None:
+            device_microservices = {}
+            for device_object in self.devices.values():
+                for microservice_object in getattr(device_object, "intelligence_modules", {}).values():
+                    device_microservices[microservice_object.intelligence_id] = microservice_object
 
-        return None
+            self._dispatch = {
+                # { 'intelligence_id': location_microservice_object }
+                "location_microservices": {microservice_object.intelligence_id: microservice_object for microservice_object in self.intelligence_modules.values()},
+
+                # { 'intelligence_id': device_microservice_object }
+                "device_microservices": device_microservices,
+
+                # { 'filter_id': filter_object }
+                "filters": {filter_object.filter_id: filter_object for filter_object in self.filters.values()},
+
+                # { device_type: [location_microservice_object, ...] }
+                "measurements": {},
+
+                # { 'address': ([location_microservice_object, ...], [device_microservice_object, ...]) }
+                "datastreams": {},
+
+                # ([location_microservice_object, ...], [device_microservice_object, ...])
+                "schedules": None
+            }
+
+        return self._dispatch
+
+    def _reset_dispatch_index(self):
+        """
+        Microservices, filters or devices changed. Rebuild the dispatch index the next time we deliver an event.
+        """
+        self._dispatch = None
+
+    def _measurement_receivers(self, device_type):
+        """
+        :param device_type: Device type that was updated
+        :return: List of location microservices subscribed to measurements from this device type
+        """
+        measurements = self._dispatch_index()["measurements"]
+        if device_type not in measurements:
+            measurements[device_type] = [x for x in self.intelligence_modules.values() if _subscribes(x, "subscribes_to_device_type", device_type)]
+        return measurements[device_type]
+
+    def _datastream_receivers(self, address):
+        """
+        :param address: Data stream address
+        :return: ([location microservices], [device microservices]) subscribed to this data stream address
+        """
+        dispatch_index = self._dispatch_index()
+        if address not in dispatch_index["datastreams"]:
+            dispatch_index["datastreams"][address] = (
+                [x for x in dispatch_index["location_microservices"].values() if hasattr(x, "datastream_updated") and _subscribes(x, "subscribes_to_datastream", address)],
+                [x for x in dispatch_index["device_microservices"].values() if hasattr(x, "datastream_updated") and _subscribes(x, "subscribes_to_datastream", address)]
+            )
+        return dispatch_index["datastreams"][address]
+
+    def _schedule_receivers(self):
+        """
+        :return: ([location microservices], [device microservices]) that implement schedule_fired()
+        """
+        dispatch_index = self._dispatch_index()
+        if dispatch_index["schedules"] is None:
+            dispatch_index["schedules"] = (
+                [x for x in dispatch_index["location_microservices"].values() if _subscribes(x, "implements", "schedule_fired")],
+                [x for x in dispatch_index["device_microservices"].values() if _subscribes(x, "implements", "schedule_fired")]
+            )
+        return dispatch_index["schedules"]
+
+    def _deliver(self, botengine, receiver, method_name, receiver_description, *args, track_statistics=True):
+        """
+        Deliver an event to a single microservice or filter, tracking how long it took and containing any errors
+        :param botengine: BotEngine environment
+        :param receiver: Microservice or filter object
+        :param method_name: Name of the event method to call, for example 'schedule_fired'
+        :param receiver_description: Description of the receiver for error logs, for example 'location microservice'
+        :param args: Event arguments following the botengine argument
+        :param track_statistics: True to track the execution time in the receiver's statistics
+        """
+        try:
+            t = time.time()
+            getattr(receiver, method_name)(botengine, *args)
+            if track_statistics:
+                receiver.track_statistics(botengine, (time.time() - t) * 1000)
+
+        except Exception as e:
+            botengine.get_logger(f"{__name__}.{__class__.__name__}").warning("location.py - Error delivering {} to {} (continuing execution): {}".format(method_name, receiver_description, str(e)))
+            import traceback
+            botengine.get_logger(f"{__name__}.{__class__.__name__}").error(traceback.format_exc())
+            if botengine.playback:
+                # Give us a chance to see the error as we playback data in fast-forward mode
+                time.sleep(2)
+
+    # ===========================================================================
+    # Device index
+    # ===========================================================================
+    def get_devices_by_class(self, device_class):
+        """
+        Get the devices that are instances of a device class, without checking every device in the location.
+        :param device_class: Device class, or a tuple of device classes like isinstance() takes
+        :return: List of device objects, in the order they were added to the location
+        """
+        classes = self._device_index()["classes"]
+        if device_class not in classes:
+            classes[device_class] = [x for x in self.devices.values() if isinstance(x, device_class)]
+        return classes[device_class]
+
+    def get_devices_with_capability(self, method_name):
+        """
+        Get the devices that implement a method, like 'is_in_bedroom', without checking every device in the location.
+        :param method_name: Name of the device method
+        :return: List of device objects, in the order they were added to the location
+        """
+        capabilities = self._device_index()["capabilities"]
+        if method_name not in capabilities:
+            capabilities[method_name] = [x for x in self.devices.values() if callable(getattr(x, method_name, None))]
+        return capabilities[method_name]
+
+    def device_updated(self, device_object):
+        """
+        Note that a device changed in this execution, like its measurements, connection status or goal.
+        Models computed from the device, like the confidence state machines, recompute its contribution next time.
+        :param device_object: Device object that changed
+        """
+        index = self._device_index()
+        index["revisions"][device_object.device_id] = index["revisions"].get(device_object.device_id, 0) + 1
+
+    def get_device_revision(self, device_object):
+        """
+        Get a revision that changes whenever the device changes, to know whether a contribution computed from the device is still current.
+        :param device_object: Device object
+        :return: Revision, which is only comparable to other revisions of the same device
+        """
+        index = self._device_index()
+        return index["token"], index["revisions"].get(device_object.device_id, 0)
+
+    def _device_index(self):
+        """
+        Index of our devices by class and capability, and a revision of each device.
+        The index is built lazily, kept up to date as devices are added and deleted, and never saved with the location.
+        It starts over if our devices dictionary was replaced.
+        :return: Device index dictionary
+        """
+        index = getattr(self, "_devices_index", None)
+        if index is None or index["devices"] is not self.devices or index["total"] != len(self.devices):
+            index = self._devices_index = {
+                # Devices dictionary this index describes, and how many devices it had
+                "devices": self.devices,
+                "total": len(self.devices),
+
+                # { device_class: [device_object, ...] }
+                "classes": {},
+
+                # { 'method_name': [device_object, ...] }
+                "capabilities": {},
+
+                # { 'device_id': revision }
+                "revisions": {},
+
+                # Identity of this index. Revisions of a previous index don't compare with revisions of this one.
+                "token": object()
+            }
+
+        return index
+
+    def _index_device(self, device_object):
+        """
+        Add a new device to the device index, at the end like it is in our devices dictionary
+        :param device_object: Device object that was added
+        """
+        index = getattr(self, "_devices_index", None)
+        if index is None or index["devices"] is not self.devices or index["total"] != len(self.devices) - 1:
+            self._reset_device_index()
+            return
+
+        index["total"] += 1
+        for device_class, device_objects in index["classes"].items():
+            if isinstance(device_object, device_class):
+                device_objects.append(device_object)
+
+        for method_name, device_objects in index["capabilities"].items():
+            if callable(getattr(device_object, method_name, None)):
+                device_objects.append(device_object)
+
+    def _unindex_device(self, device_object):
+        """
+        Remove a deleted device from the device index
+        :param device_object: Device object that was deleted
+        """
+        index = getattr(self, "_devices_index", None)
+        if index is None or index["devices"] is not self.devices or index["total"] != len(self.devices) + 1:
+            self._reset_device_index()
+            return
+
+        index["total"] -= 1
+
+        # A new device with the same ID will start from a newer revision than anything computed from this one
+        index["revisions"][device_object.device_id] = index["revisions"].get(device_object.device_id, 0) + 1
+        for device_objects in list(index["classes"].values()) + list(index["capabilities"].values()):
+            if device_object in device_objects:
+                device_objects.remove(device_object)
+
+    def _reset_device_index(self):
+        """
+        Rebuild the device index the next time it's used
+        """
+        self._devices_index = None
+
+    def __getstate__(self):
+        """
+        The dispatch index and device index are rebuilt on demand, don't save them with the location
+        """
+        state = self.__dict__.copy()
+        state.pop("_dispatch", None)
+        state.pop("_devices_index", None)
+        return state
 
     # ===========================================================================
     # Location User
@@ -1584,6 +1738,8 @@ class Location:
             changed |= m not in module_names
 
         if changed:
+            self._reset_dispatch_index()
+
             # Remove modules that no longer exist
             for module_name in dict(modules).keys():
                 found = False
@@ -58,4 +58,66 @@ class TestLocation(unittest.TestCase):
         # print("Total time described by microservices: {}".format(dt))
 
         # The reported time should be relatively close to the total time
-        assert abs(dt - x) < 1000 # Allow for some error in the timing
\ No newline at end of file
+        assert abs(dt - x) < 1000 # Allow for some error in the timing
+
+    def test_location_subscription_dispatch(self):
+        # Initial setup
+        botengine = BotEnginePyTest({})
+        mut = Location(botengine, 0)
+
+        from intelligence.intelligence import Intelligence
+
+        class EverythingMicroservice(Intelligence):
+            def device_measurements_updated(self, botengine, device_object):
+                self.received = getattr(self, "received", []) + ["measurements"]
+
+            def schedule_fired(self, botengine, schedule_id):
+                self.received = getattr(self, "received", []) + ["schedule"]
+
+        class DoorMicroservice(Intelligence):
+            SUBSCRIBED_DEVICE_TYPES = [10014]
+            SUBSCRIBED_PARAMETERS = ["doorStatus"]
+            SUBSCRIBED_DATASTREAMS = ["door_opened"]
+
+            def device_measurements_updated(self, botengine, device_object):
+                self.received = getattr(self, "received", []) + ["measurements"]
+
+            def datastream_updated(self, botengine, address, content):
+                self.received = getattr(self, "received", []) + [address]
+
+        class QuietMicroservice(Intelligence):
+            def door_opened(self, botengine, content):
+                self.received = getattr(self, "received", []) + ["door_opened"]
+
+        everything = EverythingMicroservice(botengine, mut)
+        door = DoorMicroservice(botengine, mut)
+        quiet = QuietMicroservice(botengine, mut)
+        mut.intelligence_modules = {"everything": everything, "door": door, "quiet": quiet}
+        mut._reset_dispatch_index()
+
+        device_object = MagicMock(device_type=10014, last_updated_params=["doorStatus"])
+        mut.device_measurements_updated(botengine, device_object)
+        device_object = MagicMock(device_type=10014, last_updated_params=["batteryLevel"])
+        mut.device_measurements_updated(botengine, device_object)
+        device_object = MagicMock(device_type=10072, last_updated_params=["doorStatus"])
+        mut.device_measurements_updated(botengine, device_object)
+
+        mut.datastream_updated(botengine, "door_opened", {})
+        mut.datastream_updated(botengine, "update_occupancy", {})
+        mut.schedule_fired(botengine, "MIDNIGHT")
+
+        assert everything.received == ["measurements", "measurements", "measurements", "schedule"]
+        assert door.received == ["measurements", "door_opened"]
+        assert quiet.received == ["door_opened"]
+
+        # Only microservices that implement the event method are indexed
+        assert mut._measurement_receivers(10014) == [everything, door]
+        assert mut._measurement_receivers(10072) == [everything]
+        assert mut._schedule_receivers() == ([everything], [])
+
+        # Timers and lookups go straight to the microservice by ID
+        assert mut.get_microservice_by_id(door.intelligence_id) is door
+        assert mut.get_microservice_by_id("missing") is None
+
+        # The dispatch index is never saved with the location
+        assert "_dispatch" not in mut.__getstate__()
@@ -0,0 +1,208 @@
+'''
+Created on October 17, 2026
+
+Typed coercion of measurement values.
+
+The server delivers measurement values as strings. This module converts them into real values - booleans, integers,
+floats or strings - without evaluating them as Python code. Parameters with a known type are converted directly
+through the MEASUREMENT_TYPES registry, and everything else falls back to inferring the type from the value itself.
+
+The same module is shared by com.ppc.Bot, org.ppc.Bot and maestro_cli. tests/test_coercion_copies.py fails if the copies differ.
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import ast
+
+# Value types in the measurement type registry
+TYPE_BOOL = "bool"
+TYPE_INT = "int"
+TYPE_FLOAT = "float"
+TYPE_STRING = "str"
+
+# Measurement parameter types
+# { 'paramName': TYPE_* }
+# Values that don't convert to their registered type fall back to type inference, so a wrong entry never loses data.
+#
+# Registered types are deliberate, and some differ from what eval() used to return:
+#   * TYPE_FLOAT parameters are always floats. A whole number like degC "21" is 21.0, not the int 21. They still compare equal.
+#   * TYPE_STRING parameters are never converted. A firmware or model "1.2" stays "1.2" instead of the float 1.2,
+#     so versions like "1.10" keep their meaning.
+MEASUREMENT_TYPES = {
+    # Boolean status parameters
+    "doorStatus": TYPE_BOOL,
+    "motionStatus": TYPE_BOOL,
+    "vibrationStatus": TYPE_BOOL,
+    "movementStatus": TYPE_BOOL,
+    "pressureStatus": TYPE_BOOL,
+    "lockStatusAlarm": TYPE_BOOL,
+    "reversePolarity": TYPE_BOOL,
+
+    # Integer parameters
+    "rssi": TYPE_INT,
+    "batteryLevel": TYPE_INT,
+    "currentLevel": TYPE_INT,
+    "hue": TYPE_INT,
+    "saturation": TYPE_INT,
+    "armMode": TYPE_INT,
+    "systemMode": TYPE_INT,
+    "fanMode": TYPE_INT,
+    "lockStatus": TYPE_INT,
+    "buttonStatus": TYPE_INT,
+    "fallStatus": TYPE_INT,
+
+    # Floating point parameters
+    "degC": TYPE_FLOAT,
+    "relativeHumidity": TYPE_FLOAT,
+    "coolingSetpoint": TYPE_FLOAT,
+    "heatingSetpoint": TYPE_FLOAT,
+    "batteryVoltage": TYPE_FLOAT,
+    "power": TYPE_FLOAT,
+    "energy": TYPE_FLOAT,
+
+    # String parameters
+    "manufacturer": TYPE_STRING,
+    "model": TYPE_STRING,
+    "firmware": TYPE_STRING,
+}
+
+# Literal names the server uses, and what they mean
+_NAMED_VALUES = {
+    "true": True,
+    "True": True,
+    "false": False,
+    "False": False,
+    "None": None,
+}
+
+# Characters that can start a number
+_NUMBER_START = frozenset("0123456789+-.")
+
+# Characters that can start a list, dictionary, tuple or quoted string
+_LITERAL_START = frozenset("[{(\"'")
+
+
+def register_measurement_type(param_name, value_type):
+    """
+    Register the type of a measurement parameter, so its values are converted directly without inferring the type
+    :param param_name: Measurement parameter name, for example 'doorStatus'
+    :param value_type: TYPE_BOOL, TYPE_INT, TYPE_FLOAT or TYPE_STRING
+    """
+    if value_type not in _CONVERTERS:
+        raise ValueError("coercion.register_measurement_type(): Unknown value type '{}' for parameter '{}'".format(value_type, param_name))
+
+    MEASUREMENT_TYPES[param_name] = value_type
+
+
+def coerce_measurement(value, param_name=None):
+    """
+    Transform a measurement's value, which could be a string, into a real value - like a boolean or int or float
+    :param value: a raw measurement's value
+    :param param_name: Optional measurement parameter name, used to look up the type of the value
+    :return: a value that has been corrected into the right type
+    """
+    if value.__class__ is not str:
+        return value
+
+    if param_name is not None:
+        value_type = MEASUREMENT_TYPES.get(param_name)
+        if value_type is not None:
+            try:
+                return _CONVERTERS[value_type](value)
+            except (ValueError, KeyError):
+                pass
+
+    return infer_value(value)
+
+
+def infer_value(value):
+    """
+    Infer the type of a raw string value without evaluating it.
+    Recognizes the same integer, float, boolean, None, and literal list / dictionary / string formats that Python would,
+    but never executes code.
+    :param value: Raw value
+    :return: Value converted to its inferred type, or the original value if it isn't a recognizable literal
+    """
+    if value.__class__ is not str:
+        return value
+
+    named = _NAMED_VALUES.get(value)
+    if named is not None or value == "None":
+        return named
+
+    stripped = value.lstrip(" \t")
+    if stripped == "":
+        return value
+
+    first = stripped[0]
+    if first in _NUMBER_START:
+        try:
+            return int(stripped, 0)
+        except ValueError:
+            pass
+
+        if "." in stripped or "e" in stripped or "E" in stripped:
+            try:
+                return float(stripped)
+            except ValueError:
+                pass
+
+        return value
+
+    if first in _LITERAL_START:
+        try:
+            return ast.literal_eval(stripped)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            return value
+
+    return value
+
+
+def _to_bool(value):
+    """
+    :param value: Raw value
+    :return: Boolean
+    """
+    if value in ("true", "True"):
+        return True
+
+    if value in ("false", "False"):
+        return False
+
+    raise ValueError(value)
+
+
+def _to_int(value):
+    """
+    :param value: Raw value
+    :return: Integer
+    """
+    return int(value)
+
+
+def _to_float(value):
+    """
+    :param value: Raw value
+    :return: Float
+    """
+    return float(value)
+
+
+def _to_string(value):
+    """
+    :param value: Raw value
+    :return: String
+    """
+    return value
+
+
+# Conversions for each registered value type
+_CONVERTERS = {
+    TYPE_BOOL: _to_bool,
+    TYPE_INT: _to_int,
+    TYPE_FLOAT: _to_float,
+    TYPE_STRING: _to_string,
+}
@@ -0,0 +1,311 @@
+'''
+Created on October 17, 2026
+
+Downloading and decoding the results of asynchronous data requests.
+
+When the server finishes gathering the data for a botengine.request_data() call, it triggers the bot with a
+data request trigger listing one LZ4-compressed CSV file per device. This module downloads those files
+concurrently, decompresses them into a local cache on disk one at a time, and hands each microservice a
+DataRequestContent that reads the CSV rows from the cache as they're iterated, instead of a string holding the
+whole file. Files already in the cache, for example when the same trigger is delivered again, are not downloaded twice.
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import csv
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+# Maximum number of files to download at once
+MAX_WORKERS = 4
+
+# Bytes to read from the network or the cache at a time
+CHUNK_SIZE_BYTES = 256 * 1024
+
+# Seconds a file stays in the cache. The server only keeps data request files for one day.
+CACHE_LIFETIME_S = 24 * 60 * 60
+
+# Maximum total size of the cache in bytes, oldest files are removed first
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Default cache directory
+DEFAULT_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), "botengine_data_requests")
+
+# Magic number at the start of an LZ4 frame, which can be decompressed as a stream. Anything else is a single LZ4 block.
+LZ4_FRAME_MAGIC = b"\x04\x22\x4d\x18"
+
+# Only one file is decompressed at a time, so memory holds at most one decompressed block no matter how many devices were requested
+_decompress_lock = threading.Lock()
+
+
+class DataRequestContent:
+    """
+    CSV content of a single device's data request result.
+
+    Iterate over rows() to read the CSV one row at a time:
+
+        for row in content.rows():
+            measure_time, param_name, index, group, value = row
+
+    This replaces the bytes that data_request_ready() used to receive, and it is not a bytes object:
+    isinstance(content, bytes) is False. Most of what microservices did with those bytes still works - len(content),
+    content.decode(), content.splitlines(), content[:n], b"x" in content, iterating and comparing - but each of these
+    reads the whole file into memory. Anything that needs a real bytes object, like io.BytesIO() before Python 3.12,
+    takes bytes(content) or content.read() instead.
+    """
+
+    def __init__(self, filename=None, content=None):
+        """
+        :param filename: File holding the decompressed CSV content
+        :param content: Decompressed CSV content bytes, instead of a file
+        """
+        self.filename = filename
+        self._content = content
+
+    def open(self):
+        """
+        :return: Binary file-like object to read the CSV content from
+        """
+        if self._content is not None:
+            return io.BytesIO(self._content)
+        return open(self.filename, "rb")
+
+    def lines(self):
+        """
+        :return: Iterator over the lines of the CSV content, as strings without line endings
+        """
+        with self.open() as f:
+            for line in io.TextIOWrapper(f, encoding="utf-8", newline=""):
+                yield line.rstrip("\r\n")
+
+    def headers(self):
+        """
+        :return: List of column names from the first line of the CSV content, or an empty list if there is no content
+        """
+        for line in self.lines():
+            return next(csv.reader([line]))
+        return []
+
+    def rows(self, include_headers=False):
+        """
+        :param include_headers: True to include the first line with the column names
+        :return: Iterator over the rows of the CSV content, each a list of strings
+        """
+        with self.open() as f:
+            reader = csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline=""))
+            if not include_headers:
+                next(reader, None)
+            for row in reader:
+                yield row
+
+    def read(self):
+        """
+        :return: The complete CSV content bytes
+        """
+        if self._content is not None:
+            return self._content
+        with open(self.filename, "rb") as f:
+            return f.read()
+
+    def decode(self, encoding="utf-8", errors="strict"):
+        """
+        :return: The complete CSV content as a string
+        """
+        return self.read().decode(encoding, errors)
+
+    def __bytes__(self):
+        return self.read()
+
+    def __buffer__(self, flags):
+        # Buffer protocol for memoryview(content), io.BytesIO(content) and friends, from Python 3.12
+        return memoryview(self.read())
+
+    def __getitem__(self, key):
+        return self.read()[key]
+
+    def __contains__(self, item):
+        return item in self.read()
+
+    def __iter__(self):
+        return iter(self.read())
+
+    def __len__(self):
+        if self._content is not None:
+            return len(self._content)
+        return os.path.getsize(self.filename)
+
+    def __eq__(self, other):
+        if isinstance(other, DataRequestContent):
+            return self.read() == other.read()
+        if isinstance(other, (bytes, bytearray)):
+            return self.read() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return id(self)
+
+    def __getattr__(self, name):
+        # Anything else that used to be done with the bytes of the content, like split() or splitlines()
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.read(), name)
+
+    def __repr__(self):
+        return "DataRequestContent({})".format(self.filename if self._content is None else "{} bytes".format(len(self._content)))
+
+
+def download(botengine, data, cache_directory=DEFAULT_CACHE_DIRECTORY, max_workers=MAX_WORKERS):
+    """
+    Download the files of a data request trigger
+    :param botengine: BotEngine environment
+    :param data: 'data' block of the data request trigger, a list of { 'key', 'deviceId', 'dataLength', 'url' } dictionaries
+    :param cache_directory: Directory to cache the decompressed files in
+    :param max_workers: Maximum number of files to download at once
+    :return: { reference: { device_id: DataRequestContent } }
+    """
+    os.makedirs(cache_directory, exist_ok=True)
+    _evict(cache_directory)
+
+    def fetch(d):
+        try:
+            return d, _fetch(botengine, d, cache_directory)
+
+        except Exception as e:
+            import traceback
+            botengine.get_logger(f"{__name__}").error("datarequests: Unable to download data request for device {}: {}\n{}".format(d.get('deviceId'), e, traceback.format_exc()))
+            return d, None
+
+    if len(data) <= 1 or max_workers <= 1:
+        results = [fetch(d) for d in data]
+
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(data))) as executor:
+            results = list(executor.map(fetch, data))
+
+    events = {}
+    for d, content in results:
+        reference = d.get('key')
+        if reference not in events:
+            events[reference] = {}
+
+        if content is not None:
+            events[reference][d['deviceId']] = content
+
+    return events
+
+
+def cache_filename(cache_directory, d):
+    """
+    Each file is cached under a hash of the request key, device and file it came from
+    :param cache_directory: Cache directory
+    :param d: Element of the data request trigger's 'data' block
+    :return: Filename of the cached, decompressed file
+    """
+    address = "{}\n{}\n{}\n{}".format(d.get('key'), d.get('deviceId'), d.get('dataLength'), d.get('url'))
+    return os.path.join(cache_directory, hashlib.sha256(address.encode("utf-8")).hexdigest() + ".csv")
+
+
+def _fetch(botengine, d, cache_directory):
+    """
+    Download and decompress one file, unless it's already cached
+    :param botengine: BotEngine environment
+    :param d: Element of the data request trigger's 'data' block
+    :param cache_directory: Cache directory
+    :return: DataRequestContent
+    """
+    filename = cache_filename(cache_directory, d)
+    if os.path.isfile(filename) and os.path.getsize(filename) == d['dataLength']:
+        botengine.get_logger(f"{__name__}").info("Cached {} ({} bytes)".format(d['deviceId'], d['dataLength']))
+        os.utime(filename)
+        return DataRequestContent(filename)
+
+    botengine.get_logger(f"{__name__}").info("Downloading {} ({} bytes)...".format(d['deviceId'], d['dataLength']))
+    compressed_filename = filename + ".{}.lz4".format(threading.get_ident())
+    r = botengine.send_data_request(d['url'], timeout=60, stream=True)
+    try:
+        with open(compressed_filename, "wb") as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE_BYTES):
+                f.write(chunk)
+
+        decompressed_filename = filename + ".{}.tmp".format(threading.get_ident())
+        with _decompress_lock:
+            _decompress(compressed_filename, decompressed_filename, d['dataLength'])
+        os.replace(decompressed_filename, filename)
+
+    finally:
+        r.close()
+        if os.path.exists(compressed_filename):
+            os.remove(compressed_filename)
+
+    return DataRequestContent(filename)
+
+
+def _decompress(compressed_filename, decompressed_filename, uncompressed_size):
+    """
+    Decompress an LZ4 file.
+    LZ4 frames are decompressed a chunk at a time. A single LZ4 block, which is what the server sends today,
+    can only be decompressed all at once.
+    :param compressed_filename: LZ4 compressed file
+    :param decompressed_filename: File to write the decompressed content to
+    :param uncompressed_size: Size of the decompressed content in bytes
+    """
+    with open(compressed_filename, "rb") as compressed, open(decompressed_filename, "wb") as decompressed:
+        if compressed.read(len(LZ4_FRAME_MAGIC)) == LZ4_FRAME_MAGIC:
+            import lz4.frame
+            compressed.seek(0)
+            decompressor = lz4.frame.LZ4FrameDecompressor()
+            while True:
+                chunk = compressed.read(CHUNK_SIZE_BYTES)
+                if not chunk:
+                    break
+                decompressed.write(decompressor.decompress(chunk))
+
+        else:
+            import lz4.block
+            compressed.seek(0)
+            decompressed.write(lz4.block.decompress(compressed.read(), uncompressed_size=uncompressed_size))
+
+
+def _evict(cache_directory):
+    """
+    Remove cached files that have expired, and the oldest files while the cache is larger than MAX_CACHE_BYTES
+    :param cache_directory: Cache directory
+    """
+    now = time.time()
+    files = []
+    for name in os.listdir(cache_directory):
+        filename = os.path.join(cache_directory, name)
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+
+        if now - stat.st_mtime > CACHE_LIFETIME_S:
+            _remove(filename)
+        elif name.endswith(".csv"):
+            files.append((stat.st_mtime, stat.st_size, filename))
+
+    total_bytes = sum(size for _, size, _ in files)
+    for _, size, filename in sorted(files):
+        if total_bytes <= MAX_CACHE_BYTES:
+            break
+        _remove(filename)
+        total_bytes -= size
+
+
+def _remove(filename):
+    """
+    Remove a file that another execution may have removed already
+    """
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
@@ -0,0 +1,83 @@
+import unittest
+
+import utilities.utilities as utilities
+import utilities.coercion as coercion
+
+
+def _legacy_normalize_measurement(measure):
+    """
+    The original eval() based implementation, kept here as a reference for behavior.
+    tests/coercion_benchmark.py compares their speed.
+    """
+    try:
+        return eval(measure, {}, {})
+
+    except:
+        if measure in ['true', 'True']:
+            return True
+
+        elif measure in ['false', 'False']:
+            return False
+
+        else:
+            return measure
+
+
+class TestCoercion(unittest.TestCase):
+
+    def test_coercion_infer_value_matches_legacy(self):
+        values = ["1", "-3", "+4", "1.5", ".5", "1.", "1e5", "1_000", "0x10", "05", " 5", "5 ",
+                  "true", "True", "false", "False", "None",
+                  "abc", "OPEN", "", "-", ".", "nan", "inf", "-inf", "2023-01-01", "12:30", "1.2.3",
+                  "[1, 2]", "{'a': 1}", "(1, 2)", "'quoted'", "[1,",
+                  5, 1.5, True, None]
+
+        for value in values:
+            expected = _legacy_normalize_measurement(value)
+            actual = coercion.infer_value(value)
+            assert actual == expected, "{!r}: {!r} != {!r}".format(value, actual, expected)
+            assert type(actual) == type(expected), "{!r}: {!r} != {!r}".format(value, type(actual), type(expected))
+
+    def test_coercion_never_executes_code(self):
+        for value in ["__import__('os').system('true')", "open('/etc/passwd').read()", "[x for x in ().__class__.__bases__]", "10 - 5", "1 + 1"]:
+            assert coercion.infer_value(value) == value
+            assert utilities.normalize_measurement(value) == value
+
+    def test_coercion_measurement_types(self):
+        assert coercion.coerce_measurement("true", "doorStatus") is True
+        assert coercion.coerce_measurement("False", "doorStatus") is False
+        assert coercion.coerce_measurement("87", "batteryLevel") == 87
+        assert coercion.coerce_measurement("21", "degC") == 21.0
+        assert isinstance(coercion.coerce_measurement("21", "degC"), float)
+        assert coercion.coerce_measurement("1.0", "model") == "1.0"
+
+        # Registered types differ from eval() on purpose
+        assert _legacy_normalize_measurement("1.2") == 1.2
+        assert coercion.coerce_measurement("1.2", "firmware") == "1.2"
+        assert type(_legacy_normalize_measurement("21")) is int
+        assert type(coercion.coerce_measurement("21", "coolingSetpoint")) is float
+
+        # Values that don't match their registered type fall back to inference
+        assert coercion.coerce_measurement("1", "doorStatus") == 1
+        assert coercion.coerce_measurement("12.5", "batteryLevel") == 12.5
+        assert coercion.coerce_measurement("unknown", "degC") == "unknown"
+
+        # Unregistered parameters are inferred
+        assert coercion.coerce_measurement("3", "someNewParameter") == 3
+
+        # Already typed values pass through
+        assert coercion.coerce_measurement(21, "degC") == 21
+        assert coercion.coerce_measurement(None, "degC") is None
+
+    def test_coercion_register_measurement_type(self):
+        assert "testParameter" not in coercion.MEASUREMENT_TYPES
+        try:
+            coercion.register_measurement_type("testParameter", coercion.TYPE_STRING)
+            assert utilities.normalize_measurement("42", "testParameter") == "42"
+            assert utilities.normalize_measurement("42") == 42
+
+            with self.assertRaises(ValueError):
+                coercion.register_measurement_type("testParameter", "datetime")
+
+        finally:
+            del coercion.MEASUREMENT_TYPES["testParameter"]
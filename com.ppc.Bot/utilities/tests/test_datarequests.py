@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import MagicMock
+
+import io
+import os
+import shutil
+import tempfile
+
+import lz4.block
+import lz4.frame
+
+from botengine_pytest import BotEnginePyTest
+
+import utilities.datarequests as datarequests
+
+
+CSV = "measureTime,paramName,index,group,value\n1644369206930,occupancy,,,1\n1644369206930,occupancyTarget,,,\"0:19,73,127\"\n"
+
+
+class FakeResponse:
+    """
+    Streamed response of a data request file download
+    """
+    def __init__(self, content):
+        self.content = content
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class TestDataRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+
+    def test_datarequests_download(self):
+        botengine = BotEnginePyTest({})
+        files = {
+            "https://server/block": lz4.block.compress(CSV.encode("utf-8"), store_size=False),
+            "https://server/frame": lz4.frame.compress(CSV.encode("utf-8")),
+        }
+        botengine.send_data_request = MagicMock(side_effect=lambda url, timeout, stream=False: FakeResponse(files[url]))
+
+        data = [
+            {"key": "all", "deviceId": "block", "dataLength": len(CSV), "url": "https://server/block"},
+            {"key": "all", "deviceId": "frame", "dataLength": len(CSV), "url": "https://server/frame"},
+            {"key": "other", "deviceId": "block", "dataLength": len(CSV), "url": "https://server/block"},
+        ]
+
+        events = datarequests.download(botengine, data, cache_directory=self.cache_directory)
+        assert sorted(events.keys()) == ["all", "other"]
+        assert botengine.send_data_request.call_count == 3
+
+        for content in [events["all"]["block"], events["all"]["frame"], events["other"]["block"]]:
+            assert content.headers() == ["measureTime", "paramName", "index", "group", "value"]
+            assert list(content.rows()) == [["1644369206930", "occupancy", "", "", "1"], ["1644369206930", "occupancyTarget", "", "", "0:19,73,127"]]
+
+            # Still usable like the bytes it used to be
+            assert len(content) == len(CSV)
+            assert content.decode() == CSV
+            assert content == CSV.encode("utf-8")
+            assert content.splitlines()[0] == b"measureTime,paramName,index,group,value"
+
+        # Nothing but the decompressed files is left in the cache
+        assert len(os.listdir(self.cache_directory)) == 3
+
+        # The same trigger delivered again reads from the cache
+        events = datarequests.download(botengine, data, cache_directory=self.cache_directory)
+        assert botengine.send_data_request.call_count == 3
+        assert events["all"]["frame"].decode() == CSV
+
+    def test_datarequests_download_errors(self):
+        botengine = BotEnginePyTest({})
+        botengine.send_data_request = MagicMock(side_effect=Exception("Unavailable"))
+
+        data = [{"key": "all", "deviceId": "block", "dataLength": len(CSV), "url": "https://server/block"}]
+        assert datarequests.download(botengine, data, cache_directory=self.cache_directory) == {"all": {}}
+        assert os.listdir(self.cache_directory) == []
+
+    def test_datarequests_cache_eviction(self):
+        old = os.path.join(self.cache_directory, "old.csv")
+        new = os.path.join(self.cache_directory, "new.csv")
+        for filename in [old, new]:
+            with open(filename, "w") as f:
+                f.write(CSV)
+
+        expired = os.path.getmtime(new) - datarequests.CACHE_LIFETIME_S - 1
+        os.utime(old, (expired, expired))
+        datarequests._evict(self.cache_directory)
+        assert os.listdir(self.cache_directory) == ["new.csv"]
+
+        max_cache_bytes = datarequests.MAX_CACHE_BYTES
+        try:
+            datarequests.MAX_CACHE_BYTES = 0
+            datarequests._evict(self.cache_directory)
+            assert os.listdir(self.cache_directory) == []
+        finally:
+            datarequests.MAX_CACHE_BYTES = max_cache_bytes
+
+    def test_datarequests_playback_content(self):
+        content = datarequests.DataRequestContent(content=CSV.encode("utf-8"))
+        assert len(list(content.rows())) == 2
+        assert list(content.lines())[0] == "measureTime,paramName,index,group,value"
+        assert bytes(content) == CSV.encode("utf-8")
+
+        # The bytes that data_request_ready() used to receive
+        assert content[:10] == CSV.encode("utf-8")[:10]
+        assert b"paramName" in content
+        assert list(content) == list(CSV.encode("utf-8"))
+        assert io.BytesIO(bytes(content)).read() == CSV.encode("utf-8")
+        assert not isinstance(content, bytes)
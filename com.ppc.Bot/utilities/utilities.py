@@ -7,6 +7,8 @@ file 'LICENSE.txt', which is part of this source code package.
 @author: David Moss
 '''
 
+import utilities.coercion as coercion
+
 # Time conversions to ms
 ONE_SECOND_MS = 1000
 ONE_MINUTE_MS = 60 * ONE_SECOND_MS
@@ -285,24 +287,14 @@ def ms_to_human_readable_string(ms, include_seconds=False):
     return str.strip()
 
 
-def normalize_measurement(measure):
+def normalize_measurement(measure, param_name=None):
     """
     Transform a measurement's value, which could be a string, into a real value - like a boolean or int or float
     :param measure: a raw measurement's value
+    :param param_name: Optional measurement parameter name, used to look up the type of the value
     :return: a value that has been corrected into the right type
     """
-    try:
-        return eval(measure, {}, {})
-
-    except:
-        if measure in ['true', 'True']:
-            return True
-
-        elif measure in ['false', 'False']:
-            return False
-
-        else:
-            return measure
+    return coercion.coerce_measurement(measure, param_name)
 
 
 def get_answer(question_object):
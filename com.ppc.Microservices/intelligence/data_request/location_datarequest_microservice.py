@@ -186,7 +186,7 @@ class LocationDataRequestMicroservice(Intelligence):
 
         :param botengine: BotEngine environment
         :param reference: Optional reference passed into botengine.request_data(..)
-        :param csv_dict: { device_object: 'csv data string' }
+        :param csv_dict: { device_object: DataRequestContent }
         """
         if reference == machinelearning.DATAREQUEST_REFERENCE_ALL:
             botengine.save_variable("data_request_timestamp", botengine.get_timestamp())
@@ -208,9 +208,10 @@ class LocationDataRequestMicroservice(Intelligence):
 
                 filename = "{}_{}.csv".format(d.device_id, d.device_type)
                 if EXPORT_CSV_TO_LOCAL_FILES:
-                    with open(filename, "w") as text_file:
+                    import shutil
+                    with open(filename, "wb") as csv_file, csv_dict[d].open() as content:
                         botengine.get_logger().info("Saving CSV data to {} ...".format(filename))
-                        text_file.write(csv_dict[d])
+                        shutil.copyfileobj(content, csv_file)
 
 
         # It is up to the developer to capture the data_request_ready(..) event in their own microservice
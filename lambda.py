@@ -10,6 +10,7 @@ AWS Lambda execution environment wrapper
 
 import botengine as BotEngine
 import importlib
+import logging
 import time
 
 
@@ -92,7 +93,21 @@ def send_sqs_message(queue_name, msg_body, client_context):
 
 
 class LambdaLogger():
-    
+    """
+    Collects the bot's logs to return them to the server.
+
+    Like the loggers of the logging module, messages take %-style arguments that are only applied to the messages
+    that are actually logged, so a disabled debug message never formats its arguments.
+    """
+
+    # Log levels of the logging module that each log_level enables
+    LEVELS = {
+        "debug": logging.DEBUG,
+        "info": logging.INFO,
+        "warn": logging.WARNING,
+        "error": logging.ERROR
+    }
+
     def __init__(self, log_level="info"):
         # Tracebacks for crashes
         # DEPRECATED: Captured from AWS Lambda
@@ -117,42 +132,50 @@ class LambdaLogger():
         # Start time
         self.start_time_ms = int(time.time() * 1000)
 
-    def log(self, level, message):
+    def isEnabledFor(self, level):
+        """
+        :param level: Level of the logging module, like logging.DEBUG
+        :return: True if messages at this level are logged, to guard work that only a log message needs
+        """
+        return level >= self.LEVELS.get(self.log_level, logging.INFO)
+
+    def log(self, level, message, *args):
         if level == "debug":
-            self.debug(message)
+            self.debug(message, *args)
 
         if level == "info":
-            self.info(message)
+            self.info(message, *args)
 
         if level == "warn":
-            self.warn(message)
+            self.warn(message, *args)
         
         if level == "error":
-            self.error(message)
+            self.error(message, *args)
 
-    def debug(self, message):
+    def debug(self, message, *args):
         if self.log_level in ["debug"]:
             # Too granular
             # self.logs.append("{}: [{}] {}".format(time.time(), "DEBUG", message))
             self.log_events.append({
                 'timestamp': int(time.time() * 1000),
-                'message': "[{}] {}".format("DEBUG", message)
+                'message': "[{}] {}".format("DEBUG", _format(message, args))
             })
 
-    def info(self, message):
+    def info(self, message, *args):
         if self.log_level in ["debug", "info"]:
             # Too granular
             # self.logs.append("{}: [{}] {}".format(time.time(), "INFO", message))
             self.log_events.append({
                 'timestamp': int(time.time() * 1000),
-                'message': "[{}] {}".format("INFO", message)
+                'message': "[{}] {}".format("INFO", _format(message, args))
             })
 
-    def warning(self, message):
-        self.warn(message)
+    def warning(self, message, *args):
+        self.warn(message, *args)
 
-    def warn(self, message):
+    def warn(self, message, *args):
         if self.log_level in ["debug", "info", "warn"]:
+            message = _format(message, args)
             self.logs.append("{}: [{}] {}".format(time.time(), "WARN", message))
             self.error_message = message
             self.log_events.append({
@@ -160,7 +183,8 @@ class LambdaLogger():
                 'message': "[{}] {}".format("WARN", message)
             })
 
-    def error(self, message):
+    def error(self, message, *args):
+        message = _format(message, args)
         self.logs.append("{}: [{}] {}".format(time.time(), "ERROR", message))
         self.error_message = message
         self.log_events.append({
@@ -168,7 +192,8 @@ class LambdaLogger():
                 'message': "[{}] {}".format("ERROR", message)
             })
 
-    def critical(self, message):
+    def critical(self, message, *args):
+        message = _format(message, args)
         self.logs.append("{}: [{}] {}".format(time.time(), "CRITICAL", message))
         self.error_message = message
         self.log_events.append({
@@ -176,7 +201,8 @@ class LambdaLogger():
                 'message': "[{}] {}".format("CRITICAL", message)
             })
 
-    def exception(self, message):
+    def exception(self, message, *args):
+        message = _format(message, args)
         self.logs.append("{}: [{}] {}".format(time.time(), "EXCEPTION", message))
         self.error_message = message
         self.log_events.append({
@@ -242,4 +268,20 @@ class LambdaLogger():
             client = boto3.client('logs')
             client.put_log_events(logGroupName=log_group, logStreamName=stream_name, logEvents=self.log_events)
         except Exception as e:
-            pass
\ No newline at end of file
+            pass
+
+
+def _format(message, args):
+    """
+    Apply %-style arguments to a log message, the way the logging module does
+    :param message: Log message
+    :param args: Arguments, if any
+    :return: Formatted message
+    """
+    message = str(message)
+    if args:
+        try:
+            return message % args
+        except (TypeError, ValueError) as e:
+            return "{} {} (unable to format the log message: {})".format(message, args, e)
+    return message
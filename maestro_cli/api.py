@@ -28,6 +28,10 @@ import copy
 import pandas as pd
 import openpyxl
 
+import coercion
+import csvstream
+import pipeline
+
 _https_proxy = None
 
 # Requests session
@@ -71,9 +75,30 @@ DEFAULT_DAYS_TO_DOWNLOAD_IN_EACH_REQUEST = 14
 # Sleep time between data request polling attempts to appease the server gods
 SLEEP_TIME_BETWEEN_DATA_REQUESTS_SECONDS = 5
 
+# Polling attempts before giving up on the data requests the server hasn't answered, and downloading the rest
+DATA_REQUEST_MAX_POLLS = 320
+
+# Polling attempts between submitting the unanswered data requests again
+DATA_REQUEST_RESUBMIT_POLLS = 50
+
+# Locations to run data requests for at the same time
+DATA_REQUEST_MAX_LOCATIONS = 8
+
+# Files to download at the same time
+DATA_REQUEST_MAX_DOWNLOADS = 8
+
+# Times to start a location over after its downloads failed, for example because the download links expired
+DATA_REQUEST_MAX_DOWNLOAD_FAILURES = 3
+
 # When downloading data that may contain commas, this character will replace those commas
 COMMA_DELIMITER_REPLACEMENT_CHARACTER = '&&'
 
+# Rows of a transformed CSV file to sort in memory at a time when generating recordings. Larger files are sorted in runs on disk.
+RECORDING_SORT_CHUNK_ROWS = 100000
+
+# Maximum number of sorted runs to merge at once, which bounds the number of open files
+RECORDING_MERGE_FAN_IN = 64
+
 def _session():
     """
     Retrieve the current HTTP session
@@ -679,7 +704,7 @@ def generate_bill(cloud_url, admin_key, organization_id, date=None):
     return j
 
 
-def data_request(cloud_url, admin_key, type, location_id=None, organization_id=None, start_time_ms=None, end_time_ms=None, device_types=None, ordered=1, compression=1, no_download=False):
+def data_request(cloud_url, admin_key, type, location_id=None, organization_id=None, start_time_ms=None, end_time_ms=None, device_types=None, ordered=1, compression=1, no_download=False, ism=False, incremental=False):
     """
     Submit a data request. Blocks until the data request is ready, downloads it, extracts it, and returns the file reference.
     https://iotapps.docs.apiary.io/#reference/device-measurements/data-requests/submit-data-request
@@ -697,13 +722,256 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
     :param ordered: 1=ASC (default); -1=DESC
     :param compression: 0=LZ4; 1=ZIP (default); 2=None
     :param no_download: True to only make the data request and then not actually do the download. This is useful for prepping a ton of downloads in the background before performing the downloads one-by-one. Default is False.
-    :return: Unique request key to be used in the retrieve_data_request() method to request this data.
+    :param ism: True to also generate an integrated sensor matrix from DATA_REQUEST_TYPE_DEVICE_PARAMETERS. Default is False.
+    :param incremental: True to only download the data that's new since the last extraction of this location, and merge it into that extraction's file. Default is False.
+    :return: Full path to the final downloaded file
     """
-    import uuid
+    import concurrent.futures
     import time
 
-    # Each request key we need to download
-    request_keys = []
+    # STEP 1: Request the data
+    job = _plan_data_request(cloud_url, admin_key, type, location_id=location_id, organization_id=organization_id, start_time_ms=start_time_ms, end_time_ms=end_time_ms, device_types=device_types, ordered=ordered, compression=compression, incremental=incremental)
+    if job is None:
+        return
+
+    if job['status'] == pipeline.JOB_DONE:
+        return job['final_path']
+
+    _submit_data_requests(cloud_url, admin_key, job)
+
+    if no_download:
+        return
+
+    print("Waiting data requests")
+    # STEP 2: Wait for all data to become available
+    while job['status'] == pipeline.JOB_SUBMITTED:
+        _poll_data_requests(cloud_url, admin_key, [job])
+        if job['status'] == pipeline.JOB_SUBMITTED:
+            time.sleep(SLEEP_TIME_BETWEEN_DATA_REQUESTS_SECONDS)
+
+    print("\n")
+
+    if job['status'] == pipeline.JOB_FAILED:
+        raise ApiError(job['error'], -1)
+
+    # STEP 3: Download all data
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DATA_REQUEST_MAX_DOWNLOADS) as executor:
+        for future in _download_data_requests(job, executor):
+            future.result()
+
+    # STEP 4 : Transform and finalize all previously downloaded data
+    return _finalize_data_request(cloud_url, admin_key, job, ism=ism)
+
+
+def data_requests(cloud_url, admin_key, type, location_ids, start_time_ms=None, end_time_ms=None, device_types=None, ordered=1, compression=1, ism=False, manifest_path=None, max_locations=DATA_REQUEST_MAX_LOCATIONS, incremental=False, days_ago=None):
+    """
+    Submit the same kind of data request for many locations at once, and download and extract each location's data as soon as it's ready.
+
+    Up to max_locations locations are in flight at a time. Their data requests are polled together in one round
+    between each sleep, and their files download concurrently. A manifest file remembers each location's progress,
+    so running the same extraction again after an interruption skips the locations that are done, keeps waiting on the
+    data requests that were already submitted, and resumes partial downloads. Incremental extractions don't skip the
+    locations that are done, they check them again for anything new since their watermarks.
+
+    https://iotapps.docs.apiary.io/#reference/device-measurements/data-requests/submit-data-request
+    https://iotapps.docs.apiary.io/#reference/device-measurements/data-requests/get-data
+
+    :param cloud_url: Cloud URL
+    :param admin_key: Administrative API key
+    :param type: See DATA_REQUEST_TYPE_*, like DATA_REQUEST_TYPE_DEVICE_PARAMETERS or DATA_REQUEST_TYPE_LOCATION_NARRATIVES
+    :param location_ids: List of location IDs to extract data from
+    :param start_time_ms: Optional start time in milliseconds
+    :param end_time_ms: Optional end time in milliseconds
+    :param device_types: Device types to filter by
+    :param ordered: 1=ASC (default); -1=DESC
+    :param compression: 0=LZ4; 1=ZIP (default); 2=None
+    :param ism: True to also generate an integrated sensor matrix from DATA_REQUEST_TYPE_DEVICE_PARAMETERS. Default is False.
+    :param manifest_path: Manifest file to resume from and save progress to. Default is downloads/manifest_<type>.json
+    :param max_locations: Maximum number of locations in flight at the same time
+    :param incremental: True to only download the data that's new since the last extraction of each location, and merge it into that extraction's file. Default is False.
+    :param days_ago: Optional number of days before now to start from, instead of start_time_ms
+    :return: { location_id : full path to the final downloaded file, or None if the location has no data or failed }
+    """
+    import concurrent.futures
+    import time
+
+    if manifest_path is None:
+        manifest_path = os.path.join(os.getcwd(), 'downloads', "manifest_{}.json".format(type))
+
+    if days_ago is not None:
+        # The manifest remembers the number of days instead of the start time, which moves every time this runs
+        days_ago = int(days_ago)
+        start_time_ms = int(time.time() * 1000) - (days_ago * ONE_DAY_MS)
+
+    manifest = pipeline.Manifest(manifest_path, {
+        "cloud_url": cloud_url,
+        "type": type,
+        "start_time_ms": None if start_time_ms is None or days_ago is not None else int(start_time_ms),
+        "days_ago": days_ago,
+        "end_time_ms": None if end_time_ms is None else int(end_time_ms),
+        "device_types": device_types,
+        "ism": ism,
+        "incremental": incremental
+    })
+
+    # { location_id : final_path }
+    final_paths = {}
+
+    # Locations that haven't started yet during this run
+    waiting = list(location_ids)
+
+    # Jobs in flight
+    active = []
+
+    # { location_id : [download futures] }
+    downloads = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DATA_REQUEST_MAX_DOWNLOADS) as executor:
+        while len(waiting) > 0 or len(active) > 0:
+            progressed = False
+
+            # Start more locations
+            while len(waiting) > 0 and len(active) < max_locations:
+                location_id = waiting.pop(0)
+                job = manifest.job(location_id)
+
+                if job is not None and job['status'] == pipeline.JOB_DONE and not incremental:
+                    final_paths[location_id] = job['final_path']
+                    continue
+
+                print("({} of {}) Data request for this location ID: {}".format(len(location_ids) - len(waiting), len(location_ids), location_id))
+
+                # Incremental extractions plan finished locations again, which only requests what's new since their watermarks
+                if job is None or job['status'] in [pipeline.JOB_FAILED, pipeline.JOB_DONE]:
+                    try:
+                        job = _plan_data_request(cloud_url, admin_key, type, location_id=location_id, start_time_ms=start_time_ms, end_time_ms=end_time_ms, device_types=device_types, ordered=ordered, compression=compression, incremental=incremental)
+                        if job is None:
+                            final_paths[location_id] = None
+                            continue
+
+                        if job['status'] == pipeline.JOB_DONE:
+                            manifest.save(location_id, job)
+                            final_paths[location_id] = job['final_path']
+                            continue
+
+                        _submit_data_requests(cloud_url, admin_key, job)
+
+                    except Exception as e:
+                        print("Error requesting data for location ID {} - {}".format(location_id, str(e)))
+                        final_paths[location_id] = None
+                        continue
+
+                    manifest.save(location_id, job)
+
+                active.append(job)
+                progressed = True
+
+            # Poll every location that's waiting on the server in one round
+            polling = [job for job in active if job['status'] == pipeline.JOB_SUBMITTED]
+            if len(polling) > 0:
+                for job in _poll_data_requests(cloud_url, admin_key, polling):
+                    manifest.save(job['location_id'], job)
+                    progressed = True
+
+            for job in list(active):
+                location_id = job['location_id']
+
+                if job['status'] == pipeline.JOB_READY:
+                    if location_id not in downloads:
+                        try:
+                            downloads[location_id] = _download_data_requests(job, executor)
+
+                        except ApiError as e:
+                            # The server answered every data request without any data
+                            print("Location ID {} - {}".format(location_id, str(e)))
+                            job['status'] = pipeline.JOB_DONE
+                            job['final_path'] = None
+
+                        manifest.save(location_id, job)
+                        progressed = True
+
+                    if location_id in downloads and all(future.done() for future in downloads[location_id]):
+                        errors = [future.exception() for future in downloads.pop(location_id) if future.exception() is not None]
+                        if len(errors) == 0:
+                            job['status'] = pipeline.JOB_DOWNLOADED
+
+                        else:
+                            # The download links may have expired. Ask the server again.
+                            print("Error downloading data for location ID {} - {}".format(location_id, str(errors[0])))
+                            job['download_failures'] += 1
+                            if job['download_failures'] > DATA_REQUEST_MAX_DOWNLOAD_FAILURES:
+                                job['status'] = pipeline.JOB_FAILED
+                                job['error'] = str(errors[0])
+
+                            else:
+                                # The new links can't resume the partial downloads of the old ones
+                                for download_path in job['downloads'].values():
+                                    pipeline.discard_partial(download_path)
+
+                                job['urls'] = {}
+                                job['polls'] = 0
+                                try:
+                                    _submit_data_requests(cloud_url, admin_key, job)
+
+                                except Exception as e:
+                                    print("Error requesting data for location ID {} - {}".format(location_id, str(e)))
+                                    job['status'] = pipeline.JOB_FAILED
+                                    job['error'] = str(e)
+
+                        manifest.save(location_id, job)
+                        progressed = True
+
+                if job['status'] == pipeline.JOB_DOWNLOADED:
+                    try:
+                        job['final_path'] = _finalize_data_request(cloud_url, admin_key, job, ism=ism)
+                        job['status'] = pipeline.JOB_DONE
+
+                    except Exception as e:
+                        print("Error extracting data for location ID {} - {}".format(location_id, str(e)))
+                        job['status'] = pipeline.JOB_FAILED
+                        job['error'] = str(e)
+
+                    manifest.save(location_id, job)
+                    progressed = True
+
+                if job['status'] in [pipeline.JOB_DONE, pipeline.JOB_FAILED]:
+                    final_paths[location_id] = job['final_path'] if job['status'] == pipeline.JOB_DONE else None
+                    active.remove(job)
+
+            if not progressed:
+                time.sleep(SLEEP_TIME_BETWEEN_DATA_REQUESTS_SECONDS)
+
+    failed = [location_id for location_id in location_ids if manifest.job(location_id) is not None and manifest.job(location_id)['status'] == pipeline.JOB_FAILED]
+    if len(failed) > 0:
+        print("Failed location IDs, run the same extraction again to retry them: {}".format(failed))
+
+    return final_paths
+
+
+def _plan_data_request(cloud_url, admin_key, type, location_id=None, organization_id=None, start_time_ms=None, end_time_ms=None, device_types=None, ordered=1, compression=1, incremental=False):
+    """
+    Plan the data requests to extract data, which are not submitted yet.
+
+    Incremental extractions of a location continue from the watermarks of its last extraction in the watermark index:
+    each device's parameters, activities and alerts, the modes, data streams and narratives are only requested after
+    the time they were already downloaded up to. The output then covers the time window of the last extraction
+    through the new end time.
+
+    :param cloud_url: Cloud URL
+    :param admin_key: Administrative API key
+    :param type: See DATA_REQUEST_TYPE_*
+    :param location_id: Optional Location ID to extract data from
+    :param organization_id: Optional Organization ID to extract data from
+    :param start_time_ms: Optional start time in milliseconds
+    :param end_time_ms: Optional end time in milliseconds
+    :param device_types: Device types to filter by
+    :param ordered: 1=ASC (default); -1=DESC
+    :param compression: 0=LZ4; 1=ZIP (default); 2=None
+    :param incremental: True to only request the data that's new since the last extraction of this location
+    :return: Job dictionary that can be saved as JSON, or None if there are no devices to download data from
+    """
+    import uuid
+    import time
 
     # Data requests to make in the HTTP body
     data_requests = []
@@ -749,15 +1017,9 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
     else:
         end_time_ms = int(end_time_ms)
 
-    # STEP 1: Request the data
     # HTTP params
     params = {}
 
-    # HTTP headers
-    headers = {
-        'API_KEY': admin_key
-    }
-
     if location_id is not None:
         params.update({
             "locationId": location_id
@@ -769,6 +1031,28 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
             "organizationId": organization_id
         })
 
+    # Watermarks from the last extraction of this location: { name : end time in ms it was downloaded up to }
+    watermarks = {}
+
+    # { request_key : watermark name }
+    watermark_by_requestkey = {}
+
+    # Output file of the last extraction, to merge the new data into
+    previous_final_path = None
+
+    if incremental and location_id is not None:
+        previous = pipeline.WatermarkIndex(os.path.join(os.getcwd(), 'downloads', pipeline.WATERMARKS_FILENAME)).entry(location_id, type)
+        if previous is None:
+            print("=> No previous extraction of location {}, downloading everything".format(location_id))
+
+        elif start_time_ms < previous['start_time_ms']:
+            print("=> The previous extraction of location {} starts later, downloading everything".format(location_id))
+
+        else:
+            watermarks = previous['watermarks']
+            previous_final_path = previous['final_path']
+            start_time_ms = previous['start_time_ms']
+
     if type == DATA_REQUEST_TYPE_DEVICE_PARAMETERS:
         # This is a device data request
         devices = get_devices(cloud_url, admin_key, location_id)
@@ -815,10 +1099,18 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
                 if this_download_start_time_ms < int(device["startDateMs"]):
                     # print("Device {} has a start date of {} which is after the start time of this download request. Adjusting.".format(device["id"], device["startDateMs"]))
                     this_download_start_time_ms = int(device["startDateMs"])
+
+                watermark_name = "parameters:{}".format(device["id"])
+                request_start_time_ms = _watermark_start_time_ms(watermarks, watermark_name, this_download_start_time_ms, this_download_end_time_ms)
+                if request_start_time_ms is None:
+                    # Already downloaded by the last extraction, which still needs this device to transform its data
+                    device_by_id[device["id"]] = device
+                    continue
+
                 request_key = str(uuid.uuid4())
                 device_by_requestkey[request_key] = device
                 device_by_id[device["id"]] = device
-                request_keys.append(request_key)
+                watermark_by_requestkey[request_key] = watermark_name
 
                 if device["id"] not in parameter_requestkeys_by_device:
                     parameter_requestkeys_by_device[device["id"]] = []
@@ -830,7 +1122,7 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
                     "ordered": ordered,
                     "compression": compression,
                     'deviceId': device['id'],
-                    'startTime': this_download_start_time_ms,
+                    'startTime': request_start_time_ms,
                     'endTime': this_download_end_time_ms
                 }
 
@@ -868,9 +1160,14 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
                 # print("Device {} has a start date of {} which is after the start time of this download request. Adjusting.".format(device["id"], device["startDateMs"]))
                 this_download_start_time_ms = int(device["startDateMs"])
 
+            watermark_name = "activities:{}".format(device["id"])
+            this_download_start_time_ms = _watermark_start_time_ms(watermarks, watermark_name, this_download_start_time_ms, end_time_ms)
+            if this_download_start_time_ms is None:
+                continue
+
             request_key = str(uuid.uuid4())
             device_by_requestkey[request_key] = device
-            request_keys.append(request_key)
+            watermark_by_requestkey[request_key] = watermark_name
 
             if device["id"] not in activity_requestkeys_by_device:
                 activity_requestkeys_by_device[device["id"]] = []
@@ -912,9 +1209,14 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
                 # print("Device {} has a start date of {} which is after the start time of this download request. Adjusting.".format(device["id"], device["startDateMs"]))
                 this_download_start_time_ms = int(device["startDateMs"])
 
+            watermark_name = "alerts:{}".format(device["id"])
+            this_download_start_time_ms = _watermark_start_time_ms(watermarks, watermark_name, this_download_start_time_ms, end_time_ms)
+            if this_download_start_time_ms is None:
+                continue
+
             request_key = str(uuid.uuid4())
             device_by_requestkey[request_key] = device
-            request_keys.append(request_key)
+            watermark_by_requestkey[request_key] = watermark_name
 
             if device["id"] not in alert_requestkeys_by_device:
                 alert_requestkeys_by_device[device["id"]] = []
@@ -933,74 +1235,148 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
             data_requests.append(request)
 
         # LOCATION MODE data request
-        request_key = str(uuid.uuid4())
-        request_keys.append(request_key)
-        modes_keys.append(request_key)
-        request = {
-            "type": DATA_REQUEST_TYPE_LOCATION_MODES,
-            "key": request_key,
-            "ordered": ordered,
-            "compression": compression
-        }
+        modes_start_time_ms = _watermark_start_time_ms(watermarks, "modes", start_time_ms, end_time_ms)
+        if modes_start_time_ms is not None:
+            request_key = str(uuid.uuid4())
+            modes_keys.append(request_key)
+            watermark_by_requestkey[request_key] = "modes"
+            request = {
+                "type": DATA_REQUEST_TYPE_LOCATION_MODES,
+                "key": request_key,
+                "ordered": ordered,
+                "compression": compression,
+                'startTime': int(modes_start_time_ms),
+                'endTime': int(end_time_ms)
+            }
+
+            data_requests.append(request)
 
-        if start_time_ms is not None:
-            request['startTime'] = int(start_time_ms)
+        # DATA STREAM data request
+        datastreams_start_time_ms = _watermark_start_time_ms(watermarks, "datastreams", start_time_ms, end_time_ms)
+        if datastreams_start_time_ms is not None:
+            request_key = str(uuid.uuid4())
+            datastreams_keys.append(request_key)
+            watermark_by_requestkey[request_key] = "datastreams"
+            request = {
+                "type": DATA_REQUEST_TYPE_DATA_STREAMS,
+                "key": request_key,
+                "ordered": ordered,
+                "compression": compression,
+                'startTime': int(datastreams_start_time_ms),
+                'endTime': int(end_time_ms)
+            }
 
-        if end_time_ms is not None:
-            request['endTime'] = int(end_time_ms)
+            data_requests.append(request)
 
-        data_requests.append(request)
+    else:
+        # This is not a device data request and we only need to make one request
+        watermark_name = "narratives" if type == DATA_REQUEST_TYPE_LOCATION_NARRATIVES else "type_{}".format(type)
+        request_start_time_ms = _watermark_start_time_ms(watermarks, watermark_name, start_time_ms, end_time_ms)
+        if request_start_time_ms is not None:
+            request_key = str(uuid.uuid4())
+            watermark_by_requestkey[request_key] = watermark_name
+            request = {
+                "type": type,
+                "key": request_key,
+                "ordered": ordered,
+                "compression": compression
+            }
 
-        # DATA STREAM data request
-        request_key = str(uuid.uuid4())
-        request_keys.append(request_key)
-        datastreams_keys.append(request_key)
-        request = {
-            "type": DATA_REQUEST_TYPE_DATA_STREAMS,
-            "key": request_key,
-            "ordered": ordered,
-            "compression": compression
-        }
+            if organization_id is not None:
+                request['organizationId'] = organization_id
 
-        if start_time_ms is not None:
-            request['startTime'] = int(start_time_ms)
+            if device_types is not None:
+                request["deviceTypes"] = device_types
 
-        if end_time_ms is not None:
-            request['endTime'] = int(end_time_ms)
+            request['startTime'] = int(request_start_time_ms)
 
-        data_requests.append(request)
+            if end_time_ms is not None:
+                request['endTime'] = int(end_time_ms)
 
-        if not no_download:
-            print("{} data requests".format(len(data_requests)))
+            data_requests.append(request)
 
-    else:
-        # This is not a device data request and we only need to make one request
-        request_key = str(uuid.uuid4())
-        request_keys.append(request_key)
-        request = {
-            "type": type,
-            "key": request_key,
-            "ordered": ordered,
-            "compression": compression
-        }
+    server_type = 'prod'
+    if 'sbox' in cloud_url:
+        server_type = 'sbox'
+
+    status = pipeline.JOB_SUBMITTED
+    if len(data_requests) == 0:
+        # Incremental extraction of a location that's already up to date
+        print("=> Location {} is already extracted up to {}".format(location_id, end_time_ms))
+        status = pipeline.JOB_DONE
+
+    return {
+        "status": status,
+        "type": type,
+        "location_id": location_id,
+        "organization_id": organization_id,
+        "start_time_ms": start_time_ms,
+        "end_time_ms": end_time_ms,
+        "server_type": server_type,
+        "date": datetime.datetime.now().strftime("%Y.%m.%d"),
+        "downloads_path": os.path.join(os.getcwd(), 'downloads'),
+        "params": params,
+        "location": location_object,
+        "data_requests": data_requests,
+        "device_by_requestkey": device_by_requestkey,
+        "device_by_id": device_by_id,
+        "parameter_requestkeys_by_device": parameter_requestkeys_by_device,
+        "activity_requestkeys_by_device": activity_requestkeys_by_device,
+        "alert_requestkeys_by_device": alert_requestkeys_by_device,
+        "modes_keys": modes_keys,
+        "datastreams_keys": datastreams_keys,
+        # { request_key : url, or None if there's no data }
+        "urls": {},
+        "polls": 0,
+        # { request_key : download_path }
+        "downloads": {},
+        "download_failures": 0,
+        "incremental": previous_final_path is not None,
+        "watermarks": watermarks,
+        "watermark_by_requestkey": watermark_by_requestkey,
+        "previous_final_path": previous_final_path,
+        "final_path": previous_final_path,
+        "error": None
+    }
 
-        if organization_id is not None:
-            request['organizationId'] = organization_id
 
-        if device_types is not None:
-            request["deviceTypes"] = device_types
+def _watermark_start_time_ms(watermarks, name, start_time_ms, end_time_ms):
+    """
+    :param watermarks: { name : end time in ms the data was already downloaded up to }
+    :param name: Watermark name of the data to request, like "parameters:<device_id>"
+    :param start_time_ms: Start time to request the data from without a watermark
+    :param end_time_ms: End time to request the data to
+    :return: Start time to request the data from, or None if it was already downloaded up to the end time
+    """
+    watermark_ms = watermarks.get(name)
+    if watermark_ms is None:
+        return start_time_ms
+
+    if watermark_ms >= end_time_ms:
+        return None
 
-        if start_time_ms is not None:
-            request['startTime'] = int(start_time_ms)
+    return max(start_time_ms, watermark_ms + 1)
+
+
+def _submit_data_requests(cloud_url, admin_key, job, request_keys=None):
+    """
+    Submit the data requests of a job
+    https://iotapps.docs.apiary.io/#reference/device-measurements/data-requests/submit-data-request
 
-        if end_time_ms is not None:
-            request['endTime'] = int(end_time_ms)
+    :param cloud_url: Cloud URL
+    :param admin_key: Administrative API key
+    :param job: Job from _plan_data_request()
+    :param request_keys: Optional list of request keys to submit, default is all of them
+    """
+    headers = {
+        'API_KEY': admin_key
+    }
 
-        data_requests.append(request)
+    print("Executing {} data requests".format(len(job['data_requests'])))
+    for request in job['data_requests']:
+        if request_keys is not None and request['key'] not in request_keys:
+            continue
 
-    print("Executing data requests")
-    total_requests = 0
-    for request in data_requests:
         sys.stdout.write('.')
         sys.stdout.flush()
         body = {
@@ -1008,159 +1384,247 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
             "dataRequests": [request]
         }
 
-        # print("Headers: {}".format(json.dumps(headers, indent=2, sort_keys=True)))
-        # print("Params: {}".format(json.dumps(params, indent=2, sort_keys=True)))
-        # print("Body: {}".format(json.dumps(body, indent=2, sort_keys=True)))
-
-        downloaded = False
-        while not downloaded:
+        submitted = False
+        while not submitted:
             try:
-                r = _session().post(cloud_url + "/cloud/json/dataRequests", params=params, headers=headers, data=json.dumps(body))
+                r = _session().post(cloud_url + "/cloud/json/dataRequests", params=job['params'], headers=headers, data=json.dumps(body))
                 j = json.loads(r.text)
-                # print("DATA REQUEST RESPONSE: {}".format(json.dumps(j, indent=2, sort_keys=True)))
                 _check_for_errors(j)
-                downloaded = True
+                submitted = True
 
             except ApiError as e:
-                if e.is_locked_out():
-                    e.wait_for_lock_timeout()
-                    print("Trying again...")
+                if not e.is_locked_out():
+                    raise
 
-    if no_download:
-        return
+                e.wait_for_lock_timeout()
+                print("Trying again...")
 
-    print("Waiting data requests")
-    # STEP 2: Wait for all data to become available
-    results = {}
-    attempts = 0
-    while True:
-        # print("REQUEST CHECK\nURL={}\nPARAMS={}\nHEADERS={}\n".format(cloud_url + "/cloud/json/dataRequests", params, headers))
-        r = _session().get(cloud_url + "/cloud/json/dataRequests", params=params, headers=headers)
-        j = json.loads(r.text)
+    job['status'] = pipeline.JOB_SUBMITTED
 
-        # print("REQUEST CHECK RESPONSE: {}".format(json.dumps(j, indent=2, sort_keys=True)))
 
-        if 'results' in j:
-            for result in j['results']:
-                if result['key'] in request_keys and result['key'] not in results:
-                    sys.stdout.write("!")
-                    if 'url' in result:
-                        results[result['key']] = result['url']
+def _poll_data_requests(cloud_url, admin_key, jobs):
+    """
+    Check once which data requests the server has answered, for any number of jobs.
+    Jobs with the same HTTP parameters share a single request to the server.
+    A job becomes ready when every one of its data requests is answered, or when it runs out of polling attempts.
+    https://iotapps.docs.apiary.io/#reference/device-measurements/data-requests/get-data
 
-                    elif result['dataLength'] == 0:
-                        # No data to download
-                        results[result['key']] = None
+    :param cloud_url: Cloud URL
+    :param admin_key: Administrative API key
+    :param jobs: List of jobs from _plan_data_request() that were submitted
+    :return: List of jobs that learned anything new
+    """
+    headers = {
+        'API_KEY': admin_key
+    }
 
-            if len(results) == len(request_keys):
-                break
+    # { json params : [job, job, job] }
+    jobs_by_params = {}
+    for job in jobs:
+        jobs_by_params.setdefault(json.dumps(job['params'], sort_keys=True), []).append(job)
+
+    updated = []
+    for jobs_with_params in jobs_by_params.values():
+        # { request_key : job }
+        job_by_requestkey = {}
+        for job in jobs_with_params:
+            for request in job['data_requests']:
+                if request['key'] not in job['urls']:
+                    job_by_requestkey[request['key']] = job
+
+        try:
+            r = _session().get(cloud_url + "/cloud/json/dataRequests", params=jobs_with_params[0]['params'], headers=headers)
+            j = json.loads(r.text)
 
-        attempts += 1
-        sys.stdout.write(".")
-        sys.stdout.flush()
+        except (requests.RequestException, ValueError) as e:
+            print("\nError checking data requests, will check again - {}".format(e))
+            continue
 
-        # 2020.12.01 - There was a bug on the server where data requests that would result in no data would never return.
-        # This was occurring often with 'modes' on many care users we were extracting.
-        # So we're looking for cases where the number of results is only 1 less than the number of requests.
-        stop = False
-        if len(results) >= len(request_keys) - 1:
-            for request_key in request_keys:
-                if request_key not in results.keys():
-                    if request_key in ["modes","datastreams"]:
-                        print("\nMissing Key (skipping): {}".format(request_key))
-                        stop = True
-
-        if stop:
-            break
+        for result in j.get('results', []):
+            job = job_by_requestkey.pop(result['key'], None)
+            if job is None:
+                continue
+
+            if 'url' in result:
+                job['urls'][result['key']] = result['url']
+
+            elif result['dataLength'] == 0:
+                # No data to download
+                job['urls'][result['key']] = None
+
+            else:
+                continue
+
+            sys.stdout.write("!")
+            if job not in updated:
+                updated.append(job)
+
+    for job in jobs:
+        job['polls'] += 1
+        missing_keys = [request['key'] for request in job['data_requests'] if request['key'] not in job['urls']]
 
-        # Attempt the data request again
-        if attempts % 50 == 0:
+        if len(missing_keys) == 0:
+            job['status'] = pipeline.JOB_READY
+
+        elif job['polls'] > DATA_REQUEST_MAX_POLLS:
+            print("SKIPPING DATA REQUESTS FOR LOCATION {}; MISSING KEYS {}".format(job['location_id'], missing_keys))
+            job['status'] = pipeline.JOB_READY
+
+        elif job['polls'] % DATA_REQUEST_RESUBMIT_POLLS == 0:
             print("Attempting the data request again...")
-            r = _session().post(cloud_url + "/cloud/json/dataRequests", params=params, headers=headers,
-                                data=json.dumps(body))
-            j = json.loads(r.text)
-            _check_for_errors(j)
+            try:
+                _submit_data_requests(cloud_url, admin_key, job, request_keys=missing_keys)
 
-        if attempts > 320:
-            print("SKIPPING LOCATION {}; \n\nDATA REQUESTS {}; \n\nRESULTS {}".format(location_id,
-                                                                                      data_requests,
-                                                                                      results))
-            for request_key in request_keys:
-                if request_key not in results.keys():
-                    print("\nMissing Key: {}".format(request_key))
+            except Exception as e:
+                # Only this job fails, the others polled with it keep going
+                print("Error requesting data for location ID {} - {}".format(job['location_id'], str(e)))
+                job['status'] = pipeline.JOB_FAILED
+                job['error'] = str(e)
 
-            break
+        else:
+            continue
 
-        time.sleep(SLEEP_TIME_BETWEEN_DATA_REQUESTS_SECONDS)
+        if job not in updated:
+            updated.append(job)
 
-    print("\n")
+    sys.stdout.write(".")
+    sys.stdout.flush()
+    return updated
 
-    # STEP 3: Download all data
-    download_paths = {}
-    # print("RESULTS: {}".format(json.dumps(results, indent=2, sort_keys=True)))
-    for result_key in list(results.keys()):
-        if results[result_key] is None:
-            del results[result_key]
 
-    if len(results) == 0:
+def _download_data_requests(job, executor):
+    """
+    Start downloading the files of a job that's ready.
+    Files that finished downloading before are kept, and partially downloaded files resume.
+    :param job: Job from _plan_data_request() that's ready
+    :param executor: concurrent.futures executor to download the files on
+    :return: List of futures, one for each file
+    """
+    downloads_path = job['downloads_path']
+    for path in [downloads_path, os.path.join(downloads_path, 'narratives'), os.path.join(downloads_path, 'locations'), os.path.join(downloads_path, 'data')]:
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    job['downloads'] = {}
+    if len([url for url in job['urls'].values() if url is not None]) == 0:
+        if job['incremental']:
+            # Nothing new since the last extraction
+            job['final_path'] = _data_request_paths(job, None)[1]
+            return []
+
         print("No data request results were provided by the server.")
         raise ApiError("No data request results were provided by the server.", -1)
 
-    for result_key in results:
-        if results[result_key] is None:
+    futures = []
+    for result_key, url in job['urls'].items():
+        if url is None:
             continue
 
-        server_type = 'prod'
-        if 'sbox' in cloud_url:
-            server_type = 'sbox'
+        download_path, final_path = _data_request_paths(job, result_key)
+        if os.path.exists(final_path) and final_path not in [download_path, job['previous_final_path']]:
+            os.remove(final_path)
 
-        narratives_path = os.path.join(os.getcwd(), 'downloads', 'narratives')
-        locations_path = os.path.join(os.getcwd(), 'downloads', 'locations')
-        data_path = os.path.join(os.getcwd(), 'downloads', 'data')
+        job['downloads'][result_key] = download_path
+        job['final_path'] = final_path
 
-        final_path = os.path.join(os.getcwd(), 'downloads', "{}.zip".format(result_key))
-        download_path = os.path.join(os.path.join(os.getcwd(), 'downloads'), "{}.zip".format(result_key))
+        if os.path.exists(download_path):
+            # Downloaded completely before this job was interrupted
+            continue
 
-        if not os.path.exists(os.path.join(os.getcwd(), 'downloads')):
-            os.makedirs(os.path.join(os.getcwd(), 'downloads'))
+        futures.append(executor.submit(_download_data_request_file, url, download_path))
 
-        if not os.path.exists(narratives_path):
-            os.makedirs(narratives_path)
+    return futures
 
-        if not os.path.exists(locations_path):
-            os.makedirs(locations_path)
 
-        if not os.path.exists(data_path):
-            os.makedirs(data_path)
+def _data_request_paths(job, result_key):
+    """
+    :param job: Job from _plan_data_request()
+    :param result_key: Request key of a data request result
+    :return: (path to download the result to, path of the final file)
+    """
+    downloads_path = job['downloads_path']
+    final_path = os.path.join(downloads_path, "{}.zip".format(result_key))
+    download_path = os.path.join(downloads_path, "{}.zip".format(result_key))
 
-        if type == DATA_REQUEST_TYPE_ORGANIZATION_LOCATIONS:
-            filename_no_extension = "{}_{}_locations_from_org_{}".format(datetime.datetime.now().strftime("%Y.%m.%d"),
-                                                                         server_type, organization_id)
-            final_path = os.path.join(locations_path, "{}.zip".format(filename_no_extension))
-            download_path = os.path.join(locations_path, "{}.zip".format(result_key))
+    if job['type'] == DATA_REQUEST_TYPE_ORGANIZATION_LOCATIONS:
+        locations_path = os.path.join(downloads_path, 'locations')
+        filename_no_extension = "{}_{}_locations_from_org_{}".format(job['date'], job['server_type'], job['organization_id'])
+        final_path = os.path.join(locations_path, "{}.zip".format(filename_no_extension))
+        download_path = os.path.join(locations_path, "{}.zip".format(result_key))
 
-        elif type == DATA_REQUEST_TYPE_LOCATION_NARRATIVES:
-            filename_no_extension = "{}_{}_narratives_from_location_{}".format(
-                datetime.datetime.now().strftime("%Y.%m.%d"), server_type, location_id)
-            final_path = os.path.join(narratives_path, "{}.zip".format(filename_no_extension))
-            download_path = os.path.join(narratives_path, "{}.zip".format(result_key))
+    elif job['type'] == DATA_REQUEST_TYPE_LOCATION_NARRATIVES:
+        narratives_path = os.path.join(downloads_path, 'narratives')
+        filename_no_extension = "{}_{}_narratives_from_location_{}".format(job['date'], job['server_type'], job['location_id'])
+        final_path = os.path.join(narratives_path, "{}.zip".format(filename_no_extension))
+        download_path = os.path.join(narratives_path, "{}.zip".format(result_key))
 
-        elif type == DATA_REQUEST_TYPE_DEVICE_PARAMETERS:
-            days = int((end_time_ms - start_time_ms) / ONE_DAY_MS)
-            filename_no_extension = "location_{}-{}_days_of_data".format(location_id, days)
-            final_path = os.path.join(data_path, "{}.zip".format(filename_no_extension))
-            download_path = os.path.join(data_path, "{}.zip".format(result_key))
-            download_paths[result_key] = download_path
+    elif job['type'] == DATA_REQUEST_TYPE_DEVICE_PARAMETERS:
+        data_path = os.path.join(downloads_path, 'data')
+        days = int((job['end_time_ms'] - job['start_time_ms']) / ONE_DAY_MS)
+        filename_no_extension = "location_{}-{}_days_of_data".format(job['location_id'], days)
+        final_path = os.path.join(data_path, "{}.zip".format(filename_no_extension))
+        download_path = os.path.join(data_path, "{}.zip".format(result_key))
 
-        if os.path.exists(final_path):
-            os.remove(final_path)
+    return download_path, final_path
 
-        if os.path.exists(download_path):
-            os.remove(download_path)
 
-        download_file(results[result_key], download_path)
-        print("Downloaded file: {}".format(download_path))
+def _download_data_request_file(url, download_path):
+    """
+    :param url: URL of a data request result
+    :param download_path: Full file path to download to
+    :return: Full file path
+    """
+    download_file(url, download_path)
+    print("Downloaded file: {}".format(download_path))
+    return download_path
+
+
+def _finalize_data_request(cloud_url, admin_key, job, ism=False):
+    """
+    Transform and finalize the downloaded files of a job
+    :param cloud_url: Cloud URL
+    :param admin_key: Administrative API key
+    :param job: Job from _plan_data_request() that's downloaded
+    :param ism: True to also generate an integrated sensor matrix from DATA_REQUEST_TYPE_DEVICE_PARAMETERS. Default is False.
+    :return: Full path to the final downloaded file
+    """
+    type = job['type']
+    location_id = job['location_id']
+    location_object = job['location']
+    start_time_ms = job['start_time_ms']
+    end_time_ms = job['end_time_ms']
+    device_by_requestkey = job['device_by_requestkey']
+    device_by_id = job['device_by_id']
+    activity_requestkeys_by_device = job['activity_requestkeys_by_device']
+    modes_keys = job['modes_keys']
+    datastreams_keys = job['datastreams_keys']
+    download_paths = job['downloads']
+    final_path = job['final_path']
+    filename_no_extension = os.path.splitext(os.path.basename(final_path))[0]
+    narratives_path = os.path.join(job['downloads_path'], 'narratives')
+    data_path = os.path.join(job['downloads_path'], 'data')
+
+    if job['incremental'] and len(download_paths) == 0:
+        # Nothing new since the last extraction
+        if final_path != job['previous_final_path']:
+            os.replace(job['previous_final_path'], final_path)
+
+        _record_watermarks(job)
+        return final_path
+
+    download_path = list(download_paths.values())[-1]
+
+    # Files of the last extraction to merge the new data into { filename : extracted path }
+    previous_files = {}
+    previous_path = None
+    if job['incremental']:
+        import tempfile
+        previous_path = tempfile.mkdtemp(dir=job['downloads_path'])
+        with zipfile.ZipFile(job['previous_final_path'], "r") as z:
+            for previous_filename in z.namelist():
+                z.extract(previous_filename, previous_path)
+                previous_files[previous_filename] = os.path.join(previous_path, previous_filename)
 
-    # STEP 4 : Transform and finalize all previously downloaded data
     if type == DATA_REQUEST_TYPE_LOCATION_NARRATIVES:
         # We want to add the locationId column to the CSV to help with post-processing
         extracted_files = []
@@ -1174,6 +1638,9 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
                                                    filename_no_extension + ".csv",
                                                    location_object)
 
+                for previous_file in previous_files.values():
+                    _merge_csv_rows(previous_file, filename)
+
                 zip_out = zipfile.ZipFile(final_path, 'w', zipfile.ZIP_DEFLATED)
                 zip_out.write(filename, arcname=os.path.basename(filename))
                 zip_out.close()
@@ -1245,6 +1712,26 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
             if os.path.exists(download_paths[request_key]):
                 os.remove(download_paths[request_key])
 
+        # Merge the new data into the data of the last extraction.
+        # Raw device parameters and alerts are merged before they're transformed, modes and data streams after.
+        for device_id in device_by_id:
+            previous_parameters_path = previous_files.get(slugify("{}_parameters".format(device_id)) + ".csv")
+            if previous_parameters_path is not None:
+                extracted_parameters_paths_by_device.setdefault(device_id, []).insert(0, previous_parameters_path)
+
+            previous_alerts_path = previous_files.get(slugify("{}_alerts".format(device_id)) + ".csv")
+            if previous_alerts_path is not None:
+                extracted_alerts_paths_by_device.setdefault(device_id, []).insert(0, previous_alerts_path)
+
+        for previous_filename in ["location_{}_modes_history.csv".format(location_object['id']), "location_{}_datastreams_history.csv".format(location_object['id'])]:
+            if previous_filename in previous_files:
+                transformed_path = os.path.join(data_path, previous_filename)
+                if transformed_path in transformed_files:
+                    _merge_csv_rows(previous_files[previous_filename], transformed_path)
+                else:
+                    os.replace(previous_files[previous_filename], transformed_path)
+                    transformed_files.append(transformed_path)
+
         print("Extracted paths by device: {}".format(json.dumps(extractedpath_by_requestkey, indent=2, sort_keys=True)))
         print("Extracted parameter paths by device: {}".format(json.dumps(extracted_parameters_paths_by_device, indent=2, sort_keys=True)))
         print("Extracted alerts paths by device: {}".format(json.dumps(extracted_alerts_paths_by_device, indent=2, sort_keys=True)))
@@ -1309,11 +1796,16 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
             paths = extracted_parameters_paths_by_device[device_id]
             data = ""
             out_file = os.path.join(data_path, slugify("{}_parameters".format(device_id)) + ".csv")
+            previous_lines = set()
             for p in paths:
                 with open(p, "r") as f:
                     for line in f:
                         if line.startswith("measureTime"):
                             continue
+                        if p in previous_files.values():
+                            previous_lines.add(line.rstrip("\n"))
+                        elif line.rstrip("\n") in previous_lines:
+                            continue
                         data += line
 
                 os.remove(p)
@@ -1342,11 +1834,16 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
             paths = extracted_alerts_paths_by_device[device_id]
             data = ""
             out_file = os.path.join(data_path, slugify("{}_alerts".format(device_id)) + ".csv")
+            previous_lines = set()
             for p in paths:
                 with open(p, "r") as f:
                     for line in f:
                         if line.startswith("time"):
                             continue
+                        if p in previous_files.values():
+                            previous_lines.add(line.rstrip("\n"))
+                        elif line.rstrip("\n") in previous_lines:
+                            continue
                         data += line
 
                 os.remove(p)
@@ -1383,7 +1880,8 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
                 data_request_files["{}_alert".format(key)] = filename
 
         zip_all_these_file_paths += _generate_recordings(cloud_url, admin_key, location_id, transformed_files, data_request_files, data_path, start_time_ms=start_time_ms, end_time_ms=end_time_ms)
-        #zip_all_these_file_paths.append(_generate_ism(transformed_files, os.path.join(data_path, "ism_{}.pickle".format(location_id))))
+        if ism:
+            zip_all_these_file_paths += _generate_ism(transformed_files, os.path.join(data_path, "ism_{}.pickle".format(location_id)))
 
         print("Final Path: {}".format(final_path))
         zip_out = zipfile.ZipFile(final_path, 'w', zipfile.ZIP_DEFLATED)
@@ -1393,9 +1891,82 @@ def data_request(cloud_url, admin_key, type, location_id=None, organization_id=N
                 os.remove(filename)
         zip_out.close()
 
+    if previous_path is not None:
+        shutil.rmtree(previous_path, ignore_errors=True)
+        if job['previous_final_path'] != final_path and os.path.exists(job['previous_final_path']):
+            os.remove(job['previous_final_path'])
+
+    _record_watermarks(job)
     return final_path
 
 
+def _merge_csv_rows(previous_file, new_file):
+    """
+    Merge the rows of a CSV file from the last extraction into a newly transformed CSV file with the same columns.
+    The previous rows come first, followed by the new rows.
+    :param previous_file: CSV file from the last extraction
+    :param new_file: Newly transformed CSV file, which is rewritten with the merged rows
+    """
+    with open(new_file, 'r') as f:
+        new_lines = f.read().splitlines()
+
+    if len(new_lines) == 0:
+        return
+
+    new_rows = [line for line in new_lines[1:] if line.strip() != ""]
+    new_row_set = set(new_rows)
+
+    merged_file = new_file + ".merged"
+    with open(previous_file, 'r') as in_file, open(merged_file, 'w') as f, csvstream.ChunkedWriter(f) as out_file:
+        out_file.write(new_lines[0] + "\n")
+        for index, line in enumerate(in_file):
+            line = line.rstrip("\n")
+            if index == 0 or line.strip() == "" or line in new_row_set:
+                continue
+            out_file.write(line + "\n")
+
+        for line in new_rows:
+            out_file.write(line + "\n")
+
+    os.replace(merged_file, new_file)
+
+
+def _record_watermarks(job):
+    """
+    Advance the watermarks of a finished job in the watermark index.
+    Data with a data request the server never answered keeps its old watermark, and is requested again next time.
+    :param job: Job from _plan_data_request() that's finished
+    """
+    if job['location_id'] is None:
+        return
+
+    # { watermark name : True if the server answered all of its data requests }
+    answered = {}
+    for request_key, watermark_name in job['watermark_by_requestkey'].items():
+        answered[watermark_name] = answered.get(watermark_name, True) and request_key in job['urls']
+
+    watermarks = dict(job['watermarks'])
+    for watermark_name in answered:
+        if answered[watermark_name]:
+            watermarks[watermark_name] = job['end_time_ms']
+
+    index = pipeline.WatermarkIndex(os.path.join(job['downloads_path'], pipeline.WATERMARKS_FILENAME))
+    index.update(job['location_id'], job['type'], job['final_path'], job['start_time_ms'], watermarks)
+
+
+def generate_ism(cloud_url, admin_key, location_id, start_time_ms=None, end_time_ms=None):
+    """
+    Download all device data from a location and generate an integrated sensor matrix from it
+    :param cloud_url: Cloud URL
+    :param admin_key: Administrative API key
+    :param location_id: Location ID
+    :param start_time_ms: Optional start time in milliseconds
+    :param end_time_ms: Optional end time in milliseconds
+    :return: Path to the .zip file containing the device data and the integrated sensor matrix
+    """
+    return data_request(cloud_url, admin_key, DATA_REQUEST_TYPE_DEVICE_PARAMETERS, location_id=location_id, start_time_ms=start_time_ms, end_time_ms=end_time_ms, ism=True)
+
+
 def get_service_plans(cloud_url, admin_key, location_id=None, organization_id=None):
     """
     Get service plans
@@ -1490,14 +2061,13 @@ def download_file(from_url, to_path):
     :param to_path: Full file path to download to
     :return: Full path to the local filename
     """
-    with requests.get(from_url, stream=True) as r:
-        with open(to_path, 'wb') as f:
-            shutil.copyfileobj(r.raw, f)
+    return pipeline.download(from_url, to_path)
 
 
 def transform_narrative_csv(original_csv_file, recommended_csv_filename, location_object):
     """
-    Transform a narrative CSV file in a way that injects more useful information and fixes carriage-returns
+    Transform a narrative CSV file in a way that injects more useful information and fixes carriage-returns.
+    Titles and descriptions may contain commas in quoted fields, which stay in their column.
     :param original_csv_file: Original CSV file with all the data
     :param recommended_csv_filename: Recommendation for the transformed CSV filename
     :param location_object: JSON location object from get_location()
@@ -1514,49 +2084,32 @@ def transform_narrative_csv(original_csv_file, recommended_csv_filename, locatio
     print("Transforming: {}...".format(transform_path))
 
     TIMESTAMP_COLUMN = 1
-    line_buffer = ""
-
-    with open(original_csv_file, 'r') as in_file:
-        with open(transform_path, 'w') as out_file:
-            for index, line in enumerate(in_file.readlines()):
-                if index == 0:
-                    out_file.write("locationId,timestamp_iso,timestamp_excel," + line.strip())
+    timestamps = csvstream.TimestampFormatter(timezone_string)
 
-                else:
-                    line_list = line.split(",")
+    with open(transform_path, 'w') as f, csvstream.ChunkedWriter(f) as out_file:
+        out_file.write_row(["locationId", "timestamp_iso", "timestamp_excel"] + csvstream.read_header(original_csv_file))
 
-                    # ISO is UTC time while the Excel timestamp is in the user's local timezone
-                    try:
-                        timestamp_ms = int(line_list[TIMESTAMP_COLUMN])
-
-                        # These narratives may contain arbitrary carriage-returns which may stretch a single narrative entry across multiple lines.
-                        # If we can't extract a timestamp (as indicated by an integer in the second element of a comma-split list of words),
-                        # then it's not a new narrative entry and we buffer it up and gather then next line
-                        # If we found a solid new narrative entry, we make sure the last buffered line is written.
-                        # And we always make sure the last line had a carriage-return.
-
-                        # If we make it to this line and didn't get an exception, then we probably have a new narrative entry.
-                        # So we either output the last buffered line, or if we don't have one then we at least make sure we have a carriage-return.
-                        if line_buffer != "":
-                            out_file.write(line_buffer.replace(",", " ") + "\n")
-                            line_buffer = ""
-                        else:
-                            out_file.write("\n")
+        # Each narrative is written once we know the rows after it don't continue it
+        narrative = None
+        for line_list in csvstream.read_rows(original_csv_file):
+            # ISO is UTC time while the Excel timestamp is in the user's local timezone
+            try:
+                timestamp_ms = int(line_list[TIMESTAMP_COLUMN])
 
-                    except:
-                        line_buffer += line.strip()
-                        continue
+            except (ValueError, IndexError):
+                # Narratives may contain arbitrary carriage-returns outside of quotes, which stretch a single narrative
+                # entry across multiple rows. A row without a timestamp continues the narrative before it.
+                if narrative is not None:
+                    narrative[-1] += " " + " ".join(line_list)
+                continue
 
-                    timestamp_iso = datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).isoformat() + "Z"
-                    timestamp_excel = datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, pytz.timezone(timezone_string)).strftime('%m/%d/%Y %H:%M:%S')
-                    out_file.write("{},{},{},{}".format(location_id, timestamp_iso, timestamp_excel, line.strip()))
+            if narrative is not None:
+                out_file.write_row(narrative)
 
-            if line_buffer != "":
-                out_file.write(line_buffer.replace(",", " ") + "\n")
-            else:
-                out_file.write("\n")
+            narrative = [location_id, timestamps.iso(timestamp_ms), timestamps.excel(timestamp_ms)] + line_list
 
-            out_file.flush()
+        if narrative is not None:
+            out_file.write_row(narrative)
 
     return transform_path
 
@@ -1593,6 +2146,13 @@ def transform_device_csv(original_csv_file, device_object, type=DATA_REQUEST_TYP
     new_filename = "{}_{}_{}_{}_{}.csv".format(device_type, device_model, device_id, device_description, type)
     new_file_path = os.path.join(os.path.dirname(original_csv_file), new_filename)
     print("Transforming {} into {}...".format(original_csv_file, new_file_path))
+
+    # ISO is UTC time while the Excel timestamp is in the user's local timezone
+    timezone_string = "America/Los_Angeles"
+    if 'timezone' in device_object:
+        timezone_string = device_object['timezone']['id']
+    timestamps = csvstream.TimestampFormatter(timezone_string)
+
     if type == DATA_REQUEST_TYPE_DEVICE_PARAMETERS:
 
         # STEP 1. Extract a list of all parameters and their initial (timestamp, value)
@@ -1609,123 +2169,57 @@ def transform_device_csv(original_csv_file, device_object, type=DATA_REQUEST_TYP
         PARAMETER_VALUE_COLUMN = 4
 
         parameters = {}
-        with open(original_csv_file, 'r') as f:
-            for index, line in enumerate(f.readlines()):
-                if index > 0:
-                    value = ""
-                    in_bracket = 0
-                    in_quote = 0
-                    line_list = []
-                    for c in line:
-                        if c == '[':
-                            in_bracket += 1
-                        elif c == ']':
-                            in_bracket -= 1
-
-                        if c == '\"' and in_quote > 0:
-                            in_quote -= 1
-                        elif c == '\"':
-                            in_quote += 1
-
-                        if in_bracket == 0 and in_quote == 0:
-                            if c == ',':
-                                line_list.append(value)
-                                value = ""
-                                continue
-
-                        value += c
+        for line_list in csvstream.read_rows(original_csv_file):
+            param_name = line_list[PARAMETER_NAME_COLUMN].strip()
+            param_index = line_list[PARAMETER_INDEX_COLUMN].strip()
 
-                    line_list.append(value)
+            if len(param_index) > 0:
+                param_name = param_name + "." + param_index
 
-                    param_name = line_list[PARAMETER_NAME_COLUMN].strip()
-                    param_index = line_list[PARAMETER_INDEX_COLUMN].strip()
+            if param_name not in parameters:
+                parameters[param_name] = _transformed_value(line_list[PARAMETER_VALUE_COLUMN])
 
-                    if len(param_index) > 0:
-                        param_name = param_name + "." + param_index
+        sorted_parameters = sorted(list(parameters.keys()))
 
-                    if param_name not in parameters:
-                        parameters[param_name] = line_list[PARAMETER_VALUE_COLUMN].strip()
-
-        with open(new_file_path, 'w') as out:
+        with open(new_file_path, 'w') as f, csvstream.ChunkedWriter(f) as out:
             # STEP 2. Output CSV header
             out.write("trigger,location_id,device_type,device_id,description,timestamp_ms,timestamp_iso,timestamp_excel,behavior")
 
-
-            for p in sorted(list(parameters.keys())):
+            for p in sorted_parameters:
                 out.write("," + p)
             out.write("\n")
 
-            # STEP 3. Read from the original file and export all columns
-            with open(original_csv_file, 'r') as f:
-                line_buffer = ""
-                last_timestamp_ms = 0
+            # STEP 3. Read from the original file and export one row with the state of all parameters for each timestamp
+            def state(trigger, timestamp_ms):
+                line = "{},{},{},{},{},{},{},{},{}".format(trigger, location_id, device_type, device_id,
+                                                          device_description, timestamp_ms, timestamps.iso(timestamp_ms),
+                                                          timestamps.excel(timestamp_ms), behavior)
+                return line + "," + ",".join([parameters[p] for p in sorted_parameters]) if sorted_parameters else line
+
+            last_timestamp_ms = 0
+            trigger = 8
+            for line_list in csvstream.read_rows(original_csv_file):
+                param_name = line_list[PARAMETER_NAME_COLUMN].strip()
+                param_index = line_list[PARAMETER_INDEX_COLUMN].strip()
+                timestamp_ms = int(line_list[TIMESTAMP_COLUMN].strip())
+
+                if last_timestamp_ms != timestamp_ms:
+                    if last_timestamp_ms > 0:
+                        out.write(state(trigger, last_timestamp_ms) + "\n")
+                    last_timestamp_ms = timestamp_ms
+
+                if len(param_index) > 0:
+                    param_name = param_name + "." + param_index
+
+                parameters[param_name] = _transformed_value(line_list[PARAMETER_VALUE_COLUMN])
+
+                trigger = 8
+                if param_name == "[online]":
+                    trigger = 4
 
-                for index, line in enumerate(f.readlines()):
-                    if index > 0:
-                        value = ""
-                        in_bracket = 0
-                        in_quote = 0
-                        line_list = []
-                        for c in line:
-                            if c == '[':
-                                in_bracket += 1
-                            elif c == ']':
-                                in_bracket -= 1
-
-                            if c == '\"' and in_quote > 0:
-                                in_quote -= 1
-                            elif c == '\"':
-                                in_quote += 1
-
-                            if in_bracket == 0 and in_quote == 0:
-                                if c == ',':
-                                    line_list.append(value)
-                                    value = ""
-                                    continue
-
-                            value += c
-
-                        line_list.append(value)
-
-                        param_name = line_list[PARAMETER_NAME_COLUMN].strip()
-                        param_index = line_list[PARAMETER_INDEX_COLUMN].strip()
-                        timestamp_ms = int(line_list[TIMESTAMP_COLUMN].strip())
-
-                        if last_timestamp_ms != timestamp_ms:
-                            if last_timestamp_ms > 0:
-                                line_buffer += "\n"
-
-                            out.write(line_buffer)
-                            last_timestamp_ms = timestamp_ms
-
-                        if len(param_index) > 0:
-                            param_name = param_name + "." + param_index
-
-                        parameters[param_name] = line_list[PARAMETER_VALUE_COLUMN].strip()
-
-                        trigger = 8
-                        if param_name == "[online]":
-                            trigger = 4
-
-                        # ISO is UTC time while the Excel timestamp is in the user's local timezone
-                        timestamp_iso = datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).isoformat() + "Z"
-                        timezone_string = "America/Los_Angeles"
-                        if 'timezone' in device_object:
-                            timezone_string = device_object['timezone']['id']
-                        timestamp_excel = datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, pytz.timezone(timezone_string)).strftime('%m/%d/%Y %H:%M:%S')
-
-                        line_buffer = "{},{},{},{},{},{},{},{},{}".format(trigger, location_id, device_type, device_id,
-                                                                        device_description, timestamp_ms, timestamp_iso,
-                                                                        timestamp_excel, behavior)
-
-                        for p in sorted(list(parameters.keys())):
-                            # Remove quotes on values - not sure where the quotes came from but it would be more ideal to remove them earlier.
-                            if parameters[p].startswith("\"") and parameters[p].endswith("\""):
-                                parameters[p] = parameters[p][1:-1]
-                            line_buffer += ",{}".format(parameters[p].replace(",", COMMA_DELIMITER_REPLACEMENT_CHARACTER))
-
-                line_buffer += "\n"
-                out.write(line_buffer)
+            if last_timestamp_ms > 0:
+                out.write(state(trigger, last_timestamp_ms))
+            out.write("\n")
 
     elif type == DATA_REQUEST_TYPE_DEVICE_ALERTS:
 
@@ -1740,143 +2234,97 @@ def transform_device_csv(original_csv_file, device_object, type=DATA_REQUEST_TYP
         ALERT_PARAM_GROUP_COLUMN = 2
         ALERT_CONTENT_COLUMN = 3
 
-        alert_name = ""
         alert_params = {}
         if os.path.exists(original_csv_file):
-            with open(original_csv_file, 'r') as f:
-                for index, line in enumerate(f.readlines()):
-                    if index > 0:
-                        value = ""
-                        in_bracket = 0
-                        in_quote = 0
-                        line_list = []
-                        for c in line:
-                            if c == '[':
-                                in_bracket += 1
-                            elif c == ']':
-                                in_bracket -= 1
-
-                            if c == '\"' and in_quote > 0:
-                                in_quote -= 1
-                            elif c == '\"':
-                                in_quote += 1
-
-                            if in_bracket == 0 and in_quote == 0:
-                                if c == ',':
-                                    line_list.append(value)
-                                    value = ""
-                                    continue
-
-                            value += c
-
-                        line_list.append(value)
-
-                        alert_name = line_list[ALERT_NAME_COLUMN].strip()
-                        params = line_list[ALERT_PARAM_GROUP_COLUMN].strip()
-                        if len(params) > 0:
-                            try:
-                                params_json = json.loads(params.replace('"{','{').replace('}"','}').replace('""','"'))
-                            except:
-                                continue
-                            for param_name in params_json.keys():
-                                if param_name not in alert_params:
-                                    alert_params[param_name] = params_json[param_name]
+            for line_list in csvstream.read_rows(original_csv_file):
+                params_json = _alert_params(line_list[ALERT_PARAM_GROUP_COLUMN])
+                if params_json is None:
+                    continue
+                for param_name in params_json.keys():
+                    if param_name not in alert_params:
+                        alert_params[param_name] = params_json[param_name]
 
-        with open(new_file_path, 'w') as out:
+        sorted_alert_params = sorted(list(alert_params.keys()))
+
+        with open(new_file_path, 'w') as f, csvstream.ChunkedWriter(f) as out:
             # STEP 2. Output CSV header
             out.write("trigger,location_id,device_type,device_id,description,timestamp_ms,timestamp_iso,timestamp_excel,behavior")
 
             out.write("," + "alert_type")
 
-            for p in sorted(list(alert_params.keys())):
+            for p in sorted_alert_params:
                 out.write("," + p)
             out.write("\n")
 
-            # STEP 3. Read from the original file and export all columns
+            # STEP 3. Read from the original file and export the last alert at each timestamp
             if os.path.exists(original_csv_file):
-                with open(original_csv_file, 'r') as f:
-                    line_buffer = ""
-                    last_timestamp_ms = 0
-
-                    for index, line in enumerate(f.readlines()):
-                        if index > 0:
-                            value = ""
-                            in_bracket = 0
-                            in_quote = 0
-                            line_list = []
-                            for c in line:
-                                if c == '[':
-                                    in_bracket += 1
-                                elif c == ']':
-                                    in_bracket -= 1
-
-                                if c == '\"' and in_quote > 0:
-                                    in_quote -= 1
-                                elif c == '\"':
-                                    in_quote += 1
-
-                                if in_bracket == 0 and in_quote == 0:
-                                    if c == ',':
-                                        line_list.append(value)
-                                        value = ""
-                                        continue
-
-                                value += c
-
-                            line_list.append(value)
-
-
-                            timestamp_ms = int(line_list[TIMESTAMP_COLUMN].strip())
-
-                            if last_timestamp_ms != timestamp_ms:
-                                if last_timestamp_ms > 0:
-                                    line_buffer += "\n"
-
-                                out.write(line_buffer)
-                                last_timestamp_ms = timestamp_ms
-
-                            alert_name = line_list[ALERT_NAME_COLUMN].strip()
-                            params = line_list[ALERT_PARAM_GROUP_COLUMN].strip()
-                            cur_alert_params = {}
-                            if len(params) > 0:
-                                try:
-                                    params_json = json.loads(params.replace('"{','{').replace('}"','}').replace('""','"'))
-                                except:
-                                    continue
-                                for param_name in params_json.keys():
-                                    if param_name not in cur_alert_params:
-                                        cur_alert_params[param_name] = params_json[param_name]
-                            print(alert_params)
-                            print(cur_alert_params)
-                            # asfd
-                            trigger = 4
-
-                            # ISO is UTC time while the Excel timestamp is in the user's local timezone
-                            timestamp_iso = datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).isoformat() + "Z"
-                            timezone_string = "America/Los_Angeles"
-                            if 'timezone' in device_object:
-                                timezone_string = device_object['timezone']['id']
-                            timestamp_excel = datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, pytz.timezone(timezone_string)).strftime('%m/%d/%Y %H:%M:%S')
-
-                            line_buffer = "{},{},{},{},{},{},{},{},{},{}".format(trigger, location_id, device_type, device_id,
-                                                                            device_description, timestamp_ms, timestamp_iso,
-                                                                            timestamp_excel, behavior, alert_name)
-
-                            for p in sorted(list(alert_params.keys())):
-                                if p not in cur_alert_params:
-                                    line_buffer += ","
-                                    continue        
-                                # Remove quotes on values - not sure where the quotes came from but it would be more ideal to remove them earlier.
-                                if cur_alert_params[p].startswith("\"") and cur_alert_params[p].endswith("\""):
-                                    cur_alert_params[p] = cur_alert_params[p][1:-1]
-                                line_buffer += ",{}".format(cur_alert_params[p].replace(",", COMMA_DELIMITER_REPLACEMENT_CHARACTER))
-
-                    line_buffer += "\n"
-                    out.write(line_buffer)
+                line_buffer = ""
+                last_timestamp_ms = 0
+
+                for line_list in csvstream.read_rows(original_csv_file):
+                    timestamp_ms = int(line_list[TIMESTAMP_COLUMN].strip())
+                    cur_alert_params = _alert_params(line_list[ALERT_PARAM_GROUP_COLUMN])
+                    if cur_alert_params is None:
+                        continue
+
+                    if last_timestamp_ms != timestamp_ms:
+                        if last_timestamp_ms > 0:
+                            out.write(line_buffer + "\n")
+                        last_timestamp_ms = timestamp_ms
+
+                    alert_name = line_list[ALERT_NAME_COLUMN].strip()
+                    trigger = 4
+
+                    line_buffer = "{},{},{},{},{},{},{},{},{},{}".format(trigger, location_id, device_type, device_id,
+                                                                        device_description, timestamp_ms, timestamps.iso(timestamp_ms),
+                                                                        timestamps.excel(timestamp_ms), behavior, alert_name)
+
+                    for p in sorted_alert_params:
+                        line_buffer += ","
+                        if p in cur_alert_params:
+                            line_buffer += _transformed_value(cur_alert_params[p])
+
+                out.write(line_buffer + "\n")
 
     return new_file_path
 
 
+def _transformed_value(value):
+    """
+    Format a value for a transformed CSV file
+    :param value: Value from the original CSV file
+    :return: Value without surrounding quotes, and commas replaced by COMMA_DELIMITER_REPLACEMENT_CHARACTER
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value)
+
+    value = value.strip()
+    # Remove quotes on values - not sure where the quotes came from but it would be more ideal to remove them earlier.
+    if len(value) > 1 and value.startswith("\"") and value.endswith("\""):
+        value = value[1:-1]
+    return value.replace(",", COMMA_DELIMITER_REPLACEMENT_CHARACTER)
+
+
+def _alert_params(params):
+    """
+    Decode the JSON parameters of a device alert
+    :param params: JSON parameters column of a device alert
+    :return: Dictionary of alert parameters, an empty dictionary if there are none, or None if they can't be decoded
+    """
+    params = params.strip()
+    if len(params) == 0:
+        return {}
+
+    try:
+        params_json = json.loads(params)
+    except ValueError:
+        return None
+
+    if not isinstance(params_json, dict):
+        return None
+    return params_json
+
+
 def transform_modes_csv(original_csv_file, location_object):
     """
     Transform a modes CSV file to a useful format
@@ -1906,37 +2354,32 @@ def transform_modes_csv(original_csv_file, location_object):
     new_file_path = os.path.join(os.path.dirname(original_csv_file), new_filename)
     print("Transforming {}...".format(new_file_path))
 
-    with open(new_file_path, 'w') as out:
+    # ISO is UTC time while the Excel timestamp is in the user's local timezone
+    timezone_string = "America/Los_Angeles"
+    if 'timezone' in location_object:
+        timezone_string = location_object['timezone']['id']
+    timestamps = csvstream.TimestampFormatter(timezone_string)
+
+    with open(new_file_path, 'w') as f, csvstream.ChunkedWriter(f) as out:
         # STEP 1. Output CSV header
         out.write("trigger,location_id,timestamp_ms,timestamp_iso,timestamp_excel,event,source_type\n")
 
         # STEP 2. Read from the original file and export all columns
-        with open(original_csv_file, 'r') as f:
-            for index, line in enumerate(f.readlines()):
-                if index > 0:
-                    line_list = line.split(",")
-
-                    # ISO is UTC time while the Excel timestamp is in the user's local timezone
-                    timestamp_ms = int(line_list[TIMESTAMP_COLUMN])
-                    timestamp_iso = datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).isoformat() + "Z"
-                    timezone_string = "America/Los_Angeles"
-                    if 'timezone' in location_object:
-                        timezone_string = location_object['timezone']['id']
-                    timestamp_excel = datetime.datetime.fromtimestamp(timestamp_ms / 1000.0,
-                                                                      pytz.timezone(timezone_string)).strftime('%m/%d/%Y %H:%M:%S')
-                    event = line_list[EVENT_COLUMN].strip()
-                    source_type = line_list[SOURCE_TYPE_COLUMN].strip()
-                    if source_type == 2:
-                        # Ignore bot-driven modes to allow for playback of user-driven modes only
-                        continue
+        for line_list in csvstream.read_rows(original_csv_file):
+            timestamp_ms = int(line_list[TIMESTAMP_COLUMN])
+            event = line_list[EVENT_COLUMN].strip()
+            source_type = line_list[SOURCE_TYPE_COLUMN].strip()
+            if source_type == 2:
+                # Ignore bot-driven modes to allow for playback of user-driven modes only
+                continue
 
-                    out.write("{},{},{},{},{},{},{}\n".format(2,
-                                                              location_id,
-                                                              timestamp_ms,
-                                                              timestamp_iso,
-                                                              timestamp_excel,
-                                                              event,
-                                                              source_type))
+            out.write("{},{},{},{},{},{},{}\n".format(2,
+                                                      location_id,
+                                                      timestamp_ms,
+                                                      timestamps.iso(timestamp_ms),
+                                                      timestamps.excel(timestamp_ms),
+                                                      event,
+                                                      source_type))
 
     return new_file_path
 
@@ -1965,34 +2408,29 @@ def transform_datastreams_csv(original_csv_file, location_object):
     new_file_path = os.path.join(os.path.dirname(original_csv_file), new_filename)
     print("Transforming {}...".format(new_file_path))
 
-    with open(new_file_path, 'w') as out:
+    # ISO is UTC time while the Excel timestamp is in the user's local timezone
+    timezone_string = "America/Los_Angeles"
+    if 'timezone' in location_object:
+        timezone_string = location_object['timezone']['id']
+    timestamps = csvstream.TimestampFormatter(timezone_string)
+
+    with open(new_file_path, 'w') as f, csvstream.ChunkedWriter(f) as out:
         # STEP 1. Output CSV header
         out.write("trigger,location_id,timestamp_ms,timestamp_iso,timestamp_excel,address,feed\n")
 
         # STEP 2. Read from the original file and export all columns
-        with open(original_csv_file, 'r') as f:
-            for index, line in enumerate(f.readlines()):
-                if index > 0:
-                    line_list = line.split(",")
-
-                    # ISO is UTC time while the Excel timestamp is in the user's local timezone
-                    timestamp_ms = int(line_list[TIMESTAMP_COLUMN])
-                    timestamp_iso = datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).isoformat() + "Z"
-                    timezone_string = "America/Los_Angeles"
-                    if 'timezone' in location_object:
-                        timezone_string = location_object['timezone']['id']
-                    timestamp_excel = datetime.datetime.fromtimestamp(timestamp_ms / 1000.0,
-                                                                      pytz.timezone(timezone_string)).strftime('%m/%d/%Y %H:%M:%S')
-                    feed_content = {}
-                    idx = line.find(line_list[FEED_COLUMN])
-                    feed_content = line[idx:].replace('"{','{').replace('}"','}').replace('""','"').replace(',','&&')
-                    out.write("{},{},{},{},{},{},{}\n".format(256,
-                                                              location_id,
-                                                              timestamp_ms,
-                                                              timestamp_iso,
-                                                              timestamp_excel,
-                                                              line_list[ADDRESS_COLUMN].strip(),
-                                                              feed_content.strip()))
+        for line_list in csvstream.read_rows(original_csv_file):
+            timestamp_ms = int(line_list[TIMESTAMP_COLUMN])
+
+            # The csv module already decoded the quoted JSON feed. Anything past it belongs to the feed as well.
+            feed_content = ",".join(line_list[FEED_COLUMN:]).replace(',', COMMA_DELIMITER_REPLACEMENT_CHARACTER)
+            out.write("{},{},{},{},{},{},{}\n".format(256,
+                                                      location_id,
+                                                      timestamp_ms,
+                                                      timestamps.iso(timestamp_ms),
+                                                      timestamps.excel(timestamp_ms),
+                                                      line_list[ADDRESS_COLUMN].strip(),
+                                                      feed_content.strip()))
     return new_file_path
 
 
@@ -2157,10 +2595,15 @@ def __zipdir(path, z):
 
 def _generate_recordings(cloud_url, admin_key, location_id, transformed_files, data_request_files, output_directory, start_time_ms=None, end_time_ms=None):
     """
-    Generate recordings for --playback from our downloaded, transformed files
+    Generate recordings for --playback from our downloaded, transformed files.
+    Each file is sorted by timestamp on its own, in runs on disk once the files sorted so far don't fit in memory, and the sorted files are merged
+    into the recordings as they're written so the data never has to fit in memory all at once.
     :param transformed_files:
     :return: List of recordings
     """
+    import heapq
+    import tempfile
+
     print("Generating recordings for --playback...")
     location_info = get_location(cloud_url, admin_key, location_id)
     devices = get_devices(cloud_url, admin_key, location_id)
@@ -2168,104 +2611,183 @@ def _generate_recordings(cloud_url, admin_key, location_id, transformed_files, d
     for device in devices:
         device_properties[device['id']] = get_device_properties(cloud_url, admin_key, location_id, device['id'])
 
-    all_data = []
-    for f in transformed_files:
-        all_data += _csv_file_to_python(f)
+    def timestamp(d):
+        return d['timestamp_ms']
 
-    # Massive amount of data to sort by timestamp - btw, hope your computer has a lot of memory.
-    all_data = sorted(all_data, key=lambda d: d['timestamp_ms'])
+    subdomain = _get_subdomain_from_url(cloud_url)
 
-    if start_time_ms is not None:
+    # Each device's recording is written as the merged data goes by
+    # { device_id : [ output_filename, file, lines ] }
+    device_recordings = {}
+    for device in devices:
+        device_recordings[device['id']] = [os.path.join(output_directory, slugify("recording__{}_{}_location-{}".format(device['id'], device['desc'], location_id)) + ".json"), None, 0]
+
+    with tempfile.TemporaryDirectory(dir=output_directory) as temporary_directory:
+        # Runs are kept in the order of the files and rows they came from, so merging them is a stable sort like sorted() on all the data
+        runs = []
+        for f in transformed_files:
+            _sorted_runs(_csv_file_rows(f), timestamp, temporary_directory, runs)
+
+        while len(runs) > RECORDING_MERGE_FAN_IN:
+            merged_runs = []
+            for i in range(0, len(runs), RECORDING_MERGE_FAN_IN):
+                merged_runs.append(_write_run(heapq.merge(*[_read_run(run) for run in runs[i:i + RECORDING_MERGE_FAN_IN]], key=timestamp), temporary_directory))
+            runs = merged_runs
+
+        # The total combined recording's filename includes the number of days it covers, which we know once it's written
+        combined_filename = os.path.join(temporary_directory, "recording.json")
         oldest_timestamp_ms = start_time_ms
-    else:
-        oldest_timestamp_ms = all_data[0]['timestamp_ms']
-
-    if end_time_ms is not None:
         newest_timestamp_ms = end_time_ms
-    else:
-        newest_timestamp_ms = all_data[-1]['timestamp_ms']
+        with open(combined_filename, 'w') as out:
+            # We do it this way so our file remains totally readable and editable later.
+            out.write("{\n")
+            if data_request_files:
+                param_data_request_files = {}
+                for key, filename in data_request_files.items():
+                    if "_param" in key:
+                        param_data_request_files[key.replace("_param","")] = os.path.basename(filename)
+
+                out.write("\"data_requests\":" + json.dumps(param_data_request_files) + ",\n")
+                data_request_files.clear()
+
+            out.write("\"location_info\":" + json.dumps(location_info) + ",\n")
+            out.write("\"device_properties\":" + json.dumps(device_properties) + ",\n")
+            out.write("\"data\":[\n")
+
+            lines = 0
+            last_line = None
+            try:
+                for line in heapq.merge(*[_read_run(run) for run in runs], key=timestamp):
+                    if lines > 0:
+                        out.write(",\n")
+                    out.write("{}".format(json.dumps(line)))
+                    lines += 1
+
+                    if oldest_timestamp_ms is None:
+                        oldest_timestamp_ms = int(line['timestamp_ms'])
+                    last_line = line
+
+                    # Extract each device into its own recording
+                    if device_recordings and int(line['trigger']) in [4,8] and line['device_id'] in device_recordings:
+                        recording = device_recordings[line['device_id']]
+                        if recording[1] is None:
+                            recording[1] = open(os.path.join(temporary_directory, os.path.basename(recording[0])), 'w')
+                            recording[1].write("{\n")
+                            recording[1].write("\"location_info\":" + json.dumps(location_info) + ",\n")
+                            recording[1].write("\"device_properties\":" + json.dumps(device_properties) + ",\n")
+                            recording[1].write("\"data\":[\n")
+
+                        if recording[2] > 0:
+                            recording[1].write(",\n")
+                        recording[1].write("{}".format(json.dumps(line)))
+                        recording[2] += 1
+
+                for recording in device_recordings.values():
+                    if recording[1] is not None:
+                        recording[1].write("\n\n]}\n")
+
+            finally:
+                for recording in device_recordings.values():
+                    if recording[1] is not None:
+                        recording[1].close()
+
+            if lines > 0:
+                out.write("\n")
+            out.write("\n]}\n")
 
-    subdomain = _get_subdomain_from_url(cloud_url)
+        if newest_timestamp_ms is None and last_line is not None:
+            newest_timestamp_ms = int(last_line['timestamp_ms'])
 
-    days = int((newest_timestamp_ms - oldest_timestamp_ms) / ONE_DAY_MS)
-    filename_no_extension = "recording-location_{}-{}_days_of_data".format(location_id, days)
-
-    output_filename = os.path.join(output_directory, filename_no_extension + ".json")
-    saved_files = [output_filename]
-
-    # Extract all data into a total combined recording
-    print("\t=> Exporting {}...".format(output_filename))
-    with open(output_filename, 'w') as out:
-        # We do it this way so our file remains totally readable and editable later.
-        out.write("{\n")
-        if data_request_files:
-            param_data_request_files = {}
-            for key, filename in data_request_files.items():
-                if "_param" in key:
-                    param_data_request_files[key.replace("_param","")] = os.path.basename(filename)
-
-            out.write("\"data_requests\":" + json.dumps(param_data_request_files) + ",\n")
-            data_request_files.clear()
-
-        out.write("\"location_info\":" + json.dumps(location_info) + ",\n")
-        out.write("\"device_properties\":" + json.dumps(device_properties) + ",\n")
-        out.write("\"data\":[\n")
-        for index, line in enumerate(all_data):
-            out.write("{}".format(json.dumps(line)))
-
-            if index < len(all_data) - 1:
-                out.write(",\n")
-            else:
-                out.write("\n")
+        days = 0
+        if oldest_timestamp_ms is not None and newest_timestamp_ms is not None:
+            days = int((int(newest_timestamp_ms) - int(oldest_timestamp_ms)) / ONE_DAY_MS)
+        filename_no_extension = "recording-location_{}-{}_days_of_data".format(location_id, days)
 
-        out.write("\n]}\n")
+        output_filename = os.path.join(output_directory, filename_no_extension + ".json")
+        print("\t=> Exporting {}...".format(output_filename))
+        shutil.move(combined_filename, output_filename)
+        saved_files = [output_filename]
 
-    # Now extract out each device into its own recording
-    for device in devices:
-        device_id = device['id']
-        output_filename = os.path.join(output_directory, slugify("recording__{}_{}_location-{}".format(device['id'], device['desc'], location_id)) + ".json")
+        for device in devices:
+            recording = device_recordings[device['id']]
+            if recording[1] is not None and recording[0] not in saved_files:
+                print("\t=> Exporting {}...".format(recording[0]))
+                shutil.move(recording[1].name, recording[0])
+                saved_files.append(recording[0])
 
-        lines_for_this_device = []
-        for line in all_data:
-            if int(line['trigger']) in [4,8]:
-                if line['device_id'] != device_id:
-                    continue
-                lines_for_this_device.append(line)
-
-        if len(lines_for_this_device) > 0:
-            print("\t=> Exporting {}...".format(output_filename))
-            with open(output_filename, 'w') as out:
-                # We do it this way so our file remains totally readable and editable later.
-                lines = 0
-                out.write("{\n")
-                out.write("\"location_info\":" + json.dumps(location_info) + ",\n")
-                out.write("\"device_properties\":" + json.dumps(device_properties) + ",\n")
-                out.write("\"data\":[\n")
-                for index, line in enumerate(lines_for_this_device):
-                    out.write("{}".format(json.dumps(line)))
+    return saved_files
 
-                    if index < len(lines_for_this_device) - 1:
-                        out.write(",\n")
-                    else:
-                        out.write("\n")
 
-                out.write("\n]}\n")
+def _sorted_runs(rows, key, directory, runs=None):
+    """
+    Sort rows of data by the given key into runs of up to RECORDING_SORT_CHUNK_ROWS rows each.
+    Runs stay in memory as long as the rows of every run in memory fit in RECORDING_SORT_CHUNK_ROWS. Beyond that,
+    each run in memory is written to its own run file in the given directory, so sorting any number of files
+    keeps at most about two chunks of rows in memory.
+    :param rows: Iterable of rows
+    :param key: Function returning the key to sort each row by
+    :param directory: Directory for run files
+    :param runs: Optional list of runs from rows sorted before, which the new runs are added to
+    :return: List of sorted runs, each a list of rows or a run filename
+    """
+    import itertools
+    if runs is None:
+        runs = []
 
-            saved_files.append(output_filename)
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, RECORDING_SORT_CHUNK_ROWS))
+        if len(chunk) == 0:
+            break
 
-    return saved_files
+        chunk.sort(key=key)
+        runs.append(chunk)
+        if sum(len(r) for r in runs if not isinstance(r, str)) > RECORDING_SORT_CHUNK_ROWS:
+            runs[:] = [r if isinstance(r, str) else _write_run(r, directory) for r in runs]
 
-def _csv_file_to_python(csv_file):
+    return runs
+
+
+def _write_run(rows, directory):
     """
-    Transform a CSV file into a Python list of dictionary content
+    Write a sorted run of rows to a file, one JSON object per line
+    :param rows: Iterable of rows
+    :param directory: Directory for the run file
+    :return: Run filename
+    """
+    import tempfile
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix=".run", delete=False) as f:
+        for row in rows:
+            f.write(json.dumps(row))
+            f.write("\n")
+        return f.name
+
+
+def _read_run(run):
+    """
+    Read back a sorted run
+    :param run: List of rows or a run filename from _write_run()
+    :return: Iterator over the rows
+    """
+    if not isinstance(run, str):
+        yield from run
+        return
+
+    with open(run, 'r') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _csv_file_rows(csv_file):
+    """
+    Read a CSV file one row of dictionary content at a time
     :param csv_file: CSV file path
-    :return: [ { bunch of transformed csv data here } ]
+    :return: Iterator over { bunch of transformed csv data here }
     """
     headers = []
-    all_data = []
     trim_dangling_comma = False
     with open(csv_file, 'r') as f:
-        for index, line in enumerate(f.readlines()):
+        for index, line in enumerate(f):
             line = line.strip()
             if trim_dangling_comma:
                 line = line[:-1]
@@ -2288,8 +2810,16 @@ def _csv_file_to_python(csv_file):
                     if len(values[i]) == 0:
                         continue
                     data[h] = values[i].replace(COMMA_DELIMITER_REPLACEMENT_CHARACTER, ",")
-                all_data.append(data)
-    return all_data
+                yield data
+
+
+def _csv_file_to_python(csv_file):
+    """
+    Transform a CSV file into a Python list of dictionary content
+    :param csv_file: CSV file path
+    :return: [ { bunch of transformed csv data here } ]
+    """
+    return list(_csv_file_rows(csv_file))
 
 def _generate_ism(transformed_files, ism_path):
     """
@@ -2297,19 +2827,15 @@ def _generate_ism(transformed_files, ism_path):
     TODO add modes
     TODO integrate behaviors to add context to devices - for example, a Vayyar device near an exit acts like an entry sensor.
     :param transformed_files: List of transformed files from our data request download
-    :param ism_path: File path to save the resulting ISM file
-    :return: ism_path if successful
+    :param ism_path: File path to save the resulting ISM pickle file. The same matrix is saved in typed columns to a .npz file next to it.
+    :return: List of files written, the .pickle and the .npz
     """
+    import ism
     print("Generating ISM {}...".format(ism_path))
-    modes_csv = None
-    csv_strings = []
-    csv_types = []
-    csv_total_headers = []
-    is_file_broken = False
+    device_events = []
     for transformed_filename in transformed_files:
         print("\t=> Processing {}".format(transformed_filename))
         device_type = int(os.path.basename(transformed_filename).split('_')[0])
-        # device_id = transformed_device_ids[file_index]
         # Need improvement to make the device type be easier to fetch and more solid.
         is_vayyar = device_type in [2000]
         is_motion = device_type in [9138, 10038]
@@ -2318,133 +2844,39 @@ def _generate_ism(transformed_files, ism_path):
 
         # Currently not supporting other devices besides Entry and Motion
         # Currently not supporting index numbers
-        if is_motion or is_pressurepad or is_entry or is_vayyar:
-            focused_csv = "device_type,device_id,description,behavior,timestamp_ms,timestamp_iso"
-            with open(transformed_filename, 'r') as f:
-                for index, line in enumerate(f.readlines()):
-                    if index == 0:
-                        original_headers = line.replace('\n', '').replace('\r', '').split(",")
-                        # The current_parameter_state will maintain the current state of each parameter
-                        # Because the server doesn't fill out the complete state for each parameter at every timestamp
-                        current_parameter_state = {}
-
-                        for i in range(0, 9):
-                            # Only keep the device param
-                            del (original_headers[0])
-
-                        # Add a placeholder for PIR motion detection events with Vayyar Home
-                        # Note that this now produces more CSV headers than we have columns for in our data
-                        if is_vayyar:
-                            original_headers.append("motionStatus")
-
-                        if is_entry and 'doorStatus' not in original_headers:
-                            is_file_broken = True
-                            break
-
-                        is_file_broken = False
-
-                        # Add the header to our csv headers
-                        for header in original_headers:
-                            focused_csv += ",{}".format(header)
-                            current_parameter_state[header] = None
-
-                        csv_total_headers.append(len(focused_csv.split(',')))
-
-                        # Line break
-                        focused_csv += "\r\n"
-                    else:
-                        line = line.replace('\n', '').replace('\r', '')
-                        value = ""
-                        in_bracket = 0
-                        in_quote = 0
-                        line_list = []
-                        for c in line:
-                            if c == '[':
-                                in_bracket += 1
-                            elif c == ']':
-                                in_bracket -= 1
-
-                            if c == '\"' and in_quote > 0:
-                                in_quote -= 1
-                            elif c == '\"':
-                                in_quote += 1
-
-                            if in_bracket == 0 and in_quote == 0:
-                                if c == ',':
-                                    line_list.append(value)
-                                    value = ""
-                                    continue
-
-                            value += c
-
-                        line_list.append(value)
-
-                        for i in range(9, len(line_list)):
-                            index = i - 9
-                            try:
-                                value = normalize_measurement(line_list[i])
-                            except:
-                                # Probably a Vayyar Home device where the 'motionStatus' header we added isn't in the real original headers of this device.
-                                continue
-
-                            if value != '':
-                                current_parameter_state[original_headers[index]] = value
-
-                                if is_vayyar:
-                                    # Special handling for Vayyar Home to transform it into a PIR motion detector.
-                                    if original_headers[index] == "occupancy":
-                                        try:
-                                            current_parameter_state["motionStatus"] = value > 0
-                                        except Exception as e:
-                                            print("Exception")
-
-                                    elif original_headers[index] == "occupancyTarget":
-                                        current_parameter_state[original_headers[index]] = str(value).replace("-", ";")
-                                        current_parameter_state["motionStatus"] = value != ""
-
-                        focused_csv += "{},{},{},{},{},{}".format(line_list[2], line_list[3],
-                                                                  line_list[4], line_list[8],
-                                                                  line_list[5], line_list[6])
-
-                        for header in original_headers:
-                            focused_csv += ",{}".format(current_parameter_state[header])
-
-                        focused_csv += "\r\n"
-
-            if is_file_broken:
-                continue
-
-            # CONCLUDE
-            csv_strings.append(focused_csv)
-
-            if is_motion or is_vayyar:
-                csv_types.append("motion")
-
-            elif is_entry:
-                csv_types.append("entry")
+        if is_motion or is_vayyar:
+            sensor_type = "motion"
+        elif is_entry:
+            sensor_type = "entry"
+        elif is_pressurepad:
+            sensor_type = "pressure"
+        else:
+            continue
 
-            elif is_pressurepad:
-                csv_types.append("pressure")
+        states = ism.read_device_states(transformed_filename, sensor_type, normalize_measurement, vayyar=is_vayyar)
+        if states is None:
+            continue
 
-    # TODO properly extract the modes CSV for the ISM
-    if modes_csv is not None:
-        csv_strings.append(modes_csv)
-        csv_types.append("modes")
-        csv_total_headers.append(5)
+        (name, timestamps_ms, device_states, behaviors, total_rows) = states
+        device_events.append(ism.extract_device_events(name, sensor_type, timestamps_ms, device_states, behaviors, total_rows))
 
+    # TODO properly extract the modes and notes for the ISM
     print("\t=> Generating ISM")
-    import ism
-    integrated_sensor_matrix = ism.create_integrated_sensor_matrix_str(csv_strings, csv_types, csv_total_headers, get_csv())
+    integrated_sensor_matrix = ism.build_integrated_sensor_matrix(device_events)
 
     import pickle
     if os.path.exists(ism_path):
         os.remove(ism_path)
 
     with open(ism_path, 'wb') as f:
-        pickle.dump(integrated_sensor_matrix, f)
+        pickle.dump(integrated_sensor_matrix.to_str_matrix(), f)
         print("Exported Integrated Sensor Matrix: {}".format(ism_path))
 
-    return ism_path
+    npz_path = os.path.splitext(ism_path)[0] + ".npz"
+    integrated_sensor_matrix.save(npz_path)
+    print("Exported Integrated Sensor Matrix: {}".format(npz_path))
+
+    return [ism_path, npz_path]
 
 
 def get_user_info(server, user_key, user_id=None):
@@ -2502,24 +2934,14 @@ def get_devices_from_location(server, user_key, location_id):
     return j.get('devices', [])
 
 
-def normalize_measurement(measure):
+def normalize_measurement(measure, param_name=None):
     """
     Transform a measurement's value, which could be a string, into a real value - like a boolean or int or float
     :param measure: a raw measurement's value
+    :param param_name: Optional measurement parameter name, used to look up the type of the value
     :return: a value that has been corrected into the right type
     """
-    try:
-        return eval(measure, {}, {})
-
-    except:
-        if measure in ['true', 'True']:
-            return True
-
-        elif measure in ['false', 'False']:
-            return False
-
-        else:
-            return measure
+    return coercion.coerce_measurement(measure, param_name)
 
 
 def request_data(server, location_id, user_key, initialization_days=1, type=1, device_id=None, oldest_timestamp_ms=None, newest_timestamp_ms=None, param_name_list=None, reference=None, index=None, ordered=1):
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the transformation of data request downloads on a synthetic device parameters CSV file.
+
+Usage:
+    python csv_benchmark.py --megabytes 2048
+    python csv_benchmark.py --megabytes 100 --legacy
+
+The file is generated once in the given directory and reused on later runs of the same size.
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author:     David Moss
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import csvstream
+
+# Parameters in the synthetic file, a mix of plain values, quoted values with commas, indices and brackets
+SYNTHETIC_PARAMETERS = [
+    ("doorStatus", "", lambda i: random.choice(["true", "false"])),
+    ("batteryLevel", "", lambda i: str(random.randint(0, 100))),
+    ("occupancyTarget", "", lambda i: '"0:{},{},{}"'.format(random.randint(0, 9), random.randint(0, 300), random.randint(0, 300))),
+    ("[online]", "", lambda i: random.choice(["0", "1"])),
+    ("alarmStatus", "2", lambda i: "1"),
+    ("vector", "", lambda i: "[1,2,{}]".format(i % 1000)),
+]
+
+
+def generate(filename, megabytes, seed=0):
+    """
+    Write a synthetic device parameters CSV file in the format the server delivers
+    :param filename: File to write
+    :param megabytes: Approximate size of the file in megabytes
+    :param seed: Random seed
+    """
+    random.seed(seed)
+    target_bytes = megabytes * 1024 * 1024
+    timestamp_ms = 1672531200000
+    written = 0
+    i = 0
+    with open(filename, 'w') as f, csvstream.ChunkedWriter(f) as out:
+        out.write("measureTime,paramName,index,group,value\n")
+        while written < target_bytes:
+            timestamp_ms += random.choice([0, 0, 1000, 60000])
+            name, index, value = random.choice(SYNTHETIC_PARAMETERS)
+            line = "{},{},{},,{}\n".format(timestamp_ms, name, index, value(i))
+            out.write(line)
+            written += len(line)
+            i += 1
+
+
+def legacy_split(line):
+    """
+    The character-by-character, quote and bracket aware splitter the transformations used before csvstream, for comparison
+    :param line: Line of CSV
+    :return: List of fields
+    """
+    value = ""
+    in_bracket = 0
+    in_quote = 0
+    line_list = []
+    for c in line:
+        if c == '[':
+            in_bracket += 1
+        elif c == ']':
+            in_bracket -= 1
+
+        if c == '\"' and in_quote > 0:
+            in_quote -= 1
+        elif c == '\"':
+            in_quote += 1
+
+        if in_bracket == 0 and in_quote == 0:
+            if c == ',':
+                line_list.append(value)
+                value = ""
+                continue
+
+        value += c
+
+    line_list.append(value)
+    return line_list
+
+
+def benchmark(filename, legacy=False, transform=True):
+    """
+    Time parsing and transforming a device parameters CSV file
+    :param filename: Device parameters CSV file
+    :param legacy: True to also time the legacy character-by-character parser, which is slow on large files
+    :param transform: True to also time the complete api.transform_device_csv()
+    :return: { 'megabytes', 'rows', 'csvstream_s', 'legacy_s', 'transform_s' }
+    """
+    result = {
+        'megabytes': os.path.getsize(filename) / 1024.0 / 1024.0,
+        'rows': 0,
+        'csvstream_s': None,
+        'legacy_s': None,
+        'transform_s': None
+    }
+
+    t = time.time()
+    for chunk in csvstream.read_chunks(filename):
+        result['rows'] += len(chunk)
+    result['csvstream_s'] = time.time() - t
+
+    if legacy:
+        t = time.time()
+        with open(filename, 'r') as f:
+            next(f, None)
+            for line in f:
+                legacy_split(line)
+        result['legacy_s'] = time.time() - t
+
+    if transform:
+        import api
+        device = {'id': 'benchmark', 'type': 10014, 'location': {'id': 0}, 'desc': 'Benchmark', 'timezone': {'id': 'America/Los_Angeles'}}
+        t = time.time()
+        transformed_file = api.transform_device_csv(filename, device)
+        result['transform_s'] = time.time() - t
+        os.remove(transformed_file)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CSV transformation of data request downloads")
+    parser.add_argument("--megabytes", dest="megabytes", type=int, default=100, help="Size of the synthetic CSV file in megabytes. Default is 100.")
+    parser.add_argument("--directory", dest="directory", default=tempfile.gettempdir(), help="Directory to generate the synthetic CSV file in")
+    parser.add_argument("--legacy", dest="legacy", action="store_true", help="Also time the legacy character-by-character parser")
+    parser.add_argument("--parse_only", dest="parse_only", action="store_true", help="Only time parsing, not the complete transformation")
+    args = parser.parse_args()
+
+    filename = os.path.join(args.directory, "csv_benchmark_{}mb.csv".format(args.megabytes))
+    if not os.path.exists(filename):
+        print("Generating {}...".format(filename))
+        generate(filename, args.megabytes)
+
+    result = benchmark(filename, legacy=args.legacy, transform=not args.parse_only)
+    print("{:.0f} MB, {} rows".format(result['megabytes'], result['rows']))
+    print("csvstream: {:.1f}s, {:.1f} MB/s".format(result['csvstream_s'], result['megabytes'] / result['csvstream_s']))
+    if result['legacy_s'] is not None:
+        print("legacy: {:.1f}s, {:.1f} MB/s, {:.1f}x".format(result['legacy_s'], result['megabytes'] / result['legacy_s'], result['legacy_s'] / result['csvstream_s']))
+    if result['transform_s'] is not None:
+        print("transform_device_csv: {:.1f}s, {:.1f} MB/s".format(result['transform_s'], result['megabytes'] / result['transform_s']))
+
+
+if __name__ == "__main__":
+    main()
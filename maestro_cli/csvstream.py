@@ -0,0 +1,209 @@
+'''
+Created on October 17, 2026
+
+Streaming CSV reading and writing for transforming downloaded data request files.
+
+Files are parsed by the standard csv module, which correctly decodes quoted fields like the embedded JSON
+in alerts and data streams, and handed out a fixed-size chunk of rows at a time so files of any size can be
+transformed without loading them into memory.
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import csv
+import datetime
+import io
+import itertools
+
+import pytz
+
+# Number of rows to read or write at a time
+CHUNK_ROWS = 10000
+
+# Maximum number of hours to remember formatted timestamps for
+MAX_CACHED_HOURS = 100000
+
+
+def read_header(filename):
+    """
+    :param filename: CSV file
+    :return: List of column names from the first row, or an empty list if the file is empty
+    """
+    with open(filename, 'r', newline='') as f:
+        for row in csv.reader(f):
+            return [h.strip() for h in row]
+    return []
+
+
+def read_chunks(filename, chunk_rows=CHUNK_ROWS):
+    """
+    Read the data rows of a CSV file, skipping the header row and blank lines
+    :param filename: CSV file
+    :param chunk_rows: Number of rows in each chunk
+    :return: Iterator over lists of up to chunk_rows rows, each row a list of field strings
+    """
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        columns = len(header)
+        while True:
+            chunk = list(itertools.islice(reader, chunk_rows))
+            if len(chunk) == 0:
+                return
+
+            if not all(len(row) == columns for row in chunk):
+                chunk = [row if len(row) == columns else _join_brackets(row) for row in chunk if row]
+            yield chunk
+
+
+def read_rows(filename, chunk_rows=CHUNK_ROWS):
+    """
+    Read the data rows of a CSV file one at a time, a chunk at a time underneath
+    :param filename: CSV file
+    :param chunk_rows: Number of rows to read at a time
+    :return: Iterator over rows, each row a list of field strings
+    """
+    for chunk in read_chunks(filename, chunk_rows):
+        yield from chunk
+
+
+def _join_brackets(row):
+    """
+    Unquoted values like [1,2,3] are split up by their commas. Join the fields back together until the brackets balance.
+    :param row: Row of fields
+    :return: Row of fields
+    """
+    joined = []
+    fields = iter(row)
+    for field in fields:
+        depth = field.count('[') - field.count(']') if '[' in field else 0
+        while depth > 0:
+            following = next(fields, None)
+            if following is None:
+                break
+            field += "," + following
+            depth += following.count('[') - following.count(']')
+        joined.append(field)
+    return joined
+
+
+class ChunkedWriter:
+    """
+    Write lines to a file a chunk at a time
+    """
+
+    def __init__(self, f, chunk_rows=CHUNK_ROWS):
+        """
+        :param f: File opened for writing text
+        :param chunk_rows: Number of lines to buffer before writing them out
+        """
+        self.f = f
+        self.chunk_rows = chunk_rows
+        self.lines = []
+
+        # Formats rows with write_row()
+        self.row_buffer = io.StringIO()
+        self.row_writer = csv.writer(self.row_buffer, lineterminator="\n")
+
+    def write(self, line):
+        """
+        :param line: Line to write, including its line ending
+        """
+        self.lines.append(line)
+        if len(self.lines) >= self.chunk_rows:
+            self.flush()
+
+    def write_row(self, fields):
+        """
+        Write a row of fields as a CSV line, quoting the fields that contain commas or quotes.
+        Line breaks inside a field become spaces, so every row stays on a single line.
+        :param fields: List of fields
+        """
+        self.row_writer.writerow([str(field).replace("\r\n", " ").replace("\n", " ").replace("\r", " ") for field in fields])
+        self.write(self.row_buffer.getvalue())
+        self.row_buffer.seek(0)
+        self.row_buffer.truncate()
+
+    def flush(self):
+        self.f.write("".join(self.lines))
+        self.lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+class TimestampFormatter:
+    """
+    Formats millisecond timestamps the way the transformed CSV files show them, remembering each hour it has
+    formatted because the rows of a file arrive in order.
+    """
+
+    def __init__(self, timezone_string):
+        """
+        :param timezone_string: Timezone string like "America/Los_Angeles" for Excel timestamps
+        """
+        self.timezone = pytz.timezone(timezone_string)
+
+        # { UTC hour : 'YYYY-MM-DDTHH:' }
+        self._iso_hours = {}
+
+        # { UTC hour : UTC offset in seconds, or None if the offset changes during this hour }
+        self._offset_hours = {}
+
+        # { local hour : 'MM/DD/YYYY HH:' }
+        self._excel_hours = {}
+
+    def iso(self, timestamp_ms):
+        """
+        :param timestamp_ms: Timestamp in milliseconds
+        :return: ISO 8601 UTC timestamp, like datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).isoformat() + "Z"
+        """
+        hour, ms = divmod(timestamp_ms, 3600000)
+        prefix = self._iso_hours.get(hour)
+        if prefix is None:
+            prefix = self._remember(self._iso_hours, hour, datetime.datetime.utcfromtimestamp(hour * 3600).strftime('%Y-%m-%dT%H:'))
+
+        minute, ms = divmod(ms, 60000)
+        second, ms = divmod(ms, 1000)
+        if ms == 0:
+            return "{}{:02d}:{:02d}Z".format(prefix, minute, second)
+        return "{}{:02d}:{:02d}.{:03d}000Z".format(prefix, minute, second, ms)
+
+    def excel(self, timestamp_ms):
+        """
+        :param timestamp_ms: Timestamp in milliseconds
+        :return: Local timestamp like '12/31/2023 16:00:00', like datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, timezone).strftime('%m/%d/%Y %H:%M:%S')
+        """
+        timestamp_s = timestamp_ms // 1000
+        hour = timestamp_s // 3600
+        if hour not in self._offset_hours:
+            start = datetime.datetime.fromtimestamp(hour * 3600, self.timezone).utcoffset()
+            end = datetime.datetime.fromtimestamp(hour * 3600 + 3599, self.timezone).utcoffset()
+            self._remember(self._offset_hours, hour, int(start.total_seconds()) if start == end else None)
+
+        offset_s = self._offset_hours[hour]
+        if offset_s is None:
+            # The clocks change during this hour
+            return datetime.datetime.fromtimestamp(timestamp_s, self.timezone).strftime('%m/%d/%Y %H:%M:%S')
+
+        local_hour, local_s = divmod(timestamp_s + offset_s, 3600)
+        prefix = self._excel_hours.get(local_hour)
+        if prefix is None:
+            prefix = self._remember(self._excel_hours, local_hour, datetime.datetime.utcfromtimestamp(local_hour * 3600).strftime('%m/%d/%Y %H:'))
+
+        return "{}{:02d}:{:02d}".format(prefix, local_s // 60, local_s % 60)
+
+    def _remember(self, hours, hour, value):
+        if len(hours) >= MAX_CACHED_HOURS:
+            hours.clear()
+        hours[hour] = value
+        return value
@@ -1,9 +1,375 @@
+import csv
 import datetime
+import itertools
 import re
 import time
 
 import numpy as np
 
+# Number of CSV rows to read and process at a time, so large files never have to fit in memory all at once
+CHUNK_ROWS = 65536
+
+# Devices with fewer rows than this don't add anything to the matrix
+MINIMUM_ROWS = 5
+
+# Columns of a transformed device CSV file from api.transform_device_csv()
+TRANSFORMED_DESCRIPTION_COLUMN = 4
+TRANSFORMED_TIMESTAMP_MS_COLUMN = 5
+TRANSFORMED_BEHAVIOR_COLUMN = 8
+TRANSFORMED_PARAMETERS_COLUMN = 9
+
+# Parameters holding the state of a sensor, in order of preference
+STATUS_HEADERS = ['Status', 'event', 'source', 'doorStatus', 'motionStatus', 'pressureStatus']
+
+# { sensor type : ([reading when the state turns on, reading when the state turns off], minimum milliseconds between events) }
+SENSOR_SETTINGS = {
+    'entry': (['open', 'close'], 1000.0),
+    'motion': (['start', 'stop'], 5000.0),
+    'pressure': (['pressure on', 'pressure off'], 1000.0),
+}
+
+# Parameter state codes, after forward-filling the state of the status parameter
+STATE_NO_UPDATE = -1
+STATE_OTHER = 0
+STATE_ONE = 1
+STATE_TRUE = 2
+
+
+class IntegratedSensorMatrix:
+    """
+    Integrated sensor matrix held in typed columns, one row per sensor event, ordered by time.
+    Readings, names and types are stored as indices into their own small tables of strings.
+    """
+
+    def __init__(self, timestamp_ms, reading, name, type, behavior, readings, names, types):
+        """
+        :param timestamp_ms: int64 array of event timestamps in milliseconds
+        :param reading: int16 array of indices into readings
+        :param name: int32 array of indices into names
+        :param type: int8 array of indices into types
+        :param behavior: int32 array of device behaviors (goal IDs)
+        :param readings: List of reading strings, like 'open' or 'start'
+        :param names: List of device names
+        :param types: List of sensor types, like 'entry' or 'motion'
+        """
+        self.timestamp_ms = timestamp_ms
+        self.reading = reading
+        self.name = name
+        self.type = type
+        self.behavior = behavior
+        self.readings = list(readings)
+        self.names = list(names)
+        self.types = list(types)
+
+    def __len__(self):
+        return len(self.timestamp_ms)
+
+    def to_str_matrix(self):
+        """
+        :return: The nx5 string array of [timestamp_iso, reading, name, type, behavior] produced by create_integrated_sensor_matrix_str()
+        """
+        if len(self) == 0:
+            return np.zeros((0, 5)).astype(str)
+
+        return np.c_[format_iso_timestamps(self.timestamp_ms),
+                     np.array(self.readings)[self.reading],
+                     np.array(self.names)[self.name],
+                     np.array(self.types)[self.type],
+                     self.behavior.astype(str)]
+
+    def save(self, path):
+        """
+        Save the matrix as a compressed .npz file, which loads without unpickling anything
+        :param path: File path
+        """
+        with open(path, 'wb') as f:
+            np.savez_compressed(f,
+                                timestamp_ms=self.timestamp_ms,
+                                reading=self.reading,
+                                name=self.name,
+                                type=self.type,
+                                behavior=self.behavior,
+                                readings=np.array(self.readings, dtype=str),
+                                names=np.array(self.names, dtype=str),
+                                types=np.array(self.types, dtype=str))
+
+    @staticmethod
+    def load(path):
+        """
+        Load a matrix saved with save()
+        :param path: File path
+        :return: IntegratedSensorMatrix
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return IntegratedSensorMatrix(data['timestamp_ms'], data['reading'], data['name'], data['type'], data['behavior'],
+                                          data['readings'].tolist(), data['names'].tolist(), data['types'].tolist())
+
+
+def build_integrated_sensor_matrix(device_events):
+    """
+    Merge the events of every device into one integrated sensor matrix ordered by time
+    :param device_events: List of (timestamps_ms, readings, name, type, behaviors) tuples from extract_device_events()
+    :return: IntegratedSensorMatrix
+    """
+    device_events = [e for e in device_events if len(e[0]) > 0]
+    total = sum(len(e[0]) for e in device_events)
+
+    timestamp_ms = np.empty(total, dtype=np.int64)
+    reading = np.empty(total, dtype=np.int16)
+    name = np.empty(total, dtype=np.int32)
+    type = np.empty(total, dtype=np.int8)
+    behavior = np.empty(total, dtype=np.int32)
+
+    readings = []
+    names = []
+    types = []
+    start = 0
+    for (e_timestamps, e_readings, e_name, e_type, e_behaviors) in device_events:
+        end = start + len(e_timestamps)
+        unique_readings, reading_indices = np.unique(e_readings, return_inverse=True)
+        reading_table = np.array([_table_index(readings, r) for r in unique_readings], dtype=np.int16)
+
+        timestamp_ms[start:end] = e_timestamps
+        reading[start:end] = reading_table[reading_indices]
+        name[start:end] = _table_index(names, e_name)
+        type[start:end] = _table_index(types, e_type)
+        behavior[start:end] = e_behaviors
+        start = end
+
+    order = np.argsort(timestamp_ms, kind='stable')
+    print('Overall matrix has dimension ' + str((total, 5)))
+    return IntegratedSensorMatrix(timestamp_ms[order], reading[order], name[order], type[order], behavior[order], readings, names, types)
+
+
+def read_device_states(filename, type_s, normalize, vayyar=False, chunk_rows=CHUNK_ROWS):
+    """
+    Read the state of a sensor out of a transformed device CSV file, a chunk of rows at a time.
+    Only the rows where the state changes are kept.
+    :param filename: Transformed device CSV file
+    :param type_s: Sensor type, 'entry', 'motion', or 'pressure'
+    :param normalize: Function to normalize a raw measurement value, taking (value, parameter name)
+    :param vayyar: True if this is a Vayyar Home device, whose occupancy turns into a 'motionStatus' PIR motion detector state
+    :param chunk_rows: Number of rows to process at a time
+    :return: (name, timestamps_ms, states, behaviors, total_rows) where states are STATE_* codes, or None if the file has no sensor state
+    """
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        headers = next(reader, None)
+        if headers is None:
+            return None
+
+        headers = [h.strip() for h in headers]
+        parameters = headers[TRANSFORMED_PARAMETERS_COLUMN:]
+        if vayyar:
+            # Add a placeholder for PIR motion detection events with Vayyar Home
+            parameters.append('motionStatus')
+
+        if type_s == 'entry' and 'doorStatus' not in parameters:
+            return None
+
+        status = [p for p in parameters if p in STATUS_HEADERS]
+        if len(status) == 0:
+            return None
+
+        status = status[0]
+        if vayyar and status == 'motionStatus' and 'motionStatus' not in headers:
+            sources = [(column, update) for column, update in [('occupancy', _vayyar_occupancy_update), ('occupancyTarget', _vayyar_target_update)] if column in headers]
+        else:
+            sources = [(status, _status_update)]
+
+        sources = [(headers.index(column), column, update, {}) for column, update in sources]
+
+        name = None
+        state = STATE_OTHER
+        total_rows = 0
+        timestamps = []
+        states = []
+        behaviors = []
+        while True:
+            rows = list(itertools.islice(reader, chunk_rows))
+            if len(rows) == 0:
+                break
+
+            if name is None:
+                name = rows[0][TRANSFORMED_DESCRIPTION_COLUMN]
+
+            # Later sources override earlier ones on the same row
+            updates = np.full(len(rows), STATE_NO_UPDATE, dtype=np.int8)
+            for (index, column, update, cache) in sources:
+                values = np.array([row[index] if len(row) > index else '' for row in rows])
+                unique_values, inverse = np.unique(values, return_inverse=True)
+                codes = np.array([_cached_update(cache, update, v, column, normalize) for v in unique_values.tolist()], dtype=np.int8)[inverse]
+                updates = np.where(codes != STATE_NO_UPDATE, codes, updates)
+
+            chunk_states = _forward_fill(updates, state)
+            changed = np.flatnonzero(np.diff(np.r_[state, chunk_states]) != 0)
+            if total_rows == 0:
+                changed = np.union1d([0], changed)
+
+            timestamps.append(np.array([rows[i][TRANSFORMED_TIMESTAMP_MS_COLUMN] for i in changed], dtype=np.int64))
+            behaviors.append(np.array([rows[i][TRANSFORMED_BEHAVIOR_COLUMN] for i in changed], dtype=np.int32))
+            states.append(chunk_states[changed])
+
+            state = chunk_states[-1]
+            total_rows += len(rows)
+
+    if total_rows == 0:
+        return None
+
+    return name, np.concatenate(timestamps), np.concatenate(states), np.concatenate(behaviors), total_rows
+
+
+def extract_device_events(name, type_s, timestamps_ms, states, behaviors, total_rows):
+    """
+    Turn the state changes of a sensor into events, keeping only events with enough time before and after them
+    :param name: Device name
+    :param type_s: Sensor type, 'entry', 'motion', or 'pressure'
+    :param timestamps_ms: int64 array of timestamps where the state changed
+    :param states: STATE_* codes at each timestamp
+    :param behaviors: Device behavior at each timestamp
+    :param total_rows: Total number of rows the states were read from
+    :return: (timestamps_ms, readings, name, type, behaviors) tuple for build_integrated_sensor_matrix()
+    """
+    str_set, cut = SENSOR_SETTINGS[type_s]
+    if type_s == 'motion' and any(s in name for s in ['entry', 'Entry', 'door', 'Door']):
+        type_s = 'entry'
+        str_set = ['close', 'open']
+
+    print('Read {} as {}'.format(name, type_s))
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=str), name, type_s, np.zeros(0, dtype=np.int32))
+    if total_rows < MINIMUM_ROWS:
+        print('Array is too small')
+        return empty
+
+    # Switch the state to binary ints, then a finite difference tracks changes
+    value = states == STATE_TRUE
+    if not value.any():
+        value = states == STATE_ONE
+
+    diff = np.diff(value.astype(np.int8))
+    changed = np.flatnonzero(diff) + 1
+    if len(changed) == 0:
+        return empty
+
+    t_tmp = timestamps_ms[changed]
+    r_tmp = np.where(diff[changed - 1] == 1, str_set[0], str_set[1])
+
+    # Both intervals before AND after an event must be longer than our cutoff
+    ind_t = np.diff(t_tmp) > cut
+    ind_f = np.r_[True, ind_t] & np.r_[ind_t, True]
+    return t_tmp[ind_f], r_tmp[ind_f], name, type_s, behaviors[changed][ind_f]
+
+
+def parse_iso_timestamps(values):
+    """
+    Convert an array of ISO 8601 UTC timestamps like '2023-01-01T12:00:00.123000Z' to milliseconds
+    :param values: Array of timestamp strings
+    :return: int64 array of milliseconds
+    """
+    values = np.char.rstrip(np.asarray(values, dtype=str), 'Z')
+    return values.astype('datetime64[ms]').astype(np.int64)
+
+
+def format_iso_timestamps(timestamps_ms):
+    """
+    Convert an array of milliseconds to ISO 8601 UTC timestamps, formatted like datetime.isoformat() + 'Z'
+    :param timestamps_ms: Array of timestamps in milliseconds
+    :return: Array of timestamp strings
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    dates = timestamps_ms.astype('datetime64[ms]')
+    iso = np.where(timestamps_ms % 1000 == 0, np.datetime_as_string(dates, unit='s'), np.datetime_as_string(dates, unit='us'))
+    return np.char.add(iso, 'Z')
+
+
+def _table_index(table, value):
+    """
+    :return: Index of the value in the table of strings, appending it if it's not there yet
+    """
+    value = str(value)
+    if value not in table:
+        table.append(value)
+    return table.index(value)
+
+
+def _forward_fill(updates, state):
+    """
+    Carry the last state forward over rows without an update
+    :param updates: STATE_* codes, STATE_NO_UPDATE where the row doesn't update the state
+    :param state: State before the first row
+    :return: State at every row
+    """
+    values = np.r_[np.int8(state), updates]
+    index = np.where(values != STATE_NO_UPDATE, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    return values[index][1:]
+
+
+def _cached_update(cache, update, value, column, normalize):
+    """
+    Each distinct raw value is normalized only once per file
+    """
+    if value not in cache:
+        cache[value] = update(value, column, normalize)
+    return cache[value]
+
+
+def _state_code(value):
+    """
+    :return: STATE_* code of a normalized value, compared the way its string appears in the matrix
+    """
+    value = str(value)
+    if value == 'True':
+        return STATE_TRUE
+    if value == '1':
+        return STATE_ONE
+    return STATE_OTHER
+
+
+def _status_update(value, column, normalize):
+    """
+    :return: STATE_* code that a raw status value sets, or STATE_NO_UPDATE
+    """
+    if value == '':
+        return STATE_NO_UPDATE
+    try:
+        value = normalize(value, column)
+    except Exception:
+        return STATE_NO_UPDATE
+    if value == '':
+        return STATE_NO_UPDATE
+    return _state_code(value)
+
+
+def _vayyar_occupancy_update(value, column, normalize):
+    """
+    Vayyar Home occupancy turns the PIR motion state on while there's anybody in the room
+    """
+    if value == '':
+        return STATE_NO_UPDATE
+    try:
+        value = normalize(value, column)
+        if value == '':
+            return STATE_NO_UPDATE
+        return _state_code(value > 0)
+    except Exception:
+        return STATE_NO_UPDATE
+
+
+def _vayyar_target_update(value, column, normalize):
+    """
+    Any Vayyar Home target turns the PIR motion state on
+    """
+    if value == '':
+        return STATE_NO_UPDATE
+    try:
+        value = normalize(value, column)
+    except Exception:
+        return STATE_NO_UPDATE
+    if value == '':
+        return STATE_NO_UPDATE
+    return STATE_TRUE
+
 
 def create_integrated_sensor_matrix_str(str_batch, types, h_len, ml_note):
     """
@@ -16,13 +382,12 @@ def create_integrated_sensor_matrix_str(str_batch, types, h_len, ml_note):
     """
     behavior_flag = True
     if behavior_flag:
-        ser = np.array([[0, 0, 0, 0, 0]])
         wid = 5
     if behavior_flag is False:
-        ser = np.array([[0, 0, 0, 0]])
         wid = 4
+    # Collect each sensor's matrix and concatenate them once at the end
+    parts = [np.zeros((1, wid), dtype=int).astype(str)]
     for x in range(len(str_batch)):
-        # then through this loop we append each new sensor's matrix to the master
         if behavior_flag:
             tmp = extract_sensor_data_behaviors(str_batch[x], types[x], h_len[x])
         if behavior_flag is False:
@@ -30,7 +395,7 @@ def create_integrated_sensor_matrix_str(str_batch, types, h_len, ml_note):
         if len(tmp.shape) == 2:
             # ADD EXTRA DIMENSION HERE TOO
             if tmp.shape[1] == wid:
-                ser = np.r_[ser, tmp]
+                parts.append(tmp)
             if tmp.shape[1] != wid:
                 print('Matrix for ' + types[x] + ' is too narrow')
                 print('It has shape ' + str(tmp.shape))
@@ -41,7 +406,6 @@ def create_integrated_sensor_matrix_str(str_batch, types, h_len, ml_note):
             print('It has shape ' + str(tmp.shape))
             print('It looks like:')
             print(tmp)
-    print('Overall matrix has dimension ' + str(ser.shape))
     string_a = np.array(ml_note.split(','))
     s_ln = len(string_a)
     s_rw = np.floor_divide(s_ln, 4)
@@ -54,7 +418,9 @@ def create_integrated_sensor_matrix_str(str_batch, types, h_len, ml_note):
     dum[:, 1] = 'note'
     dum[:, 2] = 'none'
     print(dum)
-    ser = np.r_[ser, dum]
+    parts.append(dum)
+    ser = np.concatenate(parts)
+    print('Overall matrix has dimension ' + str(ser.shape))
     ser = ser[ser[:, 0] != '0', :]
     print(list(set(ser[:, 2])))
     return ser[ser[:, 0].argsort(), :]
@@ -115,8 +481,7 @@ def del_sec_basic(arr):
     :param arr: an array of timestamps
     :return an array of millisecond intervals
     """
-    tmp = np.array([intify_tstmp(x) for x in arr])
-    return tmp[1:] - tmp[0:-1]
+    return np.diff(parse_iso_timestamps(arr))
 
 
 def extract_sensor_data_behaviors(csv_string, type_s, col):
@@ -170,6 +535,9 @@ def extract_sensor_data_behaviors(csv_string, type_s, col):
         # this allows a finite differencing to track changes
         diff = val[1:] - val[0:-1]
         ind_d = (diff != 0)
+        if not ind_d.any():
+            print('Adding Nothing')
+            return np.array([['0', '0', '0', '0', '0']])
         # then we develop a subset and replaces with descriptive values
         t_tmp = raw_arr[np.r_[[False], ind_d], 0]
         b_tmp = raw_arr[np.r_[[False], ind_d], 2]
@@ -215,5 +583,3 @@ def intify_tstmp(tstmp):
     if len(tstmp) > 20:
         val = int(tstmp[20:23])
     return int(time.mktime(tmp.timetuple()) * 1000) + val
-
-
@@ -79,6 +79,9 @@ def main():
     functional_group.add_argument("--start_time_ms", dest="start_time_ms", help="For data downloads, this is an optional absolute Unix epoch start time in milliseconds")
     functional_group.add_argument("--days_ago", dest="days_ago", help="Number of days ago to start a data request. Instead of looking up a start_time_ms, this will figure it out for you.")
     functional_group.add_argument("--end_time_ms", dest="end_time_ms", help="For data downloads, this is an optional absolute Unix epoch end time in milliseconds")
+    functional_group.add_argument("--manifest", dest="manifest", help="For --data and --narratives, the manifest file that tracks the progress of each location. Running the same extraction again resumes from it. Default is downloads/manifest_<type>.json")
+    functional_group.add_argument("--concurrent_locations", dest="concurrent_locations", default=api.DATA_REQUEST_MAX_LOCATIONS, help="For --data and --narratives, the number of locations to request and download at the same time. Default is {}.".format(api.DATA_REQUEST_MAX_LOCATIONS))
+    functional_group.add_argument("--incremental", dest="incremental", action="store_true", help="For --data and --narratives, only download what's new since the last extraction of each location and merge it into that extraction's file. The extractions are tracked in downloads/watermarks.json.")
     functional_group.add_argument("--care_active", dest="care_active", help="CareActive folder path, merge care active datas with PPC location datas.")
     functional_group.add_argument("--care_option", dest="care_option", choices=['default', 'merged'], default='default', help="The option for zip file, default is the whole data json file.")
 
@@ -144,14 +147,7 @@ def main():
         else:
             locations = [args.location_id]
 
-        index = 0
-        for location_id in locations:
-            index += 1
-            print("({} of {}) Narrative request for this location ID: {}".format(index, len(locations), location_id))
-            try:
-                api.data_request(args.cloud_url, args.admin_key, api.DATA_REQUEST_TYPE_LOCATION_NARRATIVES, location_id=location_id, start_time_ms=start_time_ms, end_time_ms=args.end_time_ms)
-            except Exception as e:
-                print("Error requesting narratives for location ID {} - {}".format(location_id, str(e)))
+        api.data_requests(args.cloud_url, args.admin_key, api.DATA_REQUEST_TYPE_LOCATION_NARRATIVES, locations, start_time_ms=start_time_ms, end_time_ms=args.end_time_ms, manifest_path=args.manifest, max_locations=int(args.concurrent_locations), incremental=args.incremental, days_ago=args.days_ago)
 
     if args.data:
         if args.organization_id is None and args.location_id is None:
@@ -164,21 +160,8 @@ def main():
         else:
             locations = [args.location_id]
 
-        # This doesn't work right now because the data requests in api.py are now chunked and don't cache the previous request keys for each chunk.
-        # print(Color.BOLD + "\nPRE-REQUESTING DEVICE DATA" + Color.END)
-        # index = 0
-        # for location_id in locations:
-        #     index += 1
-        #     print("({} of {}) Data pre-request for location ID: {}".format(index, len(locations), location_id))
-        #     api.data_request(args.cloud_url, args.admin_key, api.DATA_REQUEST_TYPE_DEVICE_PARAMETERS, location_id=location_id, no_download=True, start_time_ms=start_time_ms, end_time_ms=args.end_time_ms)
-        #     time.sleep(5)
-
         print(Color.BOLD + "\nDOWNLOADING DEVICE DATA" + Color.END)
-        index = 0
-        for location_id in locations:
-            index += 1
-            print("({} of {}) Data download request for this location ID: {}".format(index, len(locations), location_id))
-            api.data_request(args.cloud_url, args.admin_key, api.DATA_REQUEST_TYPE_DEVICE_PARAMETERS, location_id=location_id, no_download=False, start_time_ms=start_time_ms, end_time_ms=args.end_time_ms)
+        api.data_requests(args.cloud_url, args.admin_key, api.DATA_REQUEST_TYPE_DEVICE_PARAMETERS, locations, start_time_ms=start_time_ms, end_time_ms=args.end_time_ms, manifest_path=args.manifest, max_locations=int(args.concurrent_locations), incremental=args.incremental, days_ago=args.days_ago)
 
     if args.lz4_request is not None:
         if args.location_id is None:
@@ -559,7 +542,7 @@ def main():
         for location_id in locations:
             index += 1
             print("({} of {}) Data request for location ID: {}".format(index, len(locations), location_id))
-            api.generate_ism(args.cloud_url, args.admin_key, location_id=args.location_id)
+            api.generate_ism(args.cloud_url, args.admin_key, location_id=location_id, start_time_ms=start_time_ms, end_time_ms=args.end_time_ms)
             time.sleep(5)
 
         print(Color.BOLD + "\nISM FILE GENERATED" + Color.END)
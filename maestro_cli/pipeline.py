@@ -0,0 +1,229 @@
+'''
+Created on October 17, 2026
+
+Bookkeeping for data request jobs that run for many locations at once.
+
+The manifest remembers each location's job on disk: the data requests it made, the URLs the server
+answered with, and how far along it is. An interrupted extraction picks up each location where it
+stopped instead of starting over. Downloads go to a partial file first and resume with an HTTP range
+request when the connection drops.
+
+The watermark index remembers how far each location's data has been extracted across runs, so an incremental
+extraction only requests the time ranges it doesn't have yet.
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author: David Moss
+'''
+
+import json
+import os
+import threading
+import time
+
+import requests
+
+# Job states, in the order a job moves through them
+JOB_SUBMITTED = "submitted"
+JOB_READY = "ready"
+JOB_DOWNLOADED = "downloaded"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Bytes to write at a time while downloading
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+# Attempts to download a file when the connection keeps dropping, resuming where the last attempt stopped
+DOWNLOAD_ATTEMPTS = 5
+
+# Seconds to wait before the first retry of a download, doubling each time
+DOWNLOAD_RETRY_DELAY_S = 2
+
+# Seconds to wait for the server to connect or send more data
+DOWNLOAD_TIMEOUT_S = 60
+
+# Suffix of a file that is still being downloaded
+PARTIAL_SUFFIX = ".part"
+
+# Watermark index file in the downloads directory
+WATERMARKS_FILENAME = "watermarks.json"
+
+
+class Manifest:
+    """
+    Jobs of an extraction, saved to a JSON file every time one of them changes
+    """
+
+    def __init__(self, filename, settings):
+        """
+        Load the jobs from a previous run, if that run used the same settings
+        :param filename: Manifest JSON file
+        :param settings: Dictionary of the settings that define the extraction, like the data request type and time range
+        """
+        self.filename = filename
+        self.settings = settings
+        self.lock = threading.Lock()
+
+        # { location_id : job }
+        self.jobs = {}
+
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    saved = json.load(f)
+
+            except ValueError:
+                print("Ignoring the unreadable manifest {}".format(filename))
+                saved = {}
+
+            if saved.get('settings') == settings:
+                self.jobs = saved.get('jobs', {})
+                print("Resuming {} jobs from {}".format(len(self.jobs), filename))
+
+            else:
+                print("Starting over, the manifest {} is for a different extraction".format(filename))
+
+    def job(self, location_id):
+        """
+        :param location_id: Location ID
+        :return: Job for this location, or None if it hasn't started
+        """
+        return self.jobs.get(str(location_id))
+
+    def save(self, location_id, job):
+        """
+        Remember the job for this location and write the manifest
+        :param location_id: Location ID
+        :param job: Job, which must be serializable to JSON
+        """
+        with self.lock:
+            self.jobs[str(location_id)] = job
+
+            _write_json(self.filename, {'settings': self.settings, 'jobs': self.jobs})
+
+
+class WatermarkIndex:
+    """
+    How far each location's data has been extracted, to only download what's new the next time.
+
+    For each location and data request type, the index remembers the output file of the last extraction, the start
+    of the time window it covers, and a high-water mark for each kind of data in it, like "parameters:<device_id>",
+    "alerts:<device_id>" or "modes": the end time in milliseconds up to which that data was downloaded.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: Watermark index JSON file
+        """
+        self.filename = filename
+
+        # { location_id : { type : { 'final_path': path, 'start_time_ms': ms, 'watermarks': { name : ms } } } }
+        self.locations = {}
+
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    self.locations = json.load(f)
+
+            except ValueError:
+                print("Ignoring the unreadable watermark index {}".format(filename))
+
+    def entry(self, location_id, type):
+        """
+        :param location_id: Location ID
+        :param type: Data request type
+        :return: { 'final_path', 'start_time_ms', 'watermarks' } from the last extraction, or None if its output file is gone
+        """
+        entry = self.locations.get(str(location_id), {}).get(str(type))
+        if entry is None or not os.path.exists(entry['final_path']):
+            return None
+        return entry
+
+    def update(self, location_id, type, final_path, start_time_ms, watermarks):
+        """
+        Remember an extraction and write the index
+        :param location_id: Location ID
+        :param type: Data request type
+        :param final_path: Output file of the extraction
+        :param start_time_ms: Start of the time window the output file covers
+        :param watermarks: { name : end time in milliseconds up to which this data was downloaded }
+        """
+        self.locations.setdefault(str(location_id), {})[str(type)] = {
+            'final_path': final_path,
+            'start_time_ms': start_time_ms,
+            'watermarks': watermarks
+        }
+        _write_json(self.filename, self.locations)
+
+
+def _write_json(filename, content):
+    """
+    Write the whole file next to the old one and swap, so an interruption never leaves half a file
+    :param filename: JSON file
+    :param content: Content that can be serialized to JSON
+    """
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temporary_filename = filename + ".tmp"
+    with open(temporary_filename, 'w') as f:
+        json.dump(content, f)
+    os.replace(temporary_filename, filename)
+
+
+def download(from_url, to_path, attempts=DOWNLOAD_ATTEMPTS):
+    """
+    Download a file, resuming a previous partial download with a range request.
+    The file only appears at to_path once it's complete.
+    :param from_url: URL to download from
+    :param to_path: Full file path to download to
+    :param attempts: Number of attempts when the connection drops
+    :return: Full path to the local filename
+    """
+    partial_path = to_path + PARTIAL_SUFFIX
+
+    for attempt in range(attempts):
+        offset = 0
+        if os.path.exists(partial_path):
+            offset = os.path.getsize(partial_path)
+
+        headers = {}
+        if offset > 0:
+            headers['Range'] = "bytes={}-".format(offset)
+
+        try:
+            with requests.get(from_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT_S) as r:
+                if r.status_code == 416 and offset > 0:
+                    # Range not satisfiable: the partial file already has every byte
+                    break
+
+                r.raise_for_status()
+
+                # 206 continues the partial file, a 200 from a server that ignores ranges starts it over
+                with open(partial_path, 'ab' if r.status_code == 206 else 'wb') as f:
+                    for chunk in r.iter_content(DOWNLOAD_CHUNK_BYTES):
+                        f.write(chunk)
+            break
+
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == attempts - 1:
+                raise
+
+            print("Resuming the download of {} after: {}".format(os.path.basename(to_path), e))
+            time.sleep(DOWNLOAD_RETRY_DELAY_S * (2 ** attempt))
+
+    os.replace(partial_path, to_path)
+    return to_path
+
+
+def discard_partial(to_path):
+    """
+    Forget a partial download, so the next download of this file starts over.
+    Needed whenever the file will come from a new URL, which may not serve the same bytes.
+    :param to_path: Full file path the download was going to
+    """
+    partial_path = to_path + PARTIAL_SUFFIX
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
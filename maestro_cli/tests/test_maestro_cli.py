@@ -1,6 +1,11 @@
 import os
+import json
 import maestro_cli.maestro as maestro
 import maestro_cli.api as api
+import maestro_cli.ism as ism
+import maestro_cli.csvstream as csvstream
+import maestro_cli.csv_benchmark as csv_benchmark
+import maestro_cli.pipeline as pipeline
 
 from maestro_cli.api import DATA_REQUEST_TYPE_DEVICE_PARAMETERS
 from maestro_cli.api import DATA_REQUEST_TYPE_DEVICE_ACTIVITIES
@@ -73,3 +78,480 @@ class TestMaestroCLI():
 
 
         
+
+    def test_maestro_cli_ism(self, tmp_path):
+        """
+        :return:
+        """
+        # Motion sensor that goes on and off with 10 seconds between each change, and one 2 second blip
+        transformed_file = os.path.join(tmp_path, '10038_model_abc123_Hallway_1.csv')
+        with open(transformed_file, 'w') as f:
+            f.write("trigger,location_id,device_type,device_id,description,timestamp_ms,timestamp_iso,timestamp_excel,behavior,batteryLevel,motionStatus\n")
+            for i, status in enumerate(["false", "true", "true", "false", "true", "false", "false", "true", "false"]):
+                timestamp_ms = 1672531200000 + i * 10000 - (8000 if i == 5 else 0)
+                f.write("8,123,10038,abc123,Hallway,{},x,x,-1,{},{}\n".format(timestamp_ms, 100 - i, status))
+
+        states = ism.read_device_states(transformed_file, "motion", api.normalize_measurement, chunk_rows=4)
+        (name, timestamps_ms, device_states, behaviors, total_rows) = states
+        assert name == "Hallway"
+        assert total_rows == 9
+        assert list(device_states) == [ism.STATE_OTHER, ism.STATE_TRUE, ism.STATE_OTHER, ism.STATE_TRUE, ism.STATE_OTHER, ism.STATE_TRUE, ism.STATE_OTHER]
+
+        # Both events of the blip are too close together for motion, and dropped
+        matrix = ism.build_integrated_sensor_matrix([ism.extract_device_events(name, "motion", timestamps_ms, device_states, behaviors, total_rows)])
+        assert list(matrix.to_str_matrix()[:, 1]) == ["start", "stop", "start", "stop"]
+        assert list(matrix.to_str_matrix()[0]) == ["2023-01-01T00:00:10Z", "start", "Hallway", "motion", "-1"]
+
+        ism_paths = api._generate_ism([transformed_file], os.path.join(tmp_path, 'ism_123.pickle'))
+        assert ism_paths == [os.path.join(tmp_path, 'ism_123.pickle'), os.path.join(tmp_path, 'ism_123.npz')]
+        loaded = ism.IntegratedSensorMatrix.load(ism_paths[1])
+        assert (loaded.to_str_matrix() == matrix.to_str_matrix()).all()
+        assert list(loaded.timestamp_ms) == list(matrix.timestamp_ms)
+
+    def test_maestro_cli_recordings_external_sort(self, tmp_path):
+        """
+        :return:
+        """
+        api.get_location = MagicMock(return_value={"id": 123, "name": "My Home"})
+        api.get_devices = MagicMock(return_value=[{"id": "abc123", "desc": "Device"}, {"id": "def456", "desc": "Other Device"}])
+        api.get_device_properties = MagicMock(return_value=[])
+
+        # Two devices with interleaved and duplicate timestamps
+        transformed_files = []
+        for index, device_id in enumerate(["abc123", "def456"]):
+            transformed_file = os.path.join(tmp_path, '10014_model_{}_Device_1.csv'.format(device_id))
+            with open(transformed_file, 'w') as f:
+                f.write("trigger,location_id,device_type,device_id,description,timestamp_ms,timestamp_iso,timestamp_excel,behavior,doorStatus\n")
+                for i in range(50):
+                    f.write("8,123,10014,{},Device,{},x,x,-1,{}\n".format(device_id, 1672531200000 + ((i * 7 + index) % 50) * 1000, i % 2))
+            transformed_files.append(transformed_file)
+
+        os.makedirs(os.path.join(tmp_path, 'memory'))
+        os.makedirs(os.path.join(tmp_path, 'runs'))
+        in_memory = api._generate_recordings("some.cloud.url", "__key__", 123, transformed_files, {}, os.path.join(tmp_path, 'memory'))
+
+        # Sorting in runs of 8 rows, merged 3 at a time, gives exactly the same recordings
+        sort_chunk_rows = api.RECORDING_SORT_CHUNK_ROWS
+        merge_fan_in = api.RECORDING_MERGE_FAN_IN
+        try:
+            api.RECORDING_SORT_CHUNK_ROWS = 8
+            api.RECORDING_MERGE_FAN_IN = 3
+            in_runs = api._generate_recordings("some.cloud.url", "__key__", 123, transformed_files, {}, os.path.join(tmp_path, 'runs'))
+        finally:
+            api.RECORDING_SORT_CHUNK_ROWS = sort_chunk_rows
+            api.RECORDING_MERGE_FAN_IN = merge_fan_in
+
+        assert [os.path.basename(f) for f in in_runs] == [os.path.basename(f) for f in in_memory]
+        assert len(in_runs) == 3
+        for memory_file, runs_file in zip(in_memory, in_runs):
+            with open(memory_file) as a, open(runs_file) as b:
+                assert a.read() == b.read()
+
+        with open(in_runs[1]) as f:
+            recording = json.load(f)
+        assert len(recording["data"]) == 50
+        assert [d["timestamp_ms"] for d in recording["data"]] == sorted(d["timestamp_ms"] for d in recording["data"])
+
+        # Files that each fit in one chunk are written to runs once they don't fit in memory together
+        sort_chunk_rows = api.RECORDING_SORT_CHUNK_ROWS
+        try:
+            api.RECORDING_SORT_CHUNK_ROWS = 60
+            runs = []
+            for transformed_file in transformed_files:
+                api._sorted_runs(api._csv_file_rows(transformed_file), lambda d: d['timestamp_ms'], tmp_path, runs)
+        finally:
+            api.RECORDING_SORT_CHUNK_ROWS = sort_chunk_rows
+
+        assert len(runs) == 2
+        assert all(isinstance(run, str) for run in runs)
+
+    def test_maestro_cli_csvstream(self, tmp_path):
+        """
+        :return:
+        """
+        csv_file = os.path.join(tmp_path, 'streams.csv')
+        with open(csv_file, 'w') as f:
+            f.write("time,address,feed\n")
+            f.write('1670175747000,do_something,"{""thing"":{""type"":""0""},""other_thing"":123}"\n')
+            f.write("\n")
+            f.write("1670175748000,vector,[1,2,[3,4]]\n")
+            f.write("1670175749000,plain,1\n")
+
+        assert csvstream.read_header(csv_file) == ["time", "address", "feed"]
+        assert list(csvstream.read_rows(csv_file, chunk_rows=2)) == [
+            ["1670175747000", "do_something", '{"thing":{"type":"0"},"other_thing":123}'],
+            ["1670175748000", "vector", "[1,2,[3,4]]"],
+            ["1670175749000", "plain", "1"]
+        ]
+        assert all(len(chunk) <= 2 for chunk in csvstream.read_chunks(csv_file, chunk_rows=2))
+
+        # Embedded JSON is decoded correctly
+        transformed_file = api.transform_datastreams_csv(csv_file, {"id": 123, "timezone": {"id": "Europe/Paris"}})
+        with open(transformed_file) as f:
+            assert f.readlines()[1] == '256,123,1670175747000,2022-12-04T17:42:27Z,12/04/2022 18:42:27,do_something,{"thing":{"type":"0"}&&"other_thing":123}\n'
+
+        # Commas and line breaks in narratives stay inside their column
+        narratives_file = os.path.join(tmp_path, 'narratives.csv')
+        with open(narratives_file, 'w') as f:
+            f.write("id,timestamp,title,description\n")
+            f.write('1,1670175747000,"Door opened, then closed","Front door"\n')
+            f.write('2,1670175748000,Motion,"Hallway,\nthen kitchen"\n')
+            f.write("3,1670175749000,Alert,First line\n")
+            f.write("second line\n")
+
+        transformed_file = api.transform_narrative_csv(narratives_file, "narratives_transformed.csv", {"id": 123, "timezone": {"id": "UTC"}})
+        with open(transformed_file) as f:
+            assert f.read().splitlines() == [
+                "locationId,timestamp_iso,timestamp_excel,id,timestamp,title,description",
+                '123,2022-12-04T17:42:27Z,12/04/2022 17:42:27,1,1670175747000,"Door opened, then closed",Front door',
+                '123,2022-12-04T17:42:28Z,12/04/2022 17:42:28,2,1670175748000,Motion,"Hallway, then kitchen"',
+                "123,2022-12-04T17:42:29Z,12/04/2022 17:42:29,3,1670175749000,Alert,First line second line"
+            ]
+
+        # Formatted timestamps match datetime, including around daylight saving time changes
+        import datetime
+        import pytz
+        for timezone_string in ["America/Los_Angeles", "Australia/Lord_Howe", "Asia/Kathmandu"]:
+            timestamps = csvstream.TimestampFormatter(timezone_string)
+            for timestamp_ms in range(1667700000000, 1667800000000, 1234567):
+                assert timestamps.iso(timestamp_ms) == datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).isoformat() + "Z"
+                assert timestamps.excel(timestamp_ms) == datetime.datetime.fromtimestamp(timestamp_ms / 1000.0, pytz.timezone(timezone_string)).strftime('%m/%d/%Y %H:%M:%S')
+
+    def test_maestro_cli_csv_benchmark(self, tmp_path):
+        """
+        csvstream and the legacy parser read the benchmark's synthetic file the same way. Run csv_benchmark.py by hand to time them.
+        :return:
+        """
+        csv_file = os.path.join(tmp_path, 'benchmark.csv')
+        csv_benchmark.generate(csv_file, 1)
+
+        # The legacy parser kept the quotes around quoted values
+        with open(csv_file) as f:
+            next(f)
+            legacy_rows = [[field[1:-1] if len(field) > 1 and field[0] == field[-1] == '"' else field for field in csv_benchmark.legacy_split(line.rstrip("\n"))] for line in f]
+
+        rows = list(csvstream.read_rows(csv_file))
+        assert len(rows) > 0
+        assert rows == legacy_rows
+
+        result = csv_benchmark.benchmark(csv_file, legacy=False, transform=True)
+        assert result['rows'] == len(rows)
+
+    def test_maestro_cli_resumable_download(self, tmp_path, monkeypatch):
+        """
+        :return:
+        """
+        import http.server
+        import threading
+
+        content = bytes(range(256)) * 4096
+        requested_ranges = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requested_ranges.append(self.headers.get('Range'))
+                offset = 0
+                if self.headers.get('Range') is not None:
+                    offset = int(self.headers.get('Range').split('=')[1].split('-')[0])
+
+                self.send_response(206 if offset > 0 else 200)
+                self.send_header('Content-Length', str(len(content) - offset))
+                self.end_headers()
+
+                if len(requested_ranges) == 1:
+                    # Drop the connection halfway through the first download
+                    self.wfile.write(content[:len(content) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+
+                self.wfile.write(content[offset:])
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            monkeypatch.setattr(api.pipeline, 'DOWNLOAD_RETRY_DELAY_S', 0)
+            to_path = os.path.join(tmp_path, 'download.zip')
+            assert api.download_file("http://127.0.0.1:{}/download.zip".format(server.server_port), to_path) == to_path
+
+        finally:
+            server.shutdown()
+
+        with open(to_path, 'rb') as f:
+            assert f.read() == content
+        assert requested_ranges == [None, "bytes={}-".format(len(content) // 2)]
+        assert not os.path.exists(to_path + pipeline.PARTIAL_SUFFIX)
+
+        # A 416 only means the download is complete when we asked for the rest of a partial file
+        import requests
+
+        class Response:
+            status_code = 416
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def raise_for_status(self):
+                raise requests.HTTPError("416 Range Not Satisfiable")
+
+        monkeypatch.setattr(pipeline.requests, 'get', lambda *args, **kwargs: Response())
+        missing_path = os.path.join(tmp_path, 'missing.zip')
+        try:
+            pipeline.download("http://127.0.0.1/missing.zip", missing_path)
+            assert False
+        except requests.HTTPError:
+            pass
+        assert not os.path.exists(missing_path)
+
+    def test_maestro_cli_data_requests_manifest(self, tmp_path, monkeypatch):
+        """
+        :return:
+        """
+        import io
+        import zipfile
+
+        monkeypatch.chdir(tmp_path)
+
+        # Narratives zip file the server hands out for every data request
+        narratives_zip = io.BytesIO()
+        with zipfile.ZipFile(narratives_zip, 'w') as z:
+            z.writestr('narratives.csv', "id,timestamp,title\n1,1672531200000,Hello\n2,1672531260000,World\n")
+
+        posted_keys = []
+        downloaded_urls = []
+
+        class Response:
+            def __init__(self, body):
+                self.text = json.dumps(body)
+
+        class Session:
+            def post(self, url, params=None, headers=None, data=None):
+                posted_keys.extend([request['key'] for request in json.loads(data)['dataRequests']])
+                return Response({"resultCode": 0})
+
+            def get(self, url, params=None, headers=None):
+                return Response({"resultCode": 0, "results": [{"key": key, "url": "https://download/{}".format(key), "dataLength": 1} for key in posted_keys]})
+
+        def download(from_url, to_path):
+            downloaded_urls.append(from_url)
+            with open(to_path, 'wb') as f:
+                f.write(narratives_zip.getvalue())
+            return to_path
+
+        monkeypatch.setattr(api, '_session', lambda: Session())
+        monkeypatch.setattr(api, 'download_file', download)
+        monkeypatch.setattr(api, 'SLEEP_TIME_BETWEEN_DATA_REQUESTS_SECONDS', 0)
+        monkeypatch.setattr(api, 'get_location', lambda cloud_url, admin_key, location_id: {"id": location_id, "timezone": {"id": "America/Los_Angeles"}})
+
+        # Interrupt the first run while it's extracting the second location
+        finalize = api._finalize_data_request
+
+        def interrupted_finalize(cloud_url, admin_key, job, ism=False):
+            if job['location_id'] == 2:
+                raise KeyboardInterrupt()
+            return finalize(cloud_url, admin_key, job, ism=ism)
+
+        monkeypatch.setattr(api, '_finalize_data_request', interrupted_finalize)
+        try:
+            api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [1, 2, 3], start_time_ms=1672531200000, end_time_ms=1672617600000, max_locations=1)
+            assert False
+        except KeyboardInterrupt:
+            pass
+
+        manifest_path = os.path.join(tmp_path, 'downloads', "manifest_{}.json".format(DATA_REQUEST_TYPE_LOCATION_NARRATIVES))
+        with open(manifest_path, 'r') as f:
+            jobs = json.load(f)['jobs']
+        assert jobs['1']['status'] == pipeline.JOB_DONE
+        assert jobs['2']['status'] == pipeline.JOB_DOWNLOADED
+        assert '3' not in jobs
+        assert len(posted_keys) == 2
+        assert len(downloaded_urls) == 2
+
+        # Running the same extraction again only finishes the second location and does the third
+        monkeypatch.setattr(api, '_finalize_data_request', finalize)
+        final_paths = api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [1, 2, 3], start_time_ms=1672531200000, end_time_ms=1672617600000)
+        assert sorted(final_paths.keys()) == [1, 2, 3]
+        assert len(posted_keys) == 3
+        assert len(downloaded_urls) == 3
+
+        for location_id in final_paths:
+            with zipfile.ZipFile(final_paths[location_id], 'r') as z:
+                lines = z.read(z.namelist()[0]).decode().splitlines()
+            assert lines[0] == "locationId,timestamp_iso,timestamp_excel,id,timestamp,title"
+            assert lines[1] == "{},2023-01-01T00:00:00Z,12/31/2022 16:00:00,1,1672531200000,Hello".format(location_id)
+
+        # Every location is done, so nothing is requested or downloaded again
+        api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [1, 2, 3], start_time_ms=1672531200000, end_time_ms=1672617600000)
+        assert len(posted_keys) == 3
+        assert len(downloaded_urls) == 3
+
+        # Extractions that start some days ago resume later, even though their start time has moved since
+        import time
+        now = time.time()
+        api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [4], days_ago=7, manifest_path=os.path.join(tmp_path, 'days_ago.json'))
+        assert len(posted_keys) == 4
+
+        monkeypatch.setattr(time, 'time', lambda: now + 3600)
+        api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [4], days_ago=7, manifest_path=os.path.join(tmp_path, 'days_ago.json'))
+        assert len(posted_keys) == 4
+
+    def test_maestro_cli_data_requests_reissued_urls(self, tmp_path, monkeypatch):
+        """
+        :return:
+        """
+        import io
+        import requests
+        import zipfile
+
+        monkeypatch.chdir(tmp_path)
+
+        narratives_zip = io.BytesIO()
+        with zipfile.ZipFile(narratives_zip, 'w') as z:
+            z.writestr('narratives.csv', "id,timestamp,title\n1,1672531200000,Hello\n")
+
+        posted_keys = []
+        downloaded_urls = []
+
+        class Response:
+            def __init__(self, body):
+                self.text = json.dumps(body)
+
+        class Session:
+            def post(self, url, params=None, headers=None, data=None):
+                posted_keys.extend([request['key'] for request in json.loads(data)['dataRequests']])
+                return Response({"resultCode": 0})
+
+            def get(self, url, params=None, headers=None):
+                # Every submission gets a new link
+                return Response({"resultCode": 0, "results": [{"key": key, "url": "https://download/{}/{}".format(key, len(posted_keys)), "dataLength": 1} for key in set(posted_keys)]})
+
+        def download(from_url, to_path):
+            downloaded_urls.append(from_url)
+            if len(downloaded_urls) == 1:
+                # The first link drops the connection partway through, then expires
+                with open(to_path + pipeline.PARTIAL_SUFFIX, 'wb') as f:
+                    f.write(b"stale")
+                raise requests.ConnectionError("Connection dropped")
+
+            assert not os.path.exists(to_path + pipeline.PARTIAL_SUFFIX)
+            with open(to_path, 'wb') as f:
+                f.write(narratives_zip.getvalue())
+            return to_path
+
+        monkeypatch.setattr(api, '_session', lambda: Session())
+        monkeypatch.setattr(api, 'download_file', download)
+        monkeypatch.setattr(api, 'SLEEP_TIME_BETWEEN_DATA_REQUESTS_SECONDS', 0)
+        monkeypatch.setattr(api, 'get_location', lambda cloud_url, admin_key, location_id: {"id": location_id, "timezone": {"id": "UTC"}})
+
+        final_paths = api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [1], start_time_ms=1672531200000, end_time_ms=1672617600000)
+        assert final_paths[1] is not None
+        assert len(posted_keys) == 2
+        assert len(downloaded_urls) == 2
+        assert downloaded_urls[0] != downloaded_urls[1]
+
+        # A location that can't be submitted again fails on its own, without stopping the others polled with it
+        def post(url, params=None, headers=None, data=None):
+            if params['locationId'] == 2:
+                raise api.ApiError("Location not found", 14)
+            return Response({"resultCode": 0})
+
+        monkeypatch.setattr(api, 'DATA_REQUEST_RESUBMIT_POLLS', 1)
+        monkeypatch.setattr(Session, 'get', lambda self, url, params=None, headers=None: Response({"resultCode": 0, "results": []}))
+        monkeypatch.setattr(Session, 'post', lambda self, url, params=None, headers=None, data=None: post(url, params=params, headers=headers, data=data))
+        jobs = [{"location_id": location_id, "params": {"locationId": location_id}, "data_requests": [{"key": str(location_id)}], "urls": {}, "polls": 0, "status": pipeline.JOB_SUBMITTED} for location_id in [1, 2]]
+        assert api._poll_data_requests("https://sbox.cloud", "__key__", jobs) == jobs
+        assert [job['status'] for job in jobs] == [pipeline.JOB_SUBMITTED, pipeline.JOB_FAILED]
+        assert 'error' in jobs[1]
+
+    def test_maestro_cli_incremental_data_request(self, tmp_path, monkeypatch):
+        """
+        :return:
+        """
+        monkeypatch.chdir(tmp_path)
+
+        # Narratives every hour, for whatever time range is requested
+        narrative_times_ms = [1672531200000 + i * 3600000 + 111 for i in range(72)]
+        posted_requests = []
+        files = {}
+
+        class Response:
+            def __init__(self, body):
+                self.text = json.dumps(body)
+
+        class Session:
+            def post(self, url, params=None, headers=None, data=None):
+                posted_requests.extend(json.loads(data)['dataRequests'])
+                return Response({"resultCode": 0})
+
+            def get(self, url, params=None, headers=None):
+                results = []
+                for request in posted_requests:
+                    rows = ["{},{},Narrative".format(i, t) for i, t in enumerate(narrative_times_ms) if request['startTime'] <= t <= request['endTime']]
+                    files[request['key']] = "id,timestamp,title\n" + "\n".join(rows) + "\n"
+                    results.append({"key": request['key'], "url": request['key'], "dataLength": len(rows)})
+                return Response({"resultCode": 0, "results": results})
+
+        def download(from_url, to_path):
+            import zipfile
+            with zipfile.ZipFile(to_path, 'w') as z:
+                z.writestr('narratives.csv', files[from_url])
+            return to_path
+
+        monkeypatch.setattr(api, '_session', lambda: Session())
+        monkeypatch.setattr(api, 'download_file', download)
+        monkeypatch.setattr(api, 'SLEEP_TIME_BETWEEN_DATA_REQUESTS_SECONDS', 0)
+        monkeypatch.setattr(api, 'get_location', lambda cloud_url, admin_key, location_id: {"id": location_id, "timezone": {"id": "UTC"}})
+
+        def narrative_rows(final_path):
+            import zipfile
+            with zipfile.ZipFile(final_path, 'r') as z:
+                return [line for line in z.read(z.namelist()[0]).decode().splitlines()[1:] if line]
+
+        start_time_ms = 1672531200000
+        first_end_time_ms = start_time_ms + 24 * 3600000
+        second_end_time_ms = start_time_ms + 48 * 3600000
+
+        api.data_request("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, location_id=123, start_time_ms=start_time_ms, end_time_ms=first_end_time_ms, incremental=True)
+        assert posted_requests[-1]['startTime'] == start_time_ms
+
+        # The next extraction only requests the time after the watermark, and merges it into the same file
+        final_path = api.data_request("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, location_id=123, start_time_ms=start_time_ms + 12 * 3600000, end_time_ms=second_end_time_ms, incremental=True)
+        assert len(posted_requests) == 2
+        assert posted_requests[-1]['startTime'] == first_end_time_ms + 1
+        assert [int(row.split(",")[4]) for row in narrative_rows(final_path)] == [t for t in narrative_times_ms if t <= second_end_time_ms]
+
+        with open(os.path.join(tmp_path, 'downloads', 'watermarks.json'), 'r') as f:
+            entry = json.load(f)['123'][str(DATA_REQUEST_TYPE_LOCATION_NARRATIVES)]
+        assert entry['start_time_ms'] == start_time_ms
+        assert entry['watermarks'] == {"narratives": second_end_time_ms}
+        assert entry['final_path'] == final_path
+
+        # Nothing new to request
+        assert api.data_request("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, location_id=123, start_time_ms=start_time_ms, end_time_ms=second_end_time_ms, incremental=True) == final_path
+        assert len(posted_requests) == 2
+
+        # Starting earlier than the last extraction downloads everything again
+        api.data_request("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, location_id=123, start_time_ms=start_time_ms - 3600000, end_time_ms=second_end_time_ms, incremental=True)
+        assert posted_requests[-1]['startTime'] == start_time_ms - 3600000
+
+        # Running the same incremental extraction of several locations again requests what's new since the last run,
+        # even though the manifest of the last run says every location is done
+        import time
+        monkeypatch.setattr(time, 'time', lambda: first_end_time_ms / 1000.0)
+        api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [456, 789], start_time_ms=start_time_ms, incremental=True)
+        assert [request['startTime'] for request in posted_requests[-2:]] == [start_time_ms, start_time_ms]
+
+        monkeypatch.setattr(time, 'time', lambda: second_end_time_ms / 1000.0)
+        final_paths = api.data_requests("https://sbox.cloud", "__key__", DATA_REQUEST_TYPE_LOCATION_NARRATIVES, [456, 789], start_time_ms=start_time_ms, incremental=True)
+        assert [request['startTime'] for request in posted_requests[-2:]] == [first_end_time_ms + 1, first_end_time_ms + 1]
+        for location_id in [456, 789]:
+            assert [int(row.split(",")[4]) for row in narrative_rows(final_paths[location_id])] == [t for t in narrative_times_ms if t <= second_end_time_ms]
@@ -238,8 +238,6 @@ def start_organization_intelligence_timer(botengine, seconds, intelligence_id, a
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger().info(">start_organization_intelligence_timer({}, {})".format(seconds, reference))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.start_timer_s(int(seconds), _organization_intelligence_fired, (intelligence_id, argument), reference)
 
 
@@ -253,8 +251,6 @@ def start_organization_intelligence_timer_ms(botengine, milliseconds, intelligen
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger().info(">start_organization_intelligence_timer_ms({}, {})".format(milliseconds, reference))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.start_timer_ms(int(milliseconds), _organization_intelligence_fired, (intelligence_id, argument), reference)
 
 
@@ -268,8 +264,6 @@ def set_organization_intelligence_alarm(botengine, timestamp_ms, intelligence_id
     :param reference: Unique reference name that lets us later cancel this timer if needed
     """
     botengine.get_logger().info(">set_organization_intelligence_alarm({})".format(timestamp_ms))
-    if reference is not None and reference != "":
-        botengine.cancel_timers(reference)
     botengine.set_alarm(int(timestamp_ms), _organization_intelligence_fired, (intelligence_id, argument), reference)
 
 
@@ -7,6 +7,8 @@ file 'LICENSE.txt', which is part of this source code package.
 @author: David Moss
 '''
 
+import utilities.coercion as coercion
+
 # Time conversions to ms
 ONE_MINUTE_MS = 60000
 ONE_HOUR_MS = ONE_MINUTE_MS * 60
@@ -66,24 +68,14 @@ def relative_f_to_c_degree(fahrenheit_degree):
     return float(fahrenheit_degree) * 0.555556
 
 
-def normalize_measurement(measure):
+def normalize_measurement(measure, param_name=None):
     """
     Transform a measurement's value, which could be a string, into a real value - like a boolean or int or float
     :param measure: a raw measurement's value
+    :param param_name: Optional measurement parameter name, used to look up the type of the value
     :return: a value that has been corrected into the right type
     """
-    try:
-        return eval(measure, {}, {})
-
-    except:
-        if measure in ['true', 'True']:
-            return True
-
-        elif measure in ['false', 'False']:
-            return False
-
-        else:
-            return measure
+    return coercion.coerce_measurement(measure, param_name)
 
 def iso_format(dt):
     """
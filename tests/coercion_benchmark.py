@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark typed measurement coercion against the eval() based normalize_measurement() it replaced.
+
+Usage:
+    python tests/coercion_benchmark.py
+    python tests/coercion_benchmark.py --iterations 100000
+
+This file is subject to the terms and conditions defined in the
+file 'LICENSE.txt', which is part of this source code package.
+
+@author:     David Moss
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "com.ppc.Bot"))
+
+import utilities.coercion as coercion
+
+# A representative mix of raw measurement values and their parameter names
+MEASUREMENTS = [
+    ("doorStatus", "true"),
+    ("doorStatus", "false"),
+    ("motionStatus", "True"),
+    ("batteryLevel", "87"),
+    ("rssi", "-62"),
+    ("degC", "21.5"),
+    ("relativeHumidity", "45.25"),
+    ("power", "1.5e3"),
+    ("model", "PPC-1000"),
+    ("occupancy", "2"),
+    ("occupancyTarget", "[{'x': 1.0, 'y': 2.0}]"),
+    ("status", "OPEN"),
+    ("ppc.firmware", "1.2.3"),
+    ("index", "None"),
+]
+
+
+def legacy_normalize_measurement(measure):
+    """
+    The original eval() based implementation, for comparison
+    :param measure: Raw measurement value
+    :return: Value
+    """
+    try:
+        return eval(measure, {}, {})
+
+    except:
+        if measure in ['true', 'True']:
+            return True
+
+        elif measure in ['false', 'False']:
+            return False
+
+        else:
+            return measure
+
+
+def benchmark(iterations):
+    """
+    Time both implementations on the representative measurements
+    :param iterations: Number of times to convert every measurement
+    :return: { 'values', 'legacy_s', 'typed_s' }
+    """
+    t = time.time()
+    for i in range(iterations):
+        for param_name, value in MEASUREMENTS:
+            legacy_normalize_measurement(value)
+    legacy_s = time.time() - t
+
+    t = time.time()
+    for i in range(iterations):
+        for param_name, value in MEASUREMENTS:
+            coercion.coerce_measurement(value, param_name)
+    typed_s = time.time() - t
+
+    return {
+        'values': iterations * len(MEASUREMENTS),
+        'legacy_s': legacy_s,
+        'typed_s': typed_s
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark typed measurement coercion against eval()")
+    parser.add_argument("--iterations", dest="iterations", type=int, default=20000, help="Number of times to convert every measurement. Default is 20000.")
+    args = parser.parse_args()
+
+    result = benchmark(args.iterations)
+    print("eval: {:.0f} values/s".format(result['values'] / result['legacy_s']))
+    print("typed coercion: {:.0f} values/s, {:.1f}x".format(result['values'] / result['typed_s'], result['legacy_s'] / result['typed_s']))
+
+
+if __name__ == "__main__":
+    main()
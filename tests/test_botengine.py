@@ -118,6 +118,681 @@ class TestBotEngine(unittest.TestCase):
         botengine._download_core_variables()
         assert botengine.variables == {"-core-": {"[c]": 0, "[q]": None, "[t]": None, "a": 1}}
 
+    @requests_mock.mock()
+    def test_botengine_flush_compressed_variables(self, mock_for_requests):
+        # Import BotEngine class
+        from botengine import BotEngine, BinaryVariableStore
+
+        # Initialize BotEngine
+        host = 'https://app.host.com'
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHost': host})
+        botengine.inputs = {'trigger': 8}
+        add_logger(botengine)
+
+        mock_for_requests.post(host + "/analytic/variables", json={"resultCode": 0})
+
+        # A compressible variable is compressed on the way out
+        import dill
+        value = {"measurements": [("value", 1000)] * 1000}
+        botengine.save_variable("large", value)
+        botengine.flush_binary_variables()
+
+        assert mock_for_requests.call_count == 1
+        posted = mock_for_requests.last_request.body
+        assert posted.startswith(botengine_module().VARIABLE_HEADER_COMPRESSED)
+        assert len(posted) < len(dill.dumps(value))
+        assert botengine.variables_to_flush == {}
+
+        # Decoding the posted content gives back the original variable
+        store = BinaryVariableStore()
+        assert dill.loads(store.decode("large", bytes(posted), None)) == value
+
+        # Saving the same content again doesn't upload anything
+        botengine.save_variable("large", {"measurements": [("value", 1000)] * 1000})
+        botengine.flush_binary_variables()
+        assert mock_for_requests.call_count == 1
+
+        # Changing the content uploads it again
+        botengine.save_variable("large", {"measurements": []})
+        botengine.flush_binary_variables()
+        assert mock_for_requests.call_count == 2
+
+    @requests_mock.mock()
+    def test_botengine_chunked_variables(self, mock_for_requests):
+        # Import BotEngine class
+        from botengine import BotEngine, BinaryVariableStore
+
+        # Initialize BotEngine
+        host = 'https://app.host.com'
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHost': host})
+        botengine.inputs = {'trigger': 8}
+        botengine._variable_store = BinaryVariableStore(max_chunk_size=64)
+        add_logger(botengine)
+
+        # Our stand-in server stores whatever is posted, and serves it back
+        import urllib.parse
+        server_variables = {}
+
+        def post_variables(request, context):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(request.url).query)
+            offset = 0
+            for (name, length) in zip(query['name'], query['length']):
+                server_variables[name] = request.body[offset:offset + int(length)]
+                offset += int(length)
+            return {"resultCode": 0}
+
+        def get_variable(request, context):
+            name = urllib.parse.unquote(urllib.parse.urlparse(request.url).path.split("/")[-1])
+            return bytes(server_variables.get(name, b""))
+
+        def delete_variable(request, context):
+            name = urllib.parse.unquote(urllib.parse.urlparse(request.url).path.split("/")[-1])
+            del server_variables[name]
+            return ""
+
+        import re
+        mock_for_requests.post(host + "/analytic/variables", json=post_variables)
+        mock_for_requests.get(re.compile(host + "/analytic/variables/.*"), content=get_variable)
+        mock_for_requests.delete(re.compile(host + "/analytic/variables/.*"), text=delete_variable)
+
+        import os
+        value = os.urandom(500)
+        botengine.save_variable("random", value)
+        botengine.flush_binary_variables()
+
+        # The variable itself is just a manifest, the content lives in the chunks
+        assert server_variables["random"].startswith(botengine_module().VARIABLE_HEADER_CHUNKED)
+        chunk_names = [name for name in server_variables if name.startswith("random[chunk]")]
+        assert len(chunk_names) > 1
+
+        # A fresh execution reassembles the chunks transparently
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHost': host})
+        botengine.inputs = {'trigger': 8}
+        botengine._variable_store = BinaryVariableStore(max_chunk_size=64)
+        add_logger(botengine)
+        assert botengine.load_variable("random") == value
+
+        # Shrinking the variable removes the chunks we no longer need
+        botengine.save_variable("random", b"small")
+        botengine.flush_binary_variables()
+        assert [name for name in server_variables if name.startswith("random[chunk]")] == []
+        assert botengine.load_variables(["random"]) == {"random": b"small"}
+
+    @requests_mock.mock()
+    def test_botengine_warm_cache(self, mock_for_requests):
+        # Import BotEngine class
+        from botengine import BotEngine
+
+        host = 'https://app.host.com'
+        server_variables = {}
+
+        def post_variables(request, context):
+            import urllib.parse
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(request.url).query)
+            offset = 0
+            for (name, length) in zip(query['name'], query['length']):
+                server_variables[name] = request.body[offset:offset + int(length)]
+                offset += int(length)
+            return {"resultCode": 0}
+
+        import re
+        mock_for_requests.post(host + "/analytic/variables", json=post_variables)
+        mock_for_requests.get(re.compile(host + "/analytic/variables/.*"), content=lambda request, context: bytes(server_variables["controller"]))
+
+        def execution():
+            botengine = BotEngine({'apiKey': '1234567890', 'apiHost': host}, bot_instance_id=1234)
+            botengine.inputs = {'trigger': 8}
+            add_logger(botengine)
+            return botengine
+
+        warm_cache = botengine_module()._warm_cache
+        warm_cache.clear()
+
+        # The first execution saves the controller
+        controller = {"locations": {1: "home"}}
+        botengine = execution()
+        botengine.save_variable("controller", controller)
+        botengine.flush_binary_variables()
+
+        # The next execution in this warm container gets the same object back, without unpickling it
+        with patch('dill.loads') as loads:
+            assert execution().load_variable("controller") is controller
+            loads.assert_not_called()
+
+        # That execution failed without saving, so the one after it unpickles the server copy
+        assert execution().load_variable("controller") == controller
+        assert execution().load_variable("controller") is not controller
+
+        # Someone else changed the variable on the server, so it's unpickled again
+        botengine = execution()
+        controller = botengine.load_variable("controller")
+        controller["locations"][2] = "office"
+        botengine.save_variable("controller", controller)
+        botengine.flush_binary_variables()
+
+        import dill, zlib
+        server_variables["controller"] = botengine_module().VARIABLE_HEADER_COMPRESSED + zlib.compress(dill.dumps({"locations": {}}))
+        assert execution().load_variable("controller") == {"locations": {}}
+        warm_cache.clear()
+
+    def test_botengine_device_index(self):
+        import os
+        import tempfile
+
+        bot_directory = tempfile.mkdtemp()
+        files = {
+            "device.py": "class Device:\n    DEVICE_TYPES = []\n",
+            "entry/entry.py": "from devices.device import Device\n\nclass EntryDevice(Device):\n    DEVICE_TYPES = [10014, 10074]\n\nclass QuietEntryDevice(EntryDevice):\n    pass\n",
+            "entry/entry_develco.py": "from devices.entry.entry import EntryDevice\n\nclass DevelcoEntryDevice(EntryDevice):\n    DEVICE_TYPES = [9114, 10014]\n",
+            "camera/camera.py": "from devices.device import Device\n\nclass CameraDevice(Device):\n    pass\n",
+        }
+        for (filename, content) in files.items():
+            path = os.path.join(bot_directory, "devices", filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+
+        assert botengine._extract_device_types(bot_directory) == {
+            "9114": [{"module": "devices.entry.entry_develco", "class": "DevelcoEntryDevice"}],
+            "10014": [
+                {"module": "devices.entry.entry", "class": "EntryDevice"},
+                {"module": "devices.entry.entry", "class": "QuietEntryDevice"},
+                {"module": "devices.entry.entry_develco", "class": "DevelcoEntryDevice"}
+            ],
+            "10074": [
+                {"module": "devices.entry.entry", "class": "EntryDevice"},
+                {"module": "devices.entry.entry", "class": "QuietEntryDevice"}
+            ]
+        }
+
+        # A bot without devices has an empty index
+        assert botengine._extract_device_types(tempfile.mkdtemp()) == {}
+
+    def test_botengine_timer_scheduler(self):
+        # Import BotEngine class
+        from botengine import TimerScheduler, MAXINT
+
+        # Load timers saved in the original core variable format
+        saved_timers = [
+            (2000, timer_fired, "b", "second"),
+            (1000, timer_fired, "a", "first"),
+            (1921875905001, timer_fired, None, "mistake"),
+            (MAXINT, 500, None, None)
+        ]
+        timers = TimerScheduler(saved_timers)
+        assert len(timers) == 2
+        assert timers.last_modified_ms == 500
+        assert not timers.is_running("mistake")
+        assert timers.peek() == (1000, timer_fired, "a", "first")
+
+        # Setting a timer replaces any timer with the same reference
+        timers.set(3000, timer_fired, "c", "first", 600)
+        assert len(timers) == 2
+        assert timers.timestamp_ms("first") == 3000
+        assert timers.peek() == (2000, timer_fired, "b", "second")
+
+        # Canceling is lazy, but never visible
+        timers.set(1500, timer_fired, "d", "third", 700)
+        timers.cancel("third", 800)
+        assert not timers.is_running("third")
+        assert timers.timestamp_ms("third") is None
+
+        # Due timers pop off in order
+        assert timers.pop_due(2500) == [(2000, timer_fired, "b", "second")]
+        assert timers.pop_due(2500) == []
+        assert timers.is_running("first")
+        assert not timers.is_running("second")
+
+        # Saved back in the original format
+        assert timers.to_list() == [(3000, timer_fired, "c", "first"), (MAXINT, 800, None, None)]
+
+    def test_botengine_timers(self):
+        # Import BotEngine class
+        from botengine import BotEngine, TIMERS_VARIABLE_NAME, CORE_VARIABLE_NAME, MAXINT
+
+        # Initialize BotEngine
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHost': 'https://app.host.com'})
+        botengine.inputs = {'trigger': 8, 'time': 1000}
+        botengine._reset_core_variable()
+        botengine._cancel_execution_request = MagicMock()
+        add_logger(botengine)
+
+        for i in range(100):
+            botengine.start_timer_ms(100 - i, timer_fired, i, "timer{}".format(i))
+
+        assert botengine.is_timer_running("timer50")
+        assert botengine.timer_timestamp_ms("timer99") == 1001
+
+        for i in range(100):
+            botengine.cancel_timers("timer{}".format(i))
+
+        assert not botengine.is_timer_running("timer50")
+        botengine._cancel_execution_request.assert_called_once()
+
+        botengine.set_alarm(5000, timer_fired, "argument", "alarm")
+        botengine._flush_timers()
+        assert botengine.variables[CORE_VARIABLE_NAME][TIMERS_VARIABLE_NAME] == [(5000, timer_fired, "argument", "alarm"), (MAXINT, 1000, None, None)]
+
+    def test_botengine_playback_recording(self):
+        # Import BotEngine class
+        from botengine import PlaybackRecording, PlaybackSchedules
+
+        import json
+        import tempfile
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            f.write("{\n")
+            f.write("\"data_requests\":" + json.dumps({"abc123": "abc123.csv"}) + ",\n")
+            f.write("\"location_info\":" + json.dumps({"id": 123, "timezone": {"id": "America/Los_Angeles"}}) + ",\n")
+            f.write("\"device_properties\":" + json.dumps({"abc123": [{"name": "a", "value": "1"}]}) + ",\n")
+            f.write("\"data\":[\n")
+            f.write(",\n".join([json.dumps({"trigger": "8", "timestamp_ms": str(1670270287513 + i), "param": str(i)}) for i in range(3)]))
+            f.write("\n]}")
+
+        # Sections are available up front, records stream afterwards
+        recording = PlaybackRecording(f.name)
+        assert recording.location_info["id"] == 123
+        assert recording.device_properties == {"abc123": [{"name": "a", "value": "1"}]}
+        assert recording.data_requests == {"abc123": "abc123.csv"}
+        assert [d["param"] for d in recording.records()] == ["0", "1", "2"]
+        recording.close()
+
+        import os
+        os.remove(f.name)
+
+        # Schedules fire in order, and schedules that fire together are grouped in their declared order
+        # 2022-12-05T11:58:07.513-08:00
+        schedules = PlaybackSchedules({"HOUR": "0 0 0/1 1/1 * ? *", "MIDNIGHT": "0 0 0 1/1 * ? *"}, "America/Los_Angeles", 1670270287513)
+        due = schedules.pop_due(1670313600000)
+        assert len(due) == 13
+        assert due[0] == (1670270400000, ["HOUR"])
+        assert due[-1] == (1670313600000, ["HOUR", "MIDNIGHT"])
+        assert schedules.pop_due(1670313600000) == []
+
+    @requests_mock.mock()
+    def test_botengine_flush_coordinator(self, mock_for_requests):
+        # Import BotEngine class
+        from botengine import BotEngine, FlushCoordinator
+
+        # Initialize BotEngine
+        host = 'https://app.host.com'
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHost': host})
+        botengine.inputs = {'trigger': 8, 'time': 1000, 'locationId': 123}
+        add_logger(botengine)
+
+        mock_for_requests.put(host + "/cloud/json/locations/123/state", json={"resultCode": 0})
+        mock_for_requests.put(host + "/cloud/json/rules/1/attrs", json={"resultCode": 0})
+        mock_for_requests.put(host + "/cloud/json/rules/2/attrs", json={"resultCode": 0})
+
+        # Each state and rule is queued as its own flush
+        for address in ["a", "b", "c"]:
+            botengine.states[None] = botengine.states.get(None, {})
+            botengine.states[None][address] = {}
+            botengine.set_state(address, {"value": address})
+        botengine.rules = {1: "ACTIVE", 2: "INACTIVE"}
+
+        coordinator = FlushCoordinator(botengine)
+        botengine.flush_states(coordinator)
+        botengine.flush_rules(coordinator)
+        assert len(coordinator.pending) == 5
+        assert mock_for_requests.call_count == 0
+        assert botengine.states_to_flush == {}
+
+        coordinator.flush()
+        assert mock_for_requests.call_count == 5
+        assert sorted([r.qs["name"][0] for r in mock_for_requests.request_history if "name" in r.qs]) == ["a", "b", "c"]
+
+        # Independent flushes are sent concurrently
+        import time
+        coordinator.submit(FlushCoordinator.ENDPOINT_STATES, time.sleep, 0.2)
+        coordinator.submit(FlushCoordinator.ENDPOINT_RULES, time.sleep, 0.2)
+        coordinator.submit(FlushCoordinator.ENDPOINT_TAGS, time.sleep, 0.2)
+        t = time.time()
+        coordinator.flush()
+        assert time.time() - t < 0.4
+
+        # Each endpoint retries according to its own policy
+        coordinator.RETRY_DELAY_S = 0
+        attempts = {"states": 0, "questions": 0}
+
+        def failing_flush(endpoint, failures):
+            attempts[endpoint] += 1
+            if attempts[endpoint] <= failures:
+                raise Exception("Server unavailable")
+
+        coordinator.submit(FlushCoordinator.ENDPOINT_STATES, failing_flush, "states", 2)
+        coordinator.submit(FlushCoordinator.ENDPOINT_QUESTIONS, failing_flush, "questions", 1)
+
+        # A flush that fails after all its retries fails the execution, once every other flush finished
+        with self.assertRaisesRegex(Exception, "Server unavailable"):
+            coordinator.flush()
+        assert attempts == {"states": 3, "questions": 1}
+        assert coordinator.pending == []
+
+    def test_botengine_lazy_log_formatting(self):
+        from botengine import BotEngine, LogRepr
+        import importlib
+        import logging
+
+        class Expensive:
+            formatted = 0
+
+            def __str__(self):
+                Expensive.formatted += 1
+                return "x" * 100000
+
+            __repr__ = __str__
+
+        def expensive_function():
+            Expensive.formatted += 1
+            return "computed"
+
+        # Records every message the logger writes
+        messages = []
+        handler = logging.Handler()
+        handler.emit = lambda record: messages.append(record.getMessage())
+        logger = logging.getLogger('test.lazy')
+        logger.propagate = False
+        logger.addHandler(handler)
+
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHost': 'https://app.host.com'})
+        botengine.get_logger = MagicMock(return_value=logger)
+
+        # Nothing is formatted while debug logging is disabled
+        logger.setLevel(logging.INFO)
+        botengine.save_variable("expensive", Expensive())
+        botengine.load_variable("expensive")
+        logger.debug("computed=%s", LogRepr.call(expensive_function))
+        lambda_module = importlib.import_module('lambda')
+        lambda_module.LambdaLogger("info").debug("expensive=%s", LogRepr(Expensive()))
+        assert not lambda_module.LambdaLogger("info").isEnabledFor(logging.DEBUG)
+        assert Expensive.formatted == 0
+        assert messages == []
+
+        # Enabled debug messages are formatted, and large values are truncated
+        logger.setLevel(logging.DEBUG)
+        botengine.load_variable("expensive")
+        logger.debug("computed=%s", LogRepr.call(expensive_function))
+        assert Expensive.formatted == 2
+        assert messages[-2].startswith("botengine:load_variable() value=xxx")
+        assert messages[-2].endswith("... (100000 characters)")
+        assert len(messages[-2]) < botengine_module().LOG_REPR_MAX_LENGTH + 100
+        assert messages[-1] == "computed=computed"
+
+        # Large containers are cut short as they're formatted
+        assert str(LogRepr(list(range(100000)))).endswith("...]")
+
+        lambda_logger = lambda_module.LambdaLogger("debug")
+        lambda_logger.debug("expensive=%s", LogRepr(Expensive(), max_length=10))
+        assert lambda_logger.log_events[-1]['message'] == "[DEBUG] expensive=xxxxxxxxxx... (100000 characters)"
+
+        # Playback data request inputs hold bytes, which can't be serialized. That's a warning instead of a logging error.
+        del messages[:]
+        botengine_module()._log_execution_inputs(botengine, {"time": 1000, "trigger": 2048, "data": {"device": b"measureTime,paramName"}})
+        assert messages[0] == "Current time: 1000; Trigger: 2048"
+        assert messages[1].startswith("BotEngine Failed checking execution json...")
+        assert len(messages) == 2
+
+        botengine_module()._log_execution_inputs(botengine, {"time": 1000, "trigger": 8})
+        assert messages[-1] == 'Run Inputs: {"time": 1000, "trigger": 8}'
+        logger.removeHandler(handler)
+
+    def test_botengine_microservice_profiler(self):
+        import os
+        import sys
+        import tempfile
+        import time
+
+        # A bot with a slow and a fast microservice
+        bot_directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(bot_directory, "intelligence", "profiled"))
+        for filename in ["__init__.py", os.path.join("profiled", "__init__.py")]:
+            open(os.path.join(bot_directory, "intelligence", filename), 'w').close()
+        with open(os.path.join(bot_directory, "intelligence", "profiled", "location_profiled_microservice.py"), 'w') as f:
+            f.write("import time\n\nclass ProfiledMicroservice:\n    def timer_fired(self, botengine, argument):\n        self._work(0.2)\n\n    def schedule_fired(self, botengine, schedule_id):\n        self._work(0.02)\n\n    def _work(self, seconds):\n        end = time.time() + seconds\n        while time.time() < end:\n            pass\n")
+
+        sys.path.insert(0, bot_directory)
+        try:
+            from intelligence.profiled.location_profiled_microservice import ProfiledMicroservice
+            microservice = ProfiledMicroservice()
+
+            for mode in [botengine.MicroserviceProfiler.MODE_SAMPLING, botengine.MicroserviceProfiler.MODE_CPROFILE]:
+                profile_directory = os.path.join(tempfile.mkdtemp(), "profile")
+                profiler = botengine.MicroserviceProfiler(profile_directory, mode, interval_ms=2)
+                for execution in range(2):
+                    profiler.start()
+                    microservice.timer_fired(None, None)
+                    microservice.schedule_fired(None, "DEFAULT")
+                    profiler.stop()
+
+                # The slow hook ranks first, and the private method it calls isn't a hook
+                hooks = profiler.get_hooks()
+                assert [(hook["microservice"], hook["hook"]) for hook in hooks] == [("intelligence.profiled.location_profiled_microservice", "timer_fired"), ("intelligence.profiled.location_profiled_microservice", "schedule_fired")]
+                assert hooks[0]["time_ms"] > 300
+                if mode == botengine.MicroserviceProfiler.MODE_CPROFILE:
+                    assert [hook["calls"] for hook in hooks] == [2, 2]
+
+                filenames = profiler.write()
+                assert all(os.path.exists(filename) for filename in filenames)
+                with open(os.path.join(profile_directory, botengine.MicroserviceProfiler.REPORT_FILENAME)) as f:
+                    report = f.read()
+                assert report.index("location_profiled_microservice.timer_fired") < report.index("location_profiled_microservice.schedule_fired")
+
+                if mode == botengine.MicroserviceProfiler.MODE_SAMPLING:
+                    # Collapsed stacks go from the outermost frame to the innermost, followed by the number of samples
+                    with open(os.path.join(profile_directory, botengine.MicroserviceProfiler.COLLAPSED_FILENAME)) as f:
+                        stacks = [line.rsplit(" ", 1) for line in f.read().splitlines()]
+                    assert any(stack.endswith("intelligence.profiled.location_profiled_microservice:timer_fired;intelligence.profiled.location_profiled_microservice:_work") for (stack, samples) in stacks)
+                    assert all(int(samples) > 0 for (stack, samples) in stacks)
+
+        finally:
+            sys.path.remove(bot_directory)
+            for name in [name for name in sys.modules if name == "intelligence" or name.startswith("intelligence.")]:
+                del sys.modules[name]
+
+    def test_botengine_profiler_stops_after_errors(self):
+        # An execution that raises still stops the profiler, so --run starts profiling the next execution again
+        profiler = MagicMock()
+        bot = MagicMock()
+        bot.run.side_effect = Exception("Bot error")
+        with patch.object(botengine, "_profiler", profiler):
+            with self.assertRaisesRegex(Exception, "Bot error"):
+                botengine._run(bot, {'inputs': [{'time': 1000, 'trigger': 8}]}, logging.getLogger('test'), botengine_override=MagicMock())
+
+        assert profiler.start.call_count == 1
+        assert profiler.stop.call_count == 1
+
+    @requests_mock.mock()
+    def test_botengine_http_transport(self, mock_for_requests):
+        # Import BotEngine class
+        import requests
+        from botengine import BotEngine, HttpTransport
+
+        # Initialize BotEngine with two servers to rotate through
+        host = 'https://app.host.com'
+        backup = 'https://backup.host.com'
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHosts': [host, backup]})
+        add_logger(botengine)
+        botengine.http.BACKOFF_BASE_S = 0
+
+        assert HttpTransport.endpoint_name("GET", "/cloud/json/devices/ABC123/parameters?x=1") == "GET /cloud/json/devices/{id}/parameters"
+
+        mock_for_requests.get(host + "/cloud/json/devices/1/parameters", text="0123456789")
+        mock_for_requests.get(host + "/cloud/json/devices/2/parameters", text="01234")
+        mock_for_requests.put(host + "/cloud/json/locations/123/state", status_code=500, text="")
+        r = botengine._http_get("/cloud/json/devices/1/parameters")
+        assert r.text == "0123456789"
+        botengine._http_get("/cloud/json/devices/2/parameters")
+        botengine._http_put("/cloud/json/locations/123/state", data="abc")
+
+        statistics = botengine.get_http_statistics()
+        devices = statistics['endpoints']["GET /cloud/json/devices/{id}/parameters"]
+        assert devices['calls'] == 2
+        assert devices['bytesReceived'] == 15
+        assert devices['retries'] == 0
+        assert sum(devices['histogramMs'].values()) == 2
+        state = statistics['endpoints']["PUT /cloud/json/locations/{id}/state"]
+        assert state['httpErrors'] == 1
+        assert state['bytesSent'] == 3
+        assert statistics['total']['calls'] == 3
+
+        # A connection error retries on the next server
+        botengine.http.reset()
+        mock_for_requests.post(host + "/cloud/json/rules", exc=requests.ConnectionError)
+        mock_for_requests.post(backup + "/cloud/json/rules", json={"resultCode": 0})
+        assert botengine._http_post("/cloud/json/rules").json() == {"resultCode": 0}
+        rules = botengine.get_http_statistics()['endpoints']["POST /cloud/json/rules"]
+        assert rules['calls'] == 1
+        assert rules['retries'] == 1
+        assert rules['errors'] == 1
+
+        # Retries are bounded instead of looping forever
+        botengine.http.reset()
+        mock_for_requests.delete(host + "/cloud/json/rules/1", exc=requests.ConnectionError)
+        mock_for_requests.delete(backup + "/cloud/json/rules/1", exc=requests.ConnectionError)
+        with self.assertRaises(requests.ConnectionError):
+            botengine._http_delete("/cloud/json/rules/1")
+        rules = botengine.get_http_statistics()['endpoints']["DELETE /cloud/json/rules/{id}"]
+        assert rules['errors'] == HttpTransport.MAX_ATTEMPTS
+        assert rules['retries'] == HttpTransport.MAX_ATTEMPTS - 1
+
+        # Timeouts grow the timeout, but not past the limit for the method
+        botengine.http.reset()
+        mock_for_requests.get(host + "/cloud/json/slow", exc=requests.Timeout)
+        mock_for_requests.get(backup + "/cloud/json/slow", exc=requests.Timeout)
+        with self.assertRaises(requests.Timeout):
+            botengine._http_get("/cloud/json/slow", timeout=5)
+        timeouts = [r.timeout for r in mock_for_requests.request_history if r.path == "/cloud/json/slow"]
+        assert timeouts == [5, 15, 25]
+
+        # Playback counts what would have been sent without sending it
+        playback = BotEngine({'apiKey': None, 'apiHosts': None}, playback=True)
+        call_count = mock_for_requests.call_count
+        assert playback._http_post("/cloud/json/rules", data="abc") is None
+        assert mock_for_requests.call_count == call_count
+        rules = playback.get_http_statistics()['endpoints']["POST /cloud/json/rules"]
+        assert rules['simulated'] == 1
+        assert rules['bytesSent'] == 3
+
+    @requests_mock.mock()
+    def test_botengine_get_measurements_history(self, mock_for_requests):
+        # Import BotEngine class
+        from botengine import BotEngine, HistoryFetcher
+        import datetime
+
+        host = 'https://app.host.com'
+        botengine = BotEngine({'apiKey': '1234567890', 'apiHost': host})
+        add_logger(botengine)
+
+        def ms(year, month, day=1):
+            return int((datetime.datetime(year, month, day) - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+
+        # Calendar months in UTC, newest first
+        windows = HistoryFetcher.month_windows(ms(2023, 1, 15), ms(2023, 3, 10))
+        assert windows == [(ms(2023, 3), ms(2023, 3, 10)), (ms(2023, 2), ms(2023, 3)), (ms(2023, 1, 15), ms(2023, 2))]
+
+        # One measurement per day from December 2022 on, at noon
+        history = [{"name": "degC", "value": str(i), "time": ms(2022, 12) + 43200000 + i * 86400000} for i in range(100)]
+
+        def get_parameters(request, context):
+            start = int(request.qs['startdate'][0])
+            end = int(request.qs['enddate'][0])
+            return {"resultCode": 0, "measures": [m for m in history if start <= m['time'] <= end]}
+
+        mock_for_requests.get(host + "/analytic/devices/thermostat/parameters", json=get_parameters)
+
+        measures = botengine.get_measurements("thermostat", oldest_timestamp_ms=ms(2022, 6), newest_timestamp_ms=ms(2023, 3, 10))['measures']
+        times = [m['time'] for m in measures]
+        assert times == sorted(times)
+        assert times[0] == ms(2022, 12) + 43200000
+        assert times[-1] == ms(2023, 3, 9) + 43200000
+
+        # Stops at the first month without data. Months before it are never merged in.
+        assert len(measures) == len([m for m in history if m['time'] <= ms(2023, 3, 10)])
+
+        # Stops downloading older months once the limit is reached
+        mock_for_requests.reset_mock()
+        measures = botengine.get_measurements("thermostat", oldest_timestamp_ms=ms(2020, 1), newest_timestamp_ms=ms(2023, 3, 10), limit=5)['measures']
+        assert [m['time'] for m in measures] == [ms(2023, 3, 9) + 43200000 - i * 86400000 for i in range(4, -1, -1)]
+        assert mock_for_requests.call_count <= HistoryFetcher.MAX_WORKERS
+
+    def test_botengine_mock_server(self):
+        # Import BotEngine class and the local mock server
+        import json
+        import lz4.block
+        import requests
+        from botengine import BotEngine
+        from botengine_server import MockCloudServer
+
+        server = MockCloudServer().start()
+        try:
+            botengine = BotEngine({'apiKey': '1234567890', 'apiHost': server.url})
+            botengine.inputs = {'trigger': 8, 'time': 5000, 'locationId': 123}
+            add_logger(botengine)
+            assert botengine._start(1) is True
+
+            # Variables survive from one execution to the next
+            botengine._download_core_variables()
+            botengine.save_variable("controller", {"devices": [1, 2, 3]}, required_for_each_execution=True)
+            botengine.save_variable("history", list(range(1000)))
+            botengine.flush_binary_variables()
+            botengine = BotEngine({'apiKey': '1234567890', 'apiHost': server.url})
+            botengine.inputs = {'trigger': 8, 'time': 5000, 'locationId': 123}
+            add_logger(botengine)
+            botengine._download_core_variables()
+            assert botengine.load_variable("controller") == {"devices": [1, 2, 3]}
+            assert botengine.load_variable("history") == list(range(1000))
+
+            # States
+            botengine.states[None] = {"dashboard": {}}
+            botengine.set_state("dashboard", {"status": "ok"})
+            botengine.flush_states()
+            botengine.states = {}
+            assert botengine.get_state("dashboard") == {"status": "ok"}
+
+            # Measurements and asynchronous data requests
+            server.add_measurements("door", [{"name": "doorStatus", "value": "true", "time": 1000}, {"name": "doorStatus", "value": "false", "time": 2000}])
+            assert [m['value'] for m in botengine.get_measurements("door", param_name="doorStatus")['measures']] == ["false"]
+            assert len(botengine.get_measurements("door", oldest_timestamp_ms=0, newest_timestamp_ms=3000)['measures']) == 2
+
+            botengine.request_data(device_id="door", oldest_timestamp_ms=0, newest_timestamp_ms=3000, reference="all")
+            botengine.flush_asynchronous_requests()
+            inputs = botengine_module()._listen(server.url, "1234567890", 1, timeout=1)
+            data = inputs['inputs'][0]['data'][0]
+            assert inputs['inputs'][0]['trigger'] == 2048
+            assert data['key'] == "all"
+            csv = lz4.block.decompress(botengine.send_data_request(data['url'], timeout=5).content, uncompressed_size=data['dataLength'])
+            assert csv.decode("utf-8").splitlines() == ["measureTime,paramName,index,group,value", "1000,doorStatus,,,true", "2000,doorStatus,,,false"]
+
+            # Notifications and execution requests are recorded
+            botengine._execute_again_at_timestamp(5000)
+            assert server.execution_requests == [{"at": 5000}]
+
+            # Dropped connections are retried
+            botengine.http.BACKOFF_BASE_S = 0
+            botengine.http.reset()
+            server.add_fault(path="/state$", method="GET", disconnect=True, count=1)
+            botengine.states = {}
+            assert botengine.get_state("dashboard") == {"status": "ok"}
+            assert botengine.get_http_statistics()['total']['retries'] == 1
+
+            # Latency shows up in the HTTP statistics
+            server.clear_faults()
+            server.add_fault(path="/analytic/devices/", latency_s=0.1)
+            botengine.http.reset()
+            botengine.get_measurements("door")
+            assert botengine.get_http_statistics()['total']['totalMs'] >= 100
+
+            # Server errors and lockouts
+            server.clear_faults()
+            server.add_fault(path="/analytic/execute", status=503, count=1)
+            with self.assertRaises(json.decoder.JSONDecodeError):
+                botengine._execute_again_at_timestamp(6000)
+            server.lockout(60)
+            assert botengine._start(2) is False
+
+        finally:
+            server.stop()
+
     def test_botengine_get_secret(self):
         # Import BotEngine class
         from botengine import BotEngine
@@ -140,6 +815,19 @@ class TestBotEngine(unittest.TestCase):
 
 # Helper functions
 
+def timer_fired(botengine, argument):
+    """
+    Timer function for timer tests
+    """
+    pass
+
+def botengine_module():
+    """
+    :return: the imported botengine module, for access to module-level constants
+    """
+    import botengine
+    return botengine
+
 def add_logger(botengine):
     """
     Add a logger to the botengine instance
@@ -0,0 +1,23 @@
+import os
+import unittest
+
+# Each package is deployed on its own, so each one has its own copy of the coercion module
+COERCION_COPIES = [
+    os.path.join("com.ppc.Bot", "utilities", "coercion.py"),
+    os.path.join("org.ppc.Bot", "utilities", "coercion.py"),
+    os.path.join("maestro_cli", "coercion.py"),
+]
+
+
+class TestCoercionCopies(unittest.TestCase):
+
+    def test_coercion_copies_are_identical(self):
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+        contents = {}
+        for copy in COERCION_COPIES:
+            with open(os.path.join(root, copy), "r") as f:
+                contents[copy] = f.read()
+
+        reference = contents[COERCION_COPIES[0]]
+        for copy in COERCION_COPIES[1:]:
+            assert contents[copy] == reference, "{} differs from {}, keep the copies identical".format(copy, COERCION_COPIES[0])